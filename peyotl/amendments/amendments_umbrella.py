@@ -6,17 +6,7 @@
 # N.B. We will somebay bump to 8 digits, so sorting logic should manage this.
 from peyotl.utility import get_logger
 from peyotl.utility.str_util import (slugify, increment_slug)
-import json
-
-try:
-    import anyjson
-except:
-    class Wrapper(object):
-        pass
-
-
-    anyjson = Wrapper()
-    anyjson.loads = json.loads
+from peyotl.utility.json_backend import json_loads
 from peyotl.git_storage import ShardedDocStore, \
     TypeAwareDocStore
 from peyotl.amendments.amendments_shard import (TaxonomicAmendmentsShardProxy, TaxonomicAmendmentsShard)
@@ -338,9 +328,9 @@ class _TaxonomicAmendmentStore(TypeAwareDocStore):
             amendment = json_repr
         else:
             try:
-                amendment = anyjson.loads(json_repr)
+                amendment = json_loads(json_repr)
             except:
-                _LOG.warn('> invalid JSON (failed anyjson parsing)')
+                _LOG.warn('> invalid JSON (failed parsing)')
                 return None
         return amendment
 
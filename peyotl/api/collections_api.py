@@ -26,6 +26,8 @@ _REFRESH_VALUES = ('never',  # *DEFAULT* never call "git pull"
 
 
 class _TreeCollectionsAPIWrapper(_WSWrapper):
+    _SERVICE_NAME = 'collections_api'
+
     def __init__(self, domain, **kwargs):
         self._prefix = None
         _WSWrapper.__init__(self, domain, **kwargs)
@@ -115,6 +115,8 @@ class _OTIWrapper(_WSWrapper):
         unindexNexsons (called by phylesystem-api)
         indexNexsons (called by phylesystem-api)
     """
+    _SERVICE_NAME = 'oti'
+    _POST_IS_QUERY = True
 
     def find_nodes(self, query_dict=None, exact=False, verbose=False, **kwargs):
         """Query on node properties. See documentation for _OTIWrapper class."""
@@ -339,14 +341,14 @@ class _OTIWrapper(_WSWrapper):
         url = '{p}/indexNexsons'.format(p=self.indexing_prefix)
         nexson_url = phylesystem_api.url_for_api_get_study(study_id, schema=_OTI_NEXSON_SCHEMA)
         data = {'urls': [nexson_url]}
-        return self.json_http_post(url, data=anyjson.dumps(data))
+        return self.json_http_post(url, data=anyjson.dumps(data), is_write=True)
 
     def trigger_unindex(self, study_id):
         url = '{p}/unindexNexsons'.format(p=self.indexing_prefix)
         if is_str_type(study_id):
             study_id = [study_id]
         data = {'ids': study_id}
-        return self.json_http_post(url, data=anyjson.dumps(data))
+        return self.json_http_post(url, data=anyjson.dumps(data), is_write=True)
 
 
 def OTI(domains=None, **kwargs):
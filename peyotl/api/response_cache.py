@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""An on-disk (sqlite) cache of the bodies of web-service responses.
+
+Entries are keyed by a hash of (verb, URL, params, canonicalized body). Each entry
+belongs to a service and is dropped when:
+    - it is older than `ttl` seconds,
+    - the version recorded for its service changes (see `ResponseCache.check_version`), or
+    - the total size of the bodies exceeds `max_bytes` and it is the least recently used.
+
+`_WSWrapper` uses a ResponseCache if the `http_cache` setting (a filepath) is given (see
+the `_WSWrapper` docstring). The cache may be shared by several wrappers, threads and processes.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.str_util import is_str_type
+from peyotl.utility import get_logger
+import threading
+import hashlib
+import sqlite3
+import json
+import time
+import os
+
+_LOG = get_logger(__name__)
+
+_SCHEMA = ('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, service TEXT, created REAL, '
+           'last_access REAL, size INTEGER, body TEXT)',
+           'CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)',
+           'CREATE TABLE IF NOT EXISTS versions (service TEXT PRIMARY KEY, version TEXT)',)
+
+
+def _canonical_data(data):
+    """Returns `data` (a request body) as a string that does not depend on the order of
+    the keys in a JSON object or on the whitespace between tokens."""
+    if data is None:
+        return ''
+    if is_str_type(data):
+        try:
+            data = json.loads(data)
+        except ValueError:
+            return data
+    return json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+
+def response_cache_key(verb, url, params, data):
+    params_str = '' if not params else json.dumps(sorted(params.items()), separators=(',', ':'))
+    s = u'\n'.join([verb, url, params_str, _canonical_data(data)])
+    return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+
+class ResponseCache(object):
+    """sqlite-backed cache of response bodies (strings).
+    `ttl` is in seconds (None for no limit), `max_bytes` limits the sum of the body lengths.
+    The `hits`, `misses` and `evictions` counters are for this process (see `stats`).
+    """
+
+    def __init__(self, filepath, ttl=86400, max_bytes=100 * 1024 * 1024):
+        self.filepath = os.path.abspath(os.path.expanduser(filepath))
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        par = os.path.dirname(self.filepath)
+        if not os.path.isdir(par):
+            os.makedirs(par)
+        self._conn = sqlite3.connect(self.filepath, timeout=30, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            self._total_bytes = self._sum_sizes()
+
+    def _sum_sizes(self):
+        return self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+
+    def check_version(self, service, version):
+        """Records `version` as the version of `service` (e.g. the taxonomy version of
+        taxomachine). If it differs from the recorded version, the entries of `service` are removed.
+        """
+        version = '' if version is None else str(version)
+        with self._lock:
+            row = self._conn.execute('SELECT version FROM versions WHERE service = ?', (service,)).fetchone()
+            if row is not None and row[0] == version:
+                return
+            if row is not None:
+                _LOG.debug('version of "{s}" changed from "{o}" to "{n}". Clearing its cached responses'.format(
+                    s=service, o=row[0], n=version))
+            self._conn.execute('DELETE FROM responses WHERE service = ?', (service,))
+            self._conn.execute('INSERT OR REPLACE INTO versions (service, version) VALUES (?, ?)', (service, version))
+            self._total_bytes = self._sum_sizes()
+
+    def get(self, key):
+        """Returns the cached body for `key` or None."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT created, body FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[0] > self.ttl:
+                self._delete(key)
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return row[1]
+
+    def put(self, key, service, body):
+        size = len(body)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._conn.execute('INSERT INTO responses (key, service, created, last_access, size, body) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', (key, service, now, now, size, body))
+            self._total_bytes += size
+            if self.max_bytes is not None and self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _delete(self, key):
+        row = self._conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is not None:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._total_bytes -= row[0]
+
+    def _evict(self):
+        """Removes the least recently used entries until the total is at most 90% of max_bytes."""
+        self._total_bytes = self._sum_sizes()
+        target = int(0.9 * self.max_bytes)
+        if self._total_bytes <= self.max_bytes:
+            return
+        cursor = self._conn.execute('SELECT key, size FROM responses ORDER BY last_access')
+        doomed = []
+        for key, size in cursor:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        cursor.close()
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', doomed)
+        self.evictions += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.execute('DELETE FROM versions')
+            self._total_bytes = 0
+
+    def stats(self):
+        """Returns a dict of the hit, miss and eviction counts, and the # and total size of the entries."""
+        with self._lock:
+            num_entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'entries': num_entries,
+                    'bytes': self._total_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_response_cache(filepath, ttl=86400, max_bytes=100 * 1024 * 1024):
+    """Returns the ResponseCache for `filepath`, shared by all of the wrappers in this process."""
+    fp = os.path.abspath(os.path.expanduser(filepath))
+    with _CACHES_LOCK:
+        cache = _CACHES.get(fp)
+        if cache is None:
+            cache = ResponseCache(fp, ttl=ttl, max_bytes=max_bytes)
+            _CACHES[fp] = cache
+        return cache
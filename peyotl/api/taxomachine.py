@@ -2,7 +2,7 @@
 from peyotl.utility.dict_wrapper import FrozenDictAttrWrapper, FrozenDictWrapper
 from peyotl.api.taxon import TaxonWrapper, TaxonHolder
 from peyotl.utility import get_config_object, get_logger
-from peyotl.api.wrapper import _WSWrapper, APIWrapper
+from peyotl.api.wrapper import _WSWrapper, APIWrapper, _JSON_HEADERS
 import weakref
 import anyjson
 
@@ -87,6 +87,34 @@ class TNRSResponse(FrozenDictWrapper):
         return [k for k, v in self._raw_dict.items() if v is not _EMPTY_TUPLE]  # pylint: disable=E1101
 
 
+def perfect_ott_ids_from_tnrs_results(names, results):
+    """Returns a list of the OTT ID of the perfect, non-dubious match to each of `names`
+    in the `results` of a TNRS response.
+    Raises a ValueError if any name does not have exactly one such match.
+    """
+    d = {}
+    for blob in results:
+        query_name = blob["id"]
+        m = blob["matches"]
+        perf_ind = None
+        for i, poss_m in enumerate(m):
+            if (not poss_m['is_approximate_match']) and (not poss_m['is_dubious']):
+                if perf_ind is None:
+                    perf_ind = i
+                else:
+                    raise ValueError('Multiple matches for "{q}"'.format(q=query_name))
+        if perf_ind is None:
+            raise ValueError('No matches for "{q}"'.format(q=query_name))
+        d[query_name] = m[perf_ind]['ot:ottId']
+    ret = []
+    for query_name in names:
+        ni = d.get(query_name)
+        if ni is None:
+            raise ValueError('No matches for "{q}"'.format(q=query_name))
+        ret.append(ni)
+    return ret
+
+
 class _TaxomachineAPIWrapper(_WSWrapper):
     """Wrapper around interactions with the taxomachine TNRS.
     The primary service is TNRS (for taxonomic name resolution service)
@@ -143,6 +171,8 @@ class _TaxomachineAPIWrapper(_WSWrapper):
         parent taxon ?
         homonym finder ?
     """
+    _SERVICE_NAME = 'taxomachine'
+    _POST_IS_QUERY = True
 
     def TNRS(self,
              names,
@@ -278,6 +308,12 @@ class _TaxomachineAPIWrapper(_WSWrapper):
             self.prefix = '{d}/v2/tnrs'.format(d=d)
             self.taxonomy_prefix = '{d}/v2/taxonomy'.format(d=d)
 
+    def _fetch_cache_version(self):
+        if self.use_v1 or self._raw_urls:
+            return None
+        uri = '{p}/about'.format(p=self.taxonomy_prefix)
+        return self._do_uncached_http(uri, 'POST', headers=_JSON_HEADERS, params=None, data=None).get('version')
+
     def info(self):
         if self.use_v1:
             raise NotImplementedError('"about" method not implemented')
@@ -302,6 +338,19 @@ class _TaxomachineAPIWrapper(_WSWrapper):
             return TaxonWrapper(taxomachine_wrapper=self._wr, prop_dict=r)
         return r
 
+    def taxon_many(self, ott_ids, include_lineage=False, list_terminal_descendants=False, wrap_response=None,
+                   max_concurrency=None):
+        """Returns a list of the `taxon` responses for each of `ott_ids` (in the same order).
+        The calls are made concurrently (see `_WSWrapper.map_concurrently`).
+        """
+        def _taxon(ott_id):
+            return self.taxon(ott_id,
+                              include_lineage=include_lineage,
+                              list_terminal_descendants=list_terminal_descendants,
+                              wrap_response=wrap_response)
+
+        return self.map_concurrently(_taxon, ott_ids, max_concurrency=max_concurrency)
+
     def subtree(self, ott_id):
         if self.use_v1:
             raise NotImplementedError('"subtree" method not implemented')
@@ -347,28 +396,7 @@ class _TaxomachineAPIWrapper(_WSWrapper):
         Raises a ValueError if each name does not have exactly one perfect, non-dubious
         (score = 1.0) match in the TNRS results.
         """
-        results = self.TNRS(names, **kwargs)['results']
-        d = {}
-        for blob in results:
-            query_name = blob["id"]
-            m = blob["matches"]
-            perf_ind = None
-            for i, poss_m in enumerate(m):
-                if (not poss_m['is_approximate_match']) and (not poss_m['is_dubious']):
-                    if perf_ind is None:
-                        perf_ind = i
-                    else:
-                        raise ValueError('Multiple matches for "{q}"'.format(q=query_name))
-            if perf_ind is None:
-                raise ValueError('No matches for "{q}"'.format(q=query_name))
-            d[query_name] = m[perf_ind]['ot:ottId']
-        ret = []
-        for query_name in names:
-            ni = d.get(query_name)
-            if ni is None:
-                raise ValueError('No matches for "{q}"'.format(q=query_name))
-            ret.append(ni)
-        return ret
+        return perfect_ott_ids_from_tnrs_results(names, self.TNRS(names, **kwargs)['results'])
 
     def get_cached_parent_for_taxon(self, child_taxon):
         """If the taxa are being cached, this call will create a the lineage "spike" for taxon child_taxon
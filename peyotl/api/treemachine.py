@@ -1,6 +1,6 @@
 #!/usr/bin/env python
 from peyotl.utility import get_config_object, get_logger
-from peyotl.api.wrapper import _WSWrapper, APIWrapper
+from peyotl.api.wrapper import _WSWrapper, APIWrapper, _JSON_HEADERS
 from peyotl.api.study_ref import StudyRef
 from peyotl.api.taxon import TaxonWrapper, TaxonHolder
 import anyjson
@@ -186,6 +186,9 @@ class MRCAGoLNode(GoLNode):
 
 
 class _TreemachineAPIWrapper(_WSWrapper):
+    _SERVICE_NAME = 'treemachine'
+    _POST_IS_QUERY = True
+
     def __init__(self, domain, **kwargs):
         self._config = kwargs.get('config')
         if self._config is None:
@@ -231,6 +234,15 @@ class _TreemachineAPIWrapper(_WSWrapper):
                 self._current_synth_id = self._current_synth_info['tree_id']
         return self._current_synth_id
 
+    def _fetch_cache_version(self):
+        if self.use_v1:
+            uri = '{p}/getDraftTreeID'.format(p=self.prefix)
+            key = 'draftTreeName'
+        else:
+            uri = '{p}/about'.format(p=self.prefix)
+            key = 'tree_id'
+        return self._do_uncached_http(uri, 'POST', headers=_JSON_HEADERS, params=None, data=None).get(key)
+
     @property
     def synthetic_tree_info(self):
         if self.use_v1:
@@ -298,6 +310,23 @@ class _TreemachineAPIWrapper(_WSWrapper):
             data['ott_id'] = int(ott_id)
         return self.json_http_post_raise(uri, data=anyjson.dumps(data))
 
+    def node_info_many(self, node_ids=None, ott_ids=None, include_lineage=False, max_concurrency=None):
+        """Returns a list of the `node_info` responses for each of `node_ids` or of `ott_ids`
+        (in the same order). The calls are made concurrently (see `_WSWrapper.map_concurrently`).
+        """
+        if (node_ids is None) == (ott_ids is None):
+            raise ValueError('You must specify one of node_ids or ott_ids')
+        if node_ids is not None:
+            def _node_info(node_id):
+                return self.node_info(node_id=node_id, include_lineage=include_lineage)
+
+            return self.map_concurrently(_node_info, node_ids, max_concurrency=max_concurrency)
+
+        def _ott_node_info(ott_id):
+            return self.node_info(ott_id=ott_id, include_lineage=include_lineage)
+
+        return self.map_concurrently(_ott_node_info, ott_ids, max_concurrency=max_concurrency)
+
     def mrca(self, ott_ids=None, node_ids=None, wrap_response=False):
         if not (ott_ids or node_ids):
             raise ValueError('ott_ids or node_ids must be specified')
@@ -1,12 +1,23 @@
 #!/usr/bin/env python
 from peyotl.utility.str_util import UNICODE, is_str_type
 from peyotl.utility import get_config_object, get_logger
+from peyotl.api.response_cache import get_response_cache, response_cache_key
+from requests.adapters import HTTPAdapter
 import requests
-import warnings
 import codecs
 import anyjson
+import time
 import os
 
+try:
+    from urllib3.util.retry import Retry
+except ImportError:
+    from requests.packages.urllib3.util.retry import Retry  # pylint: disable=E0401
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:  # python 2 without the "futures" backport
+    ThreadPoolExecutor = None
+
 _LOG = get_logger(__name__)
 
 GZIP_REQUEST_HEADERS = {
@@ -259,9 +270,15 @@ class APIWrapper(object):
 
     @property
     def taxomachine(self):
-        from peyotl.api.taxomachine import _TaxomachineAPIWrapper
         if self._taxomachine is None:
-            self._taxomachine = _TaxomachineAPIWrapper(self.domains.taxomachine, config=self._config)
+            backend = self._config.get_config_setting('apis', 'taxomachine_backend', 'remote').lower()
+            if backend == 'local':
+                from peyotl.ott import OTT
+                from peyotl.ott.tnrs import LocalTNRS
+                self._taxomachine = LocalTNRS(OTT(config=self._config))
+            else:
+                from peyotl.api.taxomachine import _TaxomachineAPIWrapper
+                self._taxomachine = _TaxomachineAPIWrapper(self.domains.taxomachine, config=self._config)
         return self._taxomachine
 
     @property
@@ -464,17 +481,118 @@ def _http_method_summary_str(url, verb, headers, params, data=None):
     return fmt.format(v=verb, u=url, p=ps, h=hs, d=ds)
 
 
-_VERB_TO_METHOD_DICT = {
-    'GET': requests.get,
-    'POST': requests.post,
-    'PUT': requests.put,
-    'DELETE': requests.delete
-}
+# Responses with these status codes are retried (with backoff) by the session of a _WSWrapper.
+_RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# Verbs whose read errors and _RETRY_STATUS_CODES responses are retried. A write (PUT, DELETE, the
+#   POST of a service that is not _POST_IS_QUERY or a POST made with is_write=True) may have taken
+#   effect even if its response was lost or was a 5xx, so writes are only retried after connection errors.
+_RETRY_METHODS = ('GET', 'HEAD')
+
+
+def _create_retry(max_retries, backoff_factor, retry_post):
+    """Returns a urllib3 Retry. Connection errors are retried for every verb. Read errors and
+    the _RETRY_STATUS_CODES are only retried for GET and HEAD (and POST if `retry_post`).
+    """
+    methods = set(_RETRY_METHODS)
+    if retry_post:
+        methods.add('POST')
+    if hasattr(Retry, 'DEFAULT_ALLOWED_METHODS'):
+        methods_kwarg = 'allowed_methods'
+    else:  # urllib3 < 1.26
+        methods_kwarg = 'method_whitelist'
+    kwargs = {'total': max_retries,
+              'backoff_factor': backoff_factor,
+              'status_forcelist': _RETRY_STATUS_CODES,
+              'raise_on_status': False,
+              methods_kwarg: frozenset(methods)}
+    return Retry(**kwargs)
 
 
 class _WSWrapper(object):
+    """Base class of the web-service wrappers.
+    Each wrapper owns a requests.Session, so that connections to its domain are pooled and
+    kept alive between calls. The pool size, retries and the default number of concurrent
+    calls made by `map_concurrently` can be passed as kwargs, or read from the [apis]
+    section of the config (the setting prefixed by the service name is checked first, so
+    `taxomachine_http_pool_maxsize` overrides `http_pool_maxsize` for taxomachine):
+        http_pool_maxsize (default 10) - max # of kept-alive connections to the domain
+        http_max_retries (default 3) - # of retries of a failed call
+        http_backoff_factor (default 0.5) - seconds. Retry n sleeps backoff_factor*2^(n-1)
+        http_max_concurrency (default = http_pool_maxsize) - default for `map_concurrently`
+    The GET and POST responses of the query services (_POST_IS_QUERY) are cached on disk
+    (see peyotl.api.response_cache) if the http_cache setting is given. The POSTs of a query
+    service that change its data must be made with json_http_post(..., is_write=True), so that they
+    bypass the cache and are retried as writes.
+        http_cache (default None) - filepath of the cache. May be shared by all services
+        http_cache_ttl (default 86400) - seconds that a response stays in the cache
+        http_cache_max_mb (default 100) - size limit of the cache (least recently used are evicted)
+        http_cache_version_check (default 600) - seconds between checks of the service's data
+            version (see `_fetch_cache_version`). All of the service's responses are dropped
+            from the cache when the version changes.
+    """
+    # name of the service in the [apis] config section (used for the per-service settings)
+    _SERVICE_NAME = None
+    # True if the POST calls of the service are queries (so they can be retried and cached)
+    _POST_IS_QUERY = False
+
     def __init__(self, domain, **kwargs):  # pylint: disable=W0613
         self._domain = domain
+        config = kwargs.get('config')
+        if config is None:
+            config = get_config_object()
+        self._pool_maxsize = int(self._http_setting(kwargs, config, 'http_pool_maxsize', 10))
+        self._max_retries = int(self._http_setting(kwargs, config, 'http_max_retries', 3))
+        self._backoff_factor = float(self._http_setting(kwargs, config, 'http_backoff_factor', 0.5))
+        self._max_concurrency = int(self._http_setting(kwargs, config, 'http_max_concurrency', self._pool_maxsize))
+        self._session = None
+        self._write_session = None  # for the is_write POSTs of a _POST_IS_QUERY service
+        self._response_cache = None
+        cache_fp = self._http_setting(kwargs, config, 'http_cache', None)
+        if cache_fp and self._POST_IS_QUERY:
+            ttl = float(self._http_setting(kwargs, config, 'http_cache_ttl', 86400))
+            max_mb = float(self._http_setting(kwargs, config, 'http_cache_max_mb', 100))
+            self._response_cache = get_response_cache(cache_fp, ttl=ttl, max_bytes=int(max_mb * 1024 * 1024))
+        self._cache_version_check = float(self._http_setting(kwargs, config, 'http_cache_version_check', 600))
+        self._cache_version_checked = {}  # domain -> time of the last version check
+
+    def _http_setting(self, kwargs, config, name, default):
+        if name in kwargs:
+            return kwargs[name]
+        cascade = [('apis', name)]
+        if self._SERVICE_NAME:
+            cascade.insert(0, ('apis', '{s}_{n}'.format(s=self._SERVICE_NAME, n=name)))
+        return config.get_from_config_setting_cascade(cascade, default, warn_on_none_level=None)
+
+    def _create_session(self, retry_post):
+        session = requests.Session()
+        retry = _create_retry(self._max_retries, self._backoff_factor, retry_post)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_maxsize, max_retries=retry)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self._create_session(self._POST_IS_QUERY)
+        return self._session
+
+    @property
+    def write_session(self):
+        """The session for the is_write POSTs (the same as `session` unless the service is _POST_IS_QUERY)."""
+        if not self._POST_IS_QUERY:
+            return self.session
+        if self._write_session is None:
+            self._write_session = self._create_session(False)
+        return self._write_session
+
+    def close(self):
+        """Closes the pooled connections (a new session is created by the next call)."""
+        for session in (self._session, self._write_session):
+            if session is not None:
+                session.close()
+        self._session = None
+        self._write_session = None
 
     @property
     def endpoint(self):
@@ -482,31 +600,19 @@ class _WSWrapper(object):
 
     # pylint: disable=W0102
     def json_http_get(self, url, headers=_JSON_HEADERS, params=None, text=False):  # pylint: disable=W0102
-        # See https://github.com/kennethreitz/requests/issues/1882 for discussion of warning suppression
-        with warnings.catch_warnings():
-            try:
-                warnings.simplefilter("ignore", ResourceWarning)  # pylint: disable=E0602
-            except NameError:
-                pass  # on py2.7 we don't have ResourceWarning, but we don't need to filter...
-            return self._do_http(url, 'GET', headers=headers, params=params, data=None, text=text)
+        return self._do_http(url, 'GET', headers=headers, params=params, data=None, text=text)
 
     def json_http_put(self, url, headers=_JSON_HEADERS, params=None, data=None, text=False):  # pylint: disable=W0102
-        # See https://github.com/kennethreitz/requests/issues/1882 for discussion of warning suppression
-        with warnings.catch_warnings():
-            try:
-                warnings.simplefilter("ignore", ResourceWarning)  # pylint: disable=E0602
-            except NameError:
-                pass  # on py2.7 we don't have ResourceWarning, but we don't need to filter...
-            return self._do_http(url, 'PUT', headers=headers, params=params, data=data, text=text)
-
-    def json_http_post(self, url, headers=_JSON_HEADERS, params=None, data=None, text=False):  # pylint: disable=W0102
-        # See https://github.com/kennethreitz/requests/issues/1882 for discussion of warning suppression
-        with warnings.catch_warnings():
-            try:
-                warnings.simplefilter("ignore", ResourceWarning)  # pylint: disable=E0602
-            except NameError:
-                pass  # on py2.7 we don't have ResourceWarning, but we don't need to filter...
-            return self._do_http(url, 'POST', headers=headers, params=params, data=data, text=text)
+        return self._do_http(url, 'PUT', headers=headers, params=params, data=data, text=text)
+
+    def json_http_post(self, url, headers=_JSON_HEADERS, params=None, data=None, text=False,
+                       is_write=False):  # pylint: disable=W0102
+        """`is_write` should be True if the POST changes the data of the service (it is not cached or
+        retried after a 5xx or read error, even if the service is _POST_IS_QUERY).
+        """
+        if is_write:
+            return self._do_uncached_http(url, 'POST', headers, params, data, text=text, session=self.write_session)
+        return self._do_http(url, 'POST', headers=headers, params=params, data=data, text=text)
 
     def json_http_post_raise(self, url, headers=_JSON_HEADERS, params=None, data=None,
                              text=False):  # pylint: disable=W0102
@@ -516,20 +622,57 @@ class _WSWrapper(object):
         return r
 
     def json_http_delete(self, url, headers=_JSON_HEADERS, params=None, data=None, text=False):  # pylint: disable=W0102
-        # See https://github.com/kennethreitz/requests/issues/1882 for discussion of warning suppression
-        with warnings.catch_warnings():
-            try:
-                warnings.simplefilter("ignore", ResourceWarning)  # pylint: disable=E0602
-            except NameError:
-                pass  # on py2.7 we don't have ResourceWarning, but we don't need to filter...
-            return self._do_http(url, 'DELETE', headers=headers, params=params, data=data, text=text)
-
-    def _do_http(self, url, verb, headers, params, data, text=False):  # pylint: disable=R0201
+        return self._do_http(url, 'DELETE', headers=headers, params=params, data=data, text=text)
+
+    @property
+    def response_cache(self):
+        """The ResponseCache used by this wrapper (None if responses are not cached)."""
+        return self._response_cache
+
+    @property
+    def cache_stats(self):
+        """dict of the hit/miss/eviction counts of the response cache (None if there is no cache)."""
+        if self._response_cache is None:
+            return None
+        return self._response_cache.stats()
+
+    def _fetch_cache_version(self):
+        """Returns the version of the data served by the service (e.g. the taxonomy version).
+        Must not use the response cache. Services without a version just rely on the TTL.
+        """
+        return None
+
+    def _check_cache_version(self, service):
+        now = time.time()
+        prev = self._cache_version_checked.get(self.domain)
+        if prev is not None and now - prev < self._cache_version_check:
+            return
+        self._cache_version_checked[self.domain] = now
+        self._response_cache.check_version(service, self._fetch_cache_version())
+
+    def _do_http(self, url, verb, headers, params, data, text=False):
+        cache = self._response_cache
+        if cache is None or verb not in ('GET', 'POST'):
+            return self._do_uncached_http(url, verb, headers, params, data, text=text)
+        service = '{s}@{d}'.format(s=self._SERVICE_NAME, d=self.domain)
+        self._check_cache_version(service)
+        key = response_cache_key(verb, url, params, data)
+        body = cache.get(key)
+        if body is not None:
+            return body if text else anyjson.loads(body)
+        body = self._do_uncached_http(url, verb, headers, params, data, text=True)
+        r = body if text else anyjson.loads(body)
+        if text or not (isinstance(r, dict) and 'error' in r):
+            cache.put(key, service, body)
+        return r
+
+    def _do_uncached_http(self, url, verb, headers, params, data, text=False, session=None):
         if CURL_LOGGER is not None:
             log_request_as_curl(CURL_LOGGER, url, verb, headers, params, data)
-        func = _VERB_TO_METHOD_DICT[verb]
+        if session is None:
+            session = self.session
         try:
-            resp = func(url, params=params, headers=headers, data=data)
+            resp = session.request(verb, url, params=params, headers=headers, data=data)
         except requests.exceptions.ConnectionError:
             raise RuntimeError('Could not connect in call of {v} to "{u}"'.format(v=verb, u=url))
 
@@ -544,6 +687,21 @@ class _WSWrapper(object):
             return resp.text
         return resp.json()
 
+    def map_concurrently(self, func, items, max_concurrency=None):
+        """Returns the list [func(i) for i in items], computed with up to `max_concurrency`
+        (default http_max_concurrency) calls in flight at once over the pooled session.
+        If any call raises, the first exception (in the order of `items`) is re-raised.
+        Without concurrent.futures (python 2 without the "futures" package) the calls are sequential.
+        """
+        items = list(items)
+        if max_concurrency is None:
+            max_concurrency = self._max_concurrency
+        max_concurrency = min(max_concurrency, len(items))
+        if max_concurrency < 2 or ThreadPoolExecutor is None:
+            return [func(i) for i in items]
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(func, items))
+
     @property
     def domain(self):
         return self._domain
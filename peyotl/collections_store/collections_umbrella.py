@@ -9,17 +9,7 @@
 #
 from peyotl.utility import get_logger
 from peyotl.utility.str_util import slugify, increment_slug
-import json
-
-try:
-    import anyjson
-except:
-    class Wrapper(object):
-        pass
-
-
-    anyjson = Wrapper()
-    anyjson.loads = json.loads
+from peyotl.utility.json_backend import json_loads
 from peyotl.git_storage import ShardedDocStore, TypeAwareDocStore
 from peyotl.collections_store.collections_shard import TreeCollectionsShardProxy, TreeCollectionsShard
 from peyotl.collections_store.validation import validate_collection
@@ -273,9 +263,9 @@ class _TreeCollectionStore(TypeAwareDocStore):
             collection = json_repr
         else:
             try:
-                collection = anyjson.loads(json_repr)
+                collection = json_loads(json_repr)
             except:
-                _LOG.warn('> invalid JSON (failed anyjson parsing)')
+                _LOG.warn('> invalid JSON (failed parsing)')
                 return None
         return collection
 
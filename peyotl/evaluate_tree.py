@@ -1,20 +1,39 @@
 #!/usr/bin/env python
-from peyotl.ott import create_pruned_and_taxonomy_for_tip_ott_ids
-from peyotl.phylo.compat import compare_bits_as_splits, SplitComparison
+from peyotl.nexson_proxy import NexsonTreeProxy
+from peyotl.nexson_syntax import extract_tree_nexson
+from peyotl.ott import create_pruned_and_taxonomy_for_tip_ott_ids, OTT
+from peyotl.phylo.compat import classify_splits, SplitComparison, UnrootedConflictStatus
 from peyotl.utility import any_early_exit, get_logger
+from collections import deque, namedtuple
+import multiprocessing
+import json
+import time
+import os
 
 _LOG = get_logger(__name__)
+_UNROOTED_INCOMPATIBLE = SplitComparison.UNROOTED_INCOMPATIBLE.value
+_UNROOTED_COMPAT = SplitComparison.UNROOTED_COMPAT.value
+_ROOTED_COMPAT = SplitComparison.ROOTED_COMPAT.value
+_UNROOTED_EQUIVALENT = SplitComparison.UNROOTED_EQUIVALENT.value
+_ROOTED_EQUIVALENT = SplitComparison.ROOTED_EQUIVALENT.value
+
+# `taxa` are the OTT IDs of the taxa that are equivalent to the node's clade (for EQUIVALENT)
+#   or that conflict with it (for INCOMPATIBLE). Empty for the other statuses.
+NodeConflict = namedtuple('NodeConflict', ['status', 'taxa'])
+
+# Scores are (# of taxa displayed, # of taxa incompatible) pairs. `best_rootings` holds a
+#   ('node', ID) pair for rooting at a node and an ('edge', ID) pair for rooting on the edge
+#   from a node to its parent. The IDs of tips are OTT IDs (see create_pruned_and_taxonomy_for_tip_ott_ids).
+RootingEvaluation = namedtuple('RootingEvaluation', ['current_score', 'best_score', 'best_rootings'])
 
 
 def evaluate_tree_rooting(nexson, ott, tree_proxy):
     """
+    Returns a RootingEvaluation of the current rooting and the best rootings of `tree_proxy`.
     Returns None if the taxanomy contributes no information to the rooting decision
         (e.g. all of the tips are within one genus in the taxonomy)
-
-    TODO: need to coordinate with Jim Allman and see if we can
-    do this in a non- O(nm) manner (where n and m are the # of non-trivial edges in the phylo and taxo tree)
-    putting barrier notes on the phylo tree would work...
-
+    The internal edges of the tree are compared to the taxonomic splits in one batch by classify_splits.
+    Use evaluate_rootings_batch to evaluate the trees of many studies.
     """
     pruned_phylo, taxo_tree = create_pruned_and_taxonomy_for_tip_ott_ids(tree_proxy, ott)
     if taxo_tree is None:  # this can happen if no otus are mapped
@@ -48,6 +67,13 @@ def evaluate_tree_rooting(nexson, ott, tree_proxy):
     _LOG.debug('# nontrivial taxo splits = {}'.format(len(taxo_nontriv_splits)))
     _EMPTY_SET = frozenset([])
     non_root_pp_preorder = [nd for nd in pruned_phylo.preorder_node_iter()][1:]
+    # the comparisons of the internal edges to the taxonomic splits are done in one batch
+    taxo_split_items = list(taxo_nontriv_splits.items())
+    pp_internal = [nd for nd in non_root_pp_preorder if not nd.is_leaf]
+    pp_split_codes = classify_splits([nd.bits4subtree_ids for nd in pp_internal],
+                                     [tb for tb, tid in taxo_split_items],
+                                     taxon_mask)
+    pp_split_codes = iter(pp_split_codes)
     curr_root_incompat_set = set()
     any_root_incompat_set = set()
     _taxo_node_id_set_cache = {_EMPTY_SET: _EMPTY_SET}
@@ -77,30 +103,26 @@ def evaluate_tree_rooting(nexson, ott, tree_proxy):
                 if disp is not None:
                     edge._displays = disp
         else:
-            # TODO this could be more efficient...
-            b = node.bits4subtree_ids
             nii = set()
             ii = set()
             e = set()
             ie = set()
             displays = None
             inv_displays = None
-            # TODO: this loop does not take advantage of the fact that
-            #   taxo_nontriv_splits are splits from a tree (hence compatible with each other)
-            for tb, tid in taxo_nontriv_splits.items():
-                sp_result = compare_bits_as_splits(b, tb, taxon_mask)
-                if sp_result == SplitComparison.UNROOTED_INCOMPATIBLE:
+            # pp_internal is in the order of this loop
+            for (tb, tid), sp_result in zip(taxo_split_items, next(pp_split_codes)):
+                if sp_result == _UNROOTED_INCOMPATIBLE:
                     any_root_incompat_set.add(tid)
                     nii.add(tid)
                     ii.add(tid)
-                elif sp_result == SplitComparison.UNROOTED_COMPAT:
+                elif sp_result == _UNROOTED_COMPAT:
                     nii.add(tid)
-                elif sp_result == SplitComparison.ROOTED_COMPAT:
+                elif sp_result == _ROOTED_COMPAT:
                     ii.add(tid)
-                elif sp_result == SplitComparison.UNROOTED_EQUIVALENT:
+                elif sp_result == _UNROOTED_EQUIVALENT:
                     ie.add(tid)
                     inv_displays = tid
-                elif sp_result == SplitComparison.ROOTED_EQUIVALENT:
+                elif sp_result == _ROOTED_EQUIVALENT:
                     e.add(tid)
                     displays = tid
             edge._not_inverted_incompat = _get_cached_set(nii, _taxo_node_id_set_cache)
@@ -192,6 +214,14 @@ def evaluate_tree_rooting(nexson, ott, tree_proxy):
     _LOG.debug('best_rootings = {}'.format(best_rootings))
     _LOG.debug('current score = {}'.format(pproot.rooting_here_score))
     _LOG.debug('any_root_incompat_set (size={}) = {}'.format(len(any_root_incompat_set), any_root_incompat_set))
+    edge2node_id = dict((id(nd.edge), nd._id) for nd in non_root_pp_preorder)
+    best = []
+    for entity in best_rootings:
+        if id(entity) in edge2node_id:
+            best.append(('edge', edge2node_id[id(entity)]))
+        else:
+            best.append(('node', entity._id))
+    return RootingEvaluation(pproot.rooting_here_score, best_score, best)
 
 
 def _check_for_opt_score(entity, best, best_list):
@@ -216,3 +246,287 @@ def _check_for_opt_score(entity, best, best_list):
 def _get_cached_set(s, dict_frozensets):
     fs = frozenset(s)
     return dict_frozensets.setdefault(fs, fs)
+
+
+def tree_conflict(tree_proxy, ott):
+    """Compares each node of `tree_proxy` (a NexsonTreeProxy) to the taxonomy induced by
+    the OTT IDs of its tips. Returns a dict of node ID to NodeConflict, with the statuses:
+        TRIVIAL for tips and for nodes with one or all of the mapped tips,
+        NOT_COMPARABLE for nodes with no mapped tips (and unmapped tips),
+        EQUIVALENT if the mapped tips of the node are exactly those of a taxon,
+        RESOLVES if the node is compatible with the taxonomy, but not equivalent to a taxon,
+        INCOMPATIBLE if the mapped tips of the node overlap with those of some taxa without
+            either set including the other (the conflicting taxa are returned).
+    The tree is compared as rooted (see evaluate_tree_rooting for assessing other rootings).
+
+    Rather than comparing splits, each node is mapped to the LCA of its tips in the taxonomy.
+    The tips are numbered in the preorder of the taxonomy, so that each taxon holds a range of
+    numbers, and each boundary between adjacent numbers is assigned to the LCA of those
+    two tips. A node conflicts with the taxonomy iff one of the boundaries of its set of tips
+    falls within a taxon that is below the node's LCA. The boundaries of a node are the symmetric
+    difference of those of its children, so they are merged (smaller into larger) in postorder.
+    That is O(n log n) for n tips (plus the size of the output).
+    """
+    pruned_phylo, taxo_tree = create_pruned_and_taxonomy_for_tip_ott_ids(tree_proxy, ott)
+    index = tree_proxy.index
+    node_ids, parent, is_leaf = index.node_ids, index.parent, index.is_leaf
+    num_mapped = [int(bool(is_leaf[i]) and ott_id is not None) for i, ott_id in enumerate(index.ott_ids)]
+    for i in range(len(node_ids) - 1, 0, -1):
+        num_mapped[parent[i]] += num_mapped[i]
+    node_status = {}
+    if pruned_phylo is not None:
+        node_status = _pruned_tree_conflict(pruned_phylo, taxo_tree, ott)
+    _trivial = NodeConflict(UnrootedConflictStatus.TRIVIAL, [])
+    _not_comparable = NodeConflict(UnrootedConflictStatus.NOT_COMPARABLE, [])
+    result = {}
+    for i, nid in enumerate(node_ids):
+        if is_leaf[i]:
+            result[nid] = _trivial if num_mapped[i] else _not_comparable
+        elif num_mapped[i] == 0:
+            result[nid] = _not_comparable
+        else:
+            try:
+                pnd = pruned_phylo.find_node(nid)
+            except KeyError:
+                pnd = None  # above the root of the pruned tree (so, with all of the mapped tips)
+            result[nid] = _trivial if pnd is None else node_status.get(pnd._id, _trivial)
+    return result
+
+
+def _pruned_tree_conflict(pruned_phylo, taxo_tree, ott):
+    """Returns a dict of the ID of each non-trivial internal node of `pruned_phylo` to its NodeConflict.
+    See tree_conflict.
+    """
+    tip_ids = set(pruned_phylo.leaf_id_iter())
+    # The path of an edge of taxo_tree can hold tips (e.g. a tip mapped to a genus that is also the
+    #   MRCA of other tips), and each tip in the path has a larger clade than the taxa below it. So, the
+    #   "clades" used here are the segments of the paths (root-most ID first) that end at a tip.
+    #   The tips are numbered in the preorder of the clades, and each clade holds the range [lo, hi).
+    clade_taxa, clade_par, depth, lo, hi = [], [], [], [], []
+    tip_index = {}
+    clade_of_id = {}
+    bottom_clade = {}
+    for nd in taxo_tree.preorder_node_iter():
+        par = -1 if nd._parent is None else bottom_clade[nd._parent]
+        segment = []
+        path = list(reversed(nd._path_ids))
+        for n, i in enumerate(path):
+            segment.append(i)
+            if i in tip_ids or n == len(path) - 1:
+                c = len(clade_taxa)
+                clade_taxa.append(segment)
+                clade_par.append(par)
+                depth.append(0 if par < 0 else 1 + depth[par])
+                lo.append(len(tip_index))
+                hi.append(None)
+                for j in segment:
+                    clade_of_id[j] = c
+                if i in tip_ids:
+                    tip_index[i] = len(tip_index)
+                segment = []
+                par = c
+        bottom_clade[nd] = par
+    num_clades, num_tips = len(clade_taxa), len(tip_index)
+    # boundary_lca[i] is the clade that is the LCA of the tips numbered i and i+1. It is the
+    #   parent of the clade that holds tip i+1, if that clade starts at i+1 (and otherwise, that clade).
+    for c in range(num_clades - 1, -1, -1):
+        if hi[c] is None:
+            hi[c] = lo[c] + 1
+        p = clade_par[c]
+        if p >= 0 and (hi[p] is None or hi[p] < hi[c]):
+            hi[p] = hi[c]
+    boundary_lca = [None] * max(0, num_tips - 1)
+    for c in range(num_clades):
+        p = clade_par[c]
+        if p >= 0 and lo[c] > 0 and lo[c] > lo[p]:
+            boundary_lca[lo[c] - 1] = p
+    ac = ott.array_cache
+    ott_ids = ac.sorted_ott_ids
+    lca_row = {}
+    num_tips_below = {}
+    boundaries = {}  # node ID -> set of the boundary #'s of its tips
+    boundary_taxa = {}  # node ID -> dict of taxon -> # of the node's boundaries that have that LCA
+    result = {}
+    for nd in pruned_phylo.postorder_node_iter():
+        nid = nd._id
+        if nd.is_leaf:
+            x = tip_index[nid]
+            lca_row[nid] = ac.row(nid)
+            num_tips_below[nid] = 1
+            b = set([i for i in (x - 1, x) if 0 <= i < num_tips - 1])
+            bt = {}
+            for i in b:
+                t = boundary_lca[i]
+                bt[t] = 1 + bt.get(t, 0)
+            boundaries[nid], boundary_taxa[nid] = b, bt
+            continue
+        children = [c._id for c in nd._children]
+        row = lca_row.pop(children[0])
+        for c in children[1:]:
+            row = ac.lca_row(row, lca_row.pop(c))
+        lca_row[nid] = row
+        num_tips_below[nid] = sum([num_tips_below.pop(c) for c in children])
+        # merge the boundaries of the children (smaller into larger)
+        children.sort(key=lambda c: -len(boundaries[c]))
+        b, bt = boundaries.pop(children[0]), boundary_taxa.pop(children[0])
+        for c in children[1:]:
+            boundary_taxa.pop(c)
+            for i in boundaries.pop(c):
+                t = boundary_lca[i]
+                if i in b:
+                    b.remove(i)
+                    if bt[t] == 1:
+                        del bt[t]
+                    else:
+                        bt[t] -= 1
+                else:
+                    b.add(i)
+                    bt[t] = 1 + bt.get(t, 0)
+        boundaries[nid], boundary_taxa[nid] = b, bt
+        n = num_tips_below[nid]
+        if n <= 1 or n == num_tips:
+            continue
+        lca = clade_of_id[ott_ids[row]]
+        # the boundaries just outside of the range of the LCA have LCAs above it
+        num_outside = int(lo[lca] - 1 in b) + int(hi[lca] - 1 in b and hi[lca] < num_tips)
+        if len(b) - num_outside == bt.get(lca, 0):
+            if n == hi[lca] - lo[lca]:
+                result[nid] = NodeConflict(UnrootedConflictStatus.EQUIVALENT, clade_taxa[lca][::-1])
+            else:
+                result[nid] = NodeConflict(UnrootedConflictStatus.RESOLVES, [])
+            continue
+        conflicting = set()
+        lca_depth = depth[lca]
+        for t in bt:
+            while depth[t] > lca_depth and t not in conflicting:
+                conflicting.add(t)
+                t = clade_par[t]
+        taxa = []
+        for t in conflicting:
+            taxa.extend(clade_taxa[t])
+        taxa.sort()
+        result[nid] = NodeConflict(UnrootedConflictStatus.INCOMPATIBLE, taxa)
+    return result
+
+
+def iter_study_trees(study_objs):
+    """Yields a (study_id, tree_id, tree, otus) tuple for each tree in the (study_id, nexson) pairs
+    of `study_objs` (e.g. phylesystem.iter_study_objs()). `tree` and `otus` are in the by-ID
+    HoneyBadgerFish form used by NexsonTreeProxy.
+    """
+    for study_id, nexson in study_objs:
+        try:
+            trees = extract_tree_nexson(nexson, tree_id=None)
+        except Exception as x:
+            _LOG.warning('Could not extract the trees of study "{}": {}'.format(study_id, x))
+            continue
+        for tree_id, tree, otus in trees:
+            yield study_id, tree_id, tree, otus
+
+
+def evaluate_rootings_batch(study_objs, ott_dir, out_filepath, num_workers=None):
+    """Calls evaluate_tree_rooting for each tree in the (study_id, nexson) pairs of `study_objs`
+    (e.g. phylesystem.iter_study_objs()), and appends one JSON object per tree (one per line) to
+    `out_filepath` as the results arrive. Each object has the "study_id", "tree_id", the "seconds"
+    spent on the tree, and either the "rooting" (the RootingEvaluation, or null if the taxonomy is
+    uninformative) or an "error" message.
+    The output is the checkpoint: trees that are already in `out_filepath` are skipped, so an
+    interrupted run resumes where it stopped.
+    The trees are sent to a pool of `num_workers` processes (default = the # of CPUs; 1 for no pool).
+    Each worker opens the OTT in `ott_dir` (None for the directory in the config) once, and its
+    arrays are mmap-ed read-only, so the workers share one copy of the taxonomy in memory.
+    Returns the number of trees evaluated.
+    """
+    done = _read_rooting_checkpoint(out_filepath)
+    if done:
+        _LOG.info('Resuming: {} trees in "{}" will be skipped'.format(len(done), out_filepath))
+    tasks = (t for t in iter_study_trees(study_objs) if (t[0], t[1]) not in done)
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    # opening the OTT here builds any missing caches before the workers need them
+    _init_rooting_worker(ott_dir)
+    num_evaluated, total_seconds = 0, 0.0
+    pool = None
+    if num_workers > 1:
+        pool = multiprocessing.Pool(num_workers, _init_rooting_worker, (ott_dir,))
+        results = _bounded_imap(pool, _evaluate_rooting_task, tasks, 4 * num_workers)
+    else:
+        results = (_evaluate_rooting_task(t) for t in tasks)
+    try:
+        with open(out_filepath, 'a') as out:
+            for record in results:
+                out.write(json.dumps(record, sort_keys=True))
+                out.write('\n')
+                out.flush()
+                num_evaluated += 1
+                total_seconds += record['seconds']
+                _LOG.debug('{s} {t}: {x:.3f} sec'.format(s=record['study_id'], t=record['tree_id'],
+                                                          x=record['seconds']))
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    _LOG.info('{n} trees evaluated in {x:.1f} sec of worker time'.format(n=num_evaluated, x=total_seconds))
+    return num_evaluated
+
+
+_ROOTING_WORKER_OTT = None
+
+
+def _init_rooting_worker(ott_dir):
+    global _ROOTING_WORKER_OTT
+    if _ROOTING_WORKER_OTT is None or _ROOTING_WORKER_OTT.ott_dir != ott_dir:
+        _ROOTING_WORKER_OTT = OTT(ott_dir=ott_dir)
+    _ROOTING_WORKER_OTT.array_cache  # pylint: disable=W0104
+
+
+def _evaluate_rooting_task(task):
+    study_id, tree_id, tree, otus = task
+    record = {'study_id': study_id, 'tree_id': tree_id}
+    start = time.time()
+    try:
+        tree_proxy = NexsonTreeProxy(tree=tree, tree_id=tree_id, otus=otus)
+        rooting = evaluate_tree_rooting(None, _ROOTING_WORKER_OTT, tree_proxy)
+        record['rooting'] = None if rooting is None else dict(rooting._asdict())
+    except Exception as x:
+        record['error'] = '{}: {}'.format(type(x).__name__, x)
+    record['seconds'] = time.time() - start
+    return record
+
+
+def _bounded_imap(pool, func, tasks, max_pending):
+    """Like pool.imap, but does not read more than `max_pending` tasks ahead of the results
+    (pool.imap consumes all of `tasks` as fast as it can, which would hold every study in memory).
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _read_rooting_checkpoint(out_filepath):
+    """Returns the set of (study_id, tree_id) pairs in the output of an earlier run.
+    The file is truncated at the first incomplete or invalid line (e.g. from a killed run).
+    """
+    done = set()
+    if not os.path.exists(out_filepath):
+        return done
+    num_good_bytes = 0
+    with open(out_filepath, 'rb') as inp:
+        for line in inp:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line.decode('utf-8'))
+                done.add((record['study_id'], record['tree_id']))
+            except (ValueError, KeyError, TypeError):
+                break
+            num_good_bytes += len(line)
+    if num_good_bytes < os.path.getsize(out_filepath):
+        _LOG.warning('Discarding the output after byte {} of "{}"'.format(num_good_bytes, out_filepath))
+        with open(out_filepath, 'r+b') as outp:
+            outp.truncate(num_good_bytes)
+    return done
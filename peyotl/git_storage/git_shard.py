@@ -2,19 +2,10 @@
    Subclasses will accommodate each type."""
 import os
 import codecs
-try:
-    import anyjson
-except:
-    import json
-    class Wrapper(object):
-        pass
-
-    anyjson = Wrapper()
-    anyjson.loads = json.loads
-
 from threading import Lock
 from peyotl.utility import get_logger, write_to_filepath
 from peyotl.utility.input_output import read_as_json, write_as_json
+from peyotl.utility.json_backend import json_loads
 
 
 class FailedShardCreationError(ValueError):
@@ -221,9 +212,9 @@ class TypeAwareGitShard(GitShard):
             for doc_id, fp in self.iter_doc_filepaths(**kwargs):
                 if not self._is_alias(doc_id):
                     # TODO:hook for type-specific parser?
-                    with codecs.open(fp, 'r', 'utf-8') as fo:
+                    with open(fp, 'rb') as fo:
                         try:
-                            nex_obj = anyjson.loads(fo.read())
+                            nex_obj = json_loads(fo.read())
                             yield (doc_id, nex_obj)
                         except Exception:
                             pass
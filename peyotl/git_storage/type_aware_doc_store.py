@@ -8,20 +8,10 @@ try:
     from cStringIO import StringIO
 except ImportError:
     from io import StringIO
-import json
-
-try:
-    import anyjson
-except:
-    class Wrapper(object):
-        pass
-
-
-    anyjson = Wrapper()
-    anyjson.loads = json.loads
 from peyotl.git_storage import ShardedDocStore
 from peyotl.git_storage.git_shard import FailedShardCreationError
 from peyotl.utility import get_logger
+from peyotl.utility.json_backend import json_loads
 
 _LOG = get_logger(__name__)
 
@@ -196,7 +186,7 @@ class TypeAwareDocStore(ShardedDocStore):
             content = blob[0]
             if content is None:
                 raise KeyError('Document {} not found'.format(doc_id))
-            nexson = anyjson.loads(blob[0])
+            nexson = json_loads(blob[0])
             if return_WIP_map:
                 return nexson, blob[1], blob[2]
             return nexson, blob[1]
@@ -18,6 +18,7 @@ from peyotl.nexson_syntax import (BY_ID_HONEY_BADGERFISH,
 from peyotl.utility.str_util import is_str_type
 from peyotl.utility import get_logger
 import weakref
+import array
 
 _LOG = get_logger(__name__)
 
@@ -77,6 +78,91 @@ def reverse_edge_by_source_dict(ebs, root_id):
     return d
 
 
+class NexsonTreeIndex(object):
+    """Materialized topology of a NexSON 1.2 tree, built in O(n) (see NexsonTreeProxy.index).
+    Nodes are numbered in preorder (children in the order of the edgeBySourceId dict), so the
+    root is 0. For the node numbered i:
+        node_ids[i] and edge_ids[i] are the IDs of the node and of its edge to its parent (None for the root),
+        parent[i] is the number of the parent (-1 for the root),
+        children[child_offsets[i]:child_offsets[i + 1]] are the numbers of its children,
+        is_leaf[i] is 1 for leaves (and 0 otherwise),
+        subtree_end[i] is 1 + the number of the last node in its subtree,
+        ott_ids[i] is the OTT ID of the otu of the node (None if the node has no mapped otu).
+    node_index maps node ID to number.
+    """
+
+    def __init__(self, tree, otus):
+        edge_by_source = tree['edgeBySourceId']
+        node_by_id = tree['nodeById']
+        root_id = tree['^ot:rootNodeId']
+        node_ids, edge_ids, parent = [], [], []
+        todo = [(root_id, None, -1)]
+        while todo:
+            node_id, edge_id, par = todo.pop()
+            parent.append(par)
+            node_ids.append(node_id)
+            edge_ids.append(edge_id)
+            outgoing = edge_by_source.get(node_id)
+            if outgoing:
+                i = len(node_ids) - 1
+                todo.extend([(e['@target'], eid, i) for eid, e in reversed(list(outgoing.items()))])
+        n = len(node_ids)
+        # the arrays are filled as lists (which are faster to index) and then converted
+        num_children = [0] * n
+        for p in parent[1:]:
+            num_children[p] += 1
+        child_offsets = [0] * (n + 1)
+        total = 0
+        for i, c in enumerate(num_children):
+            total += c
+            child_offsets[i + 1] = total
+        next_slot = child_offsets[:n]
+        children = [0] * max(0, n - 1)
+        for i in range(1, n):
+            p = parent[i]
+            children[next_slot[p]] = i
+            next_slot[p] += 1
+        subtree_end = list(range(1, n + 1))
+        for i in range(n - 1, 0, -1):
+            p = parent[i]
+            if subtree_end[p] < subtree_end[i]:
+                subtree_end[p] = subtree_end[i]
+        ott_ids = []
+        for node_id in node_ids:
+            otu_id = node_by_id[node_id].get('@otu')
+            ott_ids.append(None if otu_id is None else otus[otu_id].get('^ot:ottId'))
+        self.node_ids = node_ids
+        self.edge_ids = edge_ids
+        self.parent = array.array('i', parent)
+        self.child_offsets = array.array('i', child_offsets)
+        self.children = array.array('i', children)
+        self.is_leaf = bytearray([c == 0 for c in num_children])
+        self.subtree_end = array.array('i', subtree_end)
+        self.ott_ids = ott_ids
+        self.node_index = dict((node_id, i) for i, node_id in enumerate(node_ids))
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def child_indices(self, i):
+        return self.children[self.child_offsets[i]:self.child_offsets[i + 1]]
+
+    def preorder(self, i=0):
+        """Iterates over the numbers of the nodes in the subtree of node `i` in preorder."""
+        return iter(range(i, self.subtree_end[i]))
+
+    def postorder(self, i=0):
+        """Iterates over the numbers of the nodes in the subtree of node `i` in postorder."""
+        subtree_end = self.subtree_end
+        stack = []
+        for j in range(i, subtree_end[i]):
+            while stack and subtree_end[stack[-1]] <= j:
+                yield stack.pop()
+            stack.append(j)
+        while stack:
+            yield stack.pop()
+
+
 class NexsonProxy(object):
     class NexsonOTUProxy(object):
         def __init__(self, nexson_proxy, otu_id, otu):
@@ -194,6 +280,7 @@ class NexsonTreeProxy(object):
 
         def __setitem__(self, key, value):
             self.node[key] = value
+            self._tree.invalidate_index()
 
         def keys(self):
             return self.node.keys()
@@ -271,6 +358,8 @@ class NexsonTreeProxy(object):
         self._tree_id = tree_id
         # not part of nexson, filled on demand. will be dict of node_id -> (edge_id, edge) pair
         self._edge_by_target = None
+        # not part of nexson, filled on demand. NexsonTreeIndex
+        self._index = None
         self._wr = None
         self._node_cache = {}
 
@@ -293,6 +382,22 @@ class NexsonTreeProxy(object):
 
     def __setitem__(self, key, value):
         self._nexson_tree[key] = value
+        self._edge_by_source_id = self._nexson_tree['edgeBySourceId']
+        self._node_by_source_id = self._nexson_tree['nodeById']
+        self.invalidate_index()
+
+    @property
+    def index(self):
+        """Returns the NexsonTreeIndex of this tree (built on the first call after an edit)."""
+        if self._index is None:
+            self._index = NexsonTreeIndex(self._nexson_tree, self._otus)
+        return self._index
+
+    def invalidate_index(self):
+        """Discards the cached index and edge_by_target. Called by the editing methods of the proxies;
+        call it after editing the NexSON of the tree (or its otus) directly."""
+        self._index = None
+        self._edge_by_target = None
 
     @property
     def edge_by_target(self):
@@ -333,6 +438,7 @@ class NexsonTreeProxy(object):
 
     def annotate(self, obj, key, value):
         obj[key] = value
+        self.invalidate_index()
 
     def __iter__(self):
         return iter(nexson_tree_preorder_iter(self))
@@ -382,7 +488,7 @@ def nexson_tree_preorder_iter(tree_proxy, node_id=None, node=None, edge_id=None,
         root = nbid[root_id]
         yield tree_proxy._create_node_proxy_from_edge(None, None, node_id=root_id, node=root)
     stack = []
-    new_stack = [(i['@target'], edge_id, i) for edge_id, i in ebsid[root_id].items()]
+    new_stack = [(i['@target'], edge_id, i) for edge_id, i in ebsid.get(root_id, {}).items()]
     stack.extend(new_stack)
     while stack:
         target_node_id, edge_id, edge = stack.pop()
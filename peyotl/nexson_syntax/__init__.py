@@ -34,11 +34,13 @@ from peyotl.nexson_syntax.optimal2direct_nexson import Optimal2DirectNexson
 from peyotl.nexson_syntax.direct2optimal_nexson import Direct2OptimalNexson
 from peyotl.nexson_syntax.badgerfish2direct_nexson import Badgerfish2DirectNexson
 from peyotl.nexson_syntax.direct2badgerfish_nexson import Direct2BadgerfishNexson
+from peyotl.nexson_syntax.badgerfish2optimal_nexson import Badgerfish2OptimalNexson
+from peyotl.nexson_syntax.optimal2badgerfish_nexson import Optimal2BadgerfishNexson
 from peyotl.nexson_syntax.nexson2nexml import Nexson2Nexml
 from peyotl.nexson_syntax.nexml2nexson import Nexml2Nexson
+from peyotl.nexson_syntax.lazy_nexson import LazyNexson
 from peyotl.nexson_syntax.inspect import count_num_trees
 from peyotl.utility import get_logger
-import xml.dom.minidom
 import codecs
 import re
 
@@ -50,6 +52,8 @@ _CONVERTIBLE_FORMATS = frozenset([NEXML_NEXSON_VERSION,
                                   '1.0',
                                   '1.2', ])
 _LOG = get_logger(__name__)
+# number of characters of a NeXML file that are read (and parsed) at a time
+_NEXML_READ_CHUNK_SIZE = 1 << 16
 
 
 def iter_otu(nexson, nexson_version=None):
@@ -428,6 +432,14 @@ class PhyloSchema(object):
         else:
             assert False
 
+    def _can_convert_lazily(self):
+        """True if convert only needs the parts of a LazyNexson that its methods decode."""
+        if self.format_code == PhyloSchema.NEXSON:
+            if self.content == 'tree':
+                return not self.cull_nonmatching
+            return self.content in ('subtree', 'meta', 'otus', 'otu', 'otumap', 'treelist')
+        return self.format_code in (PhyloSchema.NEWICK, PhyloSchema.NEXUS)
+
     def serialize(self, src, output_dest=None, src_schema=None):
         return self.convert(src, serialize=True, output_dest=output_dest, src_schema=src_schema)
 
@@ -443,6 +455,8 @@ class PhyloSchema(object):
             raise NotImplementedError(m)
         if src_format != PhyloSchema.NEXSON:
             raise NotImplementedError('Only conversion from NexSON is currently supported')
+        if isinstance(src, LazyNexson) and not self._can_convert_lazily():
+            src = src.get_nexson()
         if self.format_code == PhyloSchema.NEXSON:
             d = src
             if self.content == 'study':
@@ -469,7 +483,10 @@ class PhyloSchema(object):
                         i, t = ito_tup[0], ito_tup[1]
                         d[i] = t
             elif self.content == 'meta':
-                strip_to_meta_only(d, current_format)
+                if isinstance(d, LazyNexson):
+                    d = d.get_meta_only_nexson()
+                else:
+                    strip_to_meta_only(d, current_format)
             elif self.content == 'otus':
                 d = extract_otus_nexson(d, self.content_id, current_format)
             elif self.content == 'otu':
@@ -534,6 +551,15 @@ class PhyloSchema(object):
         assert False
 
 
+def _iter_utf8_chunks(file_obj, chunk_size=_NEXML_READ_CHUNK_SIZE):
+    """Yields the content of a text-mode `file_obj` as UTF-8 encoded chunks."""
+    while True:
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk.encode('utf-8')
+
+
 def get_ot_study_info_from_nexml(src=None,
                                  nexml_content=None,
                                  encoding=u'utf8',
@@ -561,23 +587,20 @@ def get_ot_study_info_from_nexml(src=None,
         nsv = DIRECT_HONEY_BADGERFISH
     else:
         nsv = nexson_syntax_version
-    if nexml_content is None:
-        if is_str_type(src):
-            if src.startswith('http://') or src.startswith('https://'):
-                from peyotl.utility import download
-                nexml_content = download(url=src, encoding=encoding)
-                nexml_content = nexml_content.encode('utf-8')
-            else:
-                with codecs.open(src, 'r', encoding=encoding) as src:
-                    nexml_content = src.read().encode('utf-8')
-        else:
-            nexml_content = src.read().encode('utf-8')
-    doc = xml.dom.minidom.parseString(nexml_content)
-    doc_root = doc.documentElement
-
     ccfg = ConversionConfig(output_format=nsv, input_format=NEXML_NEXSON_VERSION)
     converter = Nexml2Nexson(ccfg)
-    o = converter.convert(doc_root)
+    if nexml_content is not None:
+        o = converter.convert_stream([nexml_content])
+    elif is_str_type(src):
+        if src.startswith('http://') or src.startswith('https://'):
+            from peyotl.utility import download
+            nexml_content = download(url=src, encoding=encoding)
+            o = converter.convert_stream([nexml_content.encode('utf-8')])
+        else:
+            with codecs.open(src, 'r', encoding=encoding) as fo:
+                o = converter.convert_stream(_iter_utf8_chunks(fo))
+    else:
+        o = converter.convert_stream(_iter_utf8_chunks(src))
     if _is_by_id_hbf(nexson_syntax_version):
         o = convert_nexson_format(o, BY_ID_HONEY_BADGERFISH, current_format=nsv)
     if 'nex:nexml' in o:
@@ -609,8 +632,7 @@ def write_obj_as_nexml(obj_dict,
                             use_default_root_atts=use_default_root_atts,
                             otu_label=otu_label)
     converter = Nexson2Nexml(ccfg)
-    doc = converter.convert(obj_dict)
-    doc.writexml(file_obj, addindent=addindent, newl=newl, encoding='utf-8')
+    converter.write(obj_dict, file_obj, addindent=addindent, newl=newl, encoding='utf-8')
 
 
 def convert_to_nexml(obj_dict, addindent='', newl='', use_default_root_atts=True, otu_label='ot:originalLabel'):
@@ -669,8 +691,8 @@ def convert_nexson_format(blob,
         return blob
     two2zero = _is_by_id_hbf(out_nexson_format) and _is_badgerfish_version(current_format)
     zero2two = _is_by_id_hbf(current_format) and _is_badgerfish_version(out_nexson_format)
-    if two2zero or zero2two:
-        # go from 0.0 -> 1.0 then the 1.0->1.2 should succeed without nexml...
+    if (two2zero or zero2two) and not remove_old_structs:
+        # the "fat" form is only produced by going from 0.0 -> 1.0 then the 1.0->1.2
         blob = convert_nexson_format(blob,
                                      DIRECT_HONEY_BADGERFISH,
                                      current_format=current_format,
@@ -682,7 +704,11 @@ def convert_nexson_format(blob,
               'remove_old_structs': remove_old_structs,
               'pristine_if_invalid': pristine_if_invalid}
     ccfg = ConversionConfig(ccdict)
-    if _is_badgerfish_version(current_format):
+    if _is_badgerfish_version(current_format) and _is_by_id_hbf(out_nexson_format):
+        converter = Badgerfish2OptimalNexson(ccfg)
+    elif _is_by_id_hbf(current_format) and _is_badgerfish_version(out_nexson_format):
+        converter = Optimal2BadgerfishNexson(ccfg)
+    elif _is_badgerfish_version(current_format):
         converter = Badgerfish2DirectNexson(ccfg)
     elif _is_badgerfish_version(out_nexson_format):
         assert _is_direct_hbf(current_format)
@@ -826,6 +852,10 @@ def get_empty_nexson(vers='1.2.1', include_cc0=False):
 _EMPTY_TUPLE = tuple
 NEWICK_NEEDING_QUOTING = re.compile(r'(\s|[\[\]():,;])')
 NEXUS_NEEDING_QUOTING = re.compile(r'(\s|[-()\[\]{}/\,;:=*"`+<>])')
+# number of strings that nexson_frag_write_newick accumulates before writing them
+_NEWICK_CHUNK_SIZE = 1 << 16
+_NOT_YET_QUOTED = object()
+_CLOSE_NODE = object()
 
 
 def quote_newick_name(s, needs_quotes_pattern=NEWICK_NEEDING_QUOTING):
@@ -837,60 +867,11 @@ def quote_newick_name(s, needs_quotes_pattern=NEWICK_NEEDING_QUOTING):
     return s
 
 
-def _write_newick_leaf_label(out, node_id, node, otu_group, label_key, leaf_labels, unlabeled_counter, needs_quotes_pattern):
-    """
-    `label_key` is a string (a key in the otu object) or a callable that takes two arguments: the node, and the otu
-    If `leaf_labels` is not None, it shoulr be a (list, dict) pair which will be filled. The list will
-        hold the order encountered,
-        and the dict will map name to index in the list
-    """
-    otu_id = node['@otu']
-    otu = otu_group[otu_id]
-    if is_str_type(label_key):
-        label = otu.get(label_key)
-        if label is None:
-            unlabeled_counter += 1
-            o = otu.get('^ot:originalLabel', '<unknown>')
-            label = "'*tip #{n:d} not mapped to OTT. Original label - {o}'"
-            label = label.format(n=unlabeled_counter, o=o)
-        else:
-            label = quote_newick_name(label, needs_quotes_pattern)
-    else:
-        label = quote_newick_name(label_key(node_id, node, otu), needs_quotes_pattern)
-    if leaf_labels is not None:
-        if label not in leaf_labels[1]:
-            leaf_labels[1][label] = len(leaf_labels[0])
-            leaf_labels[0].append(label)
-    out.write(label)
-    return unlabeled_counter
-
-
-def _write_newick_internal_label(out, node_id, node, otu_group, label_key, needs_quotes_pattern):
-    """`label_key` is a string (a key in the otu object) or a callable that takes two arguments:
-        the node, and the otu (which may be None for an internal node)
-    If `leaf_labels` is not None, it shoulr be a (list, dict) pair which will be filled. The list will
-        hold the order encountered,
-        and the dict will map name to index in the list
-    """
-    otu_id = node.get('@otu')
-    if is_str_type(label_key):
-        if otu_id is None:
-            return
-        otu = otu_group[otu_id]
-        label = otu.get(label_key)
-    else:
-        label = label_key(node_id, node, None)
-    if label is not None:
-        label = quote_newick_name(label, needs_quotes_pattern)
-        out.write(label)
-
-
-def _write_newick_edge_len(out, edge):
-    if edge is None:
-        return
-    e_len = edge.get('@length')
-    if e_len is not None:
-        out.write(':{e}'.format(e=e_len))
+def _quoted_otu_label(otu, label_key, needs_quotes_pattern):
+    label = otu.get(label_key)
+    if label is None:
+        return None
+    return quote_newick_name(label, needs_quotes_pattern)
 
 
 def convert_tree_to_newick(tree,
@@ -899,12 +880,15 @@ def convert_tree_to_newick(tree,
                            leaf_labels,
                            needs_quotes_pattern=NEWICK_NEEDING_QUOTING,
                            subtree_id=None,
-                           bracket_ingroup=False):
+                           bracket_ingroup=False,
+                           quoted_label_memo=None):
     """`label_key` is a string (a key in the otu object) or a callable that takes two arguments:
         the node, and the otu (which may be None for an internal node)
     If `leaf_labels` is not None, it shoulr be a (list, dict) pair which will be filled. The list will
         hold the order encountered,
         and the dict will map name to index in the list
+    `quoted_label_memo` is a dict of otu ID to quoted label (or None) that can be shared by the
+        trees of an otu group, so that each label is quoted once.
     """
     assert (not is_str_type(label_key)) or (label_key in PhyloSchema._NEWICK_PROP_VALS)  # pylint: disable=W0212
     ingroup_node_id = tree.get('^ot:inGroupClade')
@@ -930,44 +914,69 @@ def convert_tree_to_newick(tree,
                              root_id,
                              needs_quotes_pattern=needs_quotes_pattern,
                              ingroup_id=ingroup_node_id,
-                             bracket_ingroup=bracket_ingroup)
+                             bracket_ingroup=bracket_ingroup,
+                             quoted_label_memo=quoted_label_memo)
     flush_utf_8_writer(out)
     return sio.getvalue()
 
 def get_subtree_otus(nexson, tree_id, subtree_id=None, return_format='otu_id'):
-    assert(return_format in ['otu_id', 'ottid'])
-    tree = extract_tree_nexson(nexson, tree_id)[0][1]
-    ingroup_node_id = tree.get('^ot:inGroupClade')
+    """Returns the set of otu IDs (or OTT IDs if `return_format` is "ottid") of the leaves of the
+    subtree rooted at `subtree_id` ("ingroup" for the ingroup, or None for the whole tree).
+    Returns None if `subtree_id` is not an internal node of the tree.
+    """
+    return get_subtree_otus_many(nexson, tree_id, [subtree_id], return_format=return_format)[subtree_id]
+
+
+def get_subtree_otus_many(nexson, tree_id, subtree_ids, return_format='otu_id'):
+    """Returns a dict mapping each of `subtree_ids` to what get_subtree_otus would return for it.
+    The leaves are listed in one traversal of the tree, and the leaves of a subtree are the slice
+    of that list that is added between entering and leaving its root. So, the cost is linear in the
+    size of the tree (plus the size of the output).
+    """
+    assert return_format in ['otu_id', 'ottid']
+    tree, otu_group = extract_tree_nexson(nexson, tree_id)[0][1:]
     edges = tree['edgeBySourceId']
     nodes = tree['nodeById']
-    if subtree_id:
+    root_id = tree['^ot:rootNodeId']
+    ingroup_node_id = tree.get('^ot:inGroupClade')
+    result = {}
+    node2subtree_ids = {}
+    for subtree_id in subtree_ids:
+        result[subtree_id] = None
         if subtree_id == 'ingroup':
-            root_id = ingroup_node_id
+            node_id = ingroup_node_id
         else:
-            root_id = subtree_id
-    else:
-        root_id = tree['^ot:rootNodeId']
-    if root_id not in edges:
-        return None
-    otuset = set()
-    todo = set()
-    todo.add(root_id)
+            node_id = subtree_id if subtree_id else root_id
+        if node_id in edges:
+            node2subtree_ids.setdefault(node_id, []).append(subtree_id)
+    if not node2subtree_ids:
+        return result
+    leaf_values = []
+    first_leaf_index = {}
+    todo = [root_id]
     while todo:
-        curr_node_id = todo.pop()
-        outgoing_edges = edges.get(curr_node_id)
+        node_id = todo.pop()
+        if node_id is _CLOSE_NODE:
+            node_id = todo.pop()
+            subtree_leaf_values = leaf_values[first_leaf_index[node_id]:]
+            for subtree_id in node2subtree_ids[node_id]:
+                result[subtree_id] = set(subtree_leaf_values)
+            continue
+        outgoing_edges = edges.get(node_id)
         if outgoing_edges is None:
-            otu = nodes.get(curr_node_id).get('@otu')
-            assert(otu)
+            otu_id = nodes[node_id].get('@otu')
+            assert otu_id
             if return_format == 'otu_id':
-                otuset.add(otu)
-            if return_format == 'ottid':
-                d = extract_otu_nexson(nexson, otu, detect_nexson_version(nexson))
-                ottid = d[otu].get('^ot:ottId')
-                otuset.add(ottid)
+                leaf_values.append(otu_id)
+            else:
+                leaf_values.append(otu_group[otu_id].get('^ot:ottId'))
         else:
-            for edge, info in outgoing_edges.items():
-                todo.add(info.get('@target'))
-    return(otuset)
+            if node_id in node2subtree_ids:
+                first_leaf_index[node_id] = len(leaf_values)
+                todo.append(node_id)
+                todo.append(_CLOSE_NODE)
+            todo.extend([e['@target'] for e in outgoing_edges.values()])
+    return result
 
 
 def nexson_frag_write_newick(out,
@@ -980,77 +989,105 @@ def nexson_frag_write_newick(out,
                              needs_quotes_pattern=NEWICK_NEEDING_QUOTING,
                              ingroup_id=None,
                              bracket_ingroup=False,
-                             with_edge_lengths=True):
+                             with_edge_lengths=True,
+                             quoted_label_memo=None):
     """`label_key` is a string (a key in the otu object) or a callable that takes two arguments:
         the node, and the otu (which may be None for an internal node)
     If `leaf_labels` is not None, it shoulr be a (list, dict) pair which will be filled. The list will
         hold the order encountered,
         and the dict will map name to index in the list
+    The children of each node are written in the order of their edge IDs. The newick is assembled
+        in a list of strings that is written to `out` in large chunks.
+    `quoted_label_memo` is as in convert_tree_to_newick.
     """
+    assert root_id
+    if is_str_type(label_key):
+        label_fn = None
+        if quoted_label_memo is None:
+            quoted_label_memo = {}
+    else:
+        label_fn = label_key
+    if leaf_labels is not None:
+        leaf_label_list, leaf_label_index = leaf_labels
     unlabeled_counter = 0
-    curr_node_id = root_id
-    assert curr_node_id
-    curr_edge = None
-    curr_sib_list = []
-    curr_stack = []
-    going_tipward = True
-    while True:
-        if going_tipward:
-            outgoing_edges = edges.get(curr_node_id)
-            if outgoing_edges is None:
-                curr_node = nodes[curr_node_id]
-                assert curr_node_id is not None
-                assert curr_node_id is not None
-                unlabeled_counter = _write_newick_leaf_label(out,
-                                                             curr_node_id,
-                                                             curr_node,
-                                                             otu_group,
-                                                             label_key,
-                                                             leaf_labels,
-                                                             unlabeled_counter,
-                                                             needs_quotes_pattern)
-                if with_edge_lengths:
-                    _write_newick_edge_len(out, curr_edge)
-                going_tipward = False
-            else:
-                te = [(i, e) for i, e in outgoing_edges.items()]
-                te.sort()  # produce a consistent rotation... Necessary?
-                if bracket_ingroup and (ingroup_id == curr_node_id):
-                    out.write('[pre-ingroup-marker]')
-                out.write('(')
-                next_p = te.pop(0)
-                curr_stack.append((curr_edge, curr_node_id, curr_sib_list))
-                curr_edge, curr_sib_list = next_p[1], te
-                curr_node_id = curr_edge['@target']
-        if not going_tipward:
-            next_up_edge_id = None
-            while True:
-                if curr_sib_list:
-                    out.write(',')
-                    next_up_edge_id, next_up_edge = curr_sib_list.pop(0)
-                    break
-                if curr_stack:
-                    curr_edge, curr_node_id, curr_sib_list = curr_stack.pop(-1)
-                    curr_node = nodes[curr_node_id]
-                    out.write(')')
-                    _write_newick_internal_label(out,
-                                                 curr_node_id,
-                                                 curr_node,
-                                                 otu_group,
-                                                 label_key,
-                                                 needs_quotes_pattern)
-                    if with_edge_lengths:
-                        _write_newick_edge_len(out, curr_edge)
-                    if bracket_ingroup and (ingroup_id == curr_node_id):
-                        out.write('[post-ingroup-marker]')
+    parts = []
+    # `todo` holds the edges to visit. Opening a node pushes its edge, ID and _CLOSE_NODE (to close the node
+    #   after its children), then its child edges (last first). Only existing objects are pushed, which
+    #   keeps the garbage collector out of the way on deep trees.
+    todo = [None]  # None for the (missing) edge to the root
+    need_comma = False
+    while todo:
+        edge = todo.pop()
+        if edge is _CLOSE_NODE:
+            node_id = todo.pop()
+            edge = todo.pop()
+            parts.append(')')
+            node = nodes[node_id]
+            if label_fn is None:
+                otu_id = node.get('@otu')
+                if otu_id is None:
+                    label = None
                 else:
-                    break
-            if next_up_edge_id is None:
-                break
-            curr_edge = next_up_edge
-            curr_node_id = curr_edge['@target']
-            going_tipward = True
-    out.write(';')
+                    label = quoted_label_memo.get(otu_id, _NOT_YET_QUOTED)
+                    if label is _NOT_YET_QUOTED:
+                        label = _quoted_otu_label(otu_group[otu_id], label_key, needs_quotes_pattern)
+                        quoted_label_memo[otu_id] = label
+            else:
+                label = label_fn(node_id, node, None)
+                if label is not None:
+                    label = quote_newick_name(label, needs_quotes_pattern)
+            if label is not None:
+                parts.append(label)
+            if with_edge_lengths and edge is not None:
+                e_len = edge.get('@length')
+                if e_len is not None:
+                    parts.append(':{e}'.format(e=e_len))
+            if bracket_ingroup and (ingroup_id == node_id):
+                parts.append('[post-ingroup-marker]')
+            need_comma = True
+            continue
+        if need_comma:
+            parts.append(',')
+        node_id = root_id if edge is None else edge['@target']
+        outgoing_edges = edges.get(node_id)
+        if outgoing_edges is not None:
+            if bracket_ingroup and (ingroup_id == node_id):
+                parts.append('[pre-ingroup-marker]')
+            parts.append('(')
+            todo.append(edge)
+            todo.append(node_id)
+            todo.append(_CLOSE_NODE)
+            todo.extend([outgoing_edges[i] for i in sorted(outgoing_edges.keys(), reverse=True)])
+            need_comma = False
+            continue
+        node = nodes[node_id]
+        otu_id = node['@otu']
+        if label_fn is None:
+            label = quoted_label_memo.get(otu_id, _NOT_YET_QUOTED)
+            if label is _NOT_YET_QUOTED:
+                label = _quoted_otu_label(otu_group[otu_id], label_key, needs_quotes_pattern)
+                quoted_label_memo[otu_id] = label
+            if label is None:
+                unlabeled_counter += 1
+                o = otu_group[otu_id].get('^ot:originalLabel', '<unknown>')
+                label = "'*tip #{n:d} not mapped to OTT. Original label - {o}'"
+                label = label.format(n=unlabeled_counter, o=o)
+        else:
+            label = quote_newick_name(label_fn(node_id, node, otu_group[otu_id]), needs_quotes_pattern)
+        if leaf_labels is not None and label not in leaf_label_index:
+            leaf_label_index[label] = len(leaf_label_list)
+            leaf_label_list.append(label)
+        parts.append(label)
+        if with_edge_lengths and edge is not None:
+            e_len = edge.get('@length')
+            if e_len is not None:
+                parts.append(':{e}'.format(e=e_len))
+        need_comma = True
+        if len(parts) > _NEWICK_CHUNK_SIZE:
+            out.write(''.join(parts))
+            parts = []
+    parts.append(';')
+    out.write(''.join(parts))
 
 
 def _write_nexus_format(quoted_leaf_labels, tree_name_newick_list):
@@ -1103,14 +1140,17 @@ def convert_trees(tid_tree_otus_list, schema, subtree_id=None):
         leaf_labels = ([], {})
         needs_quotes_pattern = NEXUS_NEEDING_QUOTING
         conv_tree_list = []
+        label_memos = {}
         for tree_id, tree, otu_group in tid_tree_otus_list:
+            memo = label_memos.setdefault(id(otu_group), {})
             newick = convert_tree_to_newick(tree,
                                             otu_group,
                                             label_key,
                                             leaf_labels,
                                             needs_quotes_pattern,
                                             subtree_id=subtree_id,
-                                            bracket_ingroup=schema.bracket_ingroup)
+                                            bracket_ingroup=schema.bracket_ingroup,
+                                            quoted_label_memo=memo)
             if newick:
                 t = (quote_newick_name(tree_id, needs_quotes_pattern), newick)
                 conv_tree_list.append(t)
@@ -1127,6 +1167,8 @@ def nexml_el_of_by_id(nexson, curr_version=None):
     return get_nexml_el(nexson)
 
 def extract_otus_nexson(nexson, otus_id, curr_version=None):
+    if isinstance(nexson, LazyNexson):
+        return nexson.extract_otus_nexson(otus_id)
     nexml_el = nexml_el_of_by_id(nexson, curr_version)
     o = nexml_el['otusById']
     if otus_id is None:
@@ -1138,6 +1180,8 @@ def extract_otus_nexson(nexson, otus_id, curr_version=None):
 
 
 def extract_otu_nexson(nexson, otu_id, curr_version=None):
+    if isinstance(nexson, LazyNexson):
+        return nexson.extract_otu_nexson(otu_id)
     nexml_el = nexml_el_of_by_id(nexson, curr_version)
     o = nexml_el['otusById']
     if otu_id is None:
@@ -1187,6 +1231,8 @@ def extract_tree_nexson(nexson, tree_id, curr_version=None):
     """Returns a list of (id, tree, otus_group) tuples for the
     specified tree_id (all trees if tree_id is None)
     """
+    if isinstance(nexson, LazyNexson):
+        return nexson.extract_tree_nexson(tree_id)
     if curr_version is None:
         curr_version = detect_nexson_version(nexson)
     if not _is_by_id_hbf(curr_version):
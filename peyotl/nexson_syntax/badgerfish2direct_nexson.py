@@ -77,23 +77,27 @@ class Badgerfish2DirectNexson(NexsonConverter):
             if isinstance(el, dict):
                 self._recursive_convert_dict(el)
 
-    def _recursive_convert_dict(self, obj):
+    def _recursive_convert_dict(self, obj, skip_keys=None):
+        """Converts `obj` and the dicts it holds, except for the values of the keys in `skip_keys`."""
         _cull_redundant_about(obj)  # rule 10...
-        meta_list = _get_index_list_of_values(obj, 'meta')
-        to_inject = {}
-        for meta in meta_list:
-            xt = meta['@xsi:type']
-            if _RESOURCE_META_PAT.match(xt):
-                mk, mv = self._transform_resource_meta(meta)
-            else:
-                assert _LITERAL_META_PAT.match(xt)
-                mk, mv = self._transform_literal_meta(meta)
-            _add_value_to_dict_bf(to_inject, mk, mv)
-        if ('meta' in obj) and self.remove_old_structs:
-            del obj['meta']
-        for k, v in to_inject.items():
-            _add_value_to_dict_bf(obj, k, v)
+        if 'meta' in obj:
+            meta_list = _get_index_list_of_values(obj, 'meta')
+            to_inject = {}
+            for meta in meta_list:
+                xt = meta['@xsi:type']
+                if _RESOURCE_META_PAT.match(xt):
+                    mk, mv = self._transform_resource_meta(meta)
+                else:
+                    assert _LITERAL_META_PAT.match(xt)
+                    mk, mv = self._transform_literal_meta(meta)
+                _add_value_to_dict_bf(to_inject, mk, mv)
+            if self.remove_old_structs:
+                del obj['meta']
+            for k, v in to_inject.items():
+                _add_value_to_dict_bf(obj, k, v)
         for k, v in obj.items():
+            if skip_keys is not None and k in skip_keys:
+                continue
             if isinstance(v, dict):
                 self._recursive_convert_dict(v)
             elif isinstance(v, list):
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""Badgerfish2OptimalNexson class"""
+from peyotl.nexson_syntax.badgerfish2direct_nexson import Badgerfish2DirectNexson
+from peyotl.nexson_syntax.helper import (get_nexml_el,
+                                         _get_index_list_of_values,
+                                         _index_list_of_values,
+                                         BY_ID_HONEY_BADGERFISH,
+                                         NexsonError)
+from peyotl.utility import get_logger
+
+_LOG = get_logger(__name__)
+
+_NEXML_CHILD_KEYS = frozenset(['otus', 'trees'])
+_TREE_CHILD_KEYS = frozenset(['node', 'edge'])
+
+
+class Badgerfish2OptimalNexson(Badgerfish2DirectNexson):
+    """Conversion of the direct Badgerfish and Phylografter JSON (v 0.0)
+    to the optimized version of honeybadgerfish JSON (v 1.2) in one walk.
+    The result is the same as that of Badgerfish2DirectNexson followed by
+    Direct2OptimalNexson, but no v 1.0 structures are built.
+    Only the lean form (remove_old_structs=True) is produced.
+    This is a dict-to-dict in-place conversion. No serialization is included.
+    """
+
+    def __init__(self, conv_cfg):
+        Badgerfish2DirectNexson.__init__(self, conv_cfg)
+
+    def convert_otus(self, otus_list):
+        for otus_el in otus_list:
+            self._recursive_convert_dict(otus_el, skip_keys=('otu',))
+        otusById = dict((i['@id'], i) for i in otus_list)
+        otusElementOrder = [i['@id'] for i in otus_list]
+        for otus_el in otusById.values():
+            otuById = {}
+            for otu in _index_list_of_values(otus_el, 'otu'):
+                self._recursive_convert_dict(otu)
+                otuById[otu['@id']] = otu
+            otus_el['otuById'] = otuById
+            del otus_el['@id']
+            del otus_el['otu']
+            for otu in otuById.values():
+                del otu['@id']
+        return otusById, otusElementOrder
+
+    def convert_tree(self, tree):
+        """Return (tree_id, tree) or None (if the tree has no edges).
+        """
+        self._recursive_convert_dict(tree, skip_keys=_TREE_CHILD_KEYS)
+        if self._add_tree_xsi_type:
+            tree.setdefault('@xsi:type', 'nex:FloatTree')
+        nodeById = {}
+        root_node_id = None
+        for node in _index_list_of_values(tree, 'node'):
+            self._recursive_convert_dict(node)
+            node_id = node['@id']
+            nodeById[node_id] = node
+            r = node.get('@root')
+            if r in [True, 'true']:  # @TEMP accepting true or "true"
+                assert root_node_id is None
+                root_node_id = node_id
+            if '^ot:isLeaf' in node:
+                del node['^ot:isLeaf']
+            del node['@id']
+        assert root_node_id is not None
+        edgeBySourceId = {}
+        edge_list = _get_index_list_of_values(tree, 'edge')
+        for edge in edge_list:
+            self._recursive_convert_dict(edge)
+            eid = edge['@id']
+            del edge['@id']
+            edgeBySourceId.setdefault(edge['@source'], {})[eid] = edge
+        tree['nodeById'] = nodeById
+        tree['edgeBySourceId'] = edgeBySourceId
+        tree['^ot:rootNodeId'] = root_node_id
+        tid = tree['@id']
+        del tree['@id']
+        del tree['node']
+        if 'edge' not in tree:
+            # see the note on empty trees in Direct2OptimalNexson.convert_tree
+            _LOG.warn('Tree with ID "{}" is being dropped because it has no edges'.format(tid))
+            assert not edge_list
+            return None
+        del tree['edge']
+        return tid, tree
+
+    def convert(self, obj):
+        """Takes a dict corresponding to the badgerfish JSON blob of the 0.0.* type and
+        converts it to BY_ID_HONEY_BADGERFISH version. The object is modified in place
+        and returned.
+        """
+        if self.pristine_if_invalid:
+            raise NotImplementedError('pristine_if_invalid option is not supported yet')
+        if not self.remove_old_structs:
+            raise NotImplementedError('remove_old_structs=False requires the conversion through v 1.0')
+        nex = get_nexml_el(obj)
+        assert nex
+        self._recursive_convert_dict(nex, skip_keys=_NEXML_CHILD_KEYS)
+        # set before the new keys are added, as in the conversion through v 1.0
+        nex['@nexml2json'] = str(BY_ID_HONEY_BADGERFISH)
+        otusById, otusElementOrder = self.convert_otus(_index_list_of_values(nex, 'otus'))
+        trees = _get_index_list_of_values(nex, 'trees')
+        treesById = dict((i['@id'], i) for i in trees)
+        treesElementOrder = [i['@id'] for i in trees]
+        if len(treesById) != len(treesElementOrder):
+            trees_id_set = set()
+            for tgid in treesElementOrder:
+                if tgid in trees_id_set:
+                    raise NexsonError('Repeated trees element id "{}"'.format(tgid))
+                trees_id_set.add(tgid)
+        tree_id_set = set()
+        for tree_group in trees:
+            self._recursive_convert_dict(tree_group, skip_keys=('tree',))
+            treeById = {}
+            treeElementOrder = []
+            for tree in _get_index_list_of_values(tree_group, 'tree'):
+                t_t = self.convert_tree(tree)
+                if t_t is None:
+                    continue
+                tid = t_t[0]
+                if tid in tree_id_set:
+                    raise NexsonError('Repeated tree element id "{}"'.format(tid))
+                tree_id_set.add(tid)
+                treeById[tid] = tree
+                treeElementOrder.append(tid)
+            tree_group['^ot:treeElementOrder'] = treeElementOrder
+            tree_group['treeById'] = treeById
+        nex['otusById'] = otusById
+        nex['^ot:otusElementOrder'] = otusElementOrder
+        nex['treesById'] = treesById
+        nex['^ot:treesElementOrder'] = treesElementOrder
+        del nex['otus']
+        del nex['trees']
+        for v in treesById.values():
+            if 'tree' in v:
+                del v['tree']
+            del v['@id']
+        return obj
@@ -25,22 +25,29 @@ class Direct2BadgerfishNexson(NexsonConverter):
             if isinstance(el, dict):
                 self._recursive_convert_dict(el)
 
-    def _recursive_convert_dict(self, obj):
+    def _recursive_convert_dict(self, obj, skip_keys=None):
+        """Converts `obj` and the dicts it holds, except for the values of the keys in `skip_keys`."""
         _add_redundant_about(obj)  # rule 10...
-        meta_list = []
-        to_del = set()
+        meta_list = None  # the lists are only created for dicts with ^ keys
+        to_del = None
         for k, v in obj.items():
             if k.startswith('^'):
-                to_del.add(k)
+                if to_del is None:
+                    meta_list, to_del = [], []
+                to_del.append(k)
                 converted = _convert_hbf_meta_val_for_xml(k[1:], v)
                 if isinstance(converted, list):
                     meta_list.extend(converted)
                 else:
                     meta_list.append(converted)
+            elif skip_keys is not None and k in skip_keys:
+                continue
             if isinstance(v, dict):
                 self._recursive_convert_dict(v)
             elif isinstance(v, list):
                 self._recursive_convert_list(v)
+        if to_del is None:
+            return
         for k in to_del:
             del obj[k]
         if meta_list:
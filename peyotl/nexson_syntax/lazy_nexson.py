@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+"""LazyNexson class: read-only access to a NexSON document that only decodes the parts
+that are requested.
+
+The document is kept as UTF-8 bytes with an index of byte ranges: the members of the
+top-level object and of the nexml element, the otus groups in otusById (and their members),
+the trees groups in treesById (and their members) and each tree in treeById.
+Building the index does not decode the trees or otus. The values that are skipped are
+bracket-matched on a "skeleton" of the document (bytes.translate keeps the quotes,
+backslashes and brackets). On the skeleton one regex match skips a run of strings
+and of flat objects (like nodes and edges), so there are only a few Python steps per
+internal node of a tree. Strings that contain brackets or escapes are matched on the
+document itself.
+"""
+from peyotl.nexson_syntax.helper import BADGER_FISH_NEXSON_VERSION, _is_by_id_hbf
+from peyotl.utility import get_logger
+import json
+import re
+
+_LOG = get_logger(__name__)
+
+
+def _skeleton_table():
+    t = bytearray(b' ' * 256)
+    for c in bytearray(b'{['):
+        t[c] = ord('(')
+    for c in bytearray(b'}]'):
+        t[c] = ord(')')
+    for c in bytearray(b'"\\'):
+        t[c] = c
+    return bytes(t)
+
+
+_SKELETON_TABLE = _skeleton_table()
+# a run of spaces, (escape-free) strings and flat containers ending at a bracket
+_SKELETON_RUN = re.compile(br' *(?:(?:" *"|\( *(?:" *" *)*\)) *)*([()])')
+# the same on the document (used if the skeleton run fails on a string with brackets or escapes)
+_STR = br'"[^"\\]*(?:\\.[^"\\]*)*"'
+_DOC_RUN = re.compile(br'[^"\[\]{}]*(?:' + _STR + br'[^"\[\]{}]*)*([\[\]{}])', re.DOTALL)
+_WS = br'[ \t\n\r]*'
+_OBJECT_START = re.compile(_WS + br'(\{)' + _WS)
+_MEMBER_KEY = re.compile(br'(' + _STR + br')' + _WS + br':' + _WS, re.DOTALL)
+_SCALAR = re.compile(_STR + br'|[^ \t\n\r,\]}]+', re.DOTALL)
+_MEMBER_SEP = re.compile(_WS + br'([,}])' + _WS)
+_TRAILING_WS = re.compile(_WS + br'$')
+
+# Which member values are indexed as objects (a key of '*' matches any key). An empty dict means
+#   that the members of the object are indexed, but their values are not.
+_NEXML_SPEC = {'otusById': {'*': {}},
+               'treesById': {'*': {'treeById': {}}}}
+_TOP_SPEC = {'nexml': _NEXML_SPEC, 'nex:nexml': _NEXML_SPEC}
+
+
+class _NotIndexed(Exception):
+    """Raised when a value that a lazy accessor needs was not indexed as an object."""
+    pass
+
+
+class LazyNexson(object):
+    """A NexSON document (from the filepath `filepath` or the str or UTF-8 bytes `content`)
+    whose parts are decoded when they are requested.
+
+    extract_tree_nexson, extract_otus_nexson and extract_otu_nexson accept a LazyNexson,
+    and PhyloSchema.convert accepts it as `src`. For NexSON 1.2, they decode only the
+    trees and otus that they return (and get_meta_only_nexson decodes neither). Other versions
+    (and documents that cannot be indexed) are decoded in full when a part is requested.
+    Every call decodes the parts again, so the caller owns (and may modify) the returned objects.
+    """
+
+    def __init__(self, filepath=None, content=None):
+        if content is None:
+            with open(filepath, 'rb') as fo:
+                content = fo.read()
+        elif not isinstance(content, bytes):
+            content = content.encode('utf-8')
+        self._content = content
+        self._skeleton = content.translate(_SKELETON_TABLE)
+        self._nexml_key = None
+        try:
+            self._top = self._index_document()
+            self._nexml = self._nexml_members()
+        except (ValueError, KeyError, _NotIndexed) as x:
+            _LOG.debug('NexSON document not indexed ({}). It will be decoded in full.'.format(x))
+            self._top, self._nexml = None, None
+        finally:
+            self._skeleton = None
+        if self._nexml is None:
+            from peyotl.nexson_syntax import detect_nexson_version
+            self.nexson_version = detect_nexson_version(self.get_nexson())
+        else:
+            v = self._nexml.get('@nexml2json')
+            self.nexson_version = BADGER_FISH_NEXSON_VERSION if v is None else self._decode(v)
+
+    def get_nexson(self):
+        """Returns the whole document as a dict."""
+        return json.loads(self._content.decode('utf-8'))
+
+    def get_meta_only_nexson(self):
+        """Returns the document with the otus and trees removed, as strip_to_meta_only does."""
+        if self._is_lazy():
+            try:
+                return self._lazy_meta_only_nexson()
+            except _NotIndexed:
+                pass
+        from peyotl.nexson_syntax import strip_to_meta_only
+        blob = self.get_nexson()
+        strip_to_meta_only(blob, self.nexson_version)
+        return blob
+
+    def extract_tree_nexson(self, tree_id):
+        """Returns a list of (id, tree, otus_group) tuples, as extract_tree_nexson does."""
+        if self._is_lazy():
+            try:
+                return self._lazy_extract_tree_nexson(tree_id)
+            except _NotIndexed:
+                pass
+        from peyotl.nexson_syntax import extract_tree_nexson
+        return extract_tree_nexson(self.get_nexson(), tree_id, self.nexson_version)
+
+    def extract_otus_nexson(self, otus_id):
+        """Returns {otus_id: otus group} (or otusById if `otus_id` is None), as extract_otus_nexson does."""
+        if self._is_lazy():
+            try:
+                return self._lazy_extract_otus_nexson(otus_id)
+            except _NotIndexed:
+                pass
+        from peyotl.nexson_syntax import extract_otus_nexson
+        return extract_otus_nexson(self.get_nexson(), otus_id, self.nexson_version)
+
+    def extract_otu_nexson(self, otu_id):
+        """Returns {otu_id: otu} (or all of the otus if `otu_id` is None), as extract_otu_nexson does."""
+        from peyotl.nexson_syntax import extract_otu_nexson
+        if self._is_lazy() and ('otusById' in self._nexml):
+            nexson = {'nexml': {'otusById': self._decode(self._nexml['otusById'])}}
+        else:
+            nexson = self.get_nexson()
+        return extract_otu_nexson(nexson, otu_id, self.nexson_version)
+
+    def _is_lazy(self):
+        return (self._nexml is not None) and _is_by_id_hbf(self.nexson_version)
+
+    def _decode(self, member):
+        return json.loads(self._content[member[1]:member[2]].decode('utf-8'))
+
+    def _lazy_meta_only_nexson(self):
+        nexml = {}
+        for m in self._nexml.values():
+            key = m[0]
+            if key == 'otusById':
+                v = {}
+                for group_id, group in _member_dict(m).items():
+                    v[group_id] = dict((k, self._decode(gm)) for k, gm in _member_dict(group).items()
+                                       if k != 'otuById')
+            elif key == 'treesById':
+                v = {}
+                for group_id, group in _member_dict(m).items():
+                    gd = {}
+                    for k, gm in _member_dict(group).items():
+                        gd[k] = dict((i, None) for i in _member_dict(gm)) if k == 'treeById' else self._decode(gm)
+                    if 'treeById' not in gd:
+                        raise _NotIndexed('treeById')
+                    v[group_id] = gd
+            else:
+                v = self._decode(m)
+            nexml[key] = v
+        blob = {}
+        for m in _member_dict(self._top).values():
+            blob[m[0]] = nexml if m[0] == self._nexml_key else self._decode(m)
+        return blob
+
+    def _lazy_extract_tree_nexson(self, tree_id):
+        tree_groups = _member_dict(self._nexml['treesById'])
+        otu_group_memo = {}
+        tree_obj_otus_group_list = []
+        for tree_group in tree_groups.values():
+            tree_group = _member_dict(tree_group)
+            tree_by_id = _member_dict(tree_group['treeById'])
+            if tree_id:
+                t = tree_by_id.get(tree_id)
+                tree_list = [(tree_id, None if t is None else self._decode(t))]
+            else:
+                tree_list = [(tid, self._decode(t)) for tid, t in tree_by_id.items()]
+            for tid, tree in tree_list:
+                if tree is not None:
+                    ogi = self._decode(tree_group['@otus'])
+                    otu_group = otu_group_memo.get(ogi)
+                    if otu_group is None:
+                        otus = _member_dict(_member_dict(self._nexml['otusById'])[ogi])
+                        otu_group = self._decode(otus['otuById'])
+                        otu_group_memo[ogi] = otu_group
+                    tree_obj_otus_group_list.append((tid, tree, otu_group))
+                    if tree_id is not None:
+                        return tree_obj_otus_group_list
+        return tree_obj_otus_group_list
+
+    def _lazy_extract_otus_nexson(self, otus_id):
+        o = self._nexml['otusById']
+        if otus_id is None:
+            return self._decode(o)
+        n = _member_dict(o).get(otus_id)
+        if n is None:
+            return None
+        return {otus_id: self._decode(n)}
+
+    def _nexml_members(self):
+        top = _member_dict(self._top)
+        nexml = top.get('nexml')
+        if nexml is None or self._content[nexml[1]:nexml[2]] == b'null':
+            nexml = top['nex:nexml']
+        self._nexml_key = nexml[0]
+        return _member_dict(nexml)
+
+    def _index_document(self):
+        mo = _OBJECT_START.match(self._content)
+        if mo is None:
+            raise ValueError('the document is not a JSON object')
+        members, end = self._index_object(mo.start(1), _TOP_SPEC)
+        if _TRAILING_WS.match(self._content, end) is None:
+            raise ValueError('extra data after byte {}'.format(end))
+        return ('', 0, end, members)
+
+    def _index_object(self, pos, spec):
+        """Returns (members, end) for the object that starts at byte `pos`. Each member is
+        a (key, value start, value end, members of the value or None) tuple.
+        """
+        content = self._content
+        members = []
+        mo = _MEMBER_SEP.match(content, pos + 1)
+        if mo is not None and mo.group(1) == b'}':
+            return members, mo.end(1)
+        pos = _OBJECT_START.match(content, pos).end()
+        while True:
+            mo = _MEMBER_KEY.match(content, pos)
+            if mo is None:
+                raise ValueError('expecting a key at byte {}'.format(pos))
+            key = json.loads(mo.group(1).decode('utf-8'))
+            start = mo.end()
+            sub_spec = spec.get(key, spec.get('*'))
+            if content[start:start + 1] in (b'{', b'['):
+                if sub_spec is not None and content[start:start + 1] == b'{':
+                    sub, end = self._index_object(start, sub_spec)
+                else:
+                    sub, end = None, self._skip_container(start)
+            else:
+                sub, smo = None, _SCALAR.match(content, start)
+                if smo is None:
+                    raise ValueError('expecting a value at byte {}'.format(start))
+                end = smo.end()
+            members.append((key, start, end, sub))
+            mo = _MEMBER_SEP.match(content, end)
+            if mo is None:
+                raise ValueError('expecting "," or "}}" at byte {}'.format(end))
+            if mo.group(1) == b'}':
+                return members, mo.end(1)
+            pos = mo.end()
+
+    def _skip_container(self, pos):
+        """Returns the end of the object or array that starts at byte `pos`."""
+        skeleton = self._skeleton
+        skeleton_run, doc_run = _SKELETON_RUN.match, _DOC_RUN.match
+        depth = 1
+        pos += 1
+        while True:
+            mo = skeleton_run(skeleton, pos)
+            if mo is None:
+                mo = doc_run(self._content, pos)
+                if mo is None:
+                    raise ValueError('unbalanced brackets after byte {}'.format(pos))
+            pos = mo.end()
+            if skeleton[pos - 1:pos] == b'(':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return pos
+
+
+def _member_dict(member):
+    """Returns the members of an indexed object as a dict (the last of repeated keys wins, as in json)."""
+    sub = member[3]
+    if sub is None:
+        raise _NotIndexed(member[0])
+    return dict((m[0], m) for m in sub)
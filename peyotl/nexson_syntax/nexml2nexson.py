@@ -1,17 +1,24 @@
 #!/usr/bin/env python
-"""Nexml2Nexson class"""
+"""Nexml2Nexson class
+
+NeXML can be converted from a minidom document (Nexml2Nexson.convert) or
+incrementally, from the text of the document (Nexml2Nexson.convert_stream).
+The incremental conversion uses expat directly: each element is converted to
+its HoneyBadgerFish dict when it closes, so the parsed elements never need to be
+held in memory.
+"""
 from peyotl.nexson_syntax.helper import (NexsonConverter,
                                          get_nexml_el,
                                          _add_value_to_dict_bf,
                                          _coerce_literal_val_to_primitive,
                                          _cull_redundant_about,
                                          _get_index_list_of_values,
-                                         _index_list_of_values,
                                          _is_badgerfish_version,
                                          _LITERAL_META_PAT,
                                          _RESOURCE_META_PAT)
 
 from peyotl.utility import get_logger, is_str_type
+import xml.parsers.expat
 import xml.dom.minidom
 
 _LOG = get_logger(__name__)
@@ -75,6 +82,18 @@ def _extract_text_and_child_element_list(minidom_node):
     return text_content, ntl
 
 
+def _minidom_attributes(minidom_node):
+    """Returns the list of (name, value) attributes of minidom_node (empty for non-elements)."""
+    att_container = minidom_node.attributes
+    if att_container is None:
+        return []
+    attrs = []
+    for i in range(att_container.length):
+        attr = att_container.item(i)
+        attrs.append((attr.name, attr.value))
+    return attrs
+
+
 class Nexml2Nexson(NexsonConverter):
     """Conversion of the optimized (v 1.2) version of NexSON to
     the more direct (v 1.0) port of NeXML
@@ -87,7 +106,39 @@ class Nexml2Nexson(NexsonConverter):
         self._badgerfish_style_conversion = _is_badgerfish_version(conv_cfg.output_format)
 
     def convert(self, doc_root):
-        key, val = self._gen_hbf_el(doc_root)
+        """Converts the minidom element `doc_root`."""
+        doc_root.normalize()
+        key, val, _ = self._minidom_record(doc_root, is_root=True)
+        return self._finish_conversion(key, val)
+
+    def _minidom_record(self, x, is_root=False):
+        """Returns the record (see _HBFStreamBuilder) for the minidom node `x`.
+        Indirect recursion through the records of the child nodes.
+        """
+        el_name = x.nodeName
+        assert el_name is not None
+        text_content, ntl = _extract_text_and_child_element_list(x)
+        records = [self._minidom_record(c) for c in ntl]
+        attrs = _minidom_attributes(x)
+        if el_name == 'meta' and not (is_root or self._badgerfish_style_conversion):
+            k, v = self._transform_meta_parts(attrs, text_content, records)
+            return k, v, True
+        return el_name, self._hbf_el_from_parts(attrs, text_content, records), False
+
+    def convert_stream(self, chunks):
+        """Converts the NeXML document whose content is the concatenation of `chunks`
+        (an iterable of strings). Produces the same object as `convert` would for the
+        documentElement of the minidom parse of the content.
+        """
+        builder = _HBFStreamBuilder(self)
+        parser = builder.create_parser()
+        for chunk in chunks:
+            parser.Parse(chunk, False)
+        parser.Parse(b'', True)
+        key, val = builder.root
+        return self._finish_conversion(key, val)
+
+    def _finish_conversion(self, key, val):
         val['@nexml2json'] = self.output_format
         o = {key: val}
         try:
@@ -124,119 +175,106 @@ class Nexml2Nexson(NexsonConverter):
                         node_id_map[ri]['@root'] = True
         return o
 
-    def _gen_hbf_el(self, x):
-        """
-        Builds a dictionary from the DOM element x
-        The function
-        Uses as hacky splitting of attribute or tag names using {}
-            to remove namespaces.
-        returns a pair of: the tag of `x` and the honeybadgerfish
-            representation of the subelements of x
-        Indirect recursion through _hbf_handle_child_elements
+    def _hbf_el_from_parts(self, attrs, text_content, records):
+        """Returns the HoneyBadgerFish dict of an element from its list of (name, value) attributes,
+        its text content and the records (see _HBFStreamBuilder) of its child nodes.
+        Uses as hacky splitting of attribute or tag names using {} to remove namespaces.
         """
         obj = {}
-        # grab the tag of x
-        el_name = x.nodeName
-        assert el_name is not None
-        # add the attributes to the dictionary
-        att_container = x.attributes
         ns_obj = {}
-        if att_container is not None:
-            for i in range(att_container.length):
-                attr = att_container.item(i)
-                n = attr.name
-                t = None
-                if n.startswith('xmlns'):
-                    if n == 'xmlns':
-                        t = '$'
-                    elif n.startswith('xmlns:'):
-                        t = n[6:]  # strip off the xmlns:
-                if t is None:
-                    obj['@' + n] = attr.value
-                else:
-                    ns_obj[t] = attr.value
+        for n, v in attrs:
+            t = None
+            if n.startswith('xmlns'):
+                if n == 'xmlns':
+                    t = '$'
+                elif n.startswith('xmlns:'):
+                    t = n[6:]  # strip off the xmlns:
+            if t is None:
+                obj['@' + n] = v
+            else:
+                ns_obj[t] = v
         if ns_obj:
             obj['@xmlns'] = ns_obj
-
-        x.normalize()
-        # store the text content of the element under the key '$'
-        text_content, ntl = _extract_text_and_child_element_list(x)
         if text_content:
             obj['$'] = text_content
-        self._hbf_handle_child_elements(obj, ntl)
-        return el_name, obj
+        return self._hbf_handle_child_records(obj, records)
 
-    def _hbf_handle_child_elements(self, obj, ntl):
+    def _hbf_handle_child_records(self, obj, records):
+        """Adds the converted child nodes in `records` to the HoneyBadgerFish dict `obj`.
+        Repetition of a tag means that it will map to a list of dicts.
         """
-        Indirect recursion through _gen_hbf_el
-        """
-        # accumulate a list of the children names in ko, and
-        #   the a dictionary of tag to xml elements.
-        # repetition of a tag means that it will map to a list of
-        #   xml elements
         cd = {}
         ko = []
-        ks = set()
-        for child in ntl:
-            k = child.nodeName
-            if k == 'meta' and (not self._badgerfish_style_conversion):
-                matk, matv = self._transform_meta_key_value(child)
-                if matk is not None:
-                    _add_value_to_dict_bf(obj, matk, matv)
+        for k, v, is_meta_pair in records:
+            if is_meta_pair:
+                if k is not None:
+                    _add_value_to_dict_bf(obj, k, v)
             else:
-                if k not in ks:
+                dcl = cd.get(k)
+                if dcl is None:
                     ko.append(k)
-                    ks.add(k)
-                _add_value_to_dict_bf(cd, k, child)
-
-        # Converts the child XML elements to dicts by recursion and
-        #   adds these to the dict.
+                    dcl = []
+                    cd[k] = dcl
+                dcl.append(v)
         for k in ko:
-            v = _index_list_of_values(cd, k)
-            dcl = []
-            ct = None
-            for xc in v:
-                ct, dc = self._gen_hbf_el(xc)
-                dcl.append(dc)
             # this assertion will trip is the hacky stripping of namespaces
             #   results in a name clash among the tags of the children
-            assert ct not in obj
-            obj[ct] = dcl
-
-        # delete redundant about attributes that are used in XML, but not JSON (last rule of HoneyBadgerFish)
+            assert k not in obj
+            obj[k] = cd[k]
         _cull_redundant_about(obj)
         return obj
 
-    def _literal_transform_meta_key_value(self, minidom_meta_element):
-        att_key = None
-        dt = minidom_meta_element.getAttribute('datatype') or 'xsd:string'
-        att_str_val = minidom_meta_element.getAttribute('content')
-        att_key = minidom_meta_element.getAttribute('property')
-        full_obj = {}
-        if att_key is None:
-            _LOG.debug('"property" missing from literal meta')
+    def _transform_meta_parts(self, attrs, text_content, records):
+        """Checks if a meta element (in the form used by _hbf_el_from_parts) can be represented
+            as a key/value pair in a object.
+
+        Returns (key, value) ready for JSON serialization, OR
+                `None, None` if the element can not be treated as simple pair.
+        If `None` is returned, then more literal translation of the
+            object may be required.
+        """
+        att_dict = dict(attrs)
+        xt = att_dict.get('xsi:type', '')
+        if _LITERAL_META_PAT.match(xt):
+            dt = att_dict.get('datatype') or 'xsd:string'
+            att_str_val = att_dict.get('content', '')
+            att_key = att_dict.get('property', '')
+            decision_fn = _literal_meta_att_decision_fn
+        elif _RESOURCE_META_PAT.match(xt):
+            att_key = att_dict.get('rel', '')
+            decision_fn = _resource_meta_att_decision_fn
+        else:
+            _LOG.debug('xsi:type attribute "%s" not LiteralMeta or ResourceMeta', xt)
             return None, None
-        att_container = minidom_meta_element.attributes
-        for i in range(att_container.length):
-            attr = att_container.item(i)
-            handling_code, new_name = _literal_meta_att_decision_fn(attr.name)
+        full_obj = {}
+        for n, v in attrs:
+            handling_code, new_name = decision_fn(n)
             if handling_code == ATT_TRANSFORM_CODE.IN_FULL_OBJECT:
-                full_obj[new_name] = attr.value
+                full_obj[new_name] = v
             else:
                 if handling_code == ATT_TRANSFORM_CODE.IN_XMLNS_OBJ:
-                    full_obj.setdefault('@xmlns', {})[new_name] = attr.value
+                    full_obj.setdefault('@xmlns', {})[new_name] = v
                 else:
                     assert handling_code == ATT_TRANSFORM_CODE.HANDLED
-
+        att_key = '^' + att_key
+        if decision_fn is _resource_meta_att_decision_fn:
+            if text_content:
+                _LOG.debug('text content of ResourceMeta of rel="%s"', att_key)
+                return None, None
+            if records:
+                self._hbf_handle_child_records(full_obj, records)
+            if not full_obj:
+                _LOG.debug('ResourceMeta of rel="%s" without condents ("href" attribute or nested meta)', att_key)
+                return None, None
+            _cull_redundant_about(full_obj)
+            return att_key, full_obj
         if not att_str_val:
-            att_str_val, ntl = _extract_text_and_child_element_list(minidom_meta_element)
-            att_str_val = att_str_val.strip()
-            if len(ntl) > 1:
+            att_str_val = text_content.strip()
+            if len(records) > 1:
                 _LOG.debug('Nested meta elements are not legal for LiteralMeta (offending property="%s")', att_key)
                 return None, None
-            if len(ntl) == 1:
-                self._hbf_handle_child_elements(full_obj, ntl)
-        att_key = '^' + att_key
+            if len(records) == 1:
+                self._hbf_handle_child_records(full_obj, records)
         trans_val = _coerce_literal_val_to_primitive(dt, att_str_val)
         if trans_val is None:
             return None, None
@@ -247,50 +285,102 @@ class Nexml2Nexson(NexsonConverter):
             return att_key, full_obj
         return att_key, trans_val
 
-    def _resource_transform_meta_key_value(self, minidom_meta_element):
-        rel = minidom_meta_element.getAttribute('rel')
-        if rel is None:
-            _LOG.debug('"rel" missing from ResourceMeta')
-            return None, None
-        full_obj = {}
-        att_container = minidom_meta_element.attributes
-        for i in range(att_container.length):
-            attr = att_container.item(i)
-            handling_code, new_name = _resource_meta_att_decision_fn(attr.name)
-            if handling_code == ATT_TRANSFORM_CODE.IN_FULL_OBJECT:
-                full_obj[new_name] = attr.value
-            else:
-                if handling_code == ATT_TRANSFORM_CODE.IN_XMLNS_OBJ:
-                    full_obj.setdefault('@xmlns', {})[new_name] = attr.value
-                else:
-                    assert handling_code == ATT_TRANSFORM_CODE.HANDLED
-        rel = '^' + rel
-        att_str_val, ntl = _extract_text_and_child_element_list(minidom_meta_element)
-        if att_str_val:
-            _LOG.debug('text content of ResourceMeta of rel="%s"', rel)
-            return None, None
-        if ntl:
-            self._hbf_handle_child_elements(full_obj, ntl)
-        if not full_obj:
-            _LOG.debug('ResourceMeta of rel="%s" without condents ("href" attribute or nested meta)', rel)
-            return None, None
-        _cull_redundant_about(full_obj)
-        return rel, full_obj
 
-    def _transform_meta_key_value(self, minidom_meta_element):
-        """Checks if the minidom_meta_element can be represented as a
-            key/value pair in a object.
+def _qualified_name(expat_name):
+    """Returns the prefix:local name (the minidom nodeName) for a name reported by
+    an expat parser with namespace processing and namespace_prefixes on."""
+    parts = expat_name.split(' ')
+    if len(parts) == 3:
+        return parts[2] + ':' + parts[1]
+    return parts[-1]
 
-        Returns (key, value) ready for JSON serialization, OR
-                `None, None` if the element can not be treated as simple pair.
-        If `None` is returned, then more literal translation of the
-            object may be required.
-        """
-        xt = minidom_meta_element.getAttribute('xsi:type')
-        if _LITERAL_META_PAT.match(xt):
-            return self._literal_transform_meta_key_value(minidom_meta_element)
-        elif _RESOURCE_META_PAT.match(xt):
-            return self._resource_transform_meta_key_value(minidom_meta_element)
+
+class _HBFStreamBuilder(object):
+    """Handlers for an expat parser that convert each element of a NeXML document as it
+    closes. The child nodes of an element are held as a list of "records":
+        (name, HoneyBadgerFish dict, False) for elements, comments, CDATA sections and
+            processing instructions (which minidom reports as non-text child nodes), or
+        (key, value, True) for a meta element that is converted to a key-value pair
+            (the key is None if the meta could not be converted).
+    After the parse, `root` holds the (name, dict) pair for the document element.
+    Nexml2Nexson.convert makes the same records from the nodes of a minidom document.
+    """
+
+    def __init__(self, converter):
+        self._converter = converter
+        self._meta_as_pair = not converter._badgerfish_style_conversion
+        # one [name, attribute list, stripped text segments, text of the current segment, records]
+        #   list for each open element
+        self._stack = []
+        self._ns_decls = []
+        self._in_cdata = False
+        self.root = None
+
+    def create_parser(self):
+        # the same settings as the namespace-aware minidom builder, so that names and errors match
+        parser = xml.parsers.expat.ParserCreate(namespace_separator=' ')
+        parser.namespace_prefixes = True
+        parser.ordered_attributes = True
+        parser.buffer_text = True
+        parser.StartNamespaceDeclHandler = self._start_namespace_decl
+        parser.StartElementHandler = self._start_element
+        parser.EndElementHandler = self._end_element
+        parser.CharacterDataHandler = self._character_data
+        parser.CommentHandler = self._comment
+        parser.ProcessingInstructionHandler = self._processing_instruction
+        parser.StartCdataSectionHandler = self._start_cdata
+        parser.EndCdataSectionHandler = self._end_cdata
+        return parser
+
+    def _start_namespace_decl(self, prefix, uri):
+        self._ns_decls.append(('xmlns:' + prefix if prefix else 'xmlns', uri))
+
+    def _end_text_segment(self):
+        """minidom strips each text node (a run of text between other nodes) separately."""
+        frame = self._stack[-1]
+        if frame[3]:
+            frame[2].append(''.join(frame[3]).strip())
+            frame[3] = []
+
+    def _add_empty_node(self, name):
+        if self._stack:
+            self._end_text_segment()
+            self._stack[-1][4].append((name, self._converter._hbf_el_from_parts([], '', []), False))
+
+    def _start_element(self, name, attributes):
+        attrs = self._ns_decls
+        self._ns_decls = []
+        for i in range(0, len(attributes), 2):
+            attrs.append((_qualified_name(attributes[i]), attributes[i + 1]))
+        if self._stack:
+            self._end_text_segment()
+        self._stack.append([_qualified_name(name), attrs, [], [], []])
+
+    def _end_element(self, name):
+        self._end_text_segment()
+        name, attrs, text_segments, _, records = self._stack.pop()
+        text_content = ''.join(text_segments)
+        if not self._stack:
+            self.root = name, self._converter._hbf_el_from_parts(attrs, text_content, records)
+        elif name == 'meta' and self._meta_as_pair:
+            k, v = self._converter._transform_meta_parts(attrs, text_content, records)
+            self._stack[-1][4].append((k, v, True))
         else:
-            _LOG.debug('xsi:type attribute "%s" not LiteralMeta or ResourceMeta', xt)
-            return None, None
+            self._stack[-1][4].append((name, self._converter._hbf_el_from_parts(attrs, text_content, records), False))
+
+    def _character_data(self, data):
+        if self._stack and not self._in_cdata:
+            self._stack[-1][3].append(data)
+
+    def _comment(self, data):
+        self._add_empty_node('#comment')
+
+    def _processing_instruction(self, target, data):
+        self._add_empty_node(target)
+
+    def _start_cdata(self):
+        self._in_cdata = True
+
+    def _end_cdata(self):
+        self._in_cdata = False
+        self._add_empty_node('#cdata-section')
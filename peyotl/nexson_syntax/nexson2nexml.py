@@ -50,6 +50,123 @@ def _create_sub_el(doc, parent, tag, attrib, data=None):
     return el
 
 
+class _MinidomBuilder(object):
+    """Builds a minidom Document from the start_element and end_element calls of
+    Nexson2Nexml (the interface of _NexmlWriter)."""
+
+    def __init__(self):
+        self.doc = xml.dom.minidom.Document()
+        self._open = [self.doc]
+
+    def write_declaration(self, encoding='utf-8'):
+        pass
+
+    def start_element(self, tag, attrib, data=None):
+        self._open.append(_create_sub_el(self.doc, self._open[-1], tag, attrib, data))
+
+    def end_element(self):
+        self._open.pop()
+
+    def flush(self):
+        pass
+
+
+# number of strings that _NexmlWriter accumulates before writing them
+_NEXML_CHUNK_SIZE = 1 << 14
+
+
+def _escape_xml_data(data):
+    """Escapes text or an attribute value (as minidom does)."""
+    if not data:
+        return ''
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+
+class _NexmlWriter(object):
+    """Writes XML elements to a stream as they are created, with the same layout that
+    minidom's writexml produces for the same `addindent` and `newl`.
+    Whether an element is written as an empty tag, with its text inline, or with
+    its children on separate lines is only known when the element is ended (or its
+    first child is started), so the end of the start tag is written then.
+    """
+
+    def __init__(self, out, addindent='', newl=''):
+        self._out = out
+        self._addindent = addindent
+        self._newl = newl
+        self._parts = []
+        # [tag, indent, text, has_children] for each element that has not been ended
+        self._open = []
+
+    def write_declaration(self, encoding='utf-8'):
+        self._parts.append('<?xml version="1.0" encoding="{e}"?>{n}'.format(e=encoding, n=self._newl))
+
+    def start_element(self, tag, attrib, data=None):
+        """Starts an element with the tag `tag` (as a child of the last element started but not ended).
+        `attrib` should be a dictionary of string keys to primitives or dicts
+            if the value is a dict, then the keys of the dict are joined with
+            the `attrib` key using a colon. This deals with the badgerfish
+            convention of nesting xmlns: attributes in a @xmnls object
+        If `data` is not None, then it will be written as data. If it is a boolean,
+            the xml true false will be writtten. Otherwise it will be
+            converted to python unicode string, stripped and written.
+        """
+        parts = self._parts
+        if self._open:
+            parent = self._open[-1]
+            if not parent[3]:
+                self._start_content(parent)
+        indent = self._addindent * len(self._open)
+        parts.append(indent + '<' + tag)
+        if attrib:
+            atts = {}
+            if ('id' in attrib) and ('about' not in attrib):
+                atts['about'] = '#' + attrib['id']
+            for att_key, att_value in attrib.items():
+                if isinstance(att_value, dict):
+                    for inner_key, inner_val in att_value.items():
+                        atts[':'.join([att_key, inner_key])] = inner_val
+                else:
+                    atts[att_key] = att_value
+            for att_key, att_value in atts.items():
+                parts.append(' {}="'.format(att_key))
+                parts.append(_escape_xml_data(att_value))
+                parts.append('"')
+        text = None
+        if data is not None:
+            if data is True:
+                text = 'true'
+            elif data is False:
+                text = 'false'
+            else:
+                text = UNICODE(data).strip() or None
+        self._open.append([tag, indent, text, False])
+
+    def _start_content(self, el):
+        el[3] = True
+        self._parts.append('>' + self._newl)
+        if el[2] is not None:
+            self._parts.append(_escape_xml_data(el[1] + self._addindent + el[2] + self._newl))
+
+    def end_element(self):
+        tag, indent, text, has_children = self._open.pop()
+        parts = self._parts
+        if has_children:
+            parts.append('{i}</{t}>{n}'.format(i=indent, t=tag, n=self._newl))
+        elif text is not None:
+            parts.append('>')
+            parts.append(_escape_xml_data(text))
+            parts.append('</{t}>{n}'.format(t=tag, n=self._newl))
+        else:
+            parts.append('/>' + self._newl)
+        if len(parts) > _NEXML_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        self._out.write(''.join(self._parts))
+        self._parts = []
+
+
 def _convert_bf_meta_val_for_xml(blob):
     if not isinstance(blob, list):
         blob = [blob]
@@ -68,7 +185,7 @@ def _convert_bf_meta_val_for_xml(blob):
 class Nexson2Nexml(NexsonConverter):
     """Conversion of the optimized (v 1.2) version of NexSON to
     the more direct (v 1.0) port of NeXML
-    This is a dict-to-minidom-doc conversion. No serialization is included.
+    The XML is written to a stream as the dict is walked (see `write`).
     """
 
     def __init__(self, conv_cfg):
@@ -85,18 +202,33 @@ class Nexson2Nexml(NexsonConverter):
         self._creating_otu_label = True
 
     def convert(self, blob):
-        doc = xml.dom.minidom.Document()
+        """Returns a minidom Document for `blob`. `write` is much faster and does not build the DOM."""
+        builder = _MinidomBuilder()
+        self._build_xml(builder, blob)
+        return builder.doc
+
+    def write(self, blob, out, addindent='', newl='', encoding='utf-8'):
+        """Writes `blob` as NeXML to the stream `out`, formatted (using `addindent` and
+        `newl`) as minidom's writexml would format it.
+        """
+        writer = _NexmlWriter(out, addindent=addindent, newl=newl)
+        writer.write_declaration(encoding)
+        self._build_xml(writer, blob)
+
+    def _build_xml(self, writer, blob):
+        """Calls the start_element and end_element methods of `writer` for each element."""
         converted_root_el = False
         if 'nexml' in blob:
             converted_root_el = True
             blob['nex:nexml'] = blob['nexml']
             del blob['nexml']
-        self._top_level_build_xml(doc, blob)
-        if converted_root_el:
-            blob['nexml'] = blob['nex:nexml']
-            del blob['nex:nexml']
-
-        return doc
+        try:
+            self._top_level_build_xml(writer, blob)
+        finally:
+            if converted_root_el:
+                blob['nexml'] = blob['nex:nexml']
+                del blob['nex:nexml']
+        writer.flush()
 
     def _partition_keys_for_xml(self, o):
         """Breaks o into four content type by key syntax:
@@ -136,7 +268,7 @@ class Nexson2Nexml(NexsonConverter):
                 ck[k] = v
         return ak, tk, ck, mc
 
-    def _top_level_build_xml(self, doc, obj_dict):
+    def _top_level_build_xml(self, writer, obj_dict):
         if self.use_default_root_atts:
             root_atts = {
                 "xmlns:nex": "http://www.nexml.org/2009",
@@ -172,8 +304,8 @@ class Nexson2Nexml(NexsonConverter):
             atts['about'] = '#' + atts['id']
         if 'nexml2json' in atts:
             del atts['nexml2json']
-        r = _create_sub_el(doc, doc, root_name, atts, data)
-        self._add_meta_dict_to_xml(doc, r, meta_children)
+        writer.start_element(root_name, atts, data)
+        self._add_meta_dict_to_xml(writer, root_name, meta_children)
         nexml_key_order = (('meta', None),
                            ('otus', (('meta', None),
                                      ('otu', None)
@@ -203,34 +335,27 @@ class Nexson2Nexml(NexsonConverter):
                                       )
                             )
                            )
-        self._add_dict_of_subtree_to_xml_doc(doc, r, children, nexml_key_order)
+        self._add_dict_of_subtree_to_xml_doc(writer, root_name, children, nexml_key_order)
+        writer.end_element()
 
-    def _add_subtree_list_to_xml_doc(self, doc, par, ch_list, key, key_order):
+    def _add_subtree_list_to_xml_doc(self, writer, par_tag, ch_list, key, key_order):
         for child in ch_list:
             if isinstance(child, dict):
-                self._add_subtree_to_xml_doc(doc, par, child, key, key_order)
+                self._add_subtree_to_xml_doc(writer, par_tag, child, key, key_order)
+            elif isinstance(child, list) or isinstance(child, tuple) or isinstance(child, set):
+                for sc in child:
+                    if isinstance(sc, dict):
+                        self._add_subtree_to_xml_doc(writer, par_tag, sc, key, key_order)
+                    else:
+                        writer.start_element(key, {}, sc)
+                        writer.end_element()
             else:
-                ca = {}
-                cc = {}
-                mc = {}
-                if isinstance(child, list) or isinstance(child, tuple) or isinstance(child, set):
-                    for sc in child:
-                        if isinstance(sc, dict):
-                            self._add_subtree_to_xml_doc(doc, par, sc, key, key_order)
-                        else:
-                            cd = sc
-                            cel = _create_sub_el(doc, par, key, ca, cd)
-                            self._add_meta_dict_to_xml(doc, cel, mc)
-                            self._add_dict_of_subtree_to_xml_doc(doc, cel, cc, key_order=None)
-                else:
-                    cd = child
-                    cel = _create_sub_el(doc, par, key, ca, cd)
-                    self._add_meta_dict_to_xml(doc, cel, mc)
-                    self._add_dict_of_subtree_to_xml_doc(doc, cel, cc, key_order=None)
+                writer.start_element(key, {}, child)
+                writer.end_element()
 
     def _add_dict_of_subtree_to_xml_doc(self,
-                                        doc,
-                                        parent,
+                                        writer,
+                                        par_tag,
                                         children_dict,
                                         key_order=None):
         written = set()
@@ -241,17 +366,17 @@ class Nexson2Nexml(NexsonConverter):
                 if k in children_dict:
                     chl = _index_list_of_values(children_dict, k)
                     written.add(k)
-                    self._add_subtree_list_to_xml_doc(doc, parent, chl, k, nko)
+                    self._add_subtree_list_to_xml_doc(writer, par_tag, chl, k, nko)
         ksl = list(children_dict.keys())
         ksl.sort()
         for k in ksl:
             chl = _index_list_of_values(children_dict, k)
             if k not in written:
-                self._add_subtree_list_to_xml_doc(doc, parent, chl, k, None)
+                self._add_subtree_list_to_xml_doc(writer, par_tag, chl, k, None)
 
     def _add_subtree_to_xml_doc(self,
-                                doc,
-                                parent,
+                                writer,
+                                par_tag,
                                 subtree,
                                 key,
                                 key_order,
@@ -265,9 +390,9 @@ class Nexson2Nexml(NexsonConverter):
                 if da in ca:
                     del ca[da]
         if self._adding_tree_xsi_type:
-            if (key == 'tree') and (parent.tagName == 'trees') and ('xsi:type' not in ca):
+            if (key == 'tree') and (par_tag == 'trees') and ('xsi:type' not in ca):
                 ca['xsi:type'] = 'nex:FloatTree'
-        if self._creating_otu_label and (key == 'otu') and (parent.tagName == 'otus'):
+        if self._creating_otu_label and (key == 'otu') and (par_tag == 'otus'):
             key_to_promote = self.otu_label  # need to verify that we are converting from 1.0 not 0.0..
             # _LOG.debug(str((key_to_promote, mc.keys())))
             if key_to_promote in mc:
@@ -277,12 +402,12 @@ class Nexson2Nexml(NexsonConverter):
                 ca['label'] = str(val)
             elif key_to_promote in ca:
                 ca['label'] = str(ca[key_to_promote])
-        cel = _create_sub_el(doc, parent, key, ca, cd)
-        self._add_meta_dict_to_xml(doc, cel, mc)
-        self._add_dict_of_subtree_to_xml_doc(doc, cel, cc, key_order)
-        return cel
+        writer.start_element(key, ca, cd)
+        self._add_meta_dict_to_xml(writer, key, mc)
+        self._add_dict_of_subtree_to_xml_doc(writer, key, cc, key_order)
+        writer.end_element()
 
-    def _add_meta_dict_to_xml(self, doc, parent, meta_dict):
+    def _add_meta_dict_to_xml(self, writer, par_tag, meta_dict):
         """
         Values in the meta element dict are converted to a BadgerFish-style
             encoding (see _convert_hbf_meta_val_for_xml), so regardless of input_format,
@@ -295,15 +420,15 @@ class Nexson2Nexml(NexsonConverter):
         for key in key_list:
             el_list = _index_list_of_values(meta_dict, key)
             for el in el_list:
-                self._add_meta_value_to_xml_doc(doc, parent, el)
+                self._add_meta_value_to_xml_doc(writer, par_tag, el)
 
-    def _add_meta_value_to_xml_doc(self, doc, parent, obj):
+    def _add_meta_value_to_xml_doc(self, writer, par_tag, obj):
         """Values in the meta element dict are converted to a BadgerFish-style
             encoding (see _convert_hbf_meta_val_for_xml), so regardless of input_format,
             we treat them as if they were BadgerFish.
         """
-        return self._add_subtree_to_xml_doc(doc,
-                                            parent,
-                                            subtree=obj,
-                                            key='meta',
-                                            key_order=None)
+        self._add_subtree_to_xml_doc(writer,
+                                     par_tag,
+                                     subtree=obj,
+                                     key='meta',
+                                     key_order=None)
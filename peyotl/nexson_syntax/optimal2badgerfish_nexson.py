@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""Optimal2BadgerfishNexson class"""
+from peyotl.nexson_syntax.direct2badgerfish_nexson import Direct2BadgerfishNexson
+from peyotl.nexson_syntax.helper import (get_nexml_el,
+                                         BADGER_FISH_NEXSON_VERSION,
+                                         NexsonError)
+from peyotl.utility import get_logger
+
+_LOG = get_logger(__name__)
+
+_NEXML_CHILD_KEYS = frozenset(['otus', 'trees'])
+_TREE_CHILD_KEYS = frozenset(['node', 'edge'])
+
+
+class Optimal2BadgerfishNexson(Direct2BadgerfishNexson):
+    """Conversion of the optimized (v 1.2) version of NexSON to
+    "raw" Badgerfish + phylografter tweaks (v 0.0) in one walk.
+    The result is the same as that of Optimal2DirectNexson followed by
+    Direct2BadgerfishNexson, but no v 1.0 structures are left to be walked again.
+    Only the lean form (remove_old_structs=True) is produced.
+    This is a dict-to-dict in-place conversion. No serialization is included.
+    """
+
+    def __init__(self, conv_cfg):
+        Direct2BadgerfishNexson.__init__(self, conv_cfg)
+
+    def convert_otus(self, otusById, otusElementOrder):
+        otu_group_list = []
+        for oid in otusElementOrder:
+            otu_group = otusById[oid]
+            otu_group['@id'] = oid
+            otu_list = []
+            otu_by_id = otu_group['otuById']
+            for otu_id in sorted(otu_by_id.keys()):
+                otu = otu_by_id[otu_id]
+                otu['@id'] = otu_id
+                self._recursive_convert_dict(otu)
+                otu_list.append(otu)
+            otu_group['otu'] = otu_list
+            del otu_group['otuById']
+            self._recursive_convert_dict(otu_group, skip_keys=('otu',))
+            otu_group_list.append(otu_group)
+        return otu_group_list
+
+    def convert_tree(self, tree, tree_id):
+        nodeById = tree['nodeById']
+        edgeBySourceId = tree['edgeBySourceId']
+        root_node_id = tree['^ot:rootNodeId']
+        node_list = []
+        edge_list = []
+        curr_node_id = root_node_id
+        edge_stack = []
+        node_set_written = set()
+        edge_set_written = set()
+        while True:
+            curr_node = nodeById[curr_node_id]
+            curr_node['@id'] = curr_node_id
+            assert curr_node_id not in node_set_written
+            node_set_written.add(curr_node_id)
+            node_list.append(curr_node)
+            sub_edge_dict = edgeBySourceId.get(curr_node_id)
+            if sub_edge_dict:
+                self._recursive_convert_dict(curr_node)
+                ks = sorted(sub_edge_dict.keys())
+                eid, edge = ks[0], sub_edge_dict[ks[0]]
+                edge_stack.extend([(ski, sub_edge_dict[ski]) for ski in ks[-1:0:-1]])
+            else:
+                curr_node['^ot:isLeaf'] = True
+                self._recursive_convert_dict(curr_node)
+                if not edge_stack:
+                    break
+                eid, edge = edge_stack.pop(-1)
+            edge['@id'] = eid
+            assert eid not in edge_set_written
+            edge_set_written.add(eid)
+            self._recursive_convert_dict(edge)
+            edge_list.append(edge)
+            curr_node_id = edge['@target']
+        for n in nodeById.values():
+            assert n['@id'] in node_set_written
+        tree['node'] = node_list
+        tree['edge'] = edge_list
+        del tree['nodeById']
+        del tree['edgeBySourceId']
+        del tree['^ot:rootNodeId']
+        tree['@id'] = tree_id
+        self._recursive_convert_dict(tree, skip_keys=_TREE_CHILD_KEYS)
+        return tree
+
+    def convert_trees(self, treesById, treesElementOrder):
+        trees_group_list = []
+        tree_id_set = set()
+        trees_id_set = set()
+        for tgid in treesElementOrder:
+            tree_group = treesById[tgid]
+            if tgid in trees_id_set:
+                raise NexsonError('Repeated trees element id "{}"'.format(tgid))
+            trees_id_set.add(tgid)
+            tree_group['@id'] = tgid
+            tree_list = []
+            tree_by_id = tree_group['treeById']
+            for tree_id in tree_group['^ot:treeElementOrder']:
+                if tree_id in tree_id_set:
+                    raise NexsonError('Repeated tree element id "{}"'.format(tree_id))
+                tree_id_set.add(tree_id)
+                tree_list.append(self.convert_tree(tree_by_id[tree_id], tree_id))
+            tree_group['tree'] = tree_list
+            del tree_group['treeById']
+            del tree_group['^ot:treeElementOrder']
+            self._recursive_convert_dict(tree_group, skip_keys=('tree',))
+            trees_group_list.append(tree_group)
+        return trees_group_list
+
+    def convert(self, obj):
+        """Takes a dict corresponding to the honeybadgerfish JSON blob of the 1.2.* type and
+        converts it to BADGER_FISH_NEXSON_VERSION. The object is modified in place
+        and returned.
+        """
+        if self.pristine_if_invalid:
+            raise NotImplementedError('pristine_if_invalid option is not supported yet')
+        if not self.remove_old_structs:
+            raise NotImplementedError('remove_old_structs=False requires the conversion through v 1.0')
+        nex = get_nexml_el(obj)
+        assert nex
+        nex['otus'] = self.convert_otus(nex['otusById'], nex['^ot:otusElementOrder'])
+        nex['trees'] = self.convert_trees(nex['treesById'], nex['^ot:treesElementOrder'])
+        # set before the old keys are removed, as in the conversion through v 1.0
+        nex['@nexml2json'] = str(BADGER_FISH_NEXSON_VERSION)
+        del nex['otusById']
+        del nex['^ot:otusElementOrder']
+        del nex['treesById']
+        del nex['^ot:treesElementOrder']
+        self._recursive_convert_dict(nex, skip_keys=_NEXML_CHILD_KEYS)
+        self._single_el_list_to_dicts(nex, 'otus')
+        self._single_el_list_to_dicts(nex, 'trees')
+        return obj
@@ -2,20 +2,31 @@
 from __future__ import absolute_import, print_function, division
 from peyotl.phylo.entities import OTULabelStyleEnum
 from peyotl.nexson_syntax import quote_newick_name
-from peyotl.phylo.tree import create_tree_from_id2par, create_anc_lineage_from_id2par
+from peyotl.ott.array_cache import (ArrayBackedParentMap, OTTArrayCache, array_cache_filepath, ott_id_to_flags_map,
+                                    ott_id_to_preorder_map, ott_id_to_ranks_map, remove_array_caches,
+                                    newick_labels_filepath, read_newick_labels, remove_newick_labels,
+                                    pruned_bitmap_filepath, read_pruned_bitmap, remove_pruned_bitmaps,
+                                    replace_file, write_array_caches, write_newick_labels, write_pruned_bitmap,
+                                    ARRAY_CACHE_INFO_FILENAME, NO_VALUE)
+from peyotl.ott.cache_builder import (CacheBuildReport, compute_jump_rows, index_taxonomy_rows,
+                                      iter_preorder2tuple_items, number_taxonomy_rows, reorder_by_row,
+                                      source_fingerprint, write_pickled_dict_items)
+from peyotl.ott.name_index import NameIndex, write_name_index
+from peyotl.utility.input_output import read_as_json, write_as_json
+from peyotl.phylo.tree import create_tree_from_id2par, NodeWithPathInEdges, TreeWithPathsInEdges
 from peyotl.utility.str_util import is_str_type
 from peyotl.utility import get_config_object, get_logger
 from collections import defaultdict
 import pickle
 import codecs
+import array
+import locket
 import os
 
 _LOG = get_logger(__name__)
 NONE_PAR = None
 
 _PICKLE_AS_JSON = False
-if _PICKLE_AS_JSON:
-    from peyotl.utility.input_output import read_as_json, write_as_json
 
 _TREEMACHINE_PRUNE_FLAGS = {'major_rank_conflict', 'major_rank_conflict_direct', 'major_rank_conflict_inherited',
                             'environmental', 'unclassified_inherited', 'unclassified_direct', 'viral', 'nootu',
@@ -25,12 +36,17 @@ _TREEMACHINE_PRUNE_FLAGS = {'major_rank_conflict', 'major_rank_conflict_direct',
 
 class OTTFlagUnion(object):
     def __init__(self, ott, flag_set):
+        self.flags = frozenset(flag_set)
         self._flag_set_keys = ott.convert_flag_string_set_to_flag_set_keys(flag_set)
 
     def keys(self):
         return set(self._flag_set_keys)
 
 
+# number of strings that the newick writers accumulate before writing them
+_NEWICK_CHUNK_SIZE = 1 << 16
+
+
 def write_newick_ott(out,
                      ott,
                      ott_id2children,
@@ -40,7 +56,8 @@ def write_newick_ott(out,
                      create_log_dict=False):
     """`out` is an output stream
     `ott` is an OTT instance used for translating labels
-    `ott_id2children` is a dict mapping an OTT ID to the IDs of its children
+    `ott_id2children` is a dict mapping an OTT ID to the IDs of its children, or None to walk
+        the taxonomy using the preorder numbering of the array caches (which is much faster).
     `root_ott_id` is the root of the subtree to write.
     `label_style` is a facet of OTULabelStyleEnum
     `prune_flags` is a set strings (flags) or OTTFlagUnion instance or None
@@ -57,6 +74,7 @@ def write_newick_ott(out,
     flags_to_prune_set = frozenset(flags_to_prune_list)
     pfd = {}
     log_dict = None
+    pruned_dict = None
     if create_log_dict:
         log_dict = {'version': ott.version, 'flags_to_prune': flags_to_prune_list}
         fsi_to_str_flag_set = {}
@@ -72,66 +90,19 @@ def write_newick_ott(out,
         # log_dict['prune_flags_d'] = d
         # log_dict['pfd'] = pfd
         pruned_dict = {}
-    num_tips = 0
-    num_pruned_anc_nodes = 0
-    num_nodes = 0
-    num_monotypic_nodes = 0
     if to_prune_fsi_set and ott.has_flag_set_key_intersection(root_ott_id, to_prune_fsi_set):
         # entire taxonomy is pruned off
         if log_dict is not None:
             fsi = ott.get_flag_set_key(root_ott_id)
             pruned_dict[fsi] = {'': [root_ott_id]}
-        num_pruned_anc_nodes += 1
+        counts = (0, 1, 0, 0)
+    elif ott_id2children is None:
+        counts = _write_newick_ott_preorder(out, ott, root_ott_id, ott.newick_labels(label_style),
+                                            to_prune_fsi_set, pruned_dict)
     else:
-        stack = [root_ott_id]
-        first_children = set(stack)
-        last_children = set()
-        while stack:
-            ott_id = stack.pop()
-            if isinstance(ott_id, tuple):
-                ott_id = ott_id[0]
-            else:
-                num_nodes += 1
-                children = ott_id2children[ott_id]
-                if to_prune_fsi_set is not None:
-                    c = []
-                    for child_id in children:
-                        if ott.has_flag_set_key_intersection(child_id, to_prune_fsi_set):
-                            if log_dict is not None:
-                                fsi = ott.get_flag_set_key(child_id)
-                                fd = pruned_dict.get(fsi)
-                                if fd is None:
-                                    pruned_dict[fsi] = {'anc_ott_id_pruned': [child_id]}
-                                else:
-                                    fd['anc_ott_id_pruned'].append(child_id)
-                            num_pruned_anc_nodes += 1
-                        else:
-                            c.append(child_id)
-                    children = c
-                    nc = len(children)
-                    if nc < 2:
-                        if nc == 1:
-                            num_monotypic_nodes += 1
-                        else:
-                            num_tips += 1
-                if ott_id not in first_children:
-                    out.write(',')
-                else:
-                    first_children.remove(ott_id)
-                if bool(children):
-                    out.write('(')
-                    first_children.add(children[0])
-                    last_children.add(children[-1])
-                    stack.append((ott_id,))  # a tuple will signal exiting a node...
-                    stack.extend([i for i in reversed(children)])
-                    continue
-            n = ott.get_label(ott_id, label_style)
-            n = quote_newick_name(n)
-            out.write(n)
-            if ott_id in last_children:
-                out.write(')')
-                last_children.remove(ott_id)
-        out.write(';')
+        counts = _write_newick_ott_children(out, ott, ott_id2children, root_ott_id, label_style,
+                                            to_prune_fsi_set, pruned_dict)
+    num_tips, num_pruned_anc_nodes, num_nodes, num_monotypic_nodes = counts
     if create_log_dict:
         log_dict['pruned'] = {}
         for fsi, obj in pruned_dict.items():
@@ -149,72 +120,185 @@ def write_newick_ott(out,
     return log_dict
 
 
-class _TransitionalNode(object):
-    def __init__(self, ott_id=None, par=None):
-        self.par = par
-        # self.ott_id = ott_id
-        self.children = None
-        self.preorder_number = None
-        if par is not None:
-            par.add_child(self)
+def _log_pruned_child(ott, pruned_dict, child_id):
+    fsi = ott.get_flag_set_key(child_id)
+    fd = pruned_dict.get(fsi)
+    if fd is None:
+        pruned_dict[fsi] = {'anc_ott_id_pruned': [child_id]}
+    else:
+        fd['anc_ott_id_pruned'].append(child_id)
 
-    def add_child(self, c):
-        if self.children is None:
-            self.children = [c]
-        else:
-            self.children.append(c)
-
-    def number_tree(self, n):
-        self.preorder_number = n
-        if self.children is None:
-            return n + 1
-        n += 1
-        for c in self.children:
-            n = c.number_tree(n)
-        return n
 
-    def fill_preorder2tuples(self, r_sib_pn, preorder2tuples):
-        ppn = self.par.preorder_number
-        pn = self.preorder_number
-        if self.children is None:
-            t = (ppn, r_sib_pn)
+def _write_newick_ott_preorder(out, ott, root_ott_id, labels, to_prune_fsi_set, pruned_dict):
+    """Writes the (unpruned) subtree of `root_ott_id` by walking its interval of preorder #'s.
+    `labels` holds the quoted label of each row (see OTT.newick_labels).
+    Pruned children are logged in `pruned_dict` (if it is not None).
+    Returns (num_tips, num_pruned_anc_nodes, num_nodes, num_monotypic_nodes)
+    """
+    ac = ott.array_cache
+    pre2row, sizes, pre2id = ac.preorder_rows, ac.subtree_sizes, ac.preorder2ott_id
+    root_pre = ac.preorder_interval(root_ott_id)[0]
+    pruned_bitmap = None
+    if to_prune_fsi_set is not None:
+        # The children of an unpruned node are pruned iff they are flagged, so the pruned bitmap
+        #   can be used unless the root of the subtree is below a flagged ancestor.
+        pruned_bitmap = ott.pruned_preorder_bitmap(to_prune_fsi_set)
+        if pruned_bitmap[root_pre]:
+            pruned_bitmap = None
+            flag_set_keys = ac.flag_set_keys
+            taboo = frozenset(to_prune_fsi_set.keys())
+    num_tips = 0
+    num_pruned_anc_nodes = 0
+    num_nodes = 0
+    num_monotypic_nodes = 0
+    parts = []
+    # `todo` holds the preorder #'s of the nodes to write (last child on top) and, below the
+    #   children of a node, the bitwise complement of its preorder # to close it.
+    todo = [root_pre]
+    need_comma = False
+    while todo:
+        p = todo.pop()
+        if p < 0:
+            parts.append(')')
+            parts.append(labels[pre2row[~p]])
+            need_comma = True
+            continue
+        if need_comma:
+            parts.append(',')
+        num_nodes += 1
+        r = pre2row[p]
+        end = p + sizes[r]
+        c = p + 1
+        children = []
+        while c < end:
+            cr = pre2row[c]
+            if to_prune_fsi_set is not None and (pruned_bitmap[c] if pruned_bitmap is not None
+                                                 else flag_set_keys[cr] in taboo):
+                if pruned_dict is not None:
+                    _log_pruned_child(ott, pruned_dict, pre2id[c])
+                num_pruned_anc_nodes += 1
+            else:
+                children.append(c)
+            c += sizes[cr]
+        if to_prune_fsi_set is not None:
+            nc = len(children)
+            if nc < 2:
+                if nc == 1:
+                    num_monotypic_nodes += 1
+                else:
+                    num_tips += 1
+        if children:
+            parts.append('(')
+            todo.append(~p)
+            children.reverse()
+            todo.extend(children)
+            need_comma = False
+        else:
+            parts.append(labels[r])
+            need_comma = True
+            if len(parts) > _NEWICK_CHUNK_SIZE:
+                out.write(''.join(parts))
+                parts = []
+    parts.append(';')
+    out.write(''.join(parts))
+    return num_tips, num_pruned_anc_nodes, num_nodes, num_monotypic_nodes
+
+
+def _write_newick_ott_children(out, ott, ott_id2children, root_ott_id, label_style, to_prune_fsi_set,
+                               pruned_dict):
+    """Writes the (unpruned) subtree of `root_ott_id` using the `ott_id2children` dict.
+    Returns (num_tips, num_pruned_anc_nodes, num_nodes, num_monotypic_nodes)
+    """
+    num_tips = 0
+    num_pruned_anc_nodes = 0
+    num_nodes = 0
+    num_monotypic_nodes = 0
+    pruned_bitmap = None
+    if to_prune_fsi_set is not None:
+        # The children of an unpruned node are pruned iff they are flagged, so the pruned bitmap
+        #   can be used unless the root of the subtree is below a flagged ancestor.
+        pruned_bitmap = ott.pruned_preorder_bitmap(to_prune_fsi_set)
+        o2pre = ott.ott_id_to_preorder
+        if pruned_bitmap[o2pre[root_ott_id]]:
+            pruned_bitmap = None
+    labels, row = ott.newick_labels(label_style), ott.array_cache.row
+    parts = []
+    stack = [root_ott_id]
+    first_children = set(stack)
+    last_children = set()
+    while stack:
+        ott_id = stack.pop()
+        if isinstance(ott_id, tuple):
+            ott_id = ott_id[0]
         else:
-            curr_c = self.children[0]
-            left_child_pn = curr_c.preorder_number
-            for r_sib in self.children[1:]:
-                right_pn = r_sib.preorder_number
-                curr_c.fill_preorder2tuples(right_pn, preorder2tuples)
-                curr_c = r_sib
-            curr_c.fill_preorder2tuples(None, preorder2tuples)
-            right_child_pn = curr_c.preorder_number
-            t = (ppn, r_sib_pn, left_child_pn, right_child_pn)
-        assert pn not in preorder2tuples
-        preorder2tuples[pn] = t
-
-    def create_leaf_set(self, leaves):
-        if self.children:
-            for c in self.children:
-                c.create_leaf_set(leaves)
-        elif self.ott_id is not None:
-            leaves.add(self.ott_id)
+            num_nodes += 1
+            children = ott_id2children[ott_id]
+            if to_prune_fsi_set is not None:
+                c = []
+                for child_id in children:
+                    if (pruned_bitmap[o2pre[child_id]] if pruned_bitmap is not None
+                            else ott.has_flag_set_key_intersection(child_id, to_prune_fsi_set)):
+                        if pruned_dict is not None:
+                            _log_pruned_child(ott, pruned_dict, child_id)
+                        num_pruned_anc_nodes += 1
+                    else:
+                        c.append(child_id)
+                children = c
+                nc = len(children)
+                if nc < 2:
+                    if nc == 1:
+                        num_monotypic_nodes += 1
+                    else:
+                        num_tips += 1
+            if ott_id not in first_children:
+                parts.append(',')
+            else:
+                first_children.remove(ott_id)
+            if bool(children):
+                parts.append('(')
+                first_children.add(children[0])
+                last_children.add(children[-1])
+                stack.append((ott_id,))  # a tuple will signal exiting a node...
+                stack.extend([i for i in reversed(children)])
+                continue
+        r = row(ott_id)
+        if r == NO_VALUE:
+            raise KeyError('OTT ID {} is not in the taxonomy'.format(ott_id))
+        parts.append(labels[r])
+        if ott_id in last_children:
+            parts.append(')')
+            last_children.remove(ott_id)
+        if len(parts) > _NEWICK_CHUNK_SIZE:
+            out.write(''.join(parts))
+            parts = []
+    parts.append(';')
+    out.write(''.join(parts))
+    return num_tips, num_pruned_anc_nodes, num_nodes, num_monotypic_nodes
+
 
 _CACHES = {
     'flagsetid2flagset': ('flagSetID2FlagSet', 'maps an integer to set of flags. Used to compress the flags field'),
-    'forwardingtable': ('forward_table', 'maps a deprecated ID to its forwarded ID'),
+    'forwardingtable': ('forwardingTable', 'maps a deprecated ID to its forwarded ID (both ints)'),
     'homonym2ottid': ('homonym2ottID', 'maps a taxon name -> tuple of OTT IDs ',),
     'name2ottid': ('name2ottID', 'maps a taxon name -> ott ID ',),
+    'nameindex': ('nameIndex', 'index of names for case-insensitive, prefix and approximate lookups. '
+                               'See peyotl.ott.name_index',),
     'ncbi2ottid': ('ncbi2ottID', 'maps an ncbi to an ott ID or list of ott IDs'),
     'nonhomonym2ottid': ('nonhomonym2ottID', 'maps a taxon name -> single OTT ID ',),
-    'ottid2flags': ('ottID2flags', '''maps an ott ID to an integer that can be looked up in the flag_set_id2flag_set dictionary. Absence of a ott ID means that there were no flags set.''',),
+    'ottid2flags': ('ottID2flags', '''array: row -> an integer that can be looked up in the flag_set_id2flag_set
+    dictionary. -1 means that there were no flags set.''',),
+    'ottid2jumprow': ('ottID2jumpRow', 'array: row -> row of an ancestor used to find LCAs in O(log depth) steps',),
     'ottid2names': ('ottID2names', 'ottID to a name or list/tuple of names',),
-    'ottid2parentottid': ('ottID2parentOttId', 'ott ID-> parent\'s ott ID. root maps to -1',),
-    'ottid2preorder': ('ottID2preorder', 'ott ID -> preorder #',),
-    'ottid2ranks': ('ottID2ranks','ottID -> rank',),
-    'ottid2sources': ('ottIDsources', '''maps an ott ID to a dict. The value
+    'ottid2parentottid': ('ottID2parentOttId', 'array: row -> row of the parent. root maps to -1',),
+    'ottid2preorder': ('ottID2preorder', 'array: row -> preorder #',),
+    'ottid2ranks': ('ottID2ranks', 'array: row -> index of the rank in the "ranks" list of the array cache info. '
+                                   '-1 for no rank',),
+    'ottid2sources': ('ottID2sources', '''maps an ott ID to a dict. The value
     holds a mapping of a source taxonomy name to the ID of this ott ID in that
     taxonomy.''',),
+    'ottid2subtreesize': ('ottID2subtreeSize', 'array: row -> # of taxa in the subtree rooted at the taxon',),
     'ottid2uniq': ('ottID2uniq', 'ott ID -> uniqname for those IDs that have a uniqname field',),
-    'preorder2ottid': ('preorder2ottID', 'preorder # -> ott ID',),
+    'preorder2ottid': ('preorder2ottID', 'array: preorder # -> ott ID',),
     'preorder2tuple': ('preorder2tuple', '''preorder # to a node definition
     Each node definition is a tuple of preorder numbers:
     leaves will be: (parent, next_sib)
@@ -223,10 +307,51 @@ _CACHES = {
     also in the map is 'root' -> root preorder number
     ''',),
     'root': ('root', 'name and ott_id of the root of the taxonomy',),
+    'sortedottids': ('sortedOttIDs', '''array: sorted table of every OTT ID. The index of an ID in this table is
+    the "row" used to index the other array caches''',),
     'taxonomicsources': ('taxonomicSources', 'the set of all taxonomic source prefixes'),
     'uniq2ottid': ('uniq2ottID', 'uniqname -> ott ID for those IDs that have a uniqname',)
    }
 _SECOND_LEVEL_CACHES = {'ncbi2ottid'}
+# caches stored as mmap-ed arrays (see peyotl.ott.array_cache) rather than pickles
+_ARRAY_CACHES = {'ottid2flags', 'ottid2jumprow', 'ottid2parentottid', 'ottid2preorder', 'ottid2ranks',
+                 'ottid2subtreesize', 'preorder2ottid', 'sortedottids'}
+
+_CACHE_MANIFEST_FILENAME = 'cacheManifest.json'
+_BUILD_LOCK_FILENAME = '.cacheBuild.lock'
+# The caches are built in steps. Each step reads the listed source files (in the OTT dir)
+#   and writes the listed caches. When the content (sha1) of a source file changes,
+#   only the caches of the steps that read it are rebuilt. The sha1 of the sources used in
+#   each build are recorded in cacheManifest.json.
+_BUILD_STEPS = (('taxonomy', ('taxonomy.tsv',), None),  # None -> every cache not in another step
+                ('names', ('taxonomy.tsv', 'synonyms.tsv'),
+                 ('homonym2ottid', 'name2ottid', 'nameindex', 'nonhomonym2ottid', 'ottid2names')),
+                ('forwarding', ('forwards.tsv', 'legacy-forwards.tsv'), ('forwardingtable',)),
+                )
+_REQUIRED_SOURCES = {'taxonomy.tsv', 'synonyms.tsv'}
+_BUILD_STEP_ORDER = tuple([i[0] for i in _BUILD_STEPS])
+_BUILD_STEP_SOURCES = dict([(i[0], i[1]) for i in _BUILD_STEPS])
+_CACHE_TO_BUILD_STEP = {}
+for _step, _sources, _targets in _BUILD_STEPS:
+    if _targets is not None:
+        for _target in _targets:
+            _CACHE_TO_BUILD_STEP[_target] = _step
+for _target in _CACHES.keys():
+    _CACHE_TO_BUILD_STEP.setdefault(_target, 'taxonomy')
+_BUILD_STEP_CACHES = {}
+for _target, _step in _CACHE_TO_BUILD_STEP.items():
+    if _target not in _SECOND_LEVEL_CACHES:
+        _BUILD_STEP_CACHES.setdefault(_step, set()).add(_target)
+del _step, _sources, _targets, _target
+
+
+def _cache_filepath(directory, target):
+    stem = _CACHES[target][0]
+    if target in _ARRAY_CACHES:
+        return array_cache_filepath(directory, stem)
+    if target == 'nameindex':
+        return os.path.join(directory, stem + '.bin')
+    return os.path.join(directory, stem + '.pickle')
 
 
 class CacheNotFoundError(RuntimeError):
@@ -251,20 +376,28 @@ class OTT(object):
             raise ValueError('"{}" is not a directory'.format(self.ott_dir))
         # self.skip_prefixes = ('environmental samples (', 'uncultured (', 'Incertae Sedis (')
         self.skip_prefixes = ('environmental samples (',)
+        # seconds to wait for another process that is building the caches (None to wait forever)
+        self._build_lock_timeout = kwargs.get('build_lock_timeout')
         self._ott_id_to_names = None
+        self._array_cache = None
         self._ott_id2par_ott_id = None
+        self._ott_id_to_preorder = None
         self._preorder2ott_id = None
         self._version = None
         self._root_name = None
         self._root_ott_id = None
         self._name2ott_ids = None
+        self._name_index = None
         self._ott_id_to_flags = None
         self._ott_id_to_sources = None
         self._ott_id_to_ranks = None
+        self._ott_id_to_uniq = None
         self._flag_set_id2flag_set = None
         self._taxonomic_sources = None
         self._ncbi_2_ott_id = None
         self._forward_table = None
+        self._pruned_bitmaps = {}
+        self._newick_labels = {}
 
     def create_ncbi_to_ott(self):
         ncbi2ott = {}
@@ -361,38 +494,39 @@ class OTT(object):
     def legacy_forwarding_filepath(self):
         return os.path.abspath(os.path.join(self.ott_dir, 'legacy-forwards.tsv'))
 
+    @property
+    def array_cache(self):
+        """OTTArrayCache holding the mmap-ed parent, preorder, flag and rank arrays"""
+        if self._array_cache is None:
+            for target in _ARRAY_CACHES:
+                self.make(target)
+            self._array_cache = OTTArrayCache(self.ott_dir)
+        return self._array_cache
+
     @property
     def ott_id2par_ott_id(self):
+        """dict-like mapping of OTT ID -> parent's OTT ID (None for the root)."""
         if self._ott_id2par_ott_id is None:
-            fp = self.make('ottid2parentottid')
-            self._ott_id2par_ott_id = self._load_cache_filepath(fp)
+            self._ott_id2par_ott_id = ArrayBackedParentMap(self.array_cache)
         return self._ott_id2par_ott_id
 
     def make(self, target):
+        """Makes sure that the cache `target` (a key of _CACHES) is up to date, rebuilding
+        the caches of its build step if the content of any of the step's sources has changed.
+        Returns the filepath of the cache.
+        """
         tl = target.lower()
         if tl not in _CACHES:
             c = '\n  '.join(_CACHES.keys())
             raise ValueError('target "{t}" not understood. Must be one of: {a}'.format(t=target, a=c))
-        info = _CACHES[tl]
-        fn = info[0] + '.pickle'
-        fp = os.path.join(self.ott_dir, fn)
-        need_build = False
-        if not os.path.exists(fp):
-            need_build = True
-        else:
-            taxonomy_file = self.taxonomy_filepath
-            if not os.path.exists(taxonomy_file):
-                raise RuntimeError('taxonomy not found at "{}"'.format(taxonomy_file))
-            if os.path.getmtime(fp) < os.path.getmtime(taxonomy_file):
-                need_build = True
-            elif tl in ['name2ottid', 'ottid2names']:  # TODO, make sure that these are the only files needing synonyms.
-                if os.path.getmtime(fp) < os.path.getmtime(self.synonyms_filepath):
-                    need_build = True
-        if need_build:
-            if tl in _SECOND_LEVEL_CACHES:
+        fp = _cache_filepath(self.ott_dir, tl)
+        step = _CACHE_TO_BUILD_STEP[tl]
+        if tl in _SECOND_LEVEL_CACHES:
+            if (not os.path.exists(fp)) or self._stale_build_steps([step]):
                 raise CacheNotFoundError(tl)
+        elif self._stale_build_steps([step]):
             _LOG.debug('building "{}"'.format(fp))
-            self._create_caches(out_dir=self.ott_dir)
+            self._create_caches(out_dir=self.ott_dir, steps=[step])
         else:
             _LOG.debug('"{}" up to date.'.format(fp))
         return fp
@@ -404,17 +538,17 @@ class OTT(object):
         return self._load_cache_filepath(fp)
 
     def _load_cache_filepath(self, fp):
-        if not os.path.exists(fp):
-            fn = os.path.split(fp)[-1]
-            if fn.endswith('.pickle'):
-                fn = fn[:-len('.pickle')]
-            self.make(fn.lower())
+        fn = os.path.split(fp)[-1]
+        if fn.endswith('.pickle'):
+            fn = fn[:-len('.pickle')]
+        self.make(fn.lower())
         return _load_pickle_fp_raw(fp)
 
     @property
     def ott_id_to_flags(self):
+        """dict-like mapping of OTT ID -> flag set key (absent for taxa without flags)"""
         if self._ott_id_to_flags is None:
-            self._ott_id_to_flags = self._load_pickled('ottID2flags')
+            self._ott_id_to_flags = ott_id_to_flags_map(self.array_cache)
         return self._ott_id_to_flags
 
     @property
@@ -423,6 +557,13 @@ class OTT(object):
             self._ott_id_to_sources = self._load_pickled('ottID2sources')
         return self._ott_id_to_sources
 
+    @property
+    def ott_id_to_uniq(self):
+        """dict of OTT ID -> uniqname (only for the taxa that have a uniqname)"""
+        if self._ott_id_to_uniq is None:
+            self._ott_id_to_uniq = self._load_pickled('ottID2uniq')
+        return self._ott_id_to_uniq
+
     @property
     def ott_id_to_names(self):
         if self._ott_id_to_names is None:
@@ -431,14 +572,23 @@ class OTT(object):
 
     @property
     def ott_id_to_ranks(self):
+        """dict-like mapping of OTT ID -> rank (absent for taxa without a rank)"""
         if self._ott_id_to_ranks is None:
-            self._ott_id_to_ranks = self._load_pickled('ottID2ranks')
+            self._ott_id_to_ranks = ott_id_to_ranks_map(self.array_cache)
         return self._ott_id_to_ranks
 
+    @property
+    def ott_id_to_preorder(self):
+        """dict-like mapping of OTT ID -> preorder #"""
+        if self._ott_id_to_preorder is None:
+            self._ott_id_to_preorder = ott_id_to_preorder_map(self.array_cache)
+        return self._ott_id_to_preorder
+
     @property
     def preorder2ott_id(self):
+        """sequence of OTT IDs indexed by preorder #"""
         if self._preorder2ott_id is None:
-            self._preorder2ott_id = self._load_pickled('preorder2ottID')
+            self._preorder2ott_id = self.array_cache.preorder2ott_id
         return self._preorder2ott_id
 
     def get_label(self, ott_id, name2label):
@@ -447,6 +597,23 @@ class OTT(object):
             return u'{n}_ott{o:d}'.format(n=n, o=ott_id)
         return n
 
+    def newick_labels(self, label_style):
+        """Returns a list of the Newick-quoted label (in `label_style`) of each row of the array caches.
+        The list for each style is written to the OTT dir the first time it is requested.
+        """
+        labels = self._newick_labels.get(label_style)
+        if labels is not None:
+            return labels
+        self.make('ottid2names')  # removes the label caches if the names are rebuilt
+        ac = self.array_cache
+        fp = newick_labels_filepath(self.ott_dir, label_style)
+        labels = read_newick_labels(fp, ac.num_taxa)
+        if labels is None:
+            labels = write_newick_labels(fp, [quote_newick_name(self.get_label(ott_id, label_style))
+                                              for ott_id in ac.sorted_ott_ids])
+        self._newick_labels[label_style] = labels
+        return labels
+
     def get_name(self, ott_id):
         name_or_name_list = self.ott_id_to_names.get(ott_id)
         if name_or_name_list is None:
@@ -455,6 +622,13 @@ class OTT(object):
             return name_or_name_list
         return name_or_name_list[0]
 
+    @property
+    def name_index(self):
+        """NameIndex for exact, case-insensitive, prefix and approximate lookups of names and synonyms"""
+        if self._name_index is None:
+            self._name_index = NameIndex(self.make('nameindex'))
+        return self._name_index
+
     def get_ott_ids(self, name):
         if self._name2ott_ids is None:
             self._name2ott_ids = self._load_pickled('name2ottID')
@@ -475,57 +649,144 @@ class OTT(object):
     def remove_caches(self, out_dir=None):
         if out_dir is None:
             out_dir = self.ott_dir
-        for tup in _CACHES.values():
-            fp = os.path.join(out_dir, tup[0] + '.pickle')
+        if out_dir == self.ott_dir:
+            self._reset_loaded_caches()
+        for target in _CACHES.keys():
+            fp = _cache_filepath(out_dir, target)
             if os.path.exists(fp):
                 _LOG.info('Removing cache "{f}"'.format(f=fp))
                 os.remove(fp)
             else:
                 _LOG.debug('Cache "{f}" was absent (no deletion needed).'.format(f=fp))
+        remove_array_caches(out_dir)
+        fp = os.path.join(out_dir, _CACHE_MANIFEST_FILENAME)
+        if os.path.exists(fp):
+            os.remove(fp)
 
-    def _create_caches(self, out_dir=None):
-        try:
-            self._create_pickle_files(out_dir=out_dir)
-        except:
-            raise  # TODO, clean up
+    def _reset_loaded_caches(self):
+        """Forgets every cache that has been loaded, so that they will be reread after a rebuild."""
+        self._ott_id_to_names = None
+        self._array_cache = None
+        self._ott_id2par_ott_id = None
+        self._ott_id_to_preorder = None
+        self._preorder2ott_id = None
+        self._name2ott_ids = None
+        self._name_index = None
+        self._ott_id_to_flags = None
+        self._ott_id_to_sources = None
+        self._ott_id_to_ranks = None
+        self._ott_id_to_uniq = None
+        self._flag_set_id2flag_set = None
+        self._taxonomic_sources = None
+        self._ncbi_2_ott_id = None
+        self._forward_table = None
+        self._pruned_bitmaps = {}
+        self._newick_labels = {}
 
-    def _create_pickle_files(self, out_dir=None):  # pylint: disable=R0914,R0915
+    def _read_cache_manifest(self, out_dir):
+        fp = os.path.join(out_dir, _CACHE_MANIFEST_FILENAME)
+        if not os.path.exists(fp):
+            return {'steps': {}}
+        return read_as_json(fp)
+
+    def _write_cache_manifest(self, out_dir, manifest):
+        fp = os.path.join(out_dir, _CACHE_MANIFEST_FILENAME)
+        tmp_fp = fp + '.tmp'
+        write_as_json(manifest, tmp_fp, indent=1)
+        replace_file(tmp_fp, fp)
+
+    def _source_fingerprints(self, step, recorded=None):
+        """Returns a dict of source filename -> fingerprint (see source_fingerprint) for
+        the sources of the build `step`. The sha1 of a file is only recomputed if its size or
+        mtime differs from the fingerprint in `recorded`.
+        """
+        if recorded is None:
+            recorded = {}
+        fingerprints = {}
+        for fn in _BUILD_STEP_SOURCES[step]:
+            fp = os.path.join(self.ott_dir, fn)
+            if fn in _REQUIRED_SOURCES and not os.path.exists(fp):
+                raise RuntimeError('OTT source file not found at "{}"'.format(fp))
+            fingerprints[fn] = source_fingerprint(fp, recorded.get(fn))
+        return fingerprints
+
+    def _stale_build_steps(self, steps, out_dir=None):
+        """Returns the list of build steps (in `steps`) that have missing outputs, or have
+        sources whose content differs from the content when the caches were built.
         """
-       preorder2tuple maps a preorder number to a node definition.
-       ottID2preorder maps every OTT ID in taxonomy.tsv to a preorder #
-        'ottID2preorder'
-        'ottID2preorder'
-        'preorder2ottID'
-        'ottID2uniq'
-        'uniq2ottID'
-        'name2ottID'
-        'ottID2names'
-        'ottID2ranks'
-        'ottID2parentOttId'
-        'preorder2tuple'
+        if out_dir is None:
+            out_dir = self.ott_dir
+        manifest = self._read_cache_manifest(out_dir)
+        recorded_steps = manifest.setdefault('steps', {})
+        stale = []
+        touched = False
+        for step in steps:
+            recorded = recorded_steps.get(step)
+            if recorded is None:
+                stale.append(step)
+                continue
+            outputs = [_cache_filepath(out_dir, i) for i in _BUILD_STEP_CACHES[step]]
+            if step == 'taxonomy':
+                outputs.append(os.path.join(out_dir, ARRAY_CACHE_INFO_FILENAME))
+            if not all(os.path.exists(i) for i in outputs):
+                stale.append(step)
+                continue
+            current = self._source_fingerprints(step, recorded)
+            for fn, fingerprint in current.items():
+                prev = recorded.get(fn)
+                if (fingerprint is None) != (prev is None) \
+                        or (fingerprint is not None and fingerprint['sha1'] != prev['sha1']):
+                    stale.append(step)
+                    break
+            else:
+                if current != recorded:
+                    # touched, but unchanged. Record the new mtimes to avoid rehashing.
+                    recorded_steps[step] = current
+                    touched = True
+        if touched:
+            self._write_cache_manifest(out_dir, manifest)
+        return stale
+
+    def _create_caches(self, out_dir=None, steps=None):
+        """Builds the caches of the build `steps` (all of them if `steps` is None).
+        If `steps` is supplied, only the ones that are still stale once the build lock is
+        acquired are built (another process may have built them while we waited).
+        Returns the CacheBuildReport or None if nothing needed to be built.
         """
         if out_dir is None:
             out_dir = self.ott_dir
+        if steps is None:
+            steps = list(_BUILD_STEP_ORDER)
+            only_stale = False
+        else:
+            only_stale = True
+        lock_fp = os.path.join(out_dir, _BUILD_LOCK_FILENAME)
+        _LOG.debug('Acquiring OTT cache build lock "{}"'.format(lock_fp))
+        with locket.lock_file(lock_fp, timeout=self._build_lock_timeout):
+            if only_stale:
+                steps = self._stale_build_steps(steps, out_dir)
+                if not steps:
+                    _LOG.debug('caches built by another process while waiting for the lock')
+                    return None
+            if out_dir == self.ott_dir:
+                self._reset_loaded_caches()
+            fingerprints = {}
+            for step in steps:
+                fingerprints[step] = self._source_fingerprints(step)
+            report = self._create_pickle_files(out_dir=out_dir, steps=steps)
+            manifest = self._read_cache_manifest(out_dir)
+            manifest.setdefault('steps', {}).update(fingerprints)
+            self._write_cache_manifest(out_dir, manifest)
+        return report
+
+    def _iter_taxonomy_fields(self):
+        """Generates the list of fields for each row of taxonomy.tsv that is not skipped
+        because of self.skip_prefixes."""
         taxonomy_file = self.taxonomy_filepath
         if not os.path.isfile(taxonomy_file):
             raise ValueError('Expecting to find "{}" based on ott_dir of "{}"'.format(taxonomy_file, self.ott_dir))
-        num_lines = 0
         _LOG.debug('Reading "{f}"...'.format(f=taxonomy_file))
-        id2par = {}  # UID to parent UID
-        id2name = {}  # UID to 'name' field
-        id2rank = {}  # UID to 'rank' field
-        id2uniq = {}  # UID to 'uniqname' field
-        uniq2id = {}  # uniqname to UID
-        id2flag = {}  # UID to a key in flag_set_id2flag_set
-        id2source = {}  # UID to {rank: ... silva: ..., ncbi: ... gbif:..., irmng : , f}
-        # where the value for f is
-        flag_set_id2flag_set = {}
-        flag_set2flag_set_id = {}
-        sources = set()
-        flag_set = set()
-        f_set_id = 0
-        source = {}
-        root_ott_id = None
+        num_lines = 0
         with codecs.open(taxonomy_file, 'r', encoding='utf-8') as tax_fo:
             it = iter(tax_fo)
             first_line = next(it)
@@ -533,8 +794,7 @@ class OTT(object):
             # now parse the rest of the taxonomy file
             for rown in it:
                 ls = rown.split('\t|\t')
-                uid, par, name = ls[:3]
-                rank,sourceinfo, uniqname, flags = ls[3:7]
+                uniqname = ls[5]
                 skip = False
                 for p in self.skip_prefixes:
                     if uniqname.startswith(p):
@@ -542,69 +802,173 @@ class OTT(object):
                         break
                 if skip:
                     continue
-                uid = int(uid)
-                if par == '':
-                    # parse the root node (name = life; no parent)
-                    par = NONE_PAR
-                    root_ott_id = uid
-                    assert name == 'life'
-                    self._root_name = name
-                else:
-                    # this is not the root node
-                    par = int(par)
-                    if par not in id2par:
-                        raise ValueError('parent {} not found in OTT parsing'.format(par))
                 assert ls[7] == '\n'
-                assert uid not in id2par
-                id2par[uid] = par
-                id2name[uid] = name
-                if rank:
-                    id2rank[uid] = rank
-                if uniqname:
-                    id2uniq[uid] = uniqname
-                    if uniqname in uniq2id:
-                        _LOG.error('uniqname "{u}" used for OTT ID "{f:d}" and "{n:d}"'.format(
-                            u=uniqname,
-                            f=uniq2id[uniqname],
-                            n=uid))
-                    uniq2id[uniqname] = uid
-                if sourceinfo:
-                    s_list = sourceinfo.split(',')
-                    for x in s_list:
-                        src, sid = x.split(':')
-                        try:
-                            sid = int(sid)
-                        except:
-                            pass
-                        sources.add(src)
-                        source[src] = sid
-                if flags:
-                    f_list = flags.split(',')
-                    if len(f_list) > 1:
-                        f_list.sort()
-                    f_set = frozenset(f_list)
-                    for x in f_list:
-                        flag_set.add(x)
-                    fsi = flag_set2flag_set_id.get(f_set)
-                    if fsi is None:
-                        fsi = f_set_id
-                        f_set_id += 1
-                        flag_set_id2flag_set[fsi] = f_set
-                        flag_set2flag_set_id[f_set] = fsi
-                    id2flag[uid] = fsi
-                if source:
-                    id2source[uid] = source
-                    source = {}
-
+                yield ls
                 num_lines += 1
                 if num_lines % 100000 == 0:
                     _LOG.debug('read {n:d} lines...'.format(n=num_lines))
-        _LOG.debug('read taxonomy file. total of {n:d} lines.'.format(n=num_lines))
-        _write_pickle(out_dir, 'ottID2parentOttId', id2par)
+
+    def _create_pickle_files(self, out_dir=None, steps=None):  # pylint: disable=R0914,R0915
+        """Builds the caches of each of the build `steps` (default: all of them).
+        See _BUILD_STEPS for the sources and caches of each step, and
+        peyotl.ott.cache_builder for the memory bound.
+        The "taxonomy" step streams taxonomy.tsv once. If the "names" step is also
+        requested, the names from that pass are reused rather than rereading the file.
+        Each cache is written (and released) as soon as its inputs have been read.
+        Returns a CacheBuildReport with the timing of each step.
+        """
+        if out_dir is None:
+            out_dir = self.ott_dir
+        if steps is None:
+            steps = _BUILD_STEP_ORDER
+        report = CacheBuildReport()
+        id2name = None
+        if 'taxonomy' in steps:
+            id2name = self._build_taxonomy_caches(out_dir, report, keep_names='names' in steps)
+        if 'names' in steps:
+            if id2name is None:
+                id2name = {}
+                for ls in self._iter_taxonomy_fields():
+                    id2name[int(ls[0])] = ls[2]
+                report.step('read names from taxonomy file')
+            self._build_name_caches(out_dir, id2name, report)
+        if 'forwarding' in steps:
+            forward_table = self._parse_forwarding_files()
+            _write_pickle(out_dir, 'forwardingTable', forward_table)
+            report.step('wrote forwarding table')
+        return report.finish()
+
+    def _build_taxonomy_caches(self, out_dir, report, keep_names=False):
+        """Writes the caches of the "taxonomy" build step. Returns the dict of OTT ID to name
+        if `keep_names` is True (or None otherwise).
+        """
+        # packed arrays of the numeric fields in file order
+        file_ids = array.array('i')
+        file_par_ids = array.array('i')  # NO_VALUE for the root
+        file_flags = array.array('i')  # key in flag_set_id2flag_set or NO_VALUE
+        file_ranks = array.array('h')  # index in `ranks` or NO_VALUE
+        ranks = []
+        rank2code = {}
+        id2name = {} if keep_names else None  # UID to 'name' field
+        id2uniq = {}  # UID to 'uniqname' field
+        uniq2id = {}  # uniqname to UID
+        id2source = {}  # UID to {rank: ... silva: ..., ncbi: ... gbif:..., irmng : , f}
+        # where the value for f is
+        flag_set_id2flag_set = {}
+        flag_set2flag_set_id = {}
+        sources = set()
+        f_set_id = 0
+        source = {}
+        root_ott_id = None
+        for ls in self._iter_taxonomy_fields():
+            uid, par, name = ls[:3]
+            rank, sourceinfo, uniqname, flags = ls[3:7]
+            uid = int(uid)
+            if par == '':
+                # parse the root node (name = life; no parent)
+                if root_ott_id is not None:
+                    raise ValueError('OTT IDs {} and {} both lack a parent'.format(root_ott_id, uid))
+                par = NO_VALUE
+                root_ott_id = uid
+                assert name == 'life'
+                self._root_name = name
+            else:
+                # this is not the root node. Parent existence is checked by index_taxonomy_rows
+                par = int(par)
+            file_ids.append(uid)
+            file_par_ids.append(par)
+            if keep_names:
+                id2name[uid] = name
+            if rank:
+                rank_code = rank2code.get(rank)
+                if rank_code is None:
+                    rank_code = len(ranks)
+                    rank2code[rank] = rank_code
+                    ranks.append(rank)
+                file_ranks.append(rank_code)
+            else:
+                file_ranks.append(NO_VALUE)
+            if uniqname:
+                id2uniq[uid] = uniqname
+                if uniqname in uniq2id:
+                    _LOG.error('uniqname "{u}" used for OTT ID "{f:d}" and "{n:d}"'.format(
+                        u=uniqname,
+                        f=uniq2id[uniqname],
+                        n=uid))
+                uniq2id[uniqname] = uid
+            if sourceinfo:
+                s_list = sourceinfo.split(',')
+                for x in s_list:
+                    src, sid = x.split(':')
+                    try:
+                        sid = int(sid)
+                    except:
+                        pass
+                    sources.add(src)
+                    source[src] = sid
+            if flags:
+                f_list = flags.split(',')
+                if len(f_list) > 1:
+                    f_list.sort()
+                f_set = frozenset(f_list)
+                fsi = flag_set2flag_set_id.get(f_set)
+                if fsi is None:
+                    fsi = f_set_id
+                    f_set_id += 1
+                    flag_set_id2flag_set[fsi] = f_set
+                    flag_set2flag_set_id[f_set] = fsi
+                file_flags.append(fsi)
+            else:
+                file_flags.append(NO_VALUE)
+            if source:
+                id2source[uid] = source
+                source = {}
+        if root_ott_id is None:
+            raise ValueError('No root (taxon without a parent) found in "{}"'.format(self.taxonomy_filepath))
+        report.step('read taxonomy file. total of {n:d} taxa'.format(n=len(file_ids)))
+        self._root_ott_id = root_ott_id
+        self._write_root_properties(out_dir, self._root_name, self._root_ott_id)
+        _write_pickle(out_dir, 'ottID2uniq', id2uniq)
+        _write_pickle(out_dir, 'uniq2ottID', uniq2id)
+        del id2uniq, uniq2id
+        _write_pickle(out_dir, 'ottID2sources', id2source)
+        del id2source
+        _write_pickle(out_dir, 'flagSetID2FlagSet', flag_set_id2flag_set)
+        _write_pickle(out_dir, 'taxonomicSources', sources)
+        # second-level caches are derived from the caches of this step
+        for target in _SECOND_LEVEL_CACHES:
+            fp = _cache_filepath(out_dir, target)
+            if os.path.exists(fp):
+                os.remove(fp)
+        remove_pruned_bitmaps(out_dir)
+        remove_newick_labels(out_dir)
+        report.step('wrote uniqname, source and flag set caches')
+        sorted_ids, row_of_pos, par_rows = index_taxonomy_rows(file_ids, file_par_ids)
+        del file_ids, file_par_ids
+        preorder, subtree_size, first_child, last_child, next_sib = number_taxonomy_rows(row_of_pos, par_rows)
+        report.step('indexed and preorder-numbered {n:d} taxa'.format(n=len(sorted_ids)))
+        flag_rows = reorder_by_row(file_flags, row_of_pos, 'i')
+        del file_flags
+        rank_rows = reorder_by_row(file_ranks, row_of_pos, 'h')
+        del file_ranks
+        jump_rows = compute_jump_rows(row_of_pos, par_rows)
+        del row_of_pos
+        write_array_caches(out_dir, sorted_ids, par_rows, preorder, subtree_size, jump_rows, flag_rows, rank_rows,
+                           ranks)
+        del flag_rows, rank_rows, jump_rows
+        _write_pickle_items(out_dir, 'preorder2tuple',
+                            iter_preorder2tuple_items(preorder, par_rows, first_child, last_child, next_sib))
+        report.step('wrote tree structure caches')
+        return id2name
+
+    def _build_name_caches(self, out_dir, id2name, report):
+        """Writes the caches of the "names" build step. `id2name` maps each OTT ID to its
+        name in the taxonomy (it is modified to add the synonyms).
+        """
         synonyms_file = self.synonyms_filepath
-        _LOG.debug('Reading "{f}"...'.format(f=synonyms_file))
         if not os.path.isfile(synonyms_file):
             raise ValueError('Expecting to find "{}" based on ott_dir of "{}"'.format(synonyms_file, self.ott_dir))
+        _LOG.debug('Reading "{f}"...'.format(f=synonyms_file))
         num_lines = 0
         with codecs.open(synonyms_file, 'r', encoding='utf-8') as syn_fo:
             it = iter(syn_fo)
@@ -628,14 +992,11 @@ class OTT(object):
                 num_lines += 1
                 if num_lines % 100000 == 0:
                     _LOG.debug('read {n:d} lines...'.format(n=num_lines))
-        _LOG.debug('read synonyms file. total of {n:d} lines.'.format(n=num_lines))
+        report.step('read synonyms file. total of {n:d} lines'.format(n=num_lines))
         _LOG.debug('normalizing id2name dict. {s:d} entries'.format(s=len(id2name)))
-        _swap = {}
         for k, v in id2name.items():
             if isinstance(v, list):
-                v = tuple(v)
-            _swap[k] = v
-        id2name = _swap
+                id2name[k] = tuple(v)
         _LOG.debug('inverting id2name dict. {s:d} entries'.format(s=len(id2name)))
         name2id = {}
         for ott_id, v in id2name.items():
@@ -649,13 +1010,15 @@ class OTT(object):
                     prev.append(ott_id)
                 else:
                     name2id[el] = [prev, ott_id]
+        remove_newick_labels(out_dir)
+        _write_pickle(out_dir, 'ottID2names', id2name)
+        del id2name
         _LOG.debug('normalizing name2id dict. {s:d} entries'.format(s=len(name2id)))
-        _swap = {}
         for k, v in name2id.items():
             if isinstance(v, list):
-                v = tuple(v)
-            _swap[k] = v
-        name2id = _swap
+                name2id[k] = tuple(v)
+        _write_pickle(out_dir, 'name2ottID', name2id)
+        write_name_index(_cache_filepath(out_dir, 'nameindex'), name2id)
         homonym2id = {}
         nonhomonym2id = {}
         for name, ott_ids in name2id.items():
@@ -663,45 +1026,10 @@ class OTT(object):
                 homonym2id[name] = ott_ids
             else:
                 nonhomonym2id[name] = ott_ids
-        _LOG.debug('Making heavy tree')
-        tt = make_tree_from_taxonomy(id2par)
-        _LOG.debug('preorder numbering nodes')
-        root = tt[root_ott_id]
-        root.number_tree(0)
-        _LOG.debug('creating ott_id <--> preorder maps')
-        ott_id2preorder = {}
-        preorder2ott_id = {}
-        for ott_id, node in tt.items():
-            ott_id2preorder[ott_id] = node.preorder_number
-            preorder2ott_id[node.preorder_number] = ott_id
-        ott_id2preorder['root_ott_id'] = root_ott_id
-        ott_id2preorder['root'] = root.preorder_number
-        preorder2ott_id['root'] = root_ott_id
-        preorder2ott_id['root_preorder'] = root.preorder_number
-        self._root_ott_id = root_ott_id
-        self._write_root_properties(out_dir, self._root_name, self._root_ott_id)
-        _write_pickle(out_dir, 'ottID2preorder', ott_id2preorder)
-        _write_pickle(out_dir, 'preorder2ottID', preorder2ott_id)
-        _write_pickle(out_dir, 'ottID2uniq', id2uniq)
-        _write_pickle(out_dir, 'uniq2ottID', uniq2id)
-        _write_pickle(out_dir, 'name2ottID', name2id)
+        del name2id
         _write_pickle(out_dir, 'homonym2ottID', homonym2id)
         _write_pickle(out_dir, 'nonhomonym2ottID', nonhomonym2id)
-        _write_pickle(out_dir, 'ottID2names', id2name)
-        _write_pickle(out_dir, 'ottID2sources', id2source)
-        _write_pickle(out_dir, 'ottID2ranks', id2rank)
-        _write_pickle(out_dir, 'ottID2flags', id2flag)
-        _write_pickle(out_dir, 'flagSetID2FlagSet', flag_set_id2flag_set)
-        _write_pickle(out_dir, 'taxonomicSources', sources)
-        forward_table = self._parse_forwarding_files()
-        _write_pickle(out_dir, 'forwardingTable', forward_table)
-        _LOG.debug('creating tree representation with preorder # to tuples')
-        preorder2tuples = {}
-        root.par = _TransitionalNode()  # fake parent of root
-        root.par.preorder_number = None
-        root.fill_preorder2tuples(None, preorder2tuples)
-        preorder2tuples['root'] = root.preorder_number
-        _write_pickle(out_dir, 'preorder2tuple', preorder2tuples)
+        report.step('wrote name caches')
 
     def _parse_forwarding_files(self):
         r = {}
@@ -710,14 +1038,15 @@ class OTT(object):
             if os.path.exists(fp):
                 with codecs.open(fp, 'r', encoding='utf-8') as syn_fo:
                     for line in syn_fo:
-                        ls = line.split('\t')
+                        ls = line.rstrip('\r\n').split('\t')
                         try:
                             if ls[0] == 'id':  # deal with header
                                 continue
-                            old_id, new_id = ls[0], ls[1]
+                            old_id, new_id = int(ls[0]), int(ls[1])
                         except:
                             if line.strip():
                                 raise RuntimeError('error parsing line in "{}":\n{}'.format(fp, line))
+                            continue
                         if old_id in r:
                             _LOG.warn(
                                 'fp: "{}" {} -> {} but {} -> {} already.'.format(fp, old_id, new_id, old_id, r[old_id]))
@@ -757,18 +1086,16 @@ class OTT(object):
             root_ott_id = self.root_ott_id
         if label_style not in [OTULabelStyleEnum.OTT_ID, OTULabelStyleEnum.CURRENT_LABEL_OTT_ID]:
             raise NotImplementedError('newick from ott with labels other than ott id')
-        o2p = self.ott_id2par_ott_id
-        ott2children = make_ott_to_children(o2p)
         return write_newick_ott(out,
                                 self,
-                                ott2children,
+                                None,
                                 root_ott_id,
                                 label_style,
                                 prune_flags,
                                 create_log_dict=create_log_dict)
 
     def get_anc_lineage(self, ott_id):
-        return create_anc_lineage_from_id2par(self.ott_id2par_ott_id, ott_id)
+        return self.array_cache.anc_lineage(ott_id)
 
     def _debug_anc_spikes(self, ott_id_list):
         al = [self.get_anc_lineage(o) for o in ott_id_list]
@@ -781,48 +1108,135 @@ class OTT(object):
         for n, o in enumerate(ott_id_list):
             _LOG.debug(fmt.format(o, asl[n]))
 
-    def induced_tree(self, ott_id_list, create_monotypic_nodes=False):
-        # self._debug_anc_spikes(ott_id_list)
-        return create_tree_from_id2par(self.ott_id2par_ott_id, ott_id_list,
-                                       create_monotypic_nodes=create_monotypic_nodes)
+    def mrca(self, ott_ids):
+        """Returns the OTT ID of the most recent common ancestor of the IDs in `ott_ids`.
+        Raises a KeyError if any of the IDs is not in the taxonomy.
+        """
+        return self.array_cache.mrca(ott_ids)
+
+    def induced_tree(self, ott_id_list, create_monotypic_nodes=False, include_path_ids=True):
+        """Returns a TreeWithPathsInEdges for the taxonomy induced by the IDs in `ott_id_list`
+        (or None if the list is empty). The root is the MRCA of the IDs.
+        The nodes are the IDs and the LCAs of the IDs that are adjacent in preorder, so the shape
+            is found in O(k log k) for k IDs regardless of the depth of the taxonomy.
+        Unless `include_path_ids` is False, the path of each edge lists the taxa that the edge
+            passes through (as with create_tree_from_id2par). That, or `create_monotypic_nodes`,
+            adds a cost proportional to the number of those taxa.
+        Raises a ValueError if an ID is not in the taxonomy.
+        """
+        if not ott_id_list:
+            return None
+        ac = self.array_cache
+        preorder, sizes, par_rows, ids = ac.preorder, ac.subtree_sizes, ac.parent_rows, ac.sorted_ott_ids
+        tip_rows = set()
+        for ott_id in ott_id_list:
+            r = ac.row(ott_id)
+            if r == NO_VALUE:
+                raise ValueError('Id "{}" not found in id to parent mapping'.format(ott_id))
+            tip_rows.add(r)
+        tip_rows = sorted(tip_rows, key=preorder.__getitem__)
+        rows = set(tip_rows)
+        for i in range(1, len(tip_rows)):
+            rows.add(ac.lca_row(tip_rows[i - 1], tip_rows[i]))
+        rows = sorted(rows, key=preorder.__getitem__)
+        tree = TreeWithPathsInEdges()
+        nodes = []
+        stack = []  # (row, node) pairs for the lineage of the current node in the induced tree
+        for r in rows:
+            pre = preorder[r]
+            while stack and pre >= preorder[stack[-1][0]] + sizes[stack[-1][0]]:
+                stack.pop()
+            if not stack:
+                nd = NodeWithPathInEdges(_id=ids[r])
+                tree._root = nd
+            else:
+                par_row, par_nd = stack[-1]
+                path_rows = [r]
+                if include_path_ids or create_monotypic_nodes:
+                    x = par_rows[r]
+                    while x != par_row:
+                        path_rows.append(x)
+                        x = par_rows[x]
+                if create_monotypic_nodes:
+                    for x in reversed(path_rows[1:]):
+                        mn = NodeWithPathInEdges(_id=ids[x])
+                        par_nd.add_child(mn)
+                        nodes.append(mn)
+                        par_nd = mn
+                    nd = NodeWithPathInEdges(_id=ids[r])
+                else:
+                    nd = NodeWithPathInEdges(_id=ids[r], path_ids=[ids[x] for x in path_rows])
+                par_nd.add_child(nd)
+            nodes.append(nd)
+            stack.append((r, nd))
+        if not create_monotypic_nodes:
+            # as in create_tree_from_id2par, a (non-root) ID with one child is merged into the path of that child.
+            #   Reverse preorder, so that a chain of such nodes is merged from the bottom up.
+            kept = []
+            for nd in reversed(nodes):
+                if nd._parent is not None and len(nd._children) == 1:
+                    child = nd._children[0]
+                    child._path_ids.extend(nd._path_ids)
+                    child._path_set.update(nd._path_ids)
+                    nd._parent.replace_child(nd, child)
+                else:
+                    kept.append(nd)
+            nodes = kept
+        for nd in nodes:
+            tree._register_node(nd)
+        return tree
+
+    def is_ancestor(self, anc_ott_id, des_ott_id):
+        """Returns True if `anc_ott_id` is a (proper) ancestor of `des_ott_id`. O(1) after the
+        row lookups (the preorder interval of `anc_ott_id` is compared to the preorder # of `des_ott_id`).
+        Raises a KeyError if either ID is not in the taxonomy.
+        """
+        return self.array_cache.is_ancestor(anc_ott_id, des_ott_id)
+
+    def is_in_subtree(self, root_ott_id, ott_ids):
+        """Returns a list of booleans: True for each ID in `ott_ids` that is `root_ott_id` or
+        one of its descendants. Raises a KeyError if any of the IDs is not in the taxonomy.
+        """
+        return self.array_cache.is_in_subtree(root_ott_id, ott_ids)
 
-    def check_if_above_root(self, curr_id, known_below_root, known_above_root, root_ott_id):
+    def check_if_above_root(self, curr_id, known_below_root=None, known_above_root=None, root_ott_id=None):
+        """Returns True if `curr_id` is not in the subtree rooted at `root_ott_id`.
+        The `known_*` sets are ignored (retained for backward compatibility).
+        """
         if root_ott_id is None:
             return False
-        if curr_id in known_below_root:
-            return False
-        if curr_id in known_above_root:
+        if root_ott_id not in self.ott_id2par_ott_id:
             return True
-        oi2poi = self.ott_id2par_ott_id
-        new_id_list = []
-        assert curr_id is not None
-        while True:
-            new_id_list.append(curr_id)
-            if (curr_id is None) or (curr_id in known_above_root):
-                known_above_root.update(new_id_list)
-                return True
-            curr_id = oi2poi.get(curr_id)
-            if (curr_id in known_below_root) or (curr_id == root_ott_id):
-                known_below_root.update(new_id_list)
-                return False
-
-    def check_if_in_pruned_subtree(self, curr_id, known_unpruned, known_pruned, to_prune_fsi_set):
-        if curr_id in known_pruned:
-            return True
-        if curr_id in known_unpruned:
-            return False
-        oi2poi = self.ott_id2par_ott_id
-        new_id_list = []
-        assert curr_id is not None
-        while True:
-            new_id_list.append(curr_id)
-            if (self.has_flag_set_key_intersection(curr_id, to_prune_fsi_set)) or (curr_id in known_pruned):
-                known_pruned.update(new_id_list)
-                return True
-            curr_id = oi2poi.get(curr_id)
-            if (curr_id is None) or (curr_id in known_unpruned):
-                known_unpruned.update(new_id_list)
-                return False
+        return not self.array_cache.is_in_subtree(root_ott_id, [curr_id])[0]
+
+    def pruned_preorder_bitmap(self, prune_flags):
+        """Returns a PreorderBitmap in which the bit for a preorder # is set if the taxon or
+        any of its ancestors has a flag in `prune_flags` (a set of flag strings or an OTTFlagUnion).
+        The bitmap for each set of flags is written to the OTT dir the first time it is requested
+        and is mmap-ed thereafter.
+        """
+        flags = prune_flags.flags if isinstance(prune_flags, OTTFlagUnion) else frozenset(prune_flags)
+        bitmap = self._pruned_bitmaps.get(flags)
+        if bitmap is not None:
+            return bitmap
+        ac = self.array_cache
+        fp = pruned_bitmap_filepath(self.ott_dir, flags)
+        bitmap = read_pruned_bitmap(fp, ac.num_taxa)
+        if bitmap is None:
+            flag_set_keys = self.convert_flag_string_set_to_flag_set_keys(flags)
+            bitmap = write_pruned_bitmap(fp, ac.pruned_preorder_ranges(flag_set_keys), ac.num_taxa)
+        self._pruned_bitmaps[flags] = bitmap
+        return bitmap
+
+    def is_pruned(self, ott_id, prune_flags):
+        """Returns True if `ott_id` or one of its ancestors has a flag in `prune_flags`."""
+        return self.pruned_preorder_bitmap(prune_flags)[self.ott_id_to_preorder[ott_id]]
+
+    def check_if_in_pruned_subtree(self, curr_id, known_unpruned=None, known_pruned=None, to_prune_fsi_set=None):
+        """Returns True if `curr_id` or one of its ancestors has a flag in `to_prune_fsi_set`
+        (an OTTFlagUnion). The `known_*` sets are ignored (retained for backward compatibility).
+        """
+        return self.is_pruned(curr_id, to_prune_fsi_set)
 
     def map_ott_ids(self, ott_id_list, to_prune_fsi_set, root_ott_id):
         """returns:
@@ -836,16 +1250,29 @@ class OTT(object):
             be deleted.
         """
         mapped, unrecog, forward2unrecog, pruned, above_root, old2new = [], [], [], [], [], {}
-        known_unpruned, known_pruned = set(), set()
-        known_above_root, known_below_root = set(), set()
-        oi2poi = self.ott_id2par_ott_id
+        ac = self.array_cache
+        preorder = ac.preorder
+        # the subtree of a taxon is an interval of preorder #'s and pruning is a bit test, so each of
+        #   the checks below is O(1) rather than a walk to the root.
+        if root_ott_id is None:
+            root_first, root_last = 0, ac.num_taxa - 1
+        elif ac.row(root_ott_id) == NO_VALUE:
+            root_first, root_last = 0, -1  # every taxon is "above" an unknown root
+        else:
+            root_first, root_last = ac.preorder_interval(root_ott_id)
+        pruned_bitmap = None if to_prune_fsi_set is None else self.pruned_preorder_bitmap(to_prune_fsi_set)
+
+        def _is_pruned(pre):
+            return pruned_bitmap is not None and pruned_bitmap[pre]
+
         ft = self.forward_table
         for old_id in ott_id_list:
-            if old_id in oi2poi:
-                if self.check_if_above_root(old_id, known_above_root, known_below_root, root_ott_id):
+            r = ac.row(old_id)
+            if r != NO_VALUE:
+                pre = preorder[r]
+                if not (root_first <= pre <= root_last):
                     above_root.append(old_id)
-                elif (to_prune_fsi_set is not None) and \
-                        self.check_if_in_pruned_subtree(old_id, known_unpruned, known_pruned, to_prune_fsi_set):
+                elif _is_pruned(pre):
                     pruned.append(old_id)
                 else:
                     mapped.append(old_id)
@@ -854,9 +1281,9 @@ class OTT(object):
                 if new_id is None:
                     unrecog.append(old_id)
                 else:
-                    if new_id in oi2poi:
-                        if (to_prune_fsi_set is not None) and \
-                                self.check_if_in_pruned_subtree(new_id, known_unpruned, known_pruned, to_prune_fsi_set):
+                    r = ac.row(new_id)
+                    if r != NO_VALUE:
+                        if _is_pruned(preorder[r]):
                             pruned.append(old_id)  # could be in a forward2pruned
                         else:
                             old2new[old_id] = new_id
@@ -870,50 +1297,37 @@ if _PICKLE_AS_JSON:
     def _write_pickle(directory, fn, obj):
         fp = os.path.join(directory, fn + '.pickle')
         _LOG.debug('Creating "{p}"'.format(p=fp))
-        with open(fp, 'wb') as fo:
-            write_as_json(obj, fo)
+        with open(fp + '.tmp', 'wb') as fo:
+            write_as_json(obj, fo, sort_keys=False)
+        replace_file(fp + '.tmp', fp)
 
 
     def _load_pickle_fp_raw(fp):
         return read_as_json(fp)
+
+
+    def _write_pickle_items(directory, fn, items):
+        _write_pickle(directory, fn, dict(items))
 else:
     def _write_pickle(directory, fn, obj):
         fp = os.path.join(directory, fn + '.pickle')
         _LOG.debug('Creating "{p}"'.format(p=fp))
-        with open(fp, 'wb') as fo:
+        # written to a temporary file and moved, so that other processes never read a partial pickle.
+        with open(fp + '.tmp', 'wb') as fo:
             pickle.dump(obj, fo)
+        replace_file(fp + '.tmp', fp)
 
 
     def _load_pickle_fp_raw(fp):
         return pickle.load(open(fp, 'rb'))
 
 
-def _generate_parent(id2par, par_ott_id, ott2transitional):
-    par = ott2transitional.get(par_ott_id)
-    if par is not None:
-        return par
-    if par_ott_id == NONE_PAR:
-        return None
-    gp_id = id2par[par_ott_id]
-    gp = ott2transitional.get(gp_id)
-    if gp is None:
-        gp = _generate_parent(id2par, gp_id, ott2transitional)
-        if gp is None:
-            root = _TransitionalNode(ott_id=gp_id)
-            ott2transitional[gp_id] = root
-            return root
-    par = _TransitionalNode(ott_id=par_ott_id, par=gp)
-    ott2transitional[par_ott_id] = par
-    return par
-
-
-def make_tree_from_taxonomy(id2par):
-    ott2transitional = {}
-    for ott_id, par_ott_id in id2par.items():
-        par = _generate_parent(id2par, par_ott_id, ott2transitional)
-        nd = _TransitionalNode(ott_id=ott_id, par=par)
-        ott2transitional[ott_id] = nd
-    return ott2transitional
+    def _write_pickle_items(directory, fn, items):
+        """Pickles a dict of the (key, value) pairs in `items` without holding the dict in memory"""
+        fp = os.path.join(directory, fn + '.pickle')
+        _LOG.debug('Creating "{p}"'.format(p=fp))
+        write_pickled_dict_items(fp + '.tmp', items)
+        replace_file(fp + '.tmp', fp)
 
 
 def make_ott_to_children(id2par):
@@ -956,22 +1370,38 @@ def create_pruned_and_taxonomy_for_tip_ott_ids(tree_proxy, ott, create_monotypic
     # TODO consider prefix scheme
     ott_ids = []
     ott_id_2_otu_par = {}
-    for node in tree_proxy:
-        if node.is_leaf:
-            ott_id = node.ott_id
-            if ott_id is not None:
-                ott_ids.append(ott_id)
-                assert isinstance(ott_id, int)
-                parent_id = node.parent._id
-                ott_id_2_otu_par[ott_id] = parent_id
-        else:
-            assert is_str_type(node._id)
-            edge = node.edge
-            if edge is not None:
-                parent_id = node.parent._id
-                ott_id_2_otu_par[node._id] = parent_id
+    index = getattr(tree_proxy, 'index', None)
+    if index is not None:
+        # NexsonTreeProxy: read the topology from its index rather than creating a proxy per node
+        node_ids, parent, is_leaf, index_ott_ids = index.node_ids, index.parent, index.is_leaf, index.ott_ids
+        for i, node_id in enumerate(node_ids):
+            par_id = node_ids[parent[i]] if i else None
+            if is_leaf[i]:
+                ott_id = index_ott_ids[i]
+                if ott_id is not None:
+                    ott_ids.append(ott_id)
+                    assert isinstance(ott_id, int)
+                    ott_id_2_otu_par[ott_id] = par_id
+            else:
+                assert is_str_type(node_id)
+                ott_id_2_otu_par[node_id] = par_id
+    else:
+        for node in tree_proxy:
+            if node.is_leaf:
+                ott_id = node.ott_id
+                if ott_id is not None:
+                    ott_ids.append(ott_id)
+                    assert isinstance(ott_id, int)
+                    parent_id = node.parent._id
+                    ott_id_2_otu_par[ott_id] = parent_id
             else:
-                ott_id_2_otu_par[node._id] = None
+                assert is_str_type(node._id)
+                edge = node.edge
+                if edge is not None:
+                    parent_id = node.parent._id
+                    ott_id_2_otu_par[node._id] = parent_id
+                else:
+                    ott_id_2_otu_par[node._id] = None
     pruned_phylo = create_tree_from_id2par(ott_id_2_otu_par, ott_ids, create_monotypic_nodes=create_monotypic_nodes)
     taxo_tree = ott.induced_tree(ott_ids)
     return pruned_phylo, taxo_tree
@@ -0,0 +1,550 @@
+#!/usr/bin/env python
+"""Array-backed caches for the numeric maps of an OTT directory.
+
+Each taxon is assigned a "row": its index in the sorted table of OTT IDs
+(the `sortedOttIDs` cache). The parent, preorder, flag-set key and rank caches
+are dense arrays of fixed-width integers that are indexed by row and written in
+native byte order. When they are read, the files are mmap-ed read-only, so
+"loading" costs an `open` call, and the pages are shared by every process that
+uses the same OTT directory.
+
+Row lookups are a binary search over the sorted ID table (O(log n)); all of the
+other lookups are O(1) array accesses.
+
+The subtree of a taxon is the interval of preorder numbers
+[preorder, preorder + subtree size), so ancestor/descendant queries are a pair
+of comparisons rather than a walk up the parent links. Each taxon also stores
+the row of a "jump" ancestor (see cache_builder.compute_jump_rows), so the
+lowest common ancestor of two taxa is found in O(log depth) steps using O(n)
+storage.
+
+Pruning by a set of flags is precomputed as a bitmap over preorder numbers
+(see PreorderBitmap) that is written to the cache directory the first time
+that set of flags is used. Similarly, the Newick-quoted label of every taxon in
+a label style is written (in row order) the first time that style is exported.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.input_output import read_as_json, write_as_json
+from peyotl.utility import get_logger
+from bisect import bisect_left
+import hashlib
+import array
+import mmap
+import sys
+import os
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # pragma: no cover
+    from collections import Mapping
+
+_LOG = get_logger(__name__)
+
+ARRAY_CACHE_FORMAT_VERSION = 1
+ARRAY_CACHE_INFO_FILENAME = 'arrayCacheInfo.json'
+ARRAY_SUFFIX = '.array'
+# value stored in a row of an array when the taxon has no value for that field
+NO_VALUE = -1
+_ABSENT = object()
+
+PRUNED_BITMAP_PREFIX = 'prunedPreorder-'
+PRUNED_BITMAP_SUFFIX = '.bitmap'
+NEWICK_LABELS_PREFIX = 'newickLabels-'
+NEWICK_LABELS_SUFFIX = '.txt'
+
+# cache name -> array.array typecode
+ARRAY_TYPECODES = {'sortedOttIDs': 'i',
+                   'ottID2parentOttId': 'i',
+                   'ottID2preorder': 'i',
+                   'ottID2subtreeSize': 'i',
+                   'ottID2jumpRow': 'i',
+                   'preorder2ottID': 'i',
+                   'ottID2flags': 'i',
+                   'ottID2ranks': 'h',
+                   }
+
+
+# os.replace is atomic on every platform, but is absent from python 2
+replace_file = getattr(os, 'replace', os.rename)
+
+
+def array_cache_filepath(directory, name):
+    return os.path.join(directory, name + ARRAY_SUFFIX)
+
+
+def _write_array(directory, name, values):
+    """Writes `values` (an iterable of ints) as the array cache called `name`."""
+    fp = array_cache_filepath(directory, name)
+    _LOG.debug('Creating "{p}"'.format(p=fp))
+    if isinstance(values, array.array):
+        assert values.typecode == ARRAY_TYPECODES[name]
+        a = values
+    else:
+        a = array.array(ARRAY_TYPECODES[name], values)
+    # written to a temporary file and then moved, so that processes that have the
+    #   previous version mmap-ed keep a valid (old) inode.
+    tmp_fp = fp + '.tmp'
+    with open(tmp_fp, 'wb') as fo:
+        a.tofile(fo)
+    replace_file(tmp_fp, fp)
+
+
+def _map_array(fp, typecode):
+    """Returns a read-only, indexable view of the array stored at `fp`."""
+    with open(fp, 'rb') as fo:
+        if os.fstat(fo.fileno()).st_size == 0:
+            return array.array(typecode)
+        mm = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return memoryview(mm).cast(typecode)
+    except (AttributeError, TypeError):  # python 2 has no memoryview.cast
+        a = array.array(typecode)
+        a.fromstring(mm[:])
+        mm.close()
+        return a
+
+
+def write_array_caches(out_dir, sorted_ids, par_rows, preorder, subtree_size, jump_rows, flag_rows, rank_rows,
+                       ranks):
+    """Writes the array caches and the JSON file that describes them.
+    `sorted_ids` is the sorted table of OTT IDs. The other arrays are indexed by row
+        (the index of the OTT ID in `sorted_ids`):
+    `par_rows` holds the row of the parent (NO_VALUE for the root),
+    `preorder` holds the preorder #,
+    `subtree_size` holds the number of taxa in the subtree rooted at the taxon (including itself),
+    `jump_rows` holds the row of the taxon's "jump" ancestor,
+    `flag_rows` holds the flag set key (NO_VALUE for unflagged taxa), and
+    `rank_rows` holds the index of the rank in the list `ranks` (NO_VALUE for no rank).
+    """
+    num_taxa = len(sorted_ids)
+    preorder2id = array.array(ARRAY_TYPECODES['preorder2ottID'], [NO_VALUE]) * num_taxa
+    for r in range(num_taxa):
+        preorder2id[preorder[r]] = sorted_ids[r]
+    _write_array(out_dir, 'sortedOttIDs', sorted_ids)
+    _write_array(out_dir, 'ottID2parentOttId', par_rows)
+    _write_array(out_dir, 'ottID2preorder', preorder)
+    _write_array(out_dir, 'ottID2subtreeSize', subtree_size)
+    _write_array(out_dir, 'ottID2jumpRow', jump_rows)
+    _write_array(out_dir, 'preorder2ottID', preorder2id)
+    _write_array(out_dir, 'ottID2flags', flag_rows)
+    _write_array(out_dir, 'ottID2ranks', rank_rows)
+    write_array_cache_info(out_dir, num_taxa, ranks)
+
+
+def write_array_cache_info(out_dir, num_taxa, ranks):
+    info = {'format_version': ARRAY_CACHE_FORMAT_VERSION,
+            'byteorder': sys.byteorder,
+            'itemsizes': dict((k, array.array(v).itemsize) for k, v in ARRAY_TYPECODES.items()),
+            'num_taxa': num_taxa,
+            'ranks': list(ranks),
+            }
+    fp = os.path.join(out_dir, ARRAY_CACHE_INFO_FILENAME)
+    write_as_json(info, fp + '.tmp')
+    replace_file(fp + '.tmp', fp)
+
+
+def remove_array_caches(out_dir):
+    fp_list = [array_cache_filepath(out_dir, n) for n in ARRAY_TYPECODES.keys()]
+    fp_list.append(os.path.join(out_dir, ARRAY_CACHE_INFO_FILENAME))
+    for fp in fp_list:
+        if os.path.exists(fp):
+            _LOG.info('Removing cache "{f}"'.format(f=fp))
+            os.remove(fp)
+    remove_pruned_bitmaps(out_dir)
+    remove_newick_labels(out_dir)
+
+
+def pruned_bitmap_filepath(directory, flags):
+    """Returns the path of the pruned bitmap for the set of flag strings `flags`."""
+    key = hashlib.sha1(','.join(sorted(flags)).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, PRUNED_BITMAP_PREFIX + key + PRUNED_BITMAP_SUFFIX)
+
+
+def remove_pruned_bitmaps(out_dir):
+    """Removes every pruned bitmap. They are derived from the array caches, so this is
+    called whenever those are rebuilt."""
+    if not os.path.isdir(out_dir):
+        return
+    for fn in os.listdir(out_dir):
+        if fn.startswith(PRUNED_BITMAP_PREFIX) and fn.endswith(PRUNED_BITMAP_SUFFIX):
+            fp = os.path.join(out_dir, fn)
+            _LOG.debug('Removing cache "{f}"'.format(f=fp))
+            os.remove(fp)
+
+
+def newick_labels_filepath(directory, label_style):
+    """Returns the path of the label cache for `label_style` (a facet of OTULabelStyleEnum)."""
+    return os.path.join(directory, NEWICK_LABELS_PREFIX + label_style.name + NEWICK_LABELS_SUFFIX)
+
+
+def remove_newick_labels(out_dir):
+    """Removes every label cache. They are derived from the names and the row order, so this
+    is called whenever either is rebuilt."""
+    if not os.path.isdir(out_dir):
+        return
+    for fn in os.listdir(out_dir):
+        if fn.startswith(NEWICK_LABELS_PREFIX) and fn.endswith(NEWICK_LABELS_SUFFIX):
+            fp = os.path.join(out_dir, fn)
+            _LOG.debug('Removing cache "{f}"'.format(f=fp))
+            os.remove(fp)
+
+
+def write_newick_labels(fp, labels):
+    """Writes (and returns as a list) the labels in `labels`, one per line. Labels come from the
+    lines of the taxonomy file, so they never contain a newline."""
+    labels = list(labels)
+    _LOG.debug('Creating "{p}"'.format(p=fp))
+    tmp_fp = fp + '.tmp'
+    with open(tmp_fp, 'wb') as fo:
+        fo.write(u'\n'.join(labels).encode('utf-8'))
+    replace_file(tmp_fp, fp)
+    return labels
+
+
+def read_newick_labels(fp, num_taxa):
+    """Returns the list of labels stored at `fp` or None if there is no (valid) label cache there."""
+    if not os.path.exists(fp):
+        return None
+    with open(fp, 'rb') as fo:
+        labels = fo.read().decode('utf-8').split(u'\n')
+    if len(labels) != num_taxa:
+        return None
+    return labels
+
+
+def _set_bit_range(bits, first, last):
+    while first <= last and first & 7:
+        bits[first >> 3] |= 1 << (first & 7)
+        first += 1
+    num_bytes = (last - first + 1) >> 3
+    if num_bytes > 0:
+        start = first >> 3
+        bits[start:start + num_bytes] = b'\xff' * num_bytes
+        first += num_bytes << 3
+    while first <= last:
+        bits[first >> 3] |= 1 << (first & 7)
+        first += 1
+
+
+def write_pruned_bitmap(fp, ranges, num_taxa):
+    """Writes (and returns as a PreorderBitmap) a bitmap of `num_taxa` bits with the bits
+    in each (first, last) interval of preorder #'s in `ranges` set."""
+    bits = bytearray((num_taxa + 7) >> 3)
+    for first, last in ranges:
+        _set_bit_range(bits, first, last)
+    _LOG.debug('Creating "{p}"'.format(p=fp))
+    tmp_fp = fp + '.tmp'
+    with open(tmp_fp, 'wb') as fo:
+        fo.write(bytes(bits))
+    replace_file(tmp_fp, fp)
+    return PreorderBitmap(bits)
+
+
+def read_pruned_bitmap(fp, num_taxa):
+    """Returns the PreorderBitmap stored at `fp` or None if there is no (valid) bitmap there."""
+    if not os.path.exists(fp) or os.stat(fp).st_size != (num_taxa + 7) >> 3:
+        return None
+    return PreorderBitmap(_map_array(fp, 'B'))
+
+
+class PreorderBitmap(object):
+    """Read-only set of preorder #'s, stored as bit (p % 8) of byte (p // 8) for preorder # p."""
+
+    def __init__(self, bits):
+        self._bits = bits
+
+    def __getitem__(self, preorder):
+        return bool(self._bits[preorder >> 3] & (1 << (preorder & 7)))
+
+
+class OTTArrayCache(object):
+    """Read-only access to the array caches of an OTT directory."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        info = read_as_json(os.path.join(cache_dir, ARRAY_CACHE_INFO_FILENAME))
+        if info.get('format_version') != ARRAY_CACHE_FORMAT_VERSION:
+            raise RuntimeError('array caches in "{}" were written in an unsupported format. '
+                               'Remove the caches and rebuild them.'.format(cache_dir))
+        itemsizes = info.get('itemsizes', {})
+        for k, v in ARRAY_TYPECODES.items():
+            if info.get('byteorder') != sys.byteorder or itemsizes.get(k) != array.array(v).itemsize:
+                raise RuntimeError('array caches in "{}" were written on a machine with a different '
+                                   'integer layout. Remove the caches and rebuild them.'.format(cache_dir))
+        self.num_taxa = info['num_taxa']
+        self.ranks = tuple(info['ranks'])
+        self._arrays = {}
+        self._preorder_rows = None
+
+    def _get_array(self, name):
+        a = self._arrays.get(name)
+        if a is None:
+            a = _map_array(array_cache_filepath(self.cache_dir, name), ARRAY_TYPECODES[name])
+            assert len(a) == self.num_taxa
+            self._arrays[name] = a
+        return a
+
+    @property
+    def sorted_ott_ids(self):
+        return self._get_array('sortedOttIDs')
+
+    @property
+    def parent_rows(self):
+        return self._get_array('ottID2parentOttId')
+
+    @property
+    def preorder(self):
+        return self._get_array('ottID2preorder')
+
+    @property
+    def subtree_sizes(self):
+        return self._get_array('ottID2subtreeSize')
+
+    @property
+    def jump_rows(self):
+        return self._get_array('ottID2jumpRow')
+
+    @property
+    def preorder2ott_id(self):
+        return self._get_array('preorder2ottID')
+
+    @property
+    def preorder_rows(self):
+        """array mapping a preorder # to a row (the inverse of `preorder`, computed on first use)"""
+        if self._preorder_rows is None:
+            rows = array.array('i', [0]) * self.num_taxa
+            for r, p in enumerate(self.preorder):
+                rows[p] = r
+            self._preorder_rows = rows
+        return self._preorder_rows
+
+    @property
+    def flag_set_keys(self):
+        return self._get_array('ottID2flags')
+
+    @property
+    def rank_codes(self):
+        return self._get_array('ottID2ranks')
+
+    def row(self, ott_id):
+        """Returns the row of `ott_id` or NO_VALUE if the ID is not in the taxonomy."""
+        ids = self.sorted_ott_ids
+        try:
+            r = bisect_left(ids, ott_id)
+        except TypeError:  # not an integer
+            return NO_VALUE
+        if r < self.num_taxa and ids[r] == ott_id:
+            return r
+        return NO_VALUE
+
+    def _existing_row(self, ott_id):
+        r = self.row(ott_id)
+        if r == NO_VALUE:
+            raise KeyError('The OTT ID {} was not found'.format(ott_id))
+        return r
+
+    def preorder_interval(self, ott_id):
+        """Returns (first, last) the preorder #'s of `ott_id` and of the last taxon in its subtree.
+        Raises a KeyError if the ID is not in the taxonomy.
+        """
+        r = self._existing_row(ott_id)
+        first = self.preorder[r]
+        return first, first + self.subtree_sizes[r] - 1
+
+    def is_ancestor(self, anc_ott_id, des_ott_id):
+        """Returns True if `anc_ott_id` is a (proper) ancestor of `des_ott_id`."""
+        first, last = self.preorder_interval(anc_ott_id)
+        des_pre = self.preorder[self._existing_row(des_ott_id)]
+        return first < des_pre <= last
+
+    def is_in_subtree(self, root_ott_id, ott_ids):
+        """Returns a list of booleans: True for each ID in `ott_ids` that is `root_ott_id` or one of
+        its descendants. Raises a KeyError if any of the IDs is not in the taxonomy.
+        """
+        first, last = self.preorder_interval(root_ott_id)
+        preorder = self.preorder
+        return [first <= preorder[self._existing_row(i)] <= last for i in ott_ids]
+
+    def lca_row(self, row_a, row_b):
+        """Returns the row of the lowest common ancestor of the taxa in rows `row_a` and `row_b`."""
+        preorder, sizes = self.preorder, self.subtree_sizes
+        par_rows, jump_rows = self.parent_rows, self.jump_rows
+        b_pre = preorder[row_b]
+        u = row_a
+        # "contains" is monotonic along a lineage, so if the jump target does not contain b,
+        #   neither do any of the taxa that are skipped.
+        while not (preorder[u] <= b_pre < preorder[u] + sizes[u]):
+            j = jump_rows[u]
+            if preorder[j] <= b_pre < preorder[j] + sizes[j]:
+                u = par_rows[u]
+            else:
+                u = j
+        return u
+
+    def mrca(self, ott_ids):
+        """Returns the OTT ID of the most recent common ancestor of the `ott_ids`.
+        Raises a KeyError if any of the IDs is not in the taxonomy, and a ValueError if `ott_ids` is empty.
+        The MRCA of a set is the LCA of its members with the lowest and highest preorder #'s,
+            so this is O(k) row lookups and one O(log depth) LCA query.
+        """
+        preorder = self.preorder
+        min_row, max_row = None, None
+        for ott_id in ott_ids:
+            r = self._existing_row(ott_id)
+            if min_row is None:
+                min_row, max_row = r, r
+            elif preorder[r] < preorder[min_row]:
+                min_row = r
+            elif preorder[r] > preorder[max_row]:
+                max_row = r
+        if min_row is None:
+            raise ValueError('mrca requires at least one OTT ID')
+        return self.sorted_ott_ids[self.lca_row(min_row, max_row)]
+
+    def pruned_preorder_ranges(self, flag_set_keys):
+        """Returns a sorted list of disjoint (first, last) preorder intervals that cover the
+        subtrees of every taxon whose flag set key is in `flag_set_keys`.
+        """
+        flag_rows, preorder, sizes = self.flag_set_keys, self.preorder, self.subtree_sizes
+        intervals = []
+        for r in range(self.num_taxa):
+            fsk = flag_rows[r]
+            if fsk != NO_VALUE and fsk in flag_set_keys:
+                first = preorder[r]
+                intervals.append((first, first + sizes[r] - 1))
+        intervals.sort()
+        merged = []
+        for first, last in intervals:
+            if merged and first <= merged[-1][1]:
+                continue  # nested within a flagged ancestor
+            merged.append((first, last))
+        return merged
+
+    def ott_id_to_children(self, root_ott_id=None, pruned=None):
+        """Returns a dict mapping every OTT ID to a list of the IDs of its children
+        (an empty tuple for leaves). Children are listed in preorder (taxonomy file) order.
+        If `root_ott_id` is supplied, only the taxa in its subtree are included.
+        If `pruned` (a PreorderBitmap) is supplied, the pruned children of unpruned taxa
+            are listed, but the pruned taxa are not keys and their subtrees are skipped.
+        """
+        ids, par_rows, preorder2id = self.sorted_ott_ids, self.parent_rows, self.preorder2ott_id
+        sizes = self.subtree_sizes
+        if root_ott_id is None:
+            root_pre, last = 0, self.num_taxa - 1
+        else:
+            root_pre, last = self.preorder_interval(root_ott_id)
+        empty_tuple = tuple()
+        ott2children = {}
+        p = root_pre
+        while p <= last:
+            ott_id = preorder2id[p]
+            r = self.row(ott_id)
+            if p != root_pre:
+                par_id = ids[par_rows[r]]
+                pc = ott2children[par_id]
+                if pc is empty_tuple:
+                    ott2children[par_id] = [ott_id]
+                else:
+                    pc.append(ott_id)
+            if pruned is not None and pruned[p]:
+                p += sizes[r]
+            else:
+                ott2children[ott_id] = empty_tuple
+                p += 1
+        return ott2children
+
+    def anc_lineage(self, ott_id):
+        """Returns a list from [ott_id, ott_id's par, ..., root ott_id]"""
+        r = self._existing_row(ott_id)
+        ids, par_rows = self.sorted_ott_ids, self.parent_rows
+        lineage = []
+        while r != NO_VALUE:
+            lineage.append(ids[r])
+            r = par_rows[r]
+        return lineage
+
+
+class _ArrayBackedMap(Mapping):
+    """Dict-like view mapping OTT ID to the decoded value stored in a row
+    of one of the array caches. Rows holding NO_VALUE are treated as absent keys.
+    """
+
+    def __init__(self, cache, array_name, decode=None, all_present=False):
+        self._cache = cache
+        self._values = cache._get_array(array_name)
+        self._decode = decode
+        self._all_present = all_present
+        self._len = None
+
+    def get(self, key, default=None):
+        r = self._cache.row(key)
+        if r == NO_VALUE:
+            return default
+        v = self._values[r]
+        if v == NO_VALUE and not self._all_present:
+            return default
+        if self._decode is None:
+            return v
+        return self._decode(v)
+
+    def __getitem__(self, key):
+        v = self.get(key, _ABSENT)
+        if v is _ABSENT:
+            raise KeyError(key)
+        return v
+
+    def __contains__(self, key):
+        return self.get(key, _ABSENT) is not _ABSENT
+
+    def _present_rows(self):
+        values = self._values
+        if self._all_present:
+            return range(len(values))
+        return (r for r in range(len(values)) if values[r] != NO_VALUE)
+
+    def __iter__(self):
+        ids = self._cache.sorted_ott_ids
+        for r in self._present_rows():
+            yield ids[r]
+
+    def items(self):
+        ids, values, decode = self._cache.sorted_ott_ids, self._values, self._decode
+        for r in self._present_rows():
+            v = values[r]
+            yield ids[r], (v if decode is None else decode(v))
+
+    def __len__(self):
+        if self._len is None:
+            if self._all_present:
+                self._len = len(self._values)
+            else:
+                self._len = sum(1 for _ in self._present_rows())
+        return self._len
+
+
+class ArrayBackedParentMap(_ArrayBackedMap):
+    """OTT ID -> parent's OTT ID (None for the root)"""
+
+    def __init__(self, cache):
+        ids = cache.sorted_ott_ids
+
+        def _row2id(r):
+            return None if r == NO_VALUE else ids[r]
+
+        _ArrayBackedMap.__init__(self, cache, 'ottID2parentOttId', decode=_row2id, all_present=True)
+
+
+def ott_id_to_flags_map(cache):
+    """OTT ID -> flag set key. Absence of a key means that there were no flags set."""
+    return _ArrayBackedMap(cache, 'ottID2flags')
+
+
+def ott_id_to_ranks_map(cache):
+    """OTT ID -> rank string. Absence of a key means that the taxon has no rank."""
+    ranks = cache.ranks
+    return _ArrayBackedMap(cache, 'ottID2ranks', decode=ranks.__getitem__)
+
+
+def ott_id_to_preorder_map(cache):
+    """OTT ID -> preorder #"""
+    return _ArrayBackedMap(cache, 'ottID2preorder', all_present=True)
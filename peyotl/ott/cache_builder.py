@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+"""Helpers used by `OTT._create_pickle_files` to build the caches of an OTT
+directory in one streaming pass over taxonomy.tsv (and one over synonyms.tsv).
+
+Memory bound: the numeric fields of each taxon are held in packed arrays of
+machine integers (at most 14 4-byte ints, ~56 bytes per taxon, so ~220 MB for
+a 4M-taxon OTT), plus one transient list of the IDs while they are sorted.
+No per-taxon objects are created for the tree structure, and the preorder
+numbering is done by two linear sweeps over those arrays (no recursion, so
+deep lineages do not hit the recursion limit). The string-valued maps
+(names, uniqnames, sources) are still held as dicts until their pickles are
+written, but each is released as soon as it has been written, so the peak is
+the arrays plus the largest of those dicts rather than their sum.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.ott.array_cache import NO_VALUE
+from peyotl.utility import get_logger
+from bisect import bisect_left
+import hashlib
+import pickle
+import array
+import os
+import time
+
+_LOG = get_logger(__name__)
+
+
+def _filled_int_array(value, n, typecode='i'):
+    return array.array(typecode, [value]) * n
+
+
+def index_taxonomy_rows(file_ids, file_par_ids):
+    """Takes the OTT IDs and parent OTT IDs (NO_VALUE for the root) of every taxon
+    in the order in which they occur in taxonomy.tsv.
+    Returns (sorted_ids, row_of_pos, par_rows) where:
+        `sorted_ids` is the sorted table of IDs (the index of an ID is its "row"),
+        `row_of_pos` maps a position in the file to the row of that taxon, and
+        `par_rows` maps a row to the row of its parent (NO_VALUE for the root).
+    Raises a ValueError if an ID is repeated, or if a parent does not precede its child.
+    """
+    n = len(file_ids)
+    sorted_ids = array.array('i', sorted(file_ids))
+    for i in range(1, n):
+        if sorted_ids[i - 1] == sorted_ids[i]:
+            raise ValueError('OTT ID {} occurs more than once in the taxonomy'.format(sorted_ids[i]))
+    row_of_pos = _filled_int_array(NO_VALUE, n)
+    pos_of_row = _filled_int_array(NO_VALUE, n)
+    for pos in range(n):
+        r = bisect_left(sorted_ids, file_ids[pos])
+        row_of_pos[pos] = r
+        pos_of_row[r] = pos
+    par_rows = _filled_int_array(NO_VALUE, n)
+    for pos in range(n):
+        par_id = file_par_ids[pos]
+        if par_id == NO_VALUE:
+            continue
+        pr = bisect_left(sorted_ids, par_id)
+        if pr == n or sorted_ids[pr] != par_id or pos_of_row[pr] > pos:
+            raise ValueError('parent {} not found in OTT parsing'.format(par_id))
+        par_rows[row_of_pos[pos]] = pr
+    return sorted_ids, row_of_pos, par_rows
+
+
+def number_taxonomy_rows(row_of_pos, par_rows):
+    """Assigns preorder numbers to every row, visiting children in file order.
+    Relies on parents preceding their children in the file (checked by index_taxonomy_rows).
+    Returns (preorder, subtree_size, first_child, last_child, next_sib) arrays indexed by row.
+    The last three hold rows (NO_VALUE if there is no such node).
+    """
+    n = len(row_of_pos)
+    subtree_size = _filled_int_array(1, n)
+    for pos in range(n - 1, -1, -1):
+        r = row_of_pos[pos]
+        pr = par_rows[r]
+        if pr != NO_VALUE:
+            subtree_size[pr] += subtree_size[r]
+    preorder = _filled_int_array(NO_VALUE, n)
+    next_slot = _filled_int_array(0, n)  # preorder # of the next child of each row
+    first_child = _filled_int_array(NO_VALUE, n)
+    last_child = _filled_int_array(NO_VALUE, n)
+    next_sib = _filled_int_array(NO_VALUE, n)
+    for pos in range(n):
+        r = row_of_pos[pos]
+        pr = par_rows[r]
+        if pr == NO_VALUE:
+            pn = 0
+        else:
+            pn = next_slot[pr]
+            next_slot[pr] += subtree_size[r]
+            lc = last_child[pr]
+            if lc == NO_VALUE:
+                first_child[pr] = r
+            else:
+                next_sib[lc] = r
+            last_child[pr] = r
+        preorder[r] = pn
+        next_slot[r] = pn + 1
+    return preorder, subtree_size, first_child, last_child, next_sib
+
+
+def compute_jump_rows(row_of_pos, par_rows):
+    """Returns an array (indexed by row) of the row of an ancestor of each taxon, chosen so
+    that the jumps form a skew-binary structure (Myers 1983): any ancestor can be found in
+    O(log depth) steps by following jump or parent links. The root jumps to itself.
+    Relies on parents preceding their children in the file (checked by index_taxonomy_rows).
+    """
+    n = len(row_of_pos)
+    depth = _filled_int_array(0, n)
+    jump = _filled_int_array(NO_VALUE, n)
+    for pos in range(n):
+        r = row_of_pos[pos]
+        pr = par_rows[r]
+        if pr == NO_VALUE:
+            jump[r] = r
+            continue
+        depth[r] = depth[pr] + 1
+        jp = jump[pr]
+        if depth[pr] - depth[jp] == depth[jp] - depth[jump[jp]]:
+            jump[r] = jump[jp]
+        else:
+            jump[r] = pr
+    return jump
+
+
+def reorder_by_row(values_by_pos, row_of_pos, typecode):
+    """Returns an array of `values_by_pos` (indexed by file position) indexed by row."""
+    by_row = _filled_int_array(NO_VALUE, len(row_of_pos), typecode)
+    for pos, v in enumerate(values_by_pos):
+        by_row[row_of_pos[pos]] = v
+    return by_row
+
+
+def iter_preorder2tuple_items(preorder, par_rows, first_child, last_child, next_sib):
+    """Generates the (key, value) pairs of the preorder2tuple cache (see _CACHES)."""
+    root_preorder = None
+    for r in range(len(preorder)):
+        pr = par_rows[r]
+        if pr == NO_VALUE:
+            root_preorder = preorder[r]
+            ppn = None
+        else:
+            ppn = preorder[pr]
+        ns = next_sib[r]
+        nspn = None if ns == NO_VALUE else preorder[ns]
+        fc = first_child[r]
+        if fc == NO_VALUE:
+            yield preorder[r], (ppn, nspn)
+        else:
+            yield preorder[r], (ppn, nspn, preorder[fc], preorder[last_child[r]])
+    yield 'root', root_preorder
+
+
+class _PickledDictItems(object):
+    """Pickles as a dict of the (key, value) pairs of the iterable `items`. The pickler
+    writes the pairs in batches (with its SETITEMS support) as they are produced.
+    """
+
+    def __init__(self, items):
+        self._items = items
+
+    def __reduce__(self):
+        return dict, (), None, None, iter(self._items)
+
+
+def write_pickled_dict_items(fp, items):
+    """Writes a (protocol 2) pickle of a dict containing the (key, value) pairs from
+    the iterable `items` without creating the dict. (The pickler holds the pickled bytes,
+    which are much smaller than the dict, until the end of the dump.)
+    """
+    with open(fp, 'wb') as fo:
+        pickler = pickle.Pickler(fo, protocol=2)
+        # no memo, so that the pickler does not hold a reference to every key and value
+        pickler.fast = True
+        pickler.dump(_PickledDictItems(items))
+
+
+def file_sha1(fp, chunk_size=1 << 20):
+    h = hashlib.sha1()
+    with open(fp, 'rb') as fo:
+        while True:
+            chunk = fo.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_fingerprint(fp, recorded=None):
+    """Returns a dict with the 'sha1', 'size' and 'mtime' of the file at `fp` (or None
+    if there is no such file). If the size and mtime match those of `recorded` (an
+    earlier fingerprint of the same file), its sha1 is reused rather than rehashing the file.
+    """
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return None
+    fingerprint = {'size': st.st_size, 'mtime': st.st_mtime}
+    if recorded and recorded.get('size') == st.st_size and recorded.get('mtime') == st.st_mtime:
+        fingerprint['sha1'] = recorded['sha1']
+    else:
+        fingerprint['sha1'] = file_sha1(fp)
+    return fingerprint
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux (bytes on Mac OS X, but this is only a report)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class CacheBuildReport(object):
+    """Records (and logs) the time taken by each step of a cache build."""
+
+    def __init__(self):
+        self.start = time.time()
+        self._prev = self.start
+        self.steps = []
+
+    def step(self, description):
+        now = time.time()
+        elapsed = now - self._prev
+        self._prev = now
+        self.steps.append((description, elapsed))
+        _LOG.info('{d} ({e:.2f} sec)'.format(d=description, e=elapsed))
+
+    @property
+    def total_seconds(self):
+        return self._prev - self.start
+
+    def finish(self):
+        rss = _peak_rss_mb()
+        if rss is None:
+            _LOG.info('built OTT caches in {t:.2f} sec'.format(t=self.total_seconds))
+        else:
+            _LOG.info('built OTT caches in {t:.2f} sec. Peak RSS {m:.1f} MB'.format(t=self.total_seconds, m=rss))
+        return self
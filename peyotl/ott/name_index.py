@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+"""On-disk index of the names (and synonyms) of an OTT version that supports
+exact, case-insensitive, prefix and bounded edit-distance lookups.
+
+Names are "normalized" (lower-cased with runs of whitespace collapsed to one
+space, see `normalize_name`) and the distinct normalized names are stored as a
+sorted string table, so exact and case-insensitive lookups are a binary search
+and prefix lookups are a binary search followed by a scan. Each normalized name
+points to the (name, OTT ID) pairs that normalize to it.
+
+Approximate lookups use an index of the padded 3-grams of each normalized name.
+An edit changes at most 3 of the 3-grams of a string, so a name within `k`
+edits of the query must contain at least one of any 3k+1 distinct 3-grams of
+the query. Only the postings of the 3k+1 rarest grams are read, and the
+candidates are verified with a banded edit-distance computation. Queries that
+are too short to have 3k+1 distinct grams do not return approximate matches.
+
+Everything is stored in one file that is mmap-ed read-only when it is used.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.ott.array_cache import replace_file
+from peyotl.utility import get_logger
+from collections import namedtuple, Counter
+import array
+import json
+import mmap
+import struct
+import sys
+
+_LOG = get_logger(__name__)
+
+NAME_INDEX_FORMAT_VERSION = 1
+_MAGIC = b'PYNI'
+_GRAM_LEN = 3
+_PAD_START = u'\x02' * (_GRAM_LEN - 1)
+_PAD_END = u'\x03' * (_GRAM_LEN - 1)
+_ALIGNMENT = 8
+# number of grams (beyond the minimum) whose postings are counted in an approximate lookup
+_EXTRA_FILTER_GRAMS = 2
+
+# `name` is the name in the taxonomy (or synonym) that matched. `distance` is the edit distance
+#   between the normalized query and the normalized name. `is_homonym` is True if the name
+#   maps to more than one OTT ID (i.e. it is a key in the homonym2ottID cache).
+NameMatch = namedtuple('NameMatch', ['name', 'ott_id', 'distance', 'is_homonym'])
+
+
+def normalize_name(name):
+    """Lower-cases `name`, strips it, and replaces each run of whitespace by one space."""
+    return u' '.join(name.lower().split())
+
+
+def _grams(norm_name):
+    padded = _PAD_START + norm_name + _PAD_END
+    return set(padded[i:i + _GRAM_LEN] for i in range(len(padded) - _GRAM_LEN + 1))
+
+
+def max_searchable_distance(name):
+    """Returns the largest `max_distance` for which `NameIndex.fuzzy` can find matches for `name`."""
+    return (len(_grams(normalize_name(name))) - 1) // _GRAM_LEN
+
+
+def bounded_edit_distance(a, b, max_distance):
+    """Returns the Levenshtein distance between `a` and `b` or None if it exceeds `max_distance`.
+    Only the band of cells within `max_distance` of the diagonal is computed (the others are
+    treated as max_distance + 1).
+    """
+    la, lb = len(a), len(b)
+    if abs(la - lb) > max_distance:
+        return None
+    if la > lb:
+        a, b, la, lb = b, a, lb, la
+    over = max_distance + 1
+    prev = [j if j <= max_distance else over for j in range(lb + 1)]
+    for i in range(1, la + 1):
+        ca = a[i - 1]
+        curr = [over] * (lb + 1)
+        if i <= max_distance:
+            curr[0] = i
+        row_min = curr[0]
+        for j in range(max(1, i - max_distance), min(lb, i + max_distance) + 1):
+            cost = prev[j - 1] if ca == b[j - 1] else prev[j - 1] + 1
+            if prev[j] + 1 < cost:
+                cost = prev[j] + 1
+            if curr[j - 1] + 1 < cost:
+                cost = curr[j - 1] + 1
+            curr[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > max_distance:
+            return None
+        prev = curr
+    d = prev[lb]
+    return d if d <= max_distance else None
+
+
+def _as_id_tuple(ott_ids):
+    if isinstance(ott_ids, (tuple, list)):
+        return tuple(ott_ids)
+    return (ott_ids,)
+
+
+def _blob_and_offsets(strings):
+    blob = bytearray()
+    offsets = array.array('i', [0])
+    for s in strings:
+        blob.extend(s)
+        offsets.append(len(blob))
+    return bytes(blob), offsets
+
+
+def write_name_index(fp, name2ott_ids):
+    """Writes the index for `name2ott_ids` (a dict mapping each name to an OTT ID or a
+    tuple of OTT IDs, as in the name2ottID cache) to `fp`."""
+    by_norm = {}
+    for name, ott_ids in name2ott_ids.items():
+        by_norm.setdefault(normalize_name(name), []).append(name)
+    norm_names = sorted(by_norm.keys(), key=lambda x: x.encode('utf-8'))
+    group_offsets = array.array('i', [0])
+    posting_ott_ids = array.array('i')
+    posting_names = array.array('i')
+    names = []
+    name_counts = array.array('i')
+    gram2postings = {}
+    for norm_index, norm in enumerate(norm_names):
+        for name in sorted(by_norm[norm]):
+            ott_ids = sorted(_as_id_tuple(name2ott_ids[name]))
+            name_index = len(names)
+            names.append(name.encode('utf-8'))
+            name_counts.append(len(ott_ids))
+            for ott_id in ott_ids:
+                posting_ott_ids.append(ott_id)
+                posting_names.append(name_index)
+        group_offsets.append(len(posting_ott_ids))
+        for gram in _grams(norm):
+            p = gram2postings.get(gram)
+            if p is None:
+                p = array.array('i')
+                gram2postings[gram] = p
+            p.append(norm_index)
+    del by_norm
+    norm_blob, norm_offsets = _blob_and_offsets([i.encode('utf-8') for i in norm_names])
+    del norm_names
+    name_blob, name_offsets = _blob_and_offsets(names)
+    del names
+    grams = sorted(gram2postings.keys(), key=lambda x: x.encode('utf-8'))
+    gram_blob, gram_offsets = _blob_and_offsets([i.encode('utf-8') for i in grams])
+    gram_posting_offsets = array.array('i', [0])
+    gram_postings = array.array('i')
+    for gram in grams:
+        gram_postings.extend(gram2postings.pop(gram))
+        gram_posting_offsets.append(len(gram_postings))
+    sections = [('norm_blob', norm_blob), ('norm_offsets', norm_offsets),
+                ('group_offsets', group_offsets),
+                ('posting_ott_ids', posting_ott_ids), ('posting_names', posting_names),
+                ('name_blob', name_blob), ('name_offsets', name_offsets), ('name_counts', name_counts),
+                ('gram_blob', gram_blob), ('gram_offsets', gram_offsets),
+                ('gram_posting_offsets', gram_posting_offsets), ('gram_postings', gram_postings),
+                ]
+    tmp_fp = fp + '.tmp'
+    _write_sections(tmp_fp, sections, {'num_names': len(norm_offsets) - 1})
+    replace_file(tmp_fp, fp)
+
+
+def _write_sections(fp, sections, info):
+    layout = {}
+    datas = []
+    offset = 0
+    for name, data in sections:
+        if isinstance(data, array.array):
+            typecode = data.typecode
+            data = data.tostring() if sys.version_info[0] == 2 else data.tobytes()
+        else:
+            typecode = None
+        layout[name] = [offset, len(data), typecode]
+        datas.append(data)
+        offset += len(data)
+        offset += (-offset) % _ALIGNMENT
+    header = {'format_version': NAME_INDEX_FORMAT_VERSION,
+              'byteorder': sys.byteorder,
+              'itemsize': array.array('i').itemsize,
+              'sections': layout,
+              'info': info}
+    header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+    start = len(_MAGIC) + 4 + len(header_bytes)
+    start += (-start) % _ALIGNMENT
+    _LOG.debug('Creating "{p}"'.format(p=fp))
+    with open(fp, 'wb') as fo:
+        fo.write(_MAGIC)
+        fo.write(struct.pack('<I', len(header_bytes)))
+        fo.write(header_bytes)
+        fo.write(b'\0' * (start - len(_MAGIC) - 4 - len(header_bytes)))
+        written = 0
+        for data, (name, _) in zip(datas, sections):
+            section_offset = layout[name][0]
+            fo.write(b'\0' * (section_offset - written))
+            fo.write(data)
+            written = section_offset + len(data)
+
+
+class NameIndex(object):
+    """Read-only access to a name index written by `write_name_index`."""
+
+    def __init__(self, fp):
+        self.filepath = fp
+        with open(fp, 'rb') as fo:
+            self._mm = mmap.mmap(fo.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mm
+        if mm[:len(_MAGIC)] != _MAGIC:
+            raise RuntimeError('"{}" is not a name index'.format(fp))
+        hl = struct.unpack('<I', mm[len(_MAGIC):len(_MAGIC) + 4])[0]
+        hs = len(_MAGIC) + 4
+        header = json.loads(mm[hs:hs + hl].decode('utf-8'))
+        if header.get('format_version') != NAME_INDEX_FORMAT_VERSION \
+                or header.get('byteorder') != sys.byteorder \
+                or header.get('itemsize') != array.array('i').itemsize:
+            raise RuntimeError('name index "{}" was written in an unsupported format. '
+                               'Remove the OTT caches and rebuild them.'.format(fp))
+        start = hs + hl
+        start += (-start) % _ALIGNMENT
+        self._start = start
+        self._layout = header['sections']
+        self.num_names = header['info']['num_names']
+        self._blob_starts = {}
+        for name in ('norm_blob', 'name_blob', 'gram_blob'):
+            self._blob_starts[name] = start + self._layout[name][0]
+        self._norm_offsets = self._ints('norm_offsets')
+        self._group_offsets = self._ints('group_offsets')
+        self._posting_ott_ids = self._ints('posting_ott_ids')
+        self._posting_names = self._ints('posting_names')
+        self._name_offsets = self._ints('name_offsets')
+        self._name_counts = self._ints('name_counts')
+        self._gram_offsets = self._ints('gram_offsets')
+        self._gram_posting_offsets = self._ints('gram_posting_offsets')
+        self._gram_postings = self._ints('gram_postings')
+        self._num_grams = len(self._gram_offsets) - 1
+        self._gram2index = None
+
+    def _ints(self, section):
+        offset, nbytes, typecode = self._layout[section]
+        offset += self._start
+        try:
+            return memoryview(self._mm)[offset:offset + nbytes].cast(typecode)
+        except (AttributeError, TypeError):  # python 2 has no memoryview.cast
+            a = array.array(typecode)
+            a.fromstring(self._mm[offset:offset + nbytes])
+            return a
+
+    def _blob_bytes(self, blob, offsets, i):
+        s = self._blob_starts[blob]
+        return self._mm[s + offsets[i]:s + offsets[i + 1]]
+
+    def _norm_bytes(self, i):
+        return self._blob_bytes('norm_blob', self._norm_offsets, i)
+
+    def _gram_bytes(self, i):
+        return self._blob_bytes('gram_blob', self._gram_offsets, i)
+
+    def _lower_bound(self, key, n, get):
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if get(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _find_norm(self, norm_name):
+        key = norm_name.encode('utf-8')
+        i = self._lower_bound(key, self.num_names, self._norm_bytes)
+        if i < self.num_names and self._norm_bytes(i) == key:
+            return i
+        return None
+
+    def _group(self, norm_index, distance, exact_name=None):
+        matches = []
+        name_offsets, name_counts = self._name_offsets, self._name_counts
+        for p in range(self._group_offsets[norm_index], self._group_offsets[norm_index + 1]):
+            ni = self._posting_names[p]
+            name = self._blob_bytes('name_blob', name_offsets, ni).decode('utf-8')
+            if exact_name is not None and name != exact_name:
+                continue
+            matches.append(NameMatch(name, self._posting_ott_ids[p], distance, name_counts[ni] > 1))
+        return matches
+
+    def exact(self, name):
+        """Returns a list of NameMatch for the taxa (or synonyms) called `name` (case-sensitive)."""
+        i = self._find_norm(normalize_name(name))
+        if i is None:
+            return []
+        return self._group(i, 0, exact_name=name)
+
+    def case_insensitive(self, name):
+        """Returns a list of NameMatch for every name that matches `name` after normalization."""
+        i = self._find_norm(normalize_name(name))
+        if i is None:
+            return []
+        return self._group(i, 0)
+
+    def prefix(self, prefix, limit=100):
+        """Returns a list of NameMatch for the names (at most `limit` distinct normalized names,
+        in sorted order) that start with `prefix` after normalization."""
+        norm = normalize_name(prefix)
+        if prefix and prefix[-1].isspace() and norm:
+            norm += u' '
+        key = norm.encode('utf-8')
+        i = self._lower_bound(key, self.num_names, self._norm_bytes)
+        matches = []
+        num_groups = 0
+        while i < self.num_names and (limit is None or num_groups < limit):
+            if not self._norm_bytes(i).startswith(key):
+                break
+            matches.extend(self._group(i, 0))
+            num_groups += 1
+            i += 1
+        return matches
+
+    def _gram_postings_range(self, gram):
+        if self._gram2index is None:
+            # the gram table is small (tens of thousands of entries), so it is read into a dict on first use
+            self._gram2index = dict((self._gram_bytes(i).decode('utf-8'), i) for i in range(self._num_grams))
+        i = self._gram2index.get(gram)
+        if i is None:
+            return 0, 0
+        return self._gram_posting_offsets[i], self._gram_posting_offsets[i + 1]
+
+    def fuzzy(self, name, max_distance=1):
+        """Returns a list of NameMatch for the names within `max_distance` edits of `name` (after
+        normalization), sorted by distance and then by name. Returns [] if the normalized query
+        has fewer than 3*max_distance + 1 distinct 3-grams.
+        """
+        norm = normalize_name(name)
+        if max_distance <= 0:
+            return self.case_insensitive(name)
+        grams = _grams(norm)
+        num_needed = _GRAM_LEN * max_distance + 1
+        if len(grams) < num_needed:
+            return []
+        # A name within max_distance edits lacks at most num_needed - 1 of the query's grams, so it
+        #   must be in the postings of at least (m - num_needed + 1) of any m of the query's grams.
+        #   Counting over the rarest grams keeps the number of candidates (and postings read) small.
+        ranges = [self._gram_postings_range(g) for g in grams]
+        ranges.sort(key=lambda x: x[1] - x[0])
+        m = min(len(ranges), num_needed + _EXTRA_FILTER_GRAMS)
+        counts = Counter()
+        postings = self._gram_postings
+        for first, last in ranges[:m]:
+            counts.update(postings[first:last])
+        min_count = m - num_needed + 1
+        scored = []
+        for c, count in counts.items():
+            if count < min_count:
+                continue
+            cand = self._norm_bytes(c).decode('utf-8')
+            d = bounded_edit_distance(norm, cand, max_distance)
+            if d is not None:
+                scored.append((d, cand, c))
+        scored.sort()
+        matches = []
+        for d, cand, c in scored:
+            matches.extend(self._group(c, d))
+        return matches
+
+    def match(self, name, max_distance=0):
+        """Returns the case-insensitive matches for `name` or, if there are none and `max_distance`
+        is positive, its approximate matches."""
+        m = self.case_insensitive(name)
+        if m or max_distance <= 0:
+            return m
+        return self.fuzzy(name, max_distance=max_distance)
+
+    def match_many(self, names, max_distance=0):
+        """Returns a dict mapping each of `names` to the list returned by `match`."""
+        r = {}
+        for name in names:
+            if name not in r:
+                r[name] = self.match(name, max_distance=max_distance)
+        return r
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+"""A taxonomic name resolution service (TNRS) that runs against a local OTT
+directory rather than the taxomachine web service.
+
+`LocalTNRS` implements the TNRS-related methods of `_TaxomachineAPIWrapper`
+(`TNRS`, `names_to_ott_ids_perfect`, `autocomplete`, `contexts` and
+`valid_contexts`) and returns responses with the same structure as the
+taxomachine v2 `match_names` call, so that callers (and `TNRSResponse`) do not
+need to know which backend is in use. Set `taxomachine_backend = local` in the
+`[apis]` section of your config to have `APIWrapper.taxomachine` return a
+`LocalTNRS` for the OTT in the `parent` setting of the `[ott]` section.
+
+Names are matched using the OTT name index (see peyotl.ott.name_index).
+peyotl.api is only imported when a wrapped response (or
+`names_to_ott_ids_perfect`) is requested. Restriction to a context is a
+comparison of preorder numbers against the preorder interval of the context's
+root taxon.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.ott.name_index import max_searchable_distance, normalize_name
+from peyotl.utility.str_util import is_str_type
+from peyotl.utility import get_logger
+
+_LOG = get_logger(__name__)
+
+# context group -> (nomenclatural code, [(context name, name of the root taxon in OTT), ...])
+#   These are the contexts of the taxomachine service.
+_CONTEXTS = (('LIFE', 'undefined', (('All life', 'life'),)),
+             ('ANIMALS', 'ICZN', (('Animals', 'Metazoa'),
+                                  ('Birds', 'Aves'),
+                                  ('Tetrapods', 'Tetrapoda'),
+                                  ('Mammals', 'Mammalia'),
+                                  ('Amphibians', 'Amphibia'),
+                                  ('Vertebrates', 'Vertebrata'),
+                                  ('Arthropods', 'Arthropoda'),
+                                  ('Molluscs', 'Mollusca'),
+                                  ('Platyhelminthes', 'Platyhelminthes'),
+                                  ('Annelids', 'Annelida'),
+                                  ('Cnidarians', 'Cnidaria'),
+                                  ('Arachnids', 'Arachnida'),
+                                  ('Insects', 'Insecta'))),
+             ('PLANTS', 'ICN', (('Land plants', 'Embryophyta'),
+                                ('Hornworts', 'Anthocerotophyta'),
+                                ('Mosses', 'Bryophyta'),
+                                ('Liverworts', 'Marchantiophyta'),
+                                ('Vascular plants', 'Tracheophyta'),
+                                ('Club mosses', 'Lycopodiophyta'),
+                                ('Ferns', 'Moniliformopses'),
+                                ('Seed plants', 'Spermatophyta'),
+                                ('Flowering plants', 'Magnoliophyta'),
+                                ('Monocots', 'Liliopsida'),
+                                ('Eudicots', 'eudicotyledons'),
+                                ('Asterids', 'asterids'),
+                                ('Rosids', 'rosids'))),
+             ('BACTERIA', 'ICNP', (('Bacteria', 'Bacteria'),)),
+             ('FUNGI', 'ICN', (('Fungi', 'Fungi'),)),
+             )
+# The nomenclatural code of a taxon is that of the first of these taxa that it is in.
+_CODE_ROOTS = (('Metazoa', 'ICZN'),
+               ('Chloroplastida', 'ICN'),
+               ('Fungi', 'ICN'),
+               ('Bacteria', 'ICNP'),
+               ('Archaea', 'ICNP'),
+               )
+_UNDEFINED_CODE = 'undefined'
+
+
+class LocalTNRS(object):
+    """TNRS for the `ott` (an OTT instance).
+    `max_edit_distance` is the largest edit distance of an approximate match. It is
+        reduced for short names (see name_index.max_searchable_distance).
+    """
+
+    def __init__(self, ott, max_edit_distance=2):
+        self.ott = ott
+        self.max_edit_distance = max_edit_distance
+        self._contexts = None
+        self._context_roots = None
+        self._code_intervals = None
+        self._taxonomy = None
+
+    def _find_root_taxon(self, name):
+        """Returns the OTT ID of the taxon called `name` with the largest subtree (or None)."""
+        ac = self.ott.array_cache
+        best, best_size = None, -1
+        for m in self.ott.name_index.exact(name):
+            first, last = ac.preorder_interval(m.ott_id)
+            if last - first > best_size:
+                best, best_size = m.ott_id, last - first
+        return best
+
+    def _init_contexts(self):
+        contexts, context_roots = {}, {}
+        for group, code, group_contexts in _CONTEXTS:
+            names = []
+            for context_name, root_name in group_contexts:
+                if root_name == self.ott.root_name:
+                    root_ott_id = self.ott.root_ott_id
+                else:
+                    root_ott_id = self._find_root_taxon(root_name)
+                if root_ott_id is None:
+                    _LOG.debug('context "{}" omitted. No taxon named "{}"'.format(context_name, root_name))
+                    continue
+                names.append(context_name)
+                context_roots[context_name] = (root_ott_id, code)
+            if names:
+                contexts[group] = names
+        self._contexts = contexts
+        self._context_roots = context_roots
+
+    def contexts(self):
+        """Returns a dict of context group -> list of the context names in this OTT"""
+        if self._contexts is None:
+            self._init_contexts()
+        return self._contexts
+
+    @property
+    def valid_contexts(self):
+        if self._context_roots is None:
+            self._init_contexts()
+        return set(self._context_roots.keys())
+
+    def context_root(self, context_name):
+        """Returns the OTT ID of the root of the context `context_name`."""
+        if self._context_roots is None:
+            self._init_contexts()
+        return self._context_roots[context_name][0]
+
+    @property
+    def taxonomy(self):
+        if self._taxonomy is None:
+            v = self.ott.version
+            self._taxonomy = {'author': 'open tree of life project',
+                              'name': 'ott',
+                              'source': 'ott{}'.format(v),
+                              'version': v,
+                              'weburl': 'https://tree.opentreeoflife.org/about/taxonomy-version/ott{}'.format(v)}
+        return self._taxonomy
+
+    def _nomenclature_code(self, preorder_num):
+        if self._code_intervals is None:
+            ac = self.ott.array_cache
+            intervals = []
+            for name, code in _CODE_ROOTS:
+                ott_id = self._find_root_taxon(name)
+                if ott_id is not None:
+                    intervals.append((ac.preorder_interval(ott_id), code))
+            self._code_intervals = intervals
+        for (first, last), code in self._code_intervals:
+            if first <= preorder_num <= last:
+                return code
+        return _UNDEFINED_CODE
+
+    def _names_of(self, ott_id):
+        n = self.ott.ott_id_to_names.get(ott_id)
+        if n is None:
+            return None, []
+        if is_str_type(n):
+            return n, []
+        return n[0], list(n[1:])
+
+    def _match_dict(self, search_string, m, preorder_num, is_dubious, score):
+        ott = self.ott
+        ott_id = m.ott_id
+        primary, synonyms = self._names_of(ott_id)
+        fsk = ott.get_flag_set_key(ott_id)
+        flags = [] if fsk is None else sorted(ott.flag_set_id_to_flag_set[fsk])
+        return {'flags': flags,
+                'is_approximate_match': m.distance > 0,
+                'is_deprecated': False,
+                'is_dubious': is_dubious,
+                'is_synonym': m.name != primary,
+                'matched_name': m.name,
+                'matched_node_id': ott_id,
+                'nomenclature_code': self._nomenclature_code(preorder_num),
+                'ot:ottId': ott_id,
+                'ot:ottTaxonName': primary,
+                'rank': ott.ott_id_to_ranks.get(ott_id, 'no rank'),
+                'score': score,
+                'search_string': search_string,
+                'synonyms': synonyms,
+                'unique_name': ott.ott_id_to_uniq.get(ott_id, primary),
+                }
+
+    def _find_matches(self, name, first, last, do_approximate_matching, include_dubious, dubious):
+        ott = self.ott
+        ni = ott.name_index
+        preorder = ott.array_cache.preorder
+        row = ott.array_cache.row
+        candidates = ni.case_insensitive(name)
+        if not candidates and do_approximate_matching:
+            k = min(self.max_edit_distance, max_searchable_distance(name))
+            if k > 0:
+                candidates = ni.fuzzy(name, max_distance=k)
+        norm_len = len(normalize_name(name))
+        matches = []
+        for m in candidates:
+            p = preorder[row(m.ott_id)]
+            if not (first <= p <= last):
+                continue
+            is_dubious = dubious[p]
+            if is_dubious and not include_dubious:
+                continue
+            score = 1.0
+            if m.distance:
+                score = round(1.0 - m.distance / max(norm_len, len(normalize_name(m.name))), 4)
+            matches.append(self._match_dict(name, m, p, is_dubious, score))
+        matches.sort(key=lambda x: (x['is_approximate_match'], -x['score'], x['is_synonym'], x['ot:ottId']))
+        return matches
+
+    def TNRS(self,
+             names,
+             context_name=None,
+             id_list=None,
+             fuzzy_matching=False,
+             include_deprecated=False,
+             include_dubious=False,
+             do_approximate_matching=None,
+             wrap_response=None):
+        """Same arguments and response structure as `_TaxomachineAPIWrapper.TNRS`.
+        If `context_name` is None, the names are matched against all of OTT ("All life").
+        Deprecated taxa are not indexed, so `include_deprecated` has no effect on the matches.
+        """
+        if do_approximate_matching is not None:
+            fuzzy_matching = do_approximate_matching
+        if context_name and context_name not in self.valid_contexts:
+            raise ValueError('"{}" is not a valid context name'.format(context_name))
+        if not (isinstance(names, list) or isinstance(names, tuple)):
+            names = [names]
+        for name in names:
+            if len(name) < 2:
+                raise ValueError('Name "{}" found. Names must have at least 2 characters!'.format(name))
+        if id_list and len(id_list) != len(names):
+            raise ValueError('"id_list must be the same size as "names"')
+        data = {'names': names, 'do_approximate_matching': bool(fuzzy_matching)}
+        if context_name:
+            data['context_name'] = context_name
+        if id_list:
+            data['ids'] = list(id_list)
+        if include_deprecated:
+            data['include_deprecated'] = True
+        if include_dubious:
+            data['include_dubious'] = True
+        ott = self.ott
+        effective_context = context_name if context_name else 'All life'
+        if effective_context in self.valid_contexts:
+            root_ott_id, governing_code = self._context_roots[effective_context]
+        else:
+            root_ott_id, governing_code = ott.root_ott_id, _UNDEFINED_CODE
+        first, last = ott.array_cache.preorder_interval(root_ott_id)
+        dubious = ott.pruned_preorder_bitmap(ott.TREEMACHINE_SUPPRESS_FLAGS)
+        results, matched, unmatched, unambiguous = [], [], [], []
+        for n, name in enumerate(names):
+            name_id = id_list[n] if id_list else name
+            matches = self._find_matches(name, first, last, fuzzy_matching, include_dubious, dubious)
+            if matches:
+                results.append({'id': name_id, 'matches': matches})
+                matched.append(name_id)
+                if len(matches) == 1:
+                    unambiguous.append(name_id)
+            else:
+                unmatched.append(name_id)
+        resp = {'context': effective_context,
+                'governing_code': governing_code,
+                'includes_approximate_matches': bool(fuzzy_matching),
+                'includes_deprecated_taxa': bool(include_deprecated),
+                'includes_dubious_names': bool(include_dubious),
+                'matched_name_ids': matched,
+                'results': results,
+                'taxonomy': self.taxonomy,
+                'unambiguous_name_ids': unambiguous,
+                'unmatched_name_ids': unmatched,
+                }
+        if wrap_response is None or wrap_response is False:
+            return resp
+        if wrap_response is True:
+            from peyotl.api.taxomachine import TNRSResponse
+            return TNRSResponse(self, resp, query_data=data)
+        return wrap_response(resp, query_data=data)
+
+    match_names = TNRS
+
+    def names_to_ott_ids_perfect(self, names, **kwargs):
+        """Same as `_TaxomachineAPIWrapper.names_to_ott_ids_perfect`"""
+        from peyotl.api.taxomachine import perfect_ott_ids_from_tnrs_results
+        return perfect_ott_ids_from_tnrs_results(names, self.TNRS(names, **kwargs)['results'])
+
+    def autocomplete(self, name, context_name=None, include_dubious=False, limit=100):
+        """Returns a list of dicts (with the fields of the taxomachine v2 `autocomplete_name`
+        response) for the taxa with a name that starts with `name`."""
+        if context_name and context_name not in self.valid_contexts:
+            raise ValueError('"{}" is not a valid context name'.format(context_name))
+        ott = self.ott
+        root_ott_id = self.context_root(context_name) if context_name else ott.root_ott_id
+        first, last = ott.array_cache.preorder_interval(root_ott_id)
+        preorder, row, sizes = ott.array_cache.preorder, ott.array_cache.row, ott.array_cache.subtree_sizes
+        dubious = ott.pruned_preorder_bitmap(ott.TREEMACHINE_SUPPRESS_FLAGS)
+        r, seen = [], set()
+        for m in ott.name_index.prefix(name, limit=limit):
+            if m.ott_id in seen:
+                continue
+            tr = row(m.ott_id)
+            p = preorder[tr]
+            if not (first <= p <= last) or (dubious[p] and not include_dubious):
+                continue
+            seen.add(m.ott_id)
+            primary = self._names_of(m.ott_id)[0]
+            r.append({'is_higher': sizes[tr] > 1,
+                      'is_suppressed': dubious[p],
+                      'ott_id': m.ott_id,
+                      'unique_name': ott.ott_id_to_uniq.get(m.ott_id, primary)})
+        return r
+
+    def get_tnrs_match_from_response(self, resp, taxonomy):
+        from peyotl.api.taxomachine import TNRSMatch
+        return TNRSMatch(resp, taxonomy=taxonomy)
@@ -68,3 +68,202 @@ def compare_bits_as_splits(one_set, other, el_universe):
     if el_universe == union_b:
         return SplitComparison.UNROOTED_COMPAT
     return SplitComparison.UNROOTED_INCOMPATIBLE
+
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_RE, _RC = SplitComparison.ROOTED_EQUIVALENT.value, SplitComparison.ROOTED_COMPAT.value
+_UE, _UC = SplitComparison.UNROOTED_EQUIVALENT.value, SplitComparison.UNROOTED_COMPAT.value
+_UI = SplitComparison.UNROOTED_INCOMPATIBLE.value
+# max # of bytes of the counts (and unpacked bits) of a block of phylo splits. Small enough to stay in cache
+_CLASSIFY_BLOCK_BYTES = 1 << 22
+
+
+def _bit_indices(bits):
+    """Returns the list of the indices of the 1 bits of the int `bits`."""
+    s = bin(bits)[:1:-1]
+    r = []
+    i = s.find('1')
+    while i >= 0:
+        r.append(i)
+        i = s.find('1', i + 1)
+    return r
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+def _split_forest(splits):
+    """Treats the distinct int bitsets in `splits` as the clades of a forest (as the splits
+    of a taxonomy are). Returns (parents, leaf_owner) where parents[i] is the index of the smallest
+    split that is a proper superset of splits[i] (or -1), and leaf_owner maps each bit index to the
+    index of the smallest split with that bit.
+    Raises a ValueError if two splits overlap without being nested.
+    """
+    parents = [-1] * len(splits)
+    leaf_owner = {}
+    for i in sorted(range(len(splits)), key=lambda x: -_popcount(splits[x])):
+        leaves = _bit_indices(splits[i])
+        if not leaves:
+            continue
+        par = leaf_owner.get(leaves[0], -1)
+        for leaf in leaves:
+            if leaf_owner.get(leaf, -1) != par:
+                raise ValueError('The taxonomic splits are not nested (split #{} overlaps another)'.format(i))
+            leaf_owner[leaf] = i
+        parents[i] = par
+    return parents, leaf_owner
+
+
+def _int_to_le_bytes(bits, num_bytes):
+    if hasattr(bits, 'to_bytes'):
+        return bits.to_bytes(num_bytes, 'little')
+    import binascii
+    return binascii.unhexlify('%0*x' % (2 * num_bytes, bits))[::-1]
+
+
+def pack_splits(splits, num_bits):
+    """Returns a (len(splits), ceil(num_bits/64)) numpy uint64 array of the int bitsets in `splits`
+    (word 0 holds bits 0-63)."""
+    num_words = max(1, (num_bits + 63) // 64)
+    buf = b''.join([_int_to_le_bytes(s, 8 * num_words) for s in splits])
+    return numpy.frombuffer(buf, dtype='<u8').reshape(len(splits), num_words)
+
+
+def _unpack_splits(packed, num_bits):
+    """Returns a uint8 array with a column of 0/1 for each of the first `num_bits` bits."""
+    return numpy.unpackbits(packed.view(numpy.uint8), axis=1, bitorder='little')[:, :num_bits]
+
+
+def classify_splits(phylo_splits, taxo_splits, universe):
+    """Compares every split in `phylo_splits` to every split in `taxo_splits`. Splits are int bitsets
+    of leaves (as created by add_bits4subtree_ids) and subsets of `universe`.
+    The `taxo_splits` must be nested or disjoint (as the clades of a tree are). That nesting is used
+    to avoid comparing bitsets: the # of leaves that a phylo split shares with each taxo split is the sum
+    of those of its child splits (and its own leaves), and a phylo split that contains (or is disjoint
+    from) a taxo split has the same relationship to all of its descendants.
+    Returns codes[i][j] = compare_bits_as_splits(phylo_splits[i], taxo_splits[j], universe).value
+        as a uint8 numpy array (packed uint64 bitsets are used for the phylo splits) or, if numpy
+        is not installed, as a list of lists of ints.
+    Raises a ValueError if `taxo_splits` are not nested.
+    """
+    taxo_splits = list(taxo_splits)
+    # duplicate taxo splits are classified once
+    uniq_index = {}
+    uniq = []
+    to_uniq = []
+    for t in taxo_splits:
+        u = uniq_index.get(t)
+        if u is None:
+            u = len(uniq)
+            uniq_index[t] = u
+            uniq.append(t)
+        to_uniq.append(u)
+    parents, leaf_owner = _split_forest(uniq)
+    if numpy is None:
+        codes = _classify_splits_py(phylo_splits, uniq, universe, parents)
+        return [[row[u] for u in to_uniq] for row in codes]
+    codes = _classify_splits_np(phylo_splits, uniq, universe, parents, leaf_owner)
+    if len(uniq) == len(to_uniq):
+        return codes
+    return codes[:, numpy.array(to_uniq, dtype=numpy.intp)]
+
+
+def _classify_splits_py(phylo_splits, taxo_splits, universe, parents):
+    m = len(taxo_splits)
+    children = [[] for _ in range(m)]
+    roots = []
+    for i, p in enumerate(parents):
+        (roots if p < 0 else children[p]).append(i)
+    # preorder of the taxo splits, and the position after the subtree of each position
+    order, subtree_end = [], [0] * m
+    stack = [(i, False) for i in reversed(roots)]
+    while stack:
+        i, done = stack.pop()
+        if done:
+            subtree_end[i] = len(order)
+            continue
+        order.append(i)
+        stack.append((i, True))
+        stack.extend([(c, False) for c in reversed(children[i])])
+    end_of_pos = [subtree_end[i] for i in order]
+    codes = []
+    for p in phylo_splits:
+        row = [0] * m
+        pos = 0
+        while pos < m:
+            j = order[pos]
+            t = taxo_splits[j]
+            inter = p & t
+            if inter == 0:
+                row[j] = _UE if (p | t) == universe else _UC
+                fill = _UC
+            elif inter == t:
+                row[j] = _RE if t == p else _RC
+                fill = _RC
+            else:
+                row[j] = compare_bits_as_splits(p, t, universe).value
+                pos += 1
+                continue
+            end = end_of_pos[pos]
+            for q in range(pos + 1, end):
+                row[order[q]] = fill
+            pos = end
+        codes.append(row)
+    return codes
+
+
+def _classify_splits_np(phylo_splits, taxo_splits, universe, parents, leaf_owner):
+    phylo_splits = list(phylo_splits)
+    n, m = len(phylo_splits), len(taxo_splits)
+    num_bits = universe.bit_length()
+    codes = numpy.empty((n, m), dtype=numpy.uint8)
+    if n == 0 or m == 0:
+        return codes
+    # the leaves, grouped by the smallest taxo split that holds them
+    owned = sorted(leaf_owner.items(), key=lambda x: x[1])
+    leaf_cols = numpy.array([leaf for leaf, owner in owned], dtype=numpy.intp)
+    owners = numpy.array([owner for leaf, owner in owned], dtype=numpy.intp)
+    group_starts = numpy.flatnonzero(numpy.r_[True, owners[1:] != owners[:-1]])
+    group_owners = owners[group_starts]
+    # the taxo splits by depth, grouped by parent, so that counts can be summed from the tips down to the roots
+    depth = [0] * m
+    for i in sorted(range(m), key=lambda x: -_popcount(taxo_splits[x])):
+        if parents[i] >= 0:
+            depth[i] = 1 + depth[parents[i]]
+    by_depth = [[] for _ in range(1 + max(depth))]
+    for i, d in enumerate(depth):
+        by_depth[d].append(i)
+    levels = []
+    parent_arr = numpy.array(parents, dtype=numpy.intp)
+    for nodes in reversed(by_depth[1:]):
+        nodes = numpy.array(sorted(nodes, key=parents.__getitem__), dtype=numpy.intp)
+        pars = parent_arr[nodes]
+        starts = numpy.flatnonzero(numpy.r_[True, pars[1:] != pars[:-1]])
+        levels.append((nodes, starts, pars[starts]))
+    taxo_sizes = numpy.array([_popcount(t) for t in taxo_splits], dtype=numpy.int32)[:, numpy.newaxis]
+    universe_size = _popcount(universe)
+    packed = pack_splits(phylo_splits, num_bits)
+    block = max(1, _CLASSIFY_BLOCK_BYTES // (4 * max(m, num_bits)))
+    for start in range(0, n, block):
+        bits = _unpack_splits(packed[start:start + block], num_bits)
+        phylo_sizes = bits.sum(axis=1, dtype=numpy.int32)
+        # taxo-major (and leaf-major) layout, so that the sums are over contiguous rows
+        counts = numpy.zeros((m, bits.shape[0]), dtype=numpy.int32)
+        if len(leaf_cols):
+            owned_bits = numpy.ascontiguousarray(bits[:, leaf_cols].T)
+            counts[group_owners] = numpy.add.reduceat(owned_bits, group_starts, axis=0, dtype=numpy.int32)
+        for nodes, starts, pars in levels:
+            counts[pars] += numpy.add.reduceat(counts[nodes], starts, axis=0)
+        union_is_universe = (phylo_sizes + taxo_sizes - counts) == universe_size
+        nested = (counts == phylo_sizes) | (counts == taxo_sizes)
+        c = numpy.where(union_is_universe, _UC, _UI).astype(numpy.uint8)
+        c[nested] = numpy.where(phylo_sizes == taxo_sizes, _RE, _RC).astype(numpy.uint8)[nested]
+        disjoint = counts == 0
+        c[disjoint] = numpy.where(union_is_universe, _UE, _UC).astype(numpy.uint8)[disjoint]
+        codes[start:start + block] = c.T
+    return codes
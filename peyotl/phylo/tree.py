@@ -1,7 +1,12 @@
 #!/usr/bin/env python
 from peyotl.utility.tokenizer import NewickEvents
 from peyotl.utility import get_logger
+from operator import attrgetter
+import codecs
+import array
 import sys
+import gc
+import re
 
 _LOG = get_logger(__name__)
 
@@ -14,6 +19,129 @@ def _write_node_info_newick(out, node, **kwargs):  # TODO
     out.write(str(node._id))
 
 
+# Groups of _NEWICK_TOKEN. The token type of a match is its `lastindex`.
+_NONE_TOK, _OPEN_TOK, _CLOSE_TOK, _COMMA_TOK, _COLON_TOK, _SEMICOLON_TOK = 0, 1, 2, 3, 4, 5
+_QUOTED_TOK, _UNQUOTED_TOK, _COMMENT_TOK = 6, 7, 8
+# only used as states of the _build_from_newick_chunks parser
+_LABEL_TOK, _EDGE_TOK = 9, 10
+_NAN = float('nan')
+_NEWICK_TOKEN = re.compile(r"""\s*(?:(\()|(\))|(,)|(:)|(;)"""
+                           r"""|'((?:[^']|'')*)'"""
+                           r"""|([^'():,;\\\[\s][^'():,;\\\[]*)"""
+                           r"""|\[([^\]]*)\])""")
+
+
+def _raise_newick_error(msg, char_offset):
+    raise ValueError('Error: {m} at character #{c}'.format(m=msg, c=1 + char_offset))
+
+
+def _parse_edge_length(edge_info):
+    """Returns the branch length (a float) for the edge info string of newick (or the string
+    itself, if it is not a number)."""
+    try:
+        return float(edge_info)
+    except ValueError:
+        return edge_info
+
+
+def _scan_newick_chunks(chunks, create_node, get_parent, set_label, set_edge_length, no_node):
+    """Builds a tree directly from the text of a newick tree (supplied as an iterable of strings) by
+    matching _NEWICK_TOKEN against a buffer, without creating tokens or events. Accepts the same
+    newick as NewickTokenizer. The tree is built by the hooks, which take and return the tree's
+    handles of its nodes (`no_node` is the handle of the parent of the root):
+        create_node(label, parent) - adds a node as the last child of `parent` (label is None for
+            internal nodes)
+        get_parent(node) - returns the handle of the node's parent
+        set_label(node, label) - sets the label of an internal node
+        set_edge_length(node, length) - sets the length of the edge to the node
+    Returns the handle of the root.
+    """
+    match = _NEWICK_TOKEN.match
+    chunk_it = iter(chunks)
+    buf, buf_len, pos, offset, at_end = '', 0, 0, 0, False
+    root, curr = no_node, no_node
+    prev = _NONE_TOK
+    num_open = 0
+    while True:
+        m = match(buf, pos)
+        if m is None or m.end() == buf_len or (m.lastindex == _QUOTED_TOK and buf[m.end()] == "'"):
+            if not at_end:
+                # the token may continue in the next chunk
+                chunk = next(chunk_it, None)
+                if chunk is None:
+                    at_end = True
+                else:
+                    offset += pos
+                    buf = buf[pos:] + chunk
+                    buf_len = len(buf)
+                    pos = 0
+                continue
+            if m is None:
+                if buf[pos:].strip():
+                    _raise_newick_error('Unexpected character "{}"'.format(buf[pos:].lstrip()[0]), offset + pos)
+                _raise_newick_error('Unexpected end of the newick (no semicolon)', offset + pos)
+        tok = m.lastindex
+        pos = m.end()
+        if tok >= _QUOTED_TOK:
+            if tok == _QUOTED_TOK:
+                label = m.group(_QUOTED_TOK).replace("''", "'")
+            elif tok == _UNQUOTED_TOK:
+                label = m.group(_UNQUOTED_TOK).strip().replace('_', ' ')
+            else:
+                continue  # comment
+            if prev == _COLON_TOK:
+                set_edge_length(curr, _parse_edge_length(label))
+                prev = _EDGE_TOK
+            elif prev == _CLOSE_TOK:
+                set_label(curr, label)
+                prev = _LABEL_TOK
+            elif prev == _OPEN_TOK:
+                curr = create_node(label, curr)
+                prev = _LABEL_TOK
+            elif prev == _COMMA_TOK:
+                curr = create_node(label, get_parent(curr))
+                prev = _LABEL_TOK
+            else:
+                _raise_newick_error('Unexpected label "{}"'.format(label), offset + m.start(tok))
+        elif tok == _OPEN_TOK:
+            if prev == _OPEN_TOK:
+                curr = create_node(None, curr)
+            elif prev == _COMMA_TOK:
+                curr = create_node(None, get_parent(curr))
+            elif prev == _NONE_TOK:
+                curr = create_node(None, no_node)
+                root = curr
+            else:
+                _raise_newick_error('Expecting "(" to be preceded by "," or "("', offset + m.start(tok))
+            num_open += 1
+            prev = _OPEN_TOK
+        elif tok == _CLOSE_TOK:
+            if prev != _LABEL_TOK and prev != _EDGE_TOK and prev != _CLOSE_TOK:
+                _raise_newick_error('Expecting ")" to be preceded by a label or branch information',
+                                    offset + m.start(tok))
+            curr = get_parent(curr)
+            if curr == no_node:
+                _raise_newick_error('Number of close parentheses exceeds the number of open parentheses',
+                                    offset + m.start(tok))
+            num_open -= 1
+            prev = _CLOSE_TOK
+        elif tok == _COMMA_TOK:
+            if (prev != _LABEL_TOK and prev != _EDGE_TOK and prev != _CLOSE_TOK) or get_parent(curr) == no_node:
+                _raise_newick_error('Unexpected ","', offset + m.start(tok))
+            prev = _COMMA_TOK
+        elif tok == _COLON_TOK:
+            if prev != _LABEL_TOK and prev != _CLOSE_TOK:
+                _raise_newick_error('Expecting ":" to be preceded by ")" or a taxon label', offset + m.start(tok))
+            prev = _COLON_TOK
+        else:  # semicolon
+            if (prev != _LABEL_TOK and prev != _EDGE_TOK and prev != _CLOSE_TOK) or num_open != 0:
+                _raise_newick_error('Unexpected ";"', offset + m.start(tok))
+            break
+    if prev == _NONE_TOK:
+        _raise_newick_error('Expected the first character to be a "("', offset)
+    return root
+
+
 class ExtensibleObject(object):
     pass
 
@@ -246,7 +374,7 @@ class TreeWithPathsInEdges(_TreeWithNodeIDs):
                     curr.add_sib(n)
                 curr = n
                 self._id2node[n._id] = n
-                self._leaves.add(curr)
+                self._leaves.add(n._id)
             else:
                 assert t == NewickEvents.CLOSE_SUBTREE
                 curr = curr._parent
@@ -254,9 +382,72 @@ class TreeWithPathsInEdges(_TreeWithNodeIDs):
                 if x is not None:
                     curr._id = x
                     self._id2node[x] = curr
+            edge_info = event.get('edge_info')
+            if edge_info is not None:
+                curr.edge.length = _parse_edge_length(edge_info)
             prev = t
         assert curr is self._root
 
+    def _build_from_newick_chunks(self, chunks):
+        """Builds the tree directly from the text of a newick tree (see _scan_newick_chunks)."""
+        id2node, leaves = self._id2node, self._leaves
+
+        def create_node(label, par):
+            n = NodeWithPathInEdges(_id=label)
+            if par is not None:
+                par.add_child(n)
+            if label is not None:
+                id2node[label] = n
+                leaves.add(label)
+            return n
+
+        def set_label(n, label):
+            n._id = label
+            id2node[label] = n
+
+        def set_edge_length(n, length):
+            n.edge.length = length
+
+        get_parent = attrgetter('_parent')
+        self._root = _scan_newick_chunks(chunks, create_node, get_parent, set_label, set_edge_length, None)
+
+    def _build_from_children_map(self, root_id, id2children, create_monotypic_nodes):
+        """Adds the nodes for create_tree_from_id2par. `id2children` maps each ID to the set of
+        IDs of its children (in the tree induced by the requested IDs).
+        Unless `create_monotypic_nodes` is True, a chain of nodes with one child is collapsed into
+        the path of the edge of the descendant (listed from the descendant to the root-most ID).
+        """
+        # Now create a map from parent to (leaf_or_internal_des, [child, grandchild, ..., par_of_leaf_or_internal])
+        to_process = [root_id]
+        self._root = NodeWithPathInEdges(_id=root_id)
+        id2tree_node = {root_id: self._root}
+        while to_process:
+            nd_id = to_process.pop(0)
+            nd = id2tree_node[nd_id]
+            c_id_set = id2children[nd_id]
+            for child_id in c_id_set:
+                des_id = child_id
+                dc_id_set = id2children[des_id]
+                path_ids = []
+                if create_monotypic_nodes:
+                    path_ids.append(des_id)
+                else:
+                    while len(dc_id_set) == 1:
+                        path_ids.append(des_id)
+                        des_id = dc_id_set.pop()
+                        dc_id_set = id2children[des_id]
+                    path_ids.append(des_id)
+                    path_ids.reverse()
+                # _LOG.debug('NodeWithPathInEdges({}, path_ids={})'.format(des_id, path_ids))
+                nn = NodeWithPathInEdges(des_id, path_ids=path_ids)
+                id2tree_node[des_id] = nn
+                nd.add_child(nn)
+                if dc_id_set:
+                    to_process.append(des_id)
+                else:
+                    self._register_node(nn)
+            self._register_node(nd)
+
     @property
     def leaf_ids(self):
         return [i for i in self.leaf_id_iter()]
@@ -345,6 +536,419 @@ class TreeWithPathsInEdges(_TreeWithNodeIDs):
         return relevant_ids
 
 
+class CompactNode(object):
+    """A view of node #`index` of a CompactTree, with the interface of NodeWithPathInEdges.
+    Views are created on demand, so two views of the same node are equal but not identical.
+    Other attributes assigned to a view are stored in the tree (in `_node_attrs`).
+    """
+    __slots__ = ('_tree', '_index')
+
+    def __init__(self, tree, index):
+        object.__setattr__(self, '_tree', tree)
+        object.__setattr__(self, '_index', index)
+
+    def __getattr__(self, name):
+        if name in CompactNode.__slots__:
+            raise AttributeError(name)
+        try:
+            return self._tree._node_attrs[self._index][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if isinstance(getattr(CompactNode, name, None), property):
+            object.__setattr__(self, name, value)
+        else:
+            self._tree._node_attrs.setdefault(self._index, {})[name] = value
+
+    def __eq__(self, other):
+        return isinstance(other, CompactNode) and other._index == self._index and other._tree is self._tree
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self._index)
+
+    def __repr__(self):
+        return 'CompactNode({i}, _id={n})'.format(i=self._index, n=repr(self._id))
+
+    @property
+    def _id(self):
+        return self._tree._ids[self._index]
+
+    @property
+    def _parent(self):
+        p = self._tree._parent[self._index]
+        return None if p < 0 else CompactNode(self._tree, p)
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @property
+    def _children(self):
+        return list(self.child_iter())
+
+    @property
+    def children(self):
+        return tuple(self.child_iter())
+
+    @property
+    def _path_ids(self):
+        return self._tree._node_path_ids(self._index)
+
+    @property
+    def _edge(self):
+        return self._tree._edge(self._index, create=False)
+
+    @property
+    def edge(self):
+        return self._tree._edge(self._index)
+
+    @property
+    def bits4subtree_ids(self):
+        if self._tree._bits4subtree_ids is None:
+            raise AttributeError('bits4subtree_ids')
+        return self._tree._bits4subtree_ids[self._index]
+
+    @bits4subtree_ids.setter
+    def bits4subtree_ids(self, value):
+        self._tree._bits4subtree_ids[self._index] = value
+
+    @property
+    def is_leaf(self):
+        return self._tree._first_child[self._index] < 0
+
+    @property
+    def is_first_child_of_parent(self):
+        """Returns True for *ROOT* and any node that is the first child of its parent"""
+        p = self._tree._parent[self._index]
+        return p < 0 or self._tree._first_child[p] == self._index
+
+    @property
+    def is_last_child_of_parent(self):
+        """Returns True for *ROOT* and any node that is the last child of its parent"""
+        return self._tree._next_sib[self._index] < 0
+
+    def child_iter(self):
+        tree = self._tree
+        c = tree._first_child[self._index]
+        while c >= 0:
+            yield CompactNode(tree, c)
+            c = tree._next_sib[c]
+
+    def children_iter(self, filter_fn=None):
+        for i in self.child_iter():
+            if filter_fn is None or filter_fn(i):
+                yield i
+
+    def children_reversed_iter(self, filter_fn=None):
+        for i in reversed(self._children):
+            if filter_fn is None or filter_fn(i):
+                yield i
+
+    def sib_iter(self):
+        p = self._parent
+        if p is None:
+            return
+        for c in p.child_iter():
+            if c._index != self._index:
+                yield c
+
+    def preorder_iter(self, filter_fn=None):
+        return self._tree.preorder_node_iter(self, filter_fn=filter_fn)
+
+    def postorder_iter(self, filter_fn=None):
+        return self._tree.postorder_node_iter(self, filter_fn=filter_fn)
+
+
+class CompactTree(object):
+    """A tree stored as parallel arrays indexed by node # (the root is node 0): the
+    parent, first child, last child and next sibling of each node (-1 for none) and the
+    ID of each node. Edge lengths are stored in an array of doubles (NaN for none).
+    Nodes are returned as CompactNode views, so this offers the traversal API of
+    TreeWithPathsInEdges for a small fraction of its memory. Other node and edge attributes
+    are stored in dicts, so they are only cheap for a small fraction of the nodes.
+    Create one with `parse_newick(..., _class=CompactTree)` or
+    `create_tree_from_id2par(..., _class=CompactTree)`.
+    """
+
+    def __init__(self, id_to_par_id=None, newick_events=None):
+        self._parent = array.array('i')
+        self._first_child = array.array('i')
+        self._last_child = array.array('i')
+        self._next_sib = array.array('i')
+        self._ids = []
+        self._id2index = {}
+        self._index2path_ids = {}  # only for nodes with more than their own ID in the path of their edge
+        self._edge_lengths = None
+        self._edges = {}
+        self._node_attrs = {}
+        self._bits4subtree_ids = None
+        self._id2par = id_to_par_id
+        if newick_events is not None:
+            self._build_from_newick_events(newick_events)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __iter__(self):
+        return self.preorder_node_iter()
+
+    @property
+    def root(self):
+        return CompactNode(self, 0) if self._ids else None
+
+    def find_node(self, _id):
+        return CompactNode(self, self._id2index[_id])
+
+    @property
+    def leaf_ids(self):
+        return [i for i in self.leaf_id_iter()]
+
+    def leaf_id_iter(self):
+        ids = self._ids
+        for i, c in enumerate(self._first_child):
+            if c < 0:
+                yield ids[i]
+
+    @property
+    def leaves(self):
+        return [CompactNode(self, i) for i, c in enumerate(self._first_child) if c < 0]
+
+    @property
+    def _id2node(self):
+        """dict of ID to node, as in TreeWithPathsInEdges. Built on each call (used by the invariant checks)."""
+        return dict((i, CompactNode(self, x)) for i, x in self._id2index.items())
+
+    @property
+    def _leaves(self):
+        return set(self.leaf_id_iter())
+
+    def _append_node(self, _id, par):
+        """Adds a node with ID `_id` as the last child of node #`par` (-1 for the root). Returns its index."""
+        i = len(self._ids)
+        self._ids.append(_id)
+        self._parent.append(par)
+        self._first_child.append(-1)
+        self._last_child.append(-1)
+        self._next_sib.append(-1)
+        if par >= 0:
+            lc = self._last_child[par]
+            if lc < 0:
+                self._first_child[par] = i
+            else:
+                self._next_sib[lc] = i
+            self._last_child[par] = i
+        if _id is not None:
+            self._id2index[_id] = i
+        return i
+
+    def _set_id(self, i, _id):
+        self._ids[i] = _id
+        self._id2index[_id] = i
+
+    def _set_edge_length(self, i, length):
+        if not isinstance(length, float) or i in self._edges:
+            self._edge(i).length = length
+            return
+        el = self._edge_lengths
+        if el is None:
+            el = array.array('d')
+            self._edge_lengths = el
+        if len(el) <= i:
+            el.extend([_NAN] * (1 + i - len(el)))
+        el[i] = length
+
+    def _edge(self, i, create=True):
+        e = self._edges.get(i)
+        if e is None:
+            el = self._edge_lengths
+            has_length = el is not None and i < len(el) and el[i] == el[i]
+            if not (create or has_length):
+                return None
+            e = ExtensibleObject()
+            if has_length:
+                e.length = el[i]
+            self._edges[i] = e
+        return e
+
+    def _node_path_ids(self, i):
+        p = self._index2path_ids.get(i)
+        if p is not None:
+            return list(p)
+        _id = self._ids[i]
+        return [] if _id is None else [_id]
+
+    def _preorder_indices(self, start=0):
+        if not self._ids:
+            return
+        fc, ns, par = self._first_child, self._next_sib, self._parent
+        i = start
+        while True:
+            yield i
+            c = fc[i]
+            if c >= 0:
+                i = c
+                continue
+            while i != start and ns[i] < 0:
+                i = par[i]
+            if i == start:
+                return
+            i = ns[i]
+
+    def _postorder_indices(self, start=0):
+        if not self._ids:
+            return
+        fc, ns, par = self._first_child, self._next_sib, self._parent
+        i = start
+        while fc[i] >= 0:
+            i = fc[i]
+        while True:
+            yield i
+            if i == start:
+                return
+            s = ns[i]
+            if s >= 0:
+                i = s
+                while fc[i] >= 0:
+                    i = fc[i]
+            else:
+                i = par[i]
+
+    def preorder_node_iter(self, nd=None, filter_fn=None):
+        for i in self._preorder_indices(0 if nd is None else nd._index):
+            node = CompactNode(self, i)
+            if filter_fn is None or filter_fn(node):
+                yield node
+
+    def postorder_node_iter(self, nd=None, filter_fn=None):
+        for i in self._postorder_indices(0 if nd is None else nd._index):
+            node = CompactNode(self, i)
+            if filter_fn is None or filter_fn(node):
+                yield node
+
+    def do_full_check_of_invariants(self, testCase, **kwargs):
+        par, fc, lc, ns = self._parent, self._first_child, self._last_child, self._next_sib
+        for i in range(len(self._ids)):
+            testCase.assertEqual(par[i] < 0, i == 0)
+            c, last = fc[i], -1
+            while c >= 0:
+                testCase.assertEqual(par[c], i)
+                last, c = c, ns[c]
+            testCase.assertEqual(lc[i], last)
+        for _id, i in self._id2index.items():
+            testCase.assertIn(_id, self._node_path_ids(i))
+        _do_full_check_of_tree_invariants(self, testCase, **kwargs)
+
+    def write_newick(self, out, **kwargs):
+        if not self._ids:
+            return
+        par, fc, ns = self._parent, self._first_child, self._next_sib
+        i = 0
+        while True:
+            p = par[i]
+            is_first = p < 0 or fc[p] == i
+            if fc[i] >= 0:
+                out.write('(' if is_first else ',(')
+                i = fc[i]
+                continue
+            if not is_first:
+                out.write(',')
+            _write_node_info_newick(out, CompactNode(self, i), **kwargs)
+            while i != 0 and ns[i] < 0:
+                i = par[i]
+                out.write(')')
+                _write_node_info_newick(out, CompactNode(self, i), **kwargs)
+            if i == 0:
+                break
+            i = ns[i]
+        out.write(';\n')
+
+    def add_bits4subtree_ids(self, relevant_ids):
+        """As TreeWithPathsInEdges.add_bits4subtree_ids, but the bits are stored in an
+        list indexed by node # (and exposed as the `bits4subtree_ids` of the nodes).
+        """
+        if relevant_ids:
+            checking = True
+        else:
+            checking = False
+            relevant_ids = {}
+            bit = 1
+        ids, fc, par = self._ids, self._first_child, self._parent
+        bits = [0] * len(ids)
+        self._bits4subtree_ids = bits
+        self.bits2internal_node = {}
+        for i in self._postorder_indices():
+            is_leaf = fc[i] < 0
+            p = par[i]
+            if p < 0:
+                if not is_leaf:
+                    self.bits2internal_node[bits[i]] = CompactNode(self, i)
+                continue
+            if checking:
+                b = relevant_ids.get(ids[i])
+                if b:
+                    bits[i] |= b
+            elif is_leaf:
+                relevant_ids[ids[i]] = bit
+                bits[i] = bit
+                bit <<= 1
+            if not is_leaf:
+                self.bits2internal_node[bits[i]] = CompactNode(self, i)
+            bits[p] |= bits[i]
+        return relevant_ids
+
+    def _build_from_children_map(self, root_id, id2children, create_monotypic_nodes):
+        """Adds the nodes for create_tree_from_id2par (see TreeWithPathsInEdges._build_from_children_map)."""
+        to_process = [self._append_node(root_id, -1)]
+        for nd_index in to_process:  # grows during the loop, so nodes are added breadth-first
+            for child_id in id2children[self._ids[nd_index]]:
+                des_id = child_id
+                dc_id_set = id2children[des_id]
+                path_ids = [des_id]
+                if not create_monotypic_nodes:
+                    while len(dc_id_set) == 1:
+                        des_id = next(iter(dc_id_set))
+                        path_ids.append(des_id)
+                        dc_id_set = id2children[des_id]
+                    path_ids.reverse()
+                c = self._append_node(des_id, nd_index)
+                if len(path_ids) > 1:
+                    self._index2path_ids[c] = tuple(path_ids)
+                    for i in path_ids:
+                        self._id2index[i] = c
+                if dc_id_set:
+                    to_process.append(c)
+
+    def _build_from_newick_events(self, ev):
+        iev = iter(ev)
+        assert next(iev)['type'] == NewickEvents.OPEN_SUBTREE
+        curr = self._append_node(None, -1)
+        prev = NewickEvents.OPEN_SUBTREE
+        for event in iev:
+            t = event['type']
+            if t == NewickEvents.CLOSE_SUBTREE:
+                curr = self._parent[curr]
+                x = event.get('label')
+                if x is not None:
+                    self._set_id(curr, x)
+            else:
+                par = curr if prev == NewickEvents.OPEN_SUBTREE else self._parent[curr]
+                curr = self._append_node(event.get('label'), par)
+            edge_info = event.get('edge_info')
+            if edge_info is not None:
+                self._set_edge_length(curr, _parse_edge_length(edge_info))
+            prev = t
+        assert curr == 0
+
+    def _build_from_newick_chunks(self, chunks):
+        """Builds the tree directly from the text of a newick tree (see _scan_newick_chunks)."""
+        _scan_newick_chunks(chunks, self._append_node, self._parent.__getitem__, self._set_id,
+                            self._set_edge_length, -1)
+
+
 def create_anc_lineage_from_id2par(id2par_id, ott_id):
     """Returns a list from [ott_id, ott_id's par, ..., root ott_id]"""
     curr = ott_id
@@ -362,16 +966,19 @@ def create_tree_from_id2par(id2par,
                             id_list,
                             _class=TreeWithPathsInEdges,
                             create_monotypic_nodes=False):
+    """Returns the tree (a `_class` instance) induced by the IDs in `id_list` (or None if it is empty).
+    `_class` can be TreeWithPathsInEdges or CompactTree.
+    """
     if not id_list:
         return None
+    id_list = list(id_list)
     f = id_list.pop(0)
     anc_spike = create_anc_lineage_from_id2par(id2par, f)
     # _LOG.debug('anc_spike = {}'.format(anc_spike))
     assert f == anc_spike[0]
     tree = _class(id_to_par_id=id2par)
     if not id_list:
-        n = tree.create_leaf(f)
-        tree._root = n
+        tree._build_from_children_map(f, {f: set()}, create_monotypic_nodes)
         del tree._id2par
         return tree
     # build a dictionary of par ID to sets of children
@@ -406,36 +1013,7 @@ def create_tree_from_id2par(id2par,
             break
         root_nd = rc.pop()
         rc = realized_to_children[root_nd]
-    # Now create a map from parent to (leaf_or_internal_des, [child, grandchild, ..., par_of_leaf_or_internal])
-    to_process = [root_nd]
-    tree._root = NodeWithPathInEdges(_id=root_nd)
-    id2tree_node = {root_nd: tree._root}
-    while to_process:
-        nd_id = to_process.pop(0)
-        nd = id2tree_node[nd_id]
-        c_id_set = realized_to_children[nd_id]
-        for child_id in c_id_set:
-            des_id = child_id
-            dc_id_set = realized_to_children[des_id]
-            path_ids = []
-            if create_monotypic_nodes:
-                path_ids.append(des_id)
-            else:
-                while len(dc_id_set) == 1:
-                    path_ids.append(des_id)
-                    des_id = dc_id_set.pop()
-                    dc_id_set = realized_to_children[des_id]
-                path_ids.append(des_id)
-                path_ids.reverse()
-            # _LOG.debug('NodeWithPathInEdges({}, path_ids={})'.format(des_id, path_ids))
-            nn = NodeWithPathInEdges(des_id, path_ids=path_ids)
-            id2tree_node[des_id] = nn
-            nd.add_child(nn)
-            if dc_id_set:
-                to_process.append(des_id)
-            else:
-                tree._register_node(nn)
-        tree._register_node(nd)
+    tree._build_from_children_map(root_nd, realized_to_children, create_monotypic_nodes)
     del tree._id2par
     return tree
 
@@ -529,13 +1107,57 @@ def _do_full_check_of_tree_invariants(tree, testCase, id2par=None, leaf_ids=None
         TreeWithPathsInEdges(newick_events=nef)
 
 
-def parse_newick(newick=None, stream=None, filepath=None, _class=TreeWithPathsInEdges):
+def _iter_newick_chunks(newick=None, stream=None, filepath=None, chunk_size=1 << 20):
+    if stream is None:
+        if newick is not None:
+            yield newick
+            return
+        if filepath is None:
+            raise ValueError('"stream", "newick", or "filepath" must be provided')
+        with codecs.open(filepath, 'r', encoding='utf-8') as fo:
+            for chunk in _iter_newick_chunks(stream=fo, chunk_size=chunk_size):
+                yield chunk
+        return
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def parse_newick(newick=None, stream=None, filepath=None, _class=TreeWithPathsInEdges, fast=False):
+    """Returns a tree (by default a TreeWithPathsInEdges) for the first tree in the newick.
+    If `fast` is True, the tree is built directly from a regex scan of the newick rather than from
+    NewickTokenizer tokens and NewickEventFactory events. That is several times faster and builds
+    the same tree, but the error messages are less detailed and only one tree is read.
+    Branch lengths are stored as the `length` attribute of the node's `edge`.
+    Pass `_class=CompactTree` for an array-backed tree that needs much less memory.
+    """
+    if fast:
+        tree = _class()
+        # none of the nodes are garbage, so collection cycles would just slow the build
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            tree._build_from_newick_chunks(_iter_newick_chunks(newick=newick, stream=stream, filepath=filepath))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return tree
     from peyotl.utility.tokenizer import NewickEventFactory, NewickTokenizer
     nt = NewickTokenizer(stream=stream, newick=newick, filepath=filepath)
     nef = NewickEventFactory(tokenizer=nt)
     return _class(newick_events=nef)
 
 
+def parse_newick_trees(newick=None, stream=None, filepath=None, _class=TreeWithPathsInEdges):
+    """Generates a tree for each of the semicolon-terminated trees in the newick input.
+    The input is read incrementally (see NewickTokenizer)."""
+    from peyotl.utility.tokenizer import iter_newick_event_factories
+    for nef in iter_newick_event_factories(stream=stream, newick=newick, filepath=filepath):
+        yield _class(newick_events=nef)
+
+
 def parse_id2par_dict(id2par=None,
                       id_list=None,
                       id2par_stream=None,
@@ -206,6 +206,23 @@ def next_unique_filepath(fp):
     return fp
 
 
+def ott_source_path(filename=None):
+    if filename is None:
+        filename = ""
+    return os.path.join(TESTS_DATA_DIR, "ott", filename)
+
+
+def scratch_ott_dir():
+    """Returns the path to a new copy of the test OTT directory in the scratch dir.
+    Building the OTT caches writes into the OTT directory, so tests should use this
+    copy rather than the test data dir.
+    """
+    import shutil
+    fp = next_unique_scratch_filepath('ott')
+    shutil.copytree(ott_source_path(), fp)
+    return fp
+
+
 def json_source_path(filename=None):
     if filename is None:
         filename = ""
@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+from peyotl.evaluate_tree import evaluate_rootings_batch, tree_conflict
+from peyotl.nexson_proxy import NexsonTreeProxy
+from peyotl.phylo.compat import UnrootedConflictStatus
+from peyotl.ott import OTT
+from peyotl.test.support import pathmap
+from peyotl.utility import get_logger
+import tempfile
+import unittest
+import shutil
+import json
+import os
+
+_LOG = get_logger(__name__)
+
+
+def _tree_proxy(nested, ott_ids):
+    """Returns a NexsonTreeProxy for a tree given as nested (node_id, [children]) pairs.
+    Tips are node IDs (strings), mapped to the OTT IDs in `ott_ids` (if present)."""
+    tree, otus = _tree_and_otus(nested, ott_ids)
+    return NexsonTreeProxy(tree=tree, otus=otus)
+
+
+def _nexson(trees):
+    """Returns a (v1.2) NexSON study for a dict of tree ID to a `nested` tree (see _tree_proxy)."""
+    tree_by_id, otu_by_id = {}, {}
+    for tree_id, nested in trees.items():
+        tree_by_id[tree_id], otus = _tree_and_otus(nested, _OTT_IDS)
+        otu_by_id.update(otus)
+    return {'nexml': {'@nexml2json': '1.2.1',
+                      'otusById': {'otus1': {'otuById': otu_by_id}},
+                      'treesById': {'trees1': {'@otus': 'otus1', 'treeById': tree_by_id}}}}
+
+
+def _tree_and_otus(nested, ott_ids):
+    edge_by_source, node_by_id, otus = {}, {}, {}
+
+    def _add(subtree, par_id):
+        if isinstance(subtree, tuple):
+            node_id, children = subtree
+            node_by_id[node_id] = {}
+        else:
+            node_id, children = subtree, []
+            otu_id = 'otu_' + node_id
+            node_by_id[node_id] = {'@otu': otu_id}
+            otus[otu_id] = {} if node_id not in ott_ids else {'^ot:ottId': ott_ids[node_id]}
+        if par_id is not None:
+            edge_id = 'e_' + node_id
+            edge_by_source.setdefault(par_id, {})[edge_id] = {'@source': par_id, '@target': node_id}
+        for c in children:
+            _add(c, node_id)
+
+    _add(nested, None)
+    tree = {'edgeBySourceId': edge_by_source, 'nodeById': node_by_id, '^ot:rootNodeId': nested[0]}
+    return tree, otus
+
+
+_OTT_IDS = {'hs': 770315, 'hn': 4129078, 'homo': 770309, 'pt': 417950, 'pp': 417957,
+            'gg': 153562, 'mb': 1041546, 'ma': 687244, 'ec': 474189}
+
+
+class TestTreeConflict(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ott = OTT(ott_dir=pathmap.scratch_ott_dir())
+
+    def testStatuses(self):
+        nested = ('r', [('n3', [('n0', [('n1', ['hs', 'hn']), 'homo']),
+                                ('n2', ['pt', 'pp'])]),
+                        ('n4', ['gg', 'ma']),
+                        ('n5', ['mb', 'un1']),
+                        ('n6', ['un2']),
+                        'ec'])
+        result = tree_conflict(_tree_proxy(nested, _OTT_IDS), self.ott)
+        status = dict((k, v.status) for k, v in result.items())
+        taxa = dict((k, v.taxa) for k, v in result.items())
+        S = UnrootedConflictStatus
+        self.assertEqual(status['n1'], S.RESOLVES)
+        self.assertEqual(result['n0'], (S.EQUIVALENT, [770309]))
+        self.assertEqual(result['n2'], (S.EQUIVALENT, [417949]))
+        self.assertEqual(status['n3'], S.EQUIVALENT)
+        self.assertEqual(sorted(taxa['n3']), [244265, 770311, 913935])
+        # Gallus and Morus alba: in conflict with Aves and Chordata (and Metazoa, which has the same tips)
+        self.assertEqual(result['n4'], (S.INCOMPATIBLE, [81461, 125642, 691846]))
+        for nid in ['r', 'n5', 'hs', 'homo', 'ec', 'mb']:
+            self.assertEqual(status[nid], S.TRIVIAL)
+        for nid in ['n6', 'un1', 'un2']:
+            self.assertEqual(status[nid], S.NOT_COMPARABLE)
+        self.assertEqual(len(result), 19)
+
+    def testConflictWithinFamily(self):
+        nested = ('r', [('n1', ['hs', 'pt']), ('n2', ['hn', 'pp']), 'gg'])
+        result = tree_conflict(_tree_proxy(nested, _OTT_IDS), self.ott)
+        self.assertEqual(result['n1'], (UnrootedConflictStatus.INCOMPATIBLE, [417949, 770309]))
+        self.assertEqual(result['n2'], (UnrootedConflictStatus.INCOMPATIBLE, [417949, 770309]))
+        # tips mapped to Morus and to Aves are ancestors of other tips
+        ott_ids = dict(_OTT_IDS, morus=1041547, aves=81461)
+        result = tree_conflict(_tree_proxy(('r', [('n1', ['mb', 'gg']), 'morus', 'aves']), ott_ids), self.ott)
+        self.assertEqual(result['n1'], (UnrootedConflictStatus.INCOMPATIBLE, [1041547]))
+        result = tree_conflict(_tree_proxy(('r', [('n1', ['mb', 'morus']), 'gg', 'aves']), ott_ids), self.ott)
+        self.assertEqual(result['n1'], (UnrootedConflictStatus.EQUIVALENT, [1041547]))
+        result = tree_conflict(_tree_proxy(('r', ['un1', 'un2']), _OTT_IDS), self.ott)
+        self.assertEqual(set(v.status for v in result.values()), {UnrootedConflictStatus.NOT_COMPARABLE})
+
+
+class TestEvaluateRootingsBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testBatchAndResume(self):
+        ott_dir = pathmap.scratch_ott_dir()
+        studies = [('s1', _nexson({'t1': ('r', [('n1', ['hs', 'pt']), ('n2', ['gg', 'ma']), 'ec']),
+                                   't2': ('r', ['hs', 'hn'])})),
+                   ('s2', _nexson({'t3': ('r', [('n1', ['hs', 'hn']), 'pt', 'gg'])}))]
+        out = os.path.join(self.tmpdir, 'rootings.jsonl')
+        self.assertEqual(evaluate_rootings_batch(studies[:1], ott_dir, out, num_workers=1), 2)
+        with open(out, 'a') as fo:
+            fo.write('{"study_id": "s2", "tr')  # as if killed while writing
+        self.assertEqual(evaluate_rootings_batch(studies, ott_dir, out, num_workers=2), 1)
+        with open(out) as fo:
+            records = dict(((r['study_id'], r['tree_id']), r) for r in [json.loads(line) for line in fo])
+        self.assertEqual(sorted(records.keys()), [('s1', 't1'), ('s1', 't2'), ('s2', 't3')])
+        self.assertIsNone(records['s1', 't2']['rooting'])
+        rooting = records['s1', 't1']['rooting']
+        self.assertEqual(set(rooting.keys()), {'current_score', 'best_score', 'best_rootings'})
+        self.assertTrue(all(r[0] in ('node', 'edge') for r in rooting['best_rootings']))
+        self.assertTrue(all('error' not in r and r['seconds'] >= 0 for r in records.values()))
+        self.assertEqual(evaluate_rootings_batch(studies, ott_dir, out, num_workers=2), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,6 @@
 #! /usr/bin/env python
-from peyotl.nexson_syntax import extract_tree, PhyloSchema
+from peyotl.nexson_syntax import (extract_tree, extract_tree_nexson, PhyloSchema, convert_tree_to_newick,
+                                  get_subtree_otus, get_subtree_otus_many, NEXUS_NEEDING_QUOTING)
 from peyotl.test.support import pathmap
 from peyotl.utility import get_logger
 import unittest
@@ -32,6 +33,67 @@ class TestExtract(unittest.TestCase):
         self.assertTrue('[post-ingroup-marker' not in newick)
         self.assertTrue('*tip #' not in newick)
 
+    def testNewickRotationAndLabels(self):
+        edges = {'r': {'e2': {'@target': 'b', '@length': 2}, 'e1': {'@target': 'x'}, 'e10': {'@target': 'c'}},
+                 'x': {'e4': {'@target': 'a'}, 'e3': {'@target': 'd', '@length': 0.5}}}
+        nodes = {'r': {}, 'x': {'@otu': 'o4'}, 'a': {'@otu': 'o1'}, 'b': {'@otu': 'o2'}, 'c': {'@otu': 'o3'},
+                 'd': {'@otu': 'o1'}}
+        otus = {'o1': {'^ot:ottTaxonName': "Homo sapiens", '^ot:originalLabel': 'h'},
+                'o2': {'^ot:ottTaxonName': "it's", '^ot:originalLabel': 'p'},
+                'o3': {'^ot:originalLabel': 'g'},
+                'o4': {'^ot:ottTaxonName': 'Homo', '^ot:originalLabel': 'hh'}}
+        tree = {'edgeBySourceId': edges, 'nodeById': nodes, '^ot:rootNodeId': 'r'}
+        leaf_labels = ([], {})
+        newick = convert_tree_to_newick(tree, otus, '^ot:ottTaxonName', leaf_labels)
+        self.assertEqual(newick, "(('Homo sapiens':0.5,'Homo sapiens')Homo,"
+                                 "'*tip #1 not mapped to OTT. Original label - g','it''s':2);")
+        self.assertEqual(leaf_labels[0], ["'Homo sapiens'", "'*tip #1 not mapped to OTT. Original label - g'",
+                                          "'it''s'"])
+        self.assertEqual(leaf_labels[1]["'it''s'"], 2)
+        newick = convert_tree_to_newick(tree, otus, lambda i, n, o: i if o is None else o['^ot:originalLabel'],
+                                        None, NEXUS_NEEDING_QUOTING, subtree_id='x')
+        self.assertEqual(newick, '(h:0.5,h)x;')
+
+    def testSubtreeOtus(self):
+        n = pathmap.nexson_obj('10/pg_10.json')
+        tree, otus = extract_tree_nexson(n, 'tree3')[0][1:]
+        all_otus = get_subtree_otus(n, 'tree3')
+        self.assertEqual(all_otus, set(nd['@otu'] for i, nd in tree['nodeById'].items()
+                                       if i not in tree['edgeBySourceId']))
+        ingroup = get_subtree_otus(n, 'tree3', 'ingroup')
+        self.assertTrue(ingroup and ingroup < all_otus)
+        self.assertEqual(get_subtree_otus(n, 'tree3', 'ingroup', return_format='ottid'),
+                         set(otus[i].get('^ot:ottId') for i in ingroup))
+        leaf_id = [i for i in tree['nodeById'] if i not in tree['edgeBySourceId']][0]
+        subtree_ids = list(tree['edgeBySourceId'].keys()) + ['ingroup', None, leaf_id, 'bogus']
+        many = get_subtree_otus_many(n, 'tree3', subtree_ids)
+        self.assertEqual(set(many.keys()), set(subtree_ids))
+        self.assertEqual(many[None], set('otu{}'.format(i) for i in range(128, 192)))
+        self.assertEqual(many['ingroup'], set('otu{}'.format(i) for i in range(131, 192)))
+        self.assertIsNone(many['bogus'])
+        self.assertIsNone(many[leaf_id])
+        # the leaves of each subtree, found by walking from each leaf to the root
+        node2par = {}
+        for par_id, node_edges in tree['edgeBySourceId'].items():
+            for e in node_edges.values():
+                node2par[e['@target']] = par_id
+        expected = dict((i, set()) for i in tree['edgeBySourceId'])
+        expected_ottids = dict((i, set()) for i in tree['edgeBySourceId'])
+        for node_id, nd in tree['nodeById'].items():
+            if node_id in tree['edgeBySourceId']:
+                continue
+            anc_id = node2par[node_id]
+            while anc_id is not None:
+                expected[anc_id].add(nd['@otu'])
+                expected_ottids[anc_id].add(otus[nd['@otu']].get('^ot:ottId'))
+                anc_id = node2par.get(anc_id)
+        many_ottids = get_subtree_otus_many(n, 'tree3', expected.keys(), return_format='ottid')
+        for node_id in expected:
+            self.assertEqual(many[node_id], expected[node_id])
+            self.assertEqual(many_ottids[node_id], expected_ottids[node_id])
+        self.assertEqual(many['ingroup'], expected[tree['^ot:inGroupClade']])
+        self.assertEqual(many[tree['^ot:rootNodeId']], all_otus)
+
     def testTreeExport(self):
         n = pathmap.nexson_obj('10/pg_10.json')
         newick = extract_tree(n, 'tree3', PhyloSchema('nexus', tip_label='ot:ottTaxonName'))
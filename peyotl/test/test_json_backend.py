@@ -0,0 +1,86 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+from peyotl.utility.json_backend import (JSON_BACKENDS, get_json_backend, set_json_backend,
+                                         json_dumps, json_loads)
+from peyotl.utility.input_output import read_as_json, write_as_json
+from peyotl.test.support import pathmap
+from peyotl.utility import get_logger
+import unittest
+import tempfile
+import codecs
+import shutil
+import json
+import io
+import os
+
+_LOG = get_logger(__name__)
+
+_ODD = {'s': u'a\\"b\\\\" {}[],: \xe9 ☃ \x00\n',
+        '': [[], {}, [{}], {'': []}],
+        'n': [1e16, -0.0, 10 ** 30, -10 ** 25, 2.5e-7, 0.00040843066099560676, float('inf')],
+        'z': None,
+        'b': True}
+
+
+class TestJSONBackend(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.backend = get_json_backend()
+
+    def tearDown(self):
+        set_json_backend(self.backend)
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _installed_backends(self):
+        b = []
+        for name in JSON_BACKENDS:
+            try:
+                set_json_backend(name)
+            except ValueError:
+                continue
+            b.append(name)
+        return b
+
+    def testDumpsMatchesStdlib(self):
+        for blob in [_ODD, pathmap.nexson_obj('9/v1.2.json'), 'x', 1, [], {}]:
+            for indent in [0, None, 1]:
+                for sort_keys in [True, False]:
+                    expected = json.dumps(blob, indent=indent, sort_keys=sort_keys)
+                    self.assertEqual(json_dumps(blob, indent=indent, sort_keys=sort_keys), expected)
+
+    def testLoads(self):
+        content = json.dumps(_ODD, indent=0)
+        for name in self._installed_backends():
+            set_json_backend(name)
+            for c in [content, content.encode('utf-8')]:
+                self.assertEqual(repr(json_loads(c)), repr(json.loads(content)))
+            self.assertEqual(json_loads(u'{"a": "\xe9"}'.encode('latin-1'), encoding='latin-1'), {'a': u'\xe9'})
+            self.assertRaises(ValueError, json_loads, '{"a": }')
+            for i in [-2 ** 63 - 1, -2 ** 63, 2 ** 63 - 1, 2 ** 64 - 1, 2 ** 64, -10 ** 19 + 1, 10 ** 25]:
+                r = json_loads('[{i}, {i}.5, {{"x": {i}}}]'.format(i=i))
+                self.assertEqual(repr(r), repr(json.loads('[{i}, {i}.5, {{"x": {i}}}]'.format(i=i))))
+                self.assertEqual(r[0], i)
+        self.assertRaises(ValueError, set_json_backend, 'nope')
+
+    def testReadWrite(self):
+        blob = pathmap.nexson_obj('9/v1.2.json')
+        fp = os.path.join(self.tmp_dir, 'x.json')
+        with codecs.open(fp, 'w', encoding='utf-8') as fo:
+            json.dump(blob, fo, indent=0, sort_keys=True)
+            fo.write('\n')
+        with open(fp, 'rb') as fo:
+            expected = fo.read()
+        out_fp = os.path.join(self.tmp_dir, 'y.json')
+        write_as_json(blob, out_fp)
+        with open(out_fp, 'rb') as fo:
+            self.assertEqual(fo.read(), expected)
+        out = io.BytesIO()
+        write_as_json(blob, out)
+        self.assertEqual(out.getvalue(), expected)
+        for name in self._installed_backends():
+            set_json_backend(name)
+            self.assertEqual(read_as_json(fp), blob)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -51,6 +51,38 @@ class TestProxy(unittest.TestCase):
         self.assertEqual(ntp['^ot:rootNodeId'], edge_less)
         self.assertEqual(ks, its)
 
+    def testIndex(self):
+        ntp = self.np.get_tree('tree1')
+        index = ntp.index
+        self.assertIs(ntp.index, index)
+        nbi = ntp['nodeById']
+        self.assertEqual(len(index), len(nbi))
+        self.assertEqual(index.node_ids[0], ntp['^ot:rootNodeId'])
+        for i, node_id in enumerate(index.node_ids):
+            self.assertEqual(index.node_index[node_id], i)
+            node = ntp.get_node(node_id)
+            self.assertEqual(bool(index.is_leaf[i]), node.is_leaf)
+            self.assertEqual(index.edge_ids[i], node.edge_id)
+            par = node.parent
+            self.assertEqual(index.parent[i], -1 if par is None else index.node_index[par.node_id])
+            self.assertEqual(set(index.node_ids[c] for c in index.child_indices(i)),
+                             set(c.node_id for c in node.child_iter()))
+            self.assertEqual(set(index.node_ids[j] for j in index.preorder(i)),
+                             set(n.node_id for n in node))
+            if node.is_leaf:
+                self.assertEqual(index.ott_ids[i], node.ott_id)
+        postorder = list(index.postorder())
+        self.assertEqual(sorted(postorder), list(range(len(index))))
+        self.assertEqual(postorder[-1], 0)
+        position = dict((j, k) for k, j in enumerate(postorder))
+        self.assertTrue(all(position[i] > position[c] for i in range(len(index)) for c in index.child_indices(i)))
+        leaf = ntp.get_node(index.node_ids[index.is_leaf.index(1)])
+        ntp.annotate(leaf.node, '@otu', 'otu123')
+        self.assertIsNot(ntp.index, index)
+        index = ntp.index
+        leaf['@otu'] = 'otu123'
+        self.assertIsNot(ntp.index, index)
+
 
 if __name__ == "__main__":
     unittest.main()
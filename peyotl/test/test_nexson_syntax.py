@@ -4,12 +4,25 @@ from peyotl.nexson_syntax import (can_convert_nexson_forms,
                                   DIRECT_HONEY_BADGERFISH,
                                   BADGER_FISH_NEXSON_VERSION,
                                   BY_ID_HONEY_BADGERFISH,
+                                  convert_to_nexml,
+                                  extract_tree_nexson,
+                                  get_ot_study_info_from_nexml,
+                                  LazyNexson,
+                                  PhyloSchema,
                                   sort_meta_elements,
-                                  sort_arbitrarily_ordered_nexson)
+                                  sort_arbitrarily_ordered_nexson,
+                                  strip_to_meta_only)
+from peyotl.nexson_syntax.badgerfish2optimal_nexson import Badgerfish2OptimalNexson
+from peyotl.nexson_syntax.helper import ConversionConfig, NEXML_NEXSON_VERSION
+from peyotl.nexson_syntax.nexml2nexson import Nexml2Nexson
+from peyotl.nexson_syntax.nexson2nexml import Nexson2Nexml
+from peyotl.utility.str_util import StringIO
 from peyotl.test.support import equal_blob_check
 from peyotl.test.support import pathmap
 from peyotl.utility import get_logger
+import xml.dom.minidom
 import unittest
+import json
 import os
 
 _LOG = get_logger(__name__)
@@ -102,6 +115,114 @@ class TestConvert(unittest.TestCase):
             b = convert_nexson_format(obj, BY_ID_HONEY_BADGERFISH)
             equal_blob_check(self, '', b, b_expect)
 
+    def testOneStepMatchesTwoStep(self):
+        for t in RT_DIRS + ['phenoscape']:
+            for fn, out_fmt in [('v0.0.json', BY_ID_HONEY_BADGERFISH), ('v1.2.json', BADGER_FISH_NEXSON_VERSION)]:
+                one_step = convert_nexson_format(pathmap.nexson_obj(os.path.join(t, fn)), out_fmt)
+                direct = convert_nexson_format(pathmap.nexson_obj(os.path.join(t, fn)), DIRECT_HONEY_BADGERFISH)
+                two_step = convert_nexson_format(direct, out_fmt)
+                # same keys in the same order
+                self.assertEqual(json.dumps(one_step), json.dumps(two_step))
+        cfg = ConversionConfig(BY_ID_HONEY_BADGERFISH, input_format=BADGER_FISH_NEXSON_VERSION,
+                               remove_old_structs=False)
+        self.assertRaises(NotImplementedError, Badgerfish2OptimalNexson(cfg).convert,
+                          pathmap.nexson_obj('otu/v0.0.json'))
+
+
+_ODD_NEXML = b'''<?xml version="1.0"?>
+<nex:nexml xmlns:nex="http://www.nexml.org/2009" xmlns="http://www.nexml.org/2009"
+           xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" id="x" about="#x">
+  <!-- a comment --> text <![CDATA[ cdata ]]> more text
+  <meta xsi:type="nex:LiteralMeta" property="ot:studyYear" datatype="xsd:int"> 2004 </meta>
+  <meta xsi:type="nex:LiteralMeta" property="ot:note">a<!-- split -->b<x/></meta>
+  <meta xsi:type="nex:ResourceMeta" rel="ot:r"
+        href="http://x"><meta xsi:type="nex:LiteralMeta" property="p" content="v"/></meta>
+  <meta xsi:type="nex:ResourceMeta" rel="ot:empty"/>
+  <otus id="otus1"><otu id="o1" label="A &amp; B"/><?pi data?></otus>
+</nex:nexml>'''
+
+
+class TestNexml2Nexson(unittest.TestCase):
+    def _check_stream_matches_dom(self, content):
+        for vers in [BADGER_FISH_NEXSON_VERSION, DIRECT_HONEY_BADGERFISH]:
+            ccfg = ConversionConfig(output_format=vers, input_format=NEXML_NEXSON_VERSION)
+            expected = Nexml2Nexson(ccfg).convert(xml.dom.minidom.parseString(content).documentElement)
+            chunks = [content[i:i + 1000] for i in range(0, len(content), 1000)]
+            converted = Nexml2Nexson(ccfg).convert_stream(chunks)
+            self.assertEqual(json.dumps(converted), json.dumps(expected))
+
+    def testStreamMatchesDOM(self):
+        with open(pathmap.nexml_source_path('S15515.xml'), 'rb') as fo:
+            self._check_stream_matches_dom(fo.read())
+        self._check_stream_matches_dom(_ODD_NEXML)
+
+    def testStudyInfoFromNexml(self):
+        fp = pathmap.nexml_source_path('S15515.xml')
+        blob = get_ot_study_info_from_nexml(fp)
+        with open(fp, 'rb') as fo:
+            self.assertEqual(get_ot_study_info_from_nexml(nexml_content=fo.read()), blob)
+        self.assertEqual(blob['nexml']['@nexml2json'], BY_ID_HONEY_BADGERFISH)
+        self.assertIn('otusById', blob['nexml'])
+
+
+class TestNexson2Nexml(unittest.TestCase):
+    def testWriterMatchesDOM(self):
+        for fn in [os.path.join('9', 'v1.0.json'), os.path.join('phenoscape', 'v1.0.json')]:
+            for addindent, newl in [('', ''), ('  ', '\n')]:
+                blob = pathmap.nexson_obj(fn)
+                ccfg = ConversionConfig(NEXML_NEXSON_VERSION, input_format=DIRECT_HONEY_BADGERFISH,
+                                        otu_label='ot:ottTaxonName')
+                out = StringIO()
+                Nexson2Nexml(ccfg).convert(blob).writexml(out, addindent=addindent, newl=newl, encoding='utf-8')
+                written = convert_to_nexml(blob, addindent=addindent, newl=newl, otu_label='ot:ottTaxonName')
+                self.assertEqual(written, out.getvalue())
+                self.assertIn('<otus', written)
+        otu = {'@id': 'o1', '^ot:originalLabel': 'A & "B" <C>', '$': 'x'}
+        blob = {'nexml': {'@nexml2json': '1.0.0', 'otus': [{'@id': 'os', 'otu': [otu]}]}}
+        written = convert_to_nexml(blob, addindent=' ', newl='\n')
+        self.assertIn(' <otu about="#o1" id="o1" label="A &amp; &quot;B&quot; &lt;C&gt;">\n   x\n', written)
+
+
+class TestLazyNexson(unittest.TestCase):
+    def _check_matches_full_parse(self, content):
+        schemas = [PhyloSchema('nexson', content='meta', version='1.2.1'),
+                   PhyloSchema('nexson', content='otus', content_id='otus9', version='1.2.1'),
+                   PhyloSchema('nexson', content='otu', content_id=None, version='1.2.1'),
+                   PhyloSchema('nexson', content='otumap', version='1.2.1'),
+                   PhyloSchema('nexson', content='treelist', version='1.2.1'),
+                   PhyloSchema('nexson', content='study', version='0.0.0'),
+                   PhyloSchema('newick', tip_label='ot:originallabel')]
+        for tree_id in ['tree2', 'nope']:
+            schemas.append(PhyloSchema('nexson', content='tree', content_id=tree_id, version='1.2.1'))
+            schemas.append(PhyloSchema('nexus', content='tree', content_id=tree_id, tip_label='ot:ottid'))
+        for ps in schemas:
+            expected = ps.convert(json.loads(content))
+            self.assertEqual(json.dumps(ps.convert(LazyNexson(content=content))), json.dumps(expected))
+
+    def testMatchesFullParse(self):
+        for fn in ['v1.2.json', 'v1.0.json', 'v0.0.json']:
+            with open(pathmap.nexson_source_path(os.path.join('9', fn)), 'rb') as fo:
+                self._check_matches_full_parse(fo.read())
+
+    def testOddStrings(self):
+        blob = pathmap.nexson_obj(os.path.join('9', 'v1.2.json'))
+        nexml = blob['nexml']
+        nexml['^ot:comment'] = u'brackets {[ ]}, "quotes" and \\ \u00e9'
+        for otu in nexml['otusById']['otus9']['otuById'].values():
+            otu['^ot:originalLabel'] = otu['^ot:originalLabel'] + ' {x} [y] "z" \\'
+        for content in [json.dumps(blob), json.dumps(blob, indent=1, ensure_ascii=False).encode('utf-8')]:
+            lazy = LazyNexson(content=content)
+            self.assertEqual(lazy.extract_tree_nexson('tree2'), extract_tree_nexson(json.loads(content), 'tree2'))
+            self._check_matches_full_parse(content)
+
+    def testNexNexmlKey(self):
+        blob = pathmap.nexson_obj(os.path.join('9', 'v1.2.json'))
+        blob = {'about': 'x', 'nex:nexml': blob['nexml']}
+        lazy = LazyNexson(content=json.dumps(blob))
+        self.assertEqual(lazy.nexson_version, BY_ID_HONEY_BADGERFISH)
+        strip_to_meta_only(blob, BY_ID_HONEY_BADGERFISH)
+        self.assertEqual(lazy.get_meta_only_nexson(), blob)
+
 
 if __name__ == "__main__":
     unittest.main()
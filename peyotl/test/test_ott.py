@@ -0,0 +1,294 @@
+#! /usr/bin/env python
+from peyotl.ott import OTT, write_newick_ott
+from peyotl.phylo.entities import OTULabelStyleEnum
+from peyotl.ott.name_index import bounded_edit_distance, normalize_name
+from peyotl.ott.tnrs import LocalTNRS
+from peyotl.utility.str_util import StringIO
+from peyotl.utility import get_logger
+from peyotl.test.support import pathmap
+import unittest
+import shutil
+import time
+import os
+
+_LOG = get_logger(__name__)
+
+_EXPECTED_PRUNED_NEWICK = "((((((((('Homo sapiens','Homo neanderthalensis')Homo," \
+                          "('Pan troglodytes','Pan paniscus')Pan)Hominidae)Primates)Mammalia," \
+                          "(('Gallus gallus')Gallus,('Morus bassanus')Morus)Aves)Chordata)" \
+                          "Metazoa,(('Morus alba')Morus)Chloroplastida)Eukaryota,(('Escherichia coli')Escherichia)" \
+                          "Bacteria)'cellular organisms')life;"
+
+
+class TestOTT(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.ott_dir = pathmap.scratch_ott_dir()
+        cls.ott = OTT(ott_dir=cls.ott_dir)
+
+    def testArrayCaches(self):
+        ott = self.ott
+        self.assertEqual(ott.root_ott_id, 805080)
+        self.assertTrue(os.path.exists(os.path.join(self.ott_dir, 'ottID2parentOttId.array')))
+        self.assertFalse(os.path.exists(os.path.join(self.ott_dir, 'ottID2parentOttId.pickle')))
+        o2p = ott.ott_id2par_ott_id
+        self.assertEqual(len(o2p), 30)
+        self.assertEqual(o2p[770315], 770309)
+        self.assertIsNone(o2p[805080])
+        self.assertIn(805080, o2p)
+        self.assertNotIn(1000001, o2p)  # skipped "environmental samples"
+        self.assertNotIn('770315', o2p)
+        self.assertIsNone(o2p.get(3))
+        self.assertRaises(KeyError, o2p.__getitem__, 3)
+        self.assertEqual(dict(o2p.items())[417957], 417949)
+
+    def testFlagsAndRanks(self):
+        ott = self.ott
+        self.assertEqual(set(ott.ott_id_to_flags.keys()), {4129078, 5264359, 5264360, 1000002, 4807313, 4807314})
+        self.assertIsNone(ott.get_flag_set_key(770315))
+        fsk = ott.get_flag_set_key(4807314)
+        self.assertEqual(ott.flag_set_id_to_flag_set[fsk], frozenset(['viral']))
+        self.assertEqual(ott.ott_id_to_ranks[770315], 'species')
+        self.assertEqual(ott.ott_id_to_ranks[304358], 'domain')
+
+    def testPreorder(self):
+        ott = self.ott
+        o2pre = ott.ott_id_to_preorder
+        self.assertEqual(o2pre[ott.root_ott_id], 0)
+        for ott_id in ott.ott_id2par_ott_id.keys():
+            self.assertEqual(ott.preorder2ott_id[o2pre[ott_id]], ott_id)
+
+    def testLineage(self):
+        exp = [770315, 770309, 770311, 913935, 244265, 125642, 691846, 304358, 93302, 805080]
+        self.assertEqual(self.ott.get_anc_lineage(770315), exp)
+        self.assertRaises(KeyError, self.ott.get_anc_lineage, 3)
+
+    def testWriteNewick(self):
+        out = StringIO()
+        log = self.ott.write_newick(out, prune_flags=OTT.TREEMACHINE_SUPPRESS_FLAGS, create_log_dict=True)
+        self.assertEqual(out.getvalue(), _EXPECTED_PRUNED_NEWICK)
+        self.assertEqual(log['num_tips'], 8)
+        self.assertEqual(log['num_pruned_anc_nodes'], 3)
+        self.assertEqual(log['pruned']['viral']['anc_ott_id_pruned'], [4807313])
+
+    def testNewickLabelCache(self):
+        ott = self.ott
+        style = OTULabelStyleEnum.CURRENT_LABEL_OTT_ID
+        labels = ott.newick_labels(style)
+        self.assertTrue(os.path.exists(os.path.join(self.ott_dir, 'newickLabels-CURRENT_LABEL_OTT_ID.txt')))
+        self.assertEqual(labels[ott.array_cache.row(770315)], "'Homo sapiens_ott770315'")
+        self.assertEqual(OTT(ott_dir=self.ott_dir).newick_labels(style), labels)
+        flags = OTT.TREEMACHINE_SUPPRESS_FLAGS
+        for root in [None, 770309, 4807314]:
+            out = StringIO()
+            log = ott.write_newick(out, root_ott_id=root, label_style=style, prune_flags=flags, create_log_dict=True)
+            if root is None:
+                root = ott.root_ott_id
+            by_dict = StringIO()
+            ott2children = ott.array_cache.ott_id_to_children(root)
+            self.assertEqual(write_newick_ott(by_dict, ott, ott2children, root, style, flags, True), log)
+            self.assertEqual(by_dict.getvalue(), out.getvalue())
+        # an ID that is not in the taxonomy has no label
+        ott2children = ott.array_cache.ott_id_to_children(770309)
+        ott2children[770309] = list(ott2children[770309]) + [999999999]
+        ott2children[999999999] = []
+        self.assertRaises(KeyError, write_newick_ott, StringIO(), ott, ott2children, 770309, style, None)
+
+    def testSubtreeQueries(self):
+        ott = self.ott
+        self.assertTrue(ott.is_ancestor(805080, 770315))
+        self.assertTrue(ott.is_ancestor(770309, 770315))
+        self.assertFalse(ott.is_ancestor(770315, 770315))
+        self.assertFalse(ott.is_ancestor(770315, 770309))
+        self.assertFalse(ott.is_ancestor(417957, 770315))
+        self.assertEqual(ott.is_in_subtree(770309, [770315, 770309, 417957, 805080]), [True, True, False, False])
+        self.assertRaises(KeyError, ott.is_ancestor, 3, 770315)
+        for ott_id in ott.ott_id2par_ott_id.keys():
+            lineage = set(ott.get_anc_lineage(ott_id)[1:])
+            for other in ott.ott_id2par_ott_id.keys():
+                self.assertEqual(ott.is_ancestor(other, ott_id), other in lineage)
+
+    def testMapOttIds(self):
+        ott = self.ott
+        prune = ott.convert_flag_string_set_to_union(OTT.TREEMACHINE_SUPPRESS_FLAGS)
+        r = ott.map_ott_ids([770315, 5264360, 474189, 512, 514, 3, 304358, 4807314], prune, 304358)
+        mapped, unrecog, forward2unrecog, pruned, above_root, old2new = r
+        self.assertEqual(mapped, [770315, 770315, 304358])
+        self.assertEqual(unrecog, [3])
+        self.assertEqual(forward2unrecog, [514])
+        self.assertEqual(pruned, [5264360])
+        self.assertEqual(above_root, [474189, 4807314])
+        self.assertEqual(old2new, {512: 770315})
+        self.assertEqual(ott.map_ott_ids([4807314, 5264359], None, None)[0], [4807314, 5264359])
+
+    def testPrunedBitmap(self):
+        ott = self.ott
+        flags = OTT.TREEMACHINE_SUPPRESS_FLAGS
+        exp = {5264359, 5264360, 1000002, 4807313, 4807314}
+        for ott_id in ott.ott_id2par_ott_id.keys():
+            self.assertEqual(ott.is_pruned(ott_id, flags), ott_id in exp)
+        self.assertFalse(ott.is_pruned(4807314, ['extinct']))
+        self.assertTrue(ott.is_pruned(4129078, ['extinct']))
+        bitmaps = [i for i in os.listdir(self.ott_dir) if i.endswith('.bitmap')]
+        self.assertEqual(len(bitmaps), 2)
+        self.assertTrue(OTT(ott_dir=self.ott_dir).is_pruned(4807314, flags))
+        out = StringIO()
+        ott.write_newick(out, root_ott_id=361838, prune_flags=flags)
+        self.assertEqual(out.getvalue(), "(('Morus alba')Morus)Chloroplastida;")
+
+    def testInducedTree(self):
+        ott = self.ott
+        tree = ott.induced_tree([770315, 417950, 153562, 687244])
+        self.assertEqual(tree.root._id, 304358)
+        self.assertEqual(set(tree.leaf_ids), {770315, 417950, 153562, 687244})
+        self.assertEqual(tree.find_node(770315).parent._id, 770311)
+        self.assertEqual(tree.find_node(770315)._path_ids, [770315, 770309])
+        self.assertIs(tree.find_node(770309), tree.find_node(770315))
+        self.assertEqual(tree.find_node(770311).parent._id, 125642)
+        self.assertEqual(tree.find_node(125642).parent._id, 304358)
+        tree = ott.induced_tree([770315, 417950, 770311], create_monotypic_nodes=True)
+        self.assertEqual(tree.root._id, 770311)
+        self.assertEqual(set(tree.leaf_ids), {770315, 417950})
+        self.assertEqual(tree.find_node(770315).parent._id, 770309)
+        self.assertEqual(tree.find_node(770309).parent._id, 770311)
+        tree = ott.induced_tree([770315])
+        self.assertEqual(tree.root._id, 770315)
+        self.assertEqual(tree.leaf_ids, [770315])
+        self.assertIsNone(ott.induced_tree([]))
+        self.assertRaises(ValueError, ott.induced_tree, [770315, 3])
+
+    def testNameIndex(self):
+        ni = self.ott.name_index
+        m = ni.exact('Morus')
+        self.assertEqual(set(i.ott_id for i in m), {1041547, 687243})
+        self.assertTrue(all(i.is_homonym for i in m))
+        self.assertEqual(ni.exact('morus'), [])
+        self.assertEqual(ni.case_insensitive('  MORUS '), m)
+        self.assertEqual([(i.name, i.ott_id) for i in ni.exact('man')], [('man', 770315)])
+        self.assertEqual(set(i.name for i in ni.prefix('homo s')), {'Homo sapiens', 'Homo sapiens sapiens'})
+        self.assertEqual(len(ni.prefix('homo', limit=1)), 2)  # both IDs of the name "Homo"
+        f = ni.fuzzy('Homo sapians')
+        self.assertEqual([(i.name, i.ott_id, i.distance) for i in f], [('Homo sapiens', 770315, 1)])
+        self.assertEqual(ni.fuzzy('Pan troglodites'), ni.fuzzy('pan  Troglodites', max_distance=1))
+        self.assertEqual([i.ott_id for i in ni.fuzzy('Galus galus', max_distance=2)], [153562])
+        self.assertEqual(ni.fuzzy('Galus galus', max_distance=1), [])
+        r = ni.match_many(['Gallus', 'Escherichia colli', 'Bogus'], max_distance=1)
+        self.assertEqual([i.ott_id for i in r['Gallus']], [153563])
+        self.assertEqual([i.ott_id for i in r['Escherichia colli']], [474189])
+        self.assertEqual(r['Bogus'], [])
+
+    def testEditDistance(self):
+        self.assertEqual(normalize_name(u' Homo\tSapiens  '), u'homo sapiens')
+        self.assertEqual(bounded_edit_distance('kitten', 'sitting', 3), 3)
+        self.assertIsNone(bounded_edit_distance('kitten', 'sitting', 2))
+        self.assertEqual(bounded_edit_distance('abc', 'abc', 0), 0)
+        self.assertEqual(bounded_edit_distance('', 'ab', 2), 2)
+
+    def testMRCA(self):
+        ott = self.ott
+        ids = list(ott.ott_id2par_ott_id.keys())
+        for a in ids:
+            la = ott.get_anc_lineage(a)
+            for b in ids:
+                lb = set(ott.get_anc_lineage(b))
+                exp = [i for i in la if i in lb][0]
+                self.assertEqual(ott.mrca([a, b]), exp)
+        self.assertEqual(ott.mrca([770315, 417957, 153562]), 125642)
+        self.assertEqual(ott.mrca([770315]), 770315)
+        self.assertEqual(ott.mrca([770315, 4807314]), 805080)
+        self.assertRaises(KeyError, ott.mrca, [770315, 3])
+        self.assertRaises(ValueError, ott.mrca, [])
+
+    def testLocalTNRS(self):
+        tnrs = LocalTNRS(self.ott)
+        self.assertEqual(tnrs.contexts()['ANIMALS'], ['Animals', 'Birds', 'Mammals'])
+        self.assertNotIn('Fungi', tnrs.valid_contexts)
+        r = tnrs.TNRS(['Morus', 'Homo sapien', 'Escherichia coli'])
+        self.assertEqual(r['context'], 'All life')
+        self.assertEqual(r['unmatched_name_ids'], ['Homo sapien'])
+        self.assertEqual(r['unambiguous_name_ids'], ['Escherichia coli'])
+        morus = r['results'][0]['matches']
+        self.assertEqual([(m['ot:ottId'], m['nomenclature_code']) for m in morus],
+                         [(687243, 'ICN'), (1041547, 'ICZN')])
+        r = tnrs.TNRS(['Homo sapien', 'man'], id_list=['a', 'b'], do_approximate_matching=True)
+        self.assertEqual(r['unambiguous_name_ids'], ['a', 'b'])
+        approx, syn = [i['matches'][0] for i in r['results']]
+        self.assertTrue(approx['is_approximate_match'])
+        self.assertLess(approx['score'], 1.0)
+        self.assertEqual(approx['ot:ottId'], 770315)
+        self.assertTrue(syn['is_synonym'])
+        self.assertEqual(syn['ot:ottTaxonName'], 'Homo sapiens')
+        r = tnrs.TNRS(['Morus'], context_name='Birds')
+        self.assertEqual(r['governing_code'], 'ICZN')
+        self.assertEqual([m['ot:ottId'] for m in r['results'][0]['matches']], [1041547])
+        self.assertEqual(tnrs.TNRS(['Viruses'])['unmatched_name_ids'], ['Viruses'])
+        m = tnrs.TNRS(['Viruses'], include_dubious=True)['results'][0]['matches'][0]
+        self.assertTrue(m['is_dubious'])
+        self.assertRaises(ValueError, tnrs.TNRS, ['Morus'], context_name='Fungi')
+        ac = tnrs.autocomplete('Morus b')
+        self.assertEqual([i['ott_id'] for i in ac], [1041546])
+
+
+class TestOTTIncrementalBuild(unittest.TestCase):
+    def setUp(self):
+        self.ott_dir = pathmap.scratch_ott_dir()
+        self.ott = OTT(ott_dir=self.ott_dir)
+        self.ott._create_caches()
+
+    def tearDown(self):
+        shutil.rmtree(self.ott_dir, ignore_errors=True)
+
+    def _mtimes(self):
+        r = {}
+        for fn in os.listdir(self.ott_dir):
+            if fn.endswith('.pickle') or fn.endswith('.array'):
+                r[fn] = os.stat(os.path.join(self.ott_dir, fn)).st_mtime
+        return r
+
+    def _append(self, fn, content):
+        time.sleep(0.01)
+        with open(os.path.join(self.ott_dir, fn), 'a') as fo:
+            fo.write(content)
+
+    def testUpToDate(self):
+        before = self._mtimes()
+        self.assertEqual(self.ott._stale_build_steps(['taxonomy', 'names', 'forwarding']), [])
+        self.ott.make('ottid2parentottid')
+        self.assertEqual(self._mtimes(), before)
+
+    def testTouchedSourceIsNotRebuilt(self):
+        before = self._mtimes()
+        fp = os.path.join(self.ott_dir, 'taxonomy.tsv')
+        st = os.stat(fp)
+        os.utime(fp, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(self.ott._stale_build_steps(['taxonomy', 'names']), [])
+        self.assertEqual(self._mtimes(), before)
+
+    def testForwardsChange(self):
+        before = self._mtimes()
+        self._append('forwards.tsv', '515\t770315\n')
+        ott = OTT(ott_dir=self.ott_dir)
+        self.assertEqual(ott.forward_table[515], 770315)
+        after = self._mtimes()
+        changed = set(k for k, v in after.items() if v != before[k])
+        self.assertEqual(changed, {'forwardingTable.pickle'})
+
+    def testSynonymsChange(self):
+        before = self._mtimes()
+        self._append('synonyms.tsv', 'Homo sapiens idaltu\t|\t770315\t|\tsynonym\t|\t\t|\t\n')
+        ott = OTT(ott_dir=self.ott_dir)
+        self.assertIn('Homo sapiens idaltu', ott.ott_id_to_names[770315])
+        after = self._mtimes()
+        changed = set(k for k, v in after.items() if v != before[k])
+        self.assertEqual(changed, {'ottID2names.pickle', 'name2ottID.pickle',
+                                   'homonym2ottID.pickle', 'nonhomonym2ottID.pickle'})
+
+    def testMissingOutputIsRebuilt(self):
+        os.remove(os.path.join(self.ott_dir, 'ottID2uniq.pickle'))
+        self.assertEqual(self.ott._stale_build_steps(['taxonomy', 'names']), ['taxonomy'])
+        self.assertEqual(self.ott.ott_id2par_ott_id[770315], 770309)
+        self.assertTrue(os.path.exists(os.path.join(self.ott_dir, 'ottID2uniq.pickle')))
+
+
+if __name__ == "__main__":
+    unittest.main()
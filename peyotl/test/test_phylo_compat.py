@@ -1,7 +1,10 @@
 #! /usr/bin/env python
-from peyotl.phylo.compat import SplitComparison, sets_are_rooted_compat, compare_sets_as_splits
+from peyotl.phylo.compat import (SplitComparison, sets_are_rooted_compat, compare_sets_as_splits,
+                                 compare_bits_as_splits, classify_splits)
+from peyotl.phylo import compat
 from peyotl.utility import get_logger
 import unittest
+import random
 
 _LOG = get_logger(__name__)
 
@@ -30,5 +33,52 @@ class TestCompat(unittest.TestCase):
                          SplitComparison.ROOTED_COMPAT)
 
 
+def _random_clades(rng, leaves, max_children):
+    """Returns the bitsets of the clades of a random tree with the (int) `leaves`."""
+    subtrees = [1 << i for i in leaves]
+    clades = []
+    while len(subtrees) > 1:
+        k = min(len(subtrees), rng.randint(2, max_children))
+        b = 0
+        for _ in range(k):
+            b |= subtrees.pop(rng.randrange(len(subtrees)))
+        clades.append(b)
+        subtrees.append(b)
+    return clades
+
+
+class TestClassifySplits(unittest.TestCase):
+    def _check(self, use_numpy):
+        rng = random.Random(3)
+        for num_leaves in (1, 2, 5, 64, 65, 130):
+            universe = (1 << num_leaves) - 1
+            taxo = [i for i in _random_clades(rng, list(range(num_leaves)), 6) if rng.random() < 0.7]
+            taxo.extend(taxo[:2])  # duplicates
+            phylo = _random_clades(rng, rng.sample(range(num_leaves), num_leaves), 3)
+            phylo.extend([0, universe, rng.getrandbits(num_leaves)])
+            expected = [[compare_bits_as_splits(p, t, universe).value for t in taxo] for p in phylo]
+            codes = self._classify(use_numpy, phylo, taxo, universe)
+            self.assertEqual([[int(c) for c in row] for row in codes], expected)
+        self.assertRaises(ValueError, self._classify, use_numpy, [1], [3, 6], 7)
+
+    def _classify(self, use_numpy, phylo, taxo, universe):
+        if use_numpy:
+            return classify_splits(phylo, taxo, universe)
+        saved = compat.numpy
+        compat.numpy = None
+        try:
+            return classify_splits(phylo, taxo, universe)
+        finally:
+            compat.numpy = saved
+
+    def testPurePython(self):
+        self._check(False)
+
+    def testNumpy(self):
+        if compat.numpy is None:
+            self.skipTest('numpy is not installed')
+        self._check(True)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,7 @@
 #! /usr/bin/env python
-from peyotl.phylo.tree import create_tree_from_id2par
+from peyotl.phylo.tree import (create_tree_from_id2par, parse_newick, parse_newick_trees, TreeWithPathsInEdges,
+                               CompactTree, _iter_newick_chunks)
+from peyotl.utility.str_util import StringIO
 from peyotl.utility import get_logger
 import unittest
 
@@ -67,5 +69,98 @@ class TestPhyloTree(unittest.TestCase):
         tree.do_full_check_of_invariants(self, id2par=_bogus_id2par)
 
 
+def _newick_signature(tree):
+    return [(nd._id, None if nd._parent is None else nd._parent._id, len(nd._children),
+             None if nd._edge is None else nd._edge.length) for nd in tree.root.preorder_iter()]
+
+
+class TestParseNewick(unittest.TestCase):
+    def testFastMatchesEvents(self):
+        newick = "(('h_s':0.5,[c]p:1)hp[x]:2, (g ,'a''b c' )  ,o_u:3e-2)'r s' ;\n"
+        slow = parse_newick(newick=newick)
+        fast = parse_newick(newick=newick, fast=True)
+        self.assertEqual(_newick_signature(slow), _newick_signature(fast))
+        self.assertEqual(_newick_signature(fast)[:4], [('r s', None, 3, None),
+                                                       ('hp', 'r s', 2, 2.0),
+                                                       ('h_s', 'hp', 0, 0.5),
+                                                       ('p', 'hp', 0, 1.0)])
+        self.assertEqual(set(fast.leaf_ids), {'h_s', 'p', 'g', "a'b c", 'o u'})
+        self.assertEqual(set(slow.leaf_ids), set(fast.leaf_ids))
+        self.assertIsNone(fast.find_node('g')._parent._id)
+        for chunk_size in (1, 2, 3):
+            t = TreeWithPathsInEdges()
+            t._build_from_newick_chunks(_iter_newick_chunks(stream=StringIO(newick), chunk_size=chunk_size))
+            self.assertEqual(_newick_signature(t), _newick_signature(fast))
+
+    def testFastErrors(self):
+        for newick in ['((a,b);', "((a,'b),c);", '(a,,b);', '(a,b));', 'a;', '(a:1:2,b);', '(a,b)', '(a,b)c d e[;']:
+            self.assertRaises(ValueError, parse_newick, newick=newick, fast=True)
+
+    def testMultipleTrees(self):
+        trees = list(parse_newick_trees(stream=StringIO('((a,b)c,d)e;\n(x,y)z;\n')))
+        self.assertEqual([[n._id for n in t.preorder_node_iter()] for t in trees],
+                         [['e', 'c', 'a', 'b', 'd'], ['z', 'x', 'y']])
+
+
+class TestCompactTree(unittest.TestCase):
+    def testFromId2Par(self):
+        full = ['h', 'p', 'g', 'Po', 'Hy', 'Sy', 'Ho', 'No']
+        checkable = [(['h'], False), (['h', 'p'], False), (['hp', 'g', 'h'], True), (full, False)]
+        for tips, monotypic in checkable + [(['hp', 'g', 'h'], False), (['h', 'Sy'], False), (['h', 'Sy'], True)]:
+            tree = create_tree_from_id2par(_bogus_id2par, list(tips), create_monotypic_nodes=monotypic)
+            compact = create_tree_from_id2par(_bogus_id2par, list(tips), _class=CompactTree,
+                                              create_monotypic_nodes=monotypic)
+            if (tips, monotypic) in checkable:
+                compact.do_full_check_of_invariants(self, id2par=_bogus_id2par)
+            self.assertEqual(set(compact.leaf_ids), set(tree.leaf_ids))
+            self.assertEqual(_newick_signature(compact), _newick_signature(tree))
+            for nd in tree.preorder_node_iter():
+                self.assertEqual(compact.find_node(nd._id)._path_ids, nd._path_ids)
+        tree = create_tree_from_id2par(_bogus_id2par, ['h', 'Sy'], _class=CompactTree)
+        self.assertEqual(tree.find_node('hpg')._id, 'h')
+        self.assertEqual(tree.find_node('h')._path_ids, ['h', 'hp', 'hpg', 'hpgPo'])
+
+    def testFromNewick(self):
+        newick = "(('h_s':0.5,[c]p:1)hp[x]:2,(g,'a''b c'),o_u:3e-2)'r s';"
+        expected = _newick_signature(parse_newick(newick=newick))
+        for fast in (False, True):
+            tree = parse_newick(newick=newick, _class=CompactTree, fast=fast)
+            self.assertEqual(_newick_signature(tree), expected)
+            self.assertEqual(len(tree), 8)
+            self.assertEqual([nd._id for nd in tree.postorder_node_iter()],
+                             ['h_s', 'p', 'hp', 'g', "a'b c", None, 'o u', 'r s'])
+            self.assertEqual([nd._id for nd in tree.find_node('hp').preorder_iter()], ['hp', 'h_s', 'p'])
+            self.assertEqual([nd._id for nd in tree.find_node('hp').sib_iter()], [None, 'o u'])
+            o = StringIO()
+            tree.write_newick(o)
+            self.assertEqual(o.getvalue(), "((h_s,p)hp,(g,a'b c)None,o u)r s;\n")
+        trees = list(parse_newick_trees(newick='((a,b)c,d)e;(x,y)z;', _class=CompactTree))
+        self.assertEqual([t.leaf_ids for t in trees], [['a', 'b', 'd'], ['x', 'y']])
+        self.assertRaises(ValueError, parse_newick, newick='(a,b));', _class=CompactTree, fast=True)
+
+    def testBitsAndNodeAttributes(self):
+        newick = '(((a,b)ab,c)abc,(d,e)de)r;'
+        tree = parse_newick(newick=newick)
+        compact = parse_newick(newick=newick, _class=CompactTree, fast=True)
+        id2bit = tree.add_bits4subtree_ids(None)
+        self.assertEqual(compact.add_bits4subtree_ids(None), id2bit)
+        self.assertEqual(set(compact.bits2internal_node.keys()), set(tree.bits2internal_node.keys()))
+        for b, nd in tree.bits2internal_node.items():
+            self.assertEqual(compact.bits2internal_node[b]._id, nd._id)
+            self.assertEqual(compact.find_node(nd._id).bits4subtree_ids, b)
+        other = parse_newick(newick='((a,b,c)abc,(d,e)de)r;', _class=CompactTree)
+        other.add_bits4subtree_ids(id2bit)
+        self.assertEqual(other.root.bits4subtree_ids, compact.root.bits4subtree_ids)
+        nd = compact.find_node('ab')
+        self.assertFalse(hasattr(nd, '_displays'))
+        nd._displays = {'x'}
+        nd.edge._displays = 'y'
+        same = compact.find_node('ab')
+        self.assertEqual(same, nd)
+        self.assertEqual(same._displays, {'x'})
+        self.assertEqual(same.edge._displays, 'y')
+        self.assertEqual(len({nd, same}), 1)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+from peyotl.api.response_cache import ResponseCache, response_cache_key
+from peyotl.utility import get_logger
+import unittest
+import tempfile
+import shutil
+import os
+
+_LOG = get_logger(__name__)
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fp = os.path.join(self.tmp_dir, 'responses.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def testKey(self):
+        u = 'https://api.opentreeoflife.org/v2/taxonomy/taxon'
+        k = response_cache_key('POST', u, None, '{"ott_id": 1, "include_lineage": false}')
+        self.assertEqual(k, response_cache_key('POST', u, None, '{"include_lineage":false,"ott_id":1}'))
+        self.assertEqual(k, response_cache_key('POST', u, {}, {'include_lineage': False, 'ott_id': 1}))
+        self.assertNotEqual(k, response_cache_key('GET', u, None, '{"ott_id": 1, "include_lineage": false}'))
+        self.assertNotEqual(k, response_cache_key('POST', u, None, '{"ott_id": 2, "include_lineage": false}'))
+        self.assertNotEqual(k, response_cache_key('POST', u, {'a': 'b'}, '{"ott_id": 1, "include_lineage": false}'))
+
+    def testGetPut(self):
+        c = ResponseCache(self.fp)
+        self.assertIsNone(c.get('a'))
+        c.put('a', 'taxomachine', '{"x": 1}')
+        self.assertEqual(c.get('a'), '{"x": 1}')
+        c.close()
+        c = ResponseCache(self.fp)
+        self.assertEqual(c.get('a'), '{"x": 1}')
+        self.assertEqual(c.stats(), {'hits': 1, 'misses': 0, 'evictions': 0, 'entries': 1, 'bytes': 8})
+        c.close()
+
+    def testTTL(self):
+        c = ResponseCache(self.fp, ttl=-1)
+        c.put('a', 'taxomachine', 'x')
+        self.assertIsNone(c.get('a'))
+        self.assertEqual(c.stats()['entries'], 0)
+        c.close()
+
+    def testLRUEviction(self):
+        c = ResponseCache(self.fp, max_bytes=30)
+        for k in 'abc':
+            c.put(k, 'oti', 'x' * 10)
+        c.get('a')
+        c.put('d', 'oti', 'x' * 10)
+        self.assertIsNone(c.get('b'))
+        self.assertEqual(c.get('a'), 'x' * 10)
+        self.assertEqual(c.get('d'), 'x' * 10)
+        self.assertLessEqual(c.stats()['bytes'], 30)
+        self.assertGreater(c.evictions, 0)
+        c.close()
+
+    def testVersionInvalidation(self):
+        c = ResponseCache(self.fp)
+        c.check_version('taxomachine', '3.0')
+        c.put('a', 'taxomachine', 'x')
+        c.put('b', 'treemachine', 'y')
+        c.check_version('taxomachine', '3.0')
+        self.assertEqual(c.get('a'), 'x')
+        c.check_version('taxomachine', '3.1')
+        self.assertIsNone(c.get('a'))
+        self.assertEqual(c.get('b'), 'y')
+        self.assertEqual((c.hits, c.misses), (2, 1))
+        c.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 #! /usr/bin/env python
-from peyotl.utility.tokenizer import NewickTokenizer, NewickEvents, NewickEventFactory
+from peyotl.utility.tokenizer import NewickTokenizer, NewickEvents, NewickEventFactory, iter_newick_event_factories
 from peyotl.utility.str_util import StringIO
 from peyotl.utility import get_logger
 import unittest
@@ -27,6 +27,41 @@ class TestNewickTokenizer(unittest.TestCase):
 
     def _do_test(self, content, expected):
         self.assertEqual([i for i in NewickTokenizer(StringIO(content))], expected)
+        for buffer_size in range(1, 8):
+            tok = NewickTokenizer(StringIO(content), buffer_size=buffer_size)
+            self.assertEqual([i for i in tok], expected)
+
+    def testStreamingSpansBuffers(self):
+        content = "(('a''b''''c' [x]:1, 'q r'[com ment]:2)'x''':3 ,z_z )root;"
+        expected = NewickTokenizer(newick=content).tokens()
+        self.assertEqual(expected[:4], ['(', '(', "a'b''c", ':'])
+        self._do_test(content, expected)
+
+    def testErrorPosition(self):
+        content = u"((\u00e9\u00e9,b)c,'d);"
+        for buffer_size in (1, 3, 100):
+            tok = NewickTokenizer(StringIO(content), buffer_size=buffer_size)
+            with self.assertRaises(ValueError) as cm:
+                tok.tokens()
+            self.assertIn('character #10 (byte offset 11)', str(cm.exception))
+
+    def testMultipleTrees(self):
+        content = '((h,p)hp,g)hpg;\n (a,b)c;\n'
+        tok = NewickTokenizer(StringIO(content), buffer_size=4)
+        self.assertEqual(self._one_tree(tok), ['(', '(', 'h', ',', 'p', ')', 'hp', ',', 'g', ')', 'hpg', ';'])
+        self.assertTrue(tok.start_next_tree())
+        self.assertEqual(self._one_tree(tok), ['(', 'a', ',', 'b', ')', 'c', ';'])
+        self.assertFalse(tok.start_next_tree())
+        tok = NewickTokenizer(StringIO(content))
+        self.assertRaises(ValueError, tok.tokens)
+
+    def _one_tree(self, tok):
+        r = []
+        for t in tok:
+            r.append(t)
+            if t == ';':
+                break
+        return r
 
     def testOddQuotes(self):
         content = "((h_ ,'p)h p,g()[],:_)hpg;"
@@ -65,6 +100,18 @@ class TestNewickEvents(unittest.TestCase):
                ]
         self._do_test(content, exp)
 
+    def testEdgeInfo(self):
+        e = [deepcopy(i) for i in NewickEventFactory(newick='((h:1,p:2.5)hp:3,g)hpg;')]
+        self.assertEqual([(i.get('label'), i.get('edge_info')) for i in e],
+                         [(None, None), (None, None), ('h', '1'), ('p', '2.5'), ('hp', '3'), ('g', None),
+                          ('hpg', None)])
+
+    def testMultipleTrees(self):
+        content = '((h,p)hp,g)hpg;(a,b)c;'
+        labels = [[i['label'] for i in nef if 'label' in i]
+                  for nef in iter_newick_event_factories(stream=StringIO(content), buffer_size=2)]
+        self.assertEqual(labels, [['h', 'p', 'hp', 'g', 'hpg'], ['a', 'b', 'c']])
+
     def _do_test(self, content, expected):
         e = [deepcopy(i) for i in NewickEventFactory(tokenizer=NewickTokenizer(stream=StringIO(content)))]
         # print(e)
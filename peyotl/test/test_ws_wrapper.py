@@ -0,0 +1,241 @@
+#! /usr/bin/env python
+from peyotl.api.wrapper import _create_retry, _WSWrapper
+from peyotl.api.taxomachine import _TaxomachineAPIWrapper
+from peyotl.api.oti import _OTIWrapper
+from peyotl.utility.get_config import ConfigWrapper
+from peyotl.utility import get_logger
+from collections import Counter
+import unittest
+import threading
+import tempfile
+import shutil
+import requests
+import json
+import time
+import os
+
+try:
+    from urllib3.exceptions import ConnectTimeoutError, ReadTimeoutError, MaxRetryError
+except ImportError:
+    from requests.packages.urllib3.exceptions import (ConnectTimeoutError,  # pylint: disable=E0401
+                                                      ReadTimeoutError,
+                                                      MaxRetryError)
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+_LOG = get_logger(__name__)
+
+_CONFIG = ConfigWrapper(overrides={'apis': {'api_version': '2'}})
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Answers every verb. The server's `statuses` maps a path to a list of status codes that are
+    returned (and popped) before the 200 responses. Taxon calls are answered after a delay that
+    depends on the ott_id, so that concurrent calls finish out of order. "about" calls return the
+    server's `version`.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.hits[(self.command, self.path)] += 1
+            pending = server.statuses.get(self.path)
+            status = pending.pop(0) if pending else 200
+        if status == 200 and self.path.endswith('/taxon'):
+            ott_id = json.loads(body.decode('utf-8'))['ott_id']
+            time.sleep(0.01 * ((ott_id * 7) % 5))
+            if ott_id < 0:
+                blob = {'error': 'bad ott_id {}'.format(ott_id)}
+            else:
+                blob = {'ott_id': ott_id, 'name': 'taxon {}'.format(ott_id)}
+        elif status == 200 and self.path.endswith('/about'):
+            blob = {'version': server.version}
+        else:
+            blob = {'verb': self.command}
+        out = json.dumps(blob).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+    def log_message(self, *args):  # pylint: disable=W0221
+        pass
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _WriteService(_WSWrapper):
+    _SERVICE_NAME = 'phylesystem_api'
+
+
+class _StubPhylesystemAPI(object):
+    def url_for_api_get_study(self, study_id, schema):  # pylint: disable=W0613
+        return 'http://example.org/study/{}'.format(study_id)
+
+
+class TestWSWrapper(unittest.TestCase):
+    def setUp(self):
+        self.server = _StubServer(('127.0.0.1', 0), _StubHandler)
+        self.server.lock = threading.Lock()
+        self.server.hits = Counter()
+        self.server.statuses = {}
+        self.server.version = 'ott2.9'
+        threading.Thread(target=self.server.serve_forever).start()
+        self.domain = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+        self.wrappers = []
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for w in self.wrappers:
+            w.close()
+            if w.response_cache is not None:
+                w.response_cache.close()
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def _wrapper(self, cls, **kwargs):
+        w = cls(self.domain, config=_CONFIG, http_backoff_factor=0, **kwargs)
+        self.wrappers.append(w)
+        return w
+
+    def testMapConcurrentlyOrder(self):
+        w = self._wrapper(_WriteService)
+
+        def slow_square(i):
+            time.sleep(0.01 * ((i * 7) % 5))
+            return i * i
+
+        items = list(range(20))
+        self.assertEqual(w.map_concurrently(slow_square, items, max_concurrency=8), [i * i for i in items])
+        self.assertEqual(w.map_concurrently(slow_square, iter(items), max_concurrency=1), [i * i for i in items])
+        self.assertEqual(w.map_concurrently(slow_square, []), [])
+        taxo = self._wrapper(_TaxomachineAPIWrapper)
+        ott_ids = list(range(1, 30))
+        r = taxo.taxon_many(ott_ids, max_concurrency=6)
+        self.assertEqual([i['ott_id'] for i in r], ott_ids)
+
+    def testMapConcurrentlyErrors(self):
+        w = self._wrapper(_WriteService)
+
+        def f(i):
+            if i == 2:
+                time.sleep(0.05)
+                raise ValueError('two')
+            if i == 4:
+                raise KeyError('four')
+            return i
+
+        # the first failure in the order of the items is raised, even if a later one finished first
+        self.assertRaises(ValueError, w.map_concurrently, f, [1, 2, 3, 4], max_concurrency=4)
+        taxo = self._wrapper(_TaxomachineAPIWrapper)
+        self.assertRaises(ValueError, taxo.taxon_many, [1, 2, -3, 4], max_concurrency=4)
+        self.server.statuses['/v2/taxonomy/taxon'] = [404]
+        self.assertRaises(requests.exceptions.HTTPError, taxo.taxon_many, [1, 2, 3], max_concurrency=1)
+
+    def testRetriedVerbs(self):
+        w = self._wrapper(_WriteService, http_max_retries=2)
+        taxo = self._wrapper(_TaxomachineAPIWrapper, http_max_retries=2)
+        for wrapper, verb, retried in [(w, 'GET', True),
+                                       (w, 'POST', False),
+                                       (w, 'PUT', False),
+                                       (w, 'DELETE', False),
+                                       (taxo, 'POST', True)]:
+            for status in (429, 500, 502, 503, 504):
+                path = '/{}/{}/{}'.format(wrapper.__class__.__name__, verb, status)
+                self.server.statuses[path] = [status]
+                method = getattr(wrapper, 'json_http_' + verb.lower())
+                if retried:
+                    self.assertEqual(method(self.domain + path), {'verb': verb})
+                    self.assertEqual(self.server.hits[(verb, path)], 2)
+                else:
+                    self.assertRaises(requests.exceptions.HTTPError, method, self.domain + path)
+                    self.assertEqual(self.server.hits[(verb, path)], 1)
+        path = '/GET/404'
+        self.server.statuses[path] = [404]
+        self.assertRaises(requests.exceptions.HTTPError, w.json_http_get, self.domain + path)
+        self.assertEqual(self.server.hits[('GET', path)], 1)
+
+    def testResponseCache(self):
+        fp = os.path.join(self.tmp_dir, 'responses.sqlite')
+        taxo = self._wrapper(_TaxomachineAPIWrapper, http_cache=fp, http_cache_version_check=0)
+        taxon = ('POST', '/v2/taxonomy/taxon')
+        self.assertEqual(taxo.taxon(1)['ott_id'], 1)
+        self.assertEqual(self.server.hits[taxon], 1)
+        # the second identical call is answered by the cache
+        self.assertEqual(taxo.taxon(1)['ott_id'], 1)
+        self.assertEqual(self.server.hits[taxon], 1)
+        self.assertEqual(taxo.cache_stats['hits'], 1)
+        self.assertEqual(taxo.cache_stats['entries'], 1)
+        self.assertEqual(taxo.taxon(2)['ott_id'], 2)
+        self.assertEqual(self.server.hits[taxon], 2)
+        # error responses are not cached
+        for _ in range(2):
+            self.assertRaises(ValueError, taxo.taxon, -1)
+        self.assertEqual(self.server.hits[taxon], 4)
+        self.assertEqual(taxo.cache_stats['entries'], 2)
+        # a new taxonomy version drops the cached responses
+        self.server.version = 'ott3.0'
+        self.assertEqual(taxo.taxon(1)['ott_id'], 1)
+        self.assertEqual(self.server.hits[taxon], 5)
+        self.assertEqual(taxo.cache_stats['entries'], 1)
+        self.assertEqual(taxo.taxon(1)['ott_id'], 1)
+        self.assertEqual(self.server.hits[taxon], 5)
+        # the version is fetched without the cache
+        self.assertEqual(self.server.hits[('POST', '/v2/taxonomy/about')], 7)
+
+    def testWritePostsBypassCache(self):
+        fp = os.path.join(self.tmp_dir, 'responses.sqlite')
+        oti = self._wrapper(_OTIWrapper, http_cache=fp, http_max_retries=2)
+        # query POSTs are cached...
+        query = self.domain + '/v3/studies/find_studies'
+        for _ in range(2):
+            oti.json_http_post(query, data=json.dumps({'property': 'ot:studyId', 'value': 'pg_10'}))
+        self.assertEqual(self.server.hits[('POST', '/v3/studies/find_studies')], 1)
+        # ... but each index trigger reaches the service
+        index = ('POST', '/oti/IndexServices/graphdb/indexNexsons')
+        unindex = ('POST', '/oti/IndexServices/graphdb/unindexNexsons')
+        for _ in range(2):
+            oti.trigger_index(_StubPhylesystemAPI(), 'pg_10')
+            oti.trigger_unindex('pg_10')
+        self.assertEqual(self.server.hits[index], 2)
+        self.assertEqual(self.server.hits[unindex], 2)
+        self.assertEqual(oti.cache_stats['entries'], 1)
+        # and is not retried after a 5xx
+        self.server.statuses[index[1]] = [503]
+        self.assertRaises(requests.exceptions.HTTPError, oti.trigger_index, _StubPhylesystemAPI(), 'pg_10')
+        self.assertEqual(self.server.hits[index], 3)
+        self.server.statuses[query[len(self.domain):]] = [503]
+        oti.json_http_post(query, data=json.dumps({'property': 'ot:studyId', 'value': 'pg_11'}))
+        self.assertEqual(self.server.hits[('POST', '/v3/studies/find_studies')], 3)
+
+    def testRetryErrors(self):
+        url = 'http://example.org/x'
+        for retry_post in (False, True):
+            retry = _create_retry(3, 0, retry_post)
+            for verb in ('GET', 'HEAD', 'POST', 'PUT', 'DELETE'):
+                # connection errors (nothing was sent) are retried for every verb
+                retry.increment(verb, url, error=ConnectTimeoutError('connect'))
+                read_error = ReadTimeoutError(None, url, 'read')
+                if verb in ('GET', 'HEAD') or (retry_post and verb == 'POST'):
+                    retry.increment(verb, url, error=read_error)
+                else:
+                    self.assertRaises(ReadTimeoutError, retry.increment, verb, url, error=read_error)
+        retry = _create_retry(1, 0, False)
+        retry = retry.increment('PUT', url, error=ConnectTimeoutError('connect'))
+        self.assertRaises(MaxRetryError, retry.increment, 'PUT', url, error=ConnectTimeoutError('connect'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,7 +13,8 @@ from peyotl.utility.get_config import (ConfigWrapper, get_config_setting, get_co
 import time
 import os
 
-__all__ = ['input_output', 'simple_file_lock', 'str_util', 'get_logger', 'dict_wrapper', 'tokenizer', 'get_config']
+__all__ = ['input_output', 'simple_file_lock', 'str_util', 'get_logger', 'dict_wrapper', 'tokenizer', 'get_config',
+           'json_backend']
 
 
 def any_early_exit(iterable, predicate):
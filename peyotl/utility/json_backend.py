@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""The JSON parsing and serialization used by read_as_json, write_as_json and the document stores.
+
+json_loads parses with the backend chosen by set_json_backend, or by the "backend" setting of the
+[json] section of the peyotl config (default "auto"): "json" (the standard library) or "orjson"
+("auto" uses orjson if it is installed). Documents that orjson rejects (e.g. NaN) or that may have an
+integer of 19 or more digits (orjson reads integers outside of the 64-bit signed and unsigned ranges
+as floats) are parsed by the standard library.
+
+json_dumps always returns the text of the standard library's json.dumps, because peyotl's JSON files
+are committed to git and diffed. The indent=0 form that write_as_json writes is made from the output
+of the C encoder (the standard library only uses it when there is no indent), which is about twice
+as fast as the pure-Python encoder that json.dumps uses for indented output.
+"""
+from peyotl.utility.get_logger import get_logger
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_LOG = get_logger(__name__)
+
+JSON_BACKENDS = ('json', 'orjson')
+_backend_name = None
+_backend_loads = None
+
+
+def _digit_table():
+    t = bytearray(b' ' * 256)
+    for c in bytearray(b'0123456789'):
+        t[c] = ord('0')
+    return bytes(t)
+
+
+# maps the digits to "0" and the other bytes to " " (see _has_long_integer)
+_DIGIT_TABLE = _digit_table()
+_LONG_DIGIT_RUN = b'0' * 19
+
+# the separator that json.dumps(..., indent=0) writes between items: ',\n' (or ', \n' in python 2)
+_INDENT0_ITEM_SEPARATOR = json.dumps([0, 0], indent=0).split('0')[1]
+
+
+def set_json_backend(name='auto'):
+    """Chooses the library that json_loads uses: "json", "orjson" or "auto".
+    Raises ValueError if `name` is unknown or is not installed.
+    """
+    global _backend_name, _backend_loads
+    if name == 'auto':
+        name = 'json' if orjson is None else 'orjson'
+    if name == 'json':
+        backend_loads = None
+    elif name == 'orjson':
+        if orjson is None:
+            raise ValueError('The "orjson" JSON backend is not installed')
+        backend_loads = orjson.loads
+    else:
+        m = 'Unknown JSON backend "{}". Expecting one of: auto, {}'.format(name, ', '.join(JSON_BACKENDS))
+        raise ValueError(m)
+    _backend_loads = backend_loads
+    _backend_name = name
+
+
+def get_json_backend():
+    """Returns the name of the library that json_loads uses."""
+    if _backend_name is None:
+        from peyotl.utility.get_config import get_config_setting
+        name = get_config_setting('json', 'backend', default='auto')
+        try:
+            set_json_backend(name.strip().lower())
+        except ValueError as x:
+            _LOG.warn('{} (from the [json] backend setting). Using the "json" backend.'.format(x))
+            set_json_backend('json')
+    return _backend_name
+
+
+def _has_long_integer(content):
+    """True if the JSON bytes `content` have a run of 19 or more digits that does not follow a "."."""
+    digits = content.translate(_DIGIT_TABLE)
+    pos = digits.find(_LONG_DIGIT_RUN)
+    while pos >= 0:
+        if content[pos - 1:pos] != b'.':
+            return True
+        pos = digits.find(b' ', pos)
+        if pos < 0:
+            return False
+        pos = digits.find(_LONG_DIGIT_RUN, pos)
+    return False
+
+
+def json_loads(content, encoding='utf-8'):
+    """Returns the object in the JSON `content` (text, or bytes in `encoding`)."""
+    if _backend_name is None:
+        get_json_backend()
+    if isinstance(content, bytes) and encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+        content = content.decode(encoding)
+    if _backend_loads is not None:
+        try:
+            utf8 = content if isinstance(content, bytes) else content.encode('utf-8')
+            if not _has_long_integer(utf8):
+                return _backend_loads(utf8)
+        except ValueError:
+            pass  # the standard library parses it or raises the error
+    if isinstance(content, bytes):
+        content = content.decode(encoding)
+    return json.loads(content)
+
+
+def json_dumps(obj, indent=None, sort_keys=False):
+    """Returns json.dumps(obj, indent=indent, sort_keys=sort_keys)."""
+    if indent != 0:
+        return json.dumps(obj, indent=indent, sort_keys=sort_keys)
+    compact = json.dumps(obj, sort_keys=sort_keys, separators=(',', ':'))
+    # With ensure_ascii, control characters only occur (escaped) in strings. So they can stand in
+    #   for the escaped backslashes and quotes, and the text can be split at the quotes
+    #   (the odd-numbered parts are the contents of the strings).
+    parts = compact.replace('\\\\', '\x03').replace('\\"', '\x04').split('"')
+    s = '\x00'.join(parts[0::2])
+    s = s.replace('{}', '\x01').replace('[]', '\x02')
+    s = s.replace(':', ': ').replace(',', _INDENT0_ITEM_SEPARATOR)
+    s = s.replace('{', '{\n').replace('[', '[\n').replace('}', '\n}').replace(']', '\n]')
+    s = s.replace('\x01', '{}').replace('\x02', '[]')
+    parts[0::2] = s.split('\x00')
+    return '"'.join(parts).replace('\x04', '\\"').replace('\x03', '\\\\')
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 from peyotl.utility import get_logger
-from peyotl.utility.input_output import read_filepath
 from enum import Enum
+import codecs
 import re
 
 _LOG = get_logger(__name__)
@@ -10,6 +10,14 @@ _PUNC = re.compile(r'[(),:;\[\]]')
 _SINGLE_QUOTED_STR = re.compile(r"([^']*)'")
 _COMMENT_STR = re.compile(r"([^\]]*)\]")
 _UNQUOTED_STR = re.compile(r"([^'():,;\\[]+)(?=$|['():,;\\[])")
+# of characters read from a stream at a time
+DEFAULT_BUFFER_SIZE = 1 << 16
+
+
+def _num_bytes(text):
+    if isinstance(text, bytes):
+        return len(text)
+    return len(text.encode('utf-8'))
 
 
 class NewickTokenType(Enum):
@@ -27,10 +35,20 @@ class NewickTokenizer(object):
     """given a file-like object, this becomes an iterator
     over the newick tokens in the file-object.
     Name tokens are stripped of whitespace and comments.
+
+    A `stream` (or the file at `filepath`) is read in chunks of `buffer_size` characters,
+    and the text before the current token is discarded as tokenizing proceeds, so the
+    memory used is bounded by the buffer size (and the longest label or comment) rather
+    than by the size of the input.
+    The tokenizer stops at the first semicolon. If the input holds several trees, call
+    `start_next_tree` to continue (or use `iter_newick_event_factories`).
     """
 
-    def __init__(self, stream=None, newick=None, filepath=None):
+    def __init__(self, stream=None, newick=None, filepath=None, buffer_size=DEFAULT_BUFFER_SIZE):
         # _LOG.debug('INIT: newick = {} filepath = {}'.format(newick, filepath))
+        self._stream = None
+        self._close_stream_at_end = False
+        self._buffer_size = buffer_size
         if stream is None:
             if newick is not None:
                 self._src = newick
@@ -38,16 +56,16 @@ class NewickTokenizer(object):
                 if filepath is None:
                     # _LOG.debug('VE: newick = {} filepath = {}'.format(newick, filepath))
                     raise ValueError('"stream", "newick", or "filepath" must be provided')
-                self._src = read_filepath(filepath)
+                self._src = ''
+                self._stream = codecs.open(filepath, 'r', encoding='utf-8')
+                self._close_stream_at_end = True
         else:
-            self._src = stream.read()
-        self._last_ind = len(self._src) - 1
+            self._src = ''
+            self._stream = stream
         self._index = -1
-        self.num_open_parens = 0
-        self.num_close_parens = 0
-        self._token = None
+        self._discarded_chars = 0  # of characters before _src[0]
+        self._discarded_bytes = 0  # of (utf-8) bytes before _src[0]
         self.comments = []
-        self.prev_token = NewickTokenType.NONE
         self._cb = {'(': self._handle_open_parens,
                     ')': self._handle_close_parens,
                     ',': self._handle_comma,
@@ -55,6 +73,13 @@ class NewickTokenizer(object):
                     ';': self._handle_semicolon,
                     '[': self._handle_comment,
                     }
+        self._start_tree()
+
+    def _start_tree(self):
+        self.num_open_parens = 0
+        self.num_close_parens = 0
+        self._token = None
+        self.prev_token = NewickTokenType.NONE
         self._default_cb = self._handle_label
         self.finished = False
         c = self._eat_whitespace_get_next_char()
@@ -64,6 +89,71 @@ class NewickTokenizer(object):
         # just so we don't have to check for NONE on every ( we fake a legal preceding token
         self.prev_token = NewickTokenType.OPEN
 
+    def start_next_tree(self):
+        """Prepares the tokenizer to read the next tree in the input (after the semicolon
+        that ended the last tree). Returns False if there is only whitespace left.
+        """
+        if not self.finished:
+            raise ValueError('start_next_tree called before the end of the current tree')
+        self._eat_whitespace()
+        if not self._ensure_available(1 + self._index):
+            self.close()
+            return False
+        self._start_tree()
+        return True
+
+    def close(self):
+        """Closes the file opened for `filepath` (done automatically at the end of the file)."""
+        if self._stream is not None:
+            if self._close_stream_at_end:
+                self._stream.close()
+            self._stream = None
+
+    def _read_chunk(self):
+        """Appends the next chunk of the stream to the buffer. Returns False at the end of the input."""
+        if self._stream is None:
+            return False
+        chunk = self._stream.read(self._buffer_size)
+        if not chunk:
+            self.close()
+            return False
+        self._src += chunk
+        return True
+
+    def _ensure_available(self, ind):
+        """Reads chunks until _src[ind] exists. Returns False if the input ends first."""
+        while ind >= len(self._src):
+            if not self._read_chunk():
+                return False
+        return True
+
+    def _match(self, regex, pos, terminated=False):
+        """Returns regex.match(_src, pos), reading more of the stream if the match could
+        continue past the end of the buffer. If `terminated` (the pattern ends with a closing
+        character), a failed match is also retried with more input."""
+        if self._stream is None:
+            return regex.match(self._src, pos)
+        while True:
+            m = regex.match(self._src, pos)
+            if m is None:
+                if (pos < len(self._src)) and not terminated:
+                    return m
+            elif m.end() < len(self._src) or terminated:
+                return m
+            if not self._read_chunk():
+                return m
+
+    def _discard_consumed(self):
+        """Drops the consumed text from the buffer, once it is longer than the buffer size."""
+        if self._stream is None or self._index < self._buffer_size:
+            return
+        n = 1 + self._index
+        consumed = self._src[:n]
+        self._discarded_chars += n
+        self._discarded_bytes += _num_bytes(consumed)
+        self._src = self._src[n:]
+        self._index = -1
+
     def tokens(self):
         return [i for i in iter(self)]
 
@@ -81,7 +171,7 @@ class NewickTokenizer(object):
     def _eat_whitespace(self):
         # if (1 + self._index) <= self._last_ind:
         # _LOG.debug('_eat_whitespace ind= {} str="{}"'.format(self._index, self._src[1+self._index]))
-        w = _WS.match(self._src, 1 + self._index)
+        w = self._match(_WS, 1 + self._index)
         if w:
             # _LOG.debug('found ws ending at {}'.format(w.end()))
             self._index = w.end() - 1
@@ -93,30 +183,29 @@ class NewickTokenizer(object):
 
     def _get_next_char(self):
         self._index += 1
-        try:
+        if self._ensure_available(self._index):
             x = self._src[self._index]
             if self.finished:
                 m = 'Unexpected newick content after the semicolon. Found "{c}" and {f}'
                 m = m.format(c=x, f=self.file_pos())
                 raise ValueError(m)
             return x
-        except IndexError:
-            if self.num_close_parens != self.num_open_parens:
-                raise ValueError('Number of close parentheses ({c:d}) does not equal '
-                                 'the number of open parentheses ({o:d}) at the end '
-                                 'of the input ({f:d}).'.format(c=self.num_close_parens,
-                                                                o=self.num_open_parens,
-                                                                f=self.file_pos()))
-            raise StopIteration
+        if self.num_close_parens != self.num_open_parens:
+            raise ValueError('Number of close parentheses ({c:d}) does not equal '
+                             'the number of open parentheses ({o:d}) at the end '
+                             'of the input ({f}).'.format(c=self.num_close_parens,
+                                                          o=self.num_open_parens,
+                                                          f=self.file_pos()))
+        raise StopIteration
 
     def _peek(self):
-        if self._index >= self._last_ind:
+        if not self._ensure_available(1 + self._index):
             return None
         return self._src[1 + self._index]
 
     def _grab_one_single_quoted_word(self):
         b = self._index + 1
-        m = _SINGLE_QUOTED_STR.match(self._src, b)
+        m = self._match(_SINGLE_QUOTED_STR, b, terminated=True)
         # _LOG.debug('_grab_one_single_quoted_word b = {} str="{}"'.format(b, self._src[b:]))
         if not m:
             self._index = b - 1
@@ -140,7 +229,7 @@ class NewickTokenizer(object):
     def _read_unquoted_label(self):
         b = self._index
         # _LOG.debug('_read_unquoted_label b = {} str="{}"'.format(b, self._src[b:]))
-        m = _UNQUOTED_STR.match(self._src, b)  # called after we grabbed the first letter, so we look one back
+        m = self._match(_UNQUOTED_STR, b)  # called after we grabbed the first letter, so we look one back
         if not m:
             self._raise_unexpected('Expecting a label but found "{}"'.format(self._src[b]))
         label = m.group(1)
@@ -166,7 +255,7 @@ class NewickTokenizer(object):
     def _handle_comment(self):
         b = self._index + 1
         # _LOG.debug('_handle_comment b = {} str="{}"'.format(b, self._src[b:]))
-        m = _COMMENT_STR.match(self._src, b)
+        m = self._match(_COMMENT_STR, b, terminated=True)
         if not m:
             self._index = b
             self._raise_unexpected("Found an opening [ of a comment, but not closing ]")
@@ -190,7 +279,10 @@ class NewickTokenizer(object):
         return ','
 
     def file_pos(self):
-        return 'character #{}'.format(1 + self._index)
+        """Describes the position of the current character (as a 1-based character # and a byte offset
+        in the utf-8 encoding of the input)."""
+        byte_offset = self._discarded_bytes + _num_bytes(self._src[:max(0, self._index)])
+        return 'character #{c} (byte offset {b})'.format(c=self._discarded_chars + 1 + self._index, b=byte_offset)
 
     def _handle_edge_info(self):
         x = self._src[self._index]
@@ -228,6 +320,7 @@ class NewickTokenizer(object):
 
     def __next__(self):
         del self.comments[:]
+        self._discard_consumed()
         c = self._read_next()
         return c
 
@@ -258,12 +351,12 @@ class NewickEventFactory(object):
     You must make a copy of it if you want to process comments later.
     """
 
-    def __init__(self, tokenizer=None, newick=None, filepath=None, event_handler=None):
+    def __init__(self, tokenizer=None, newick=None, filepath=None, event_handler=None, stream=None):
         if tokenizer is None:
-            if newick is None and filepath is None:
+            if newick is None and filepath is None and stream is None:
                 raise ValueError('tokenizer or newick argument must be supplied')
             # _LOG.debug('newick = {} filepath = {}'.format(newick, filepath))
-            self._tokenizer = NewickTokenizer(newick=newick, filepath=filepath)
+            self._tokenizer = NewickTokenizer(stream=stream, newick=newick, filepath=filepath)
         else:
             self._tokenizer = tokenizer
         self._base_it = iter(self._tokenizer)
@@ -309,6 +402,8 @@ class NewickEventFactory(object):
     def _greedy_token_seq(self, label, t):
         tok = next(self._base_it)
         self._comments.extend(self._tokenizer.comments)
+        if t == NewickEvents.CLOSE_SUBTREE:
+            label = None  # rather than the ")" token
         if t == NewickEvents.CLOSE_SUBTREE and self._tokenizer.prev_token == NewickTokenType.LABEL:
             label = tok
             tok = next(self._base_it)
@@ -317,7 +412,7 @@ class NewickEventFactory(object):
         if tok == ':':
             tok = next(self._base_it)
             self._comments.extend(self._tokenizer.comments)
-            assert self._prev_type == NewickTokenType.EDGE_INFO
+            assert self._tokenizer.prev_token == NewickTokenType.EDGE_INFO
             edge_info = tok
             tok = next(self._base_it)
             self._comments.extend(self._tokenizer.comments)
@@ -331,3 +426,17 @@ class NewickEventFactory(object):
                 'comments': self._comments}
 
     next = __next__
+
+
+def iter_newick_event_factories(stream=None, newick=None, filepath=None, buffer_size=DEFAULT_BUFFER_SIZE):
+    """Generates a NewickEventFactory for each tree in a (possibly multi-tree) newick input.
+    Each factory must be exhausted before the next one is requested.
+    """
+    tokenizer = NewickTokenizer(stream=stream, newick=newick, filepath=filepath, buffer_size=buffer_size)
+    try:
+        while True:
+            yield NewickEventFactory(tokenizer=tokenizer)
+            if not tokenizer.start_next_tree():
+                return
+    finally:
+        tokenizer.close()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Times reading and writing the JSON files below the `dirs` (by default the test phylesystem,
+peyotl/test/data/mini_par, if it has been cloned, or else peyotl/test/data/nexson) with the
+codecs + json code that read_as_json and write_as_json used before, and with read_as_json
+(with each installed JSON backend) and write_as_json (with and without sort_keys).
+Files that are not valid JSON are skipped. The best of `reps` runs over all of the files is reported.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.utility.input_output import read_as_json, write_as_json
+from peyotl.utility.json_backend import JSON_BACKENDS, get_json_backend, set_json_backend
+from peyotl.test.support import pathmap
+import tempfile
+import codecs
+import json
+import time
+import os
+
+
+def _codecs_read(fp):
+    with codecs.open(fp, 'r', encoding='utf-8') as inpf:
+        return json.load(inpf)
+
+
+def _codecs_write(blob, fp):
+    with codecs.open(fp, mode='w', encoding='utf-8') as out:
+        json.dump(blob, out, indent=0, sort_keys=True)
+        out.write('\n')
+
+
+def _json_filepaths(dirs):
+    fps = []
+    for d in dirs:
+        for dirpath, dirnames, filenames in os.walk(d):
+            dirnames[:] = [i for i in dirnames if i != '.git']
+            for fn in filenames:
+                if fn.endswith('.json'):
+                    fp = os.path.join(dirpath, fn)
+                    try:
+                        _codecs_read(fp)
+                    except ValueError:
+                        continue
+                    fps.append(fp)
+    return fps
+
+
+def _time(func, args_list, reps):
+    best = None
+    for _ in range(reps):
+        start = time.time()
+        for args in args_list:
+            func(*args)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(dirs, reps):
+    fps = _json_filepaths(dirs)
+    num_bytes = sum(os.path.getsize(fp) for fp in fps)
+    print('{} JSON files ({:.1f} MB)'.format(len(fps), num_bytes / 1e6))
+    print('{:38} {:8.3f} sec'.format('read: codecs + json.load', _time(_codecs_read, [(fp,) for fp in fps], reps)))
+    default_backend = get_json_backend()
+    for backend in JSON_BACKENDS:
+        try:
+            set_json_backend(backend)
+        except ValueError:
+            print('read: read_as_json ({:7}) not installed'.format(backend))
+            continue
+        t = _time(read_as_json, [(fp,) for fp in fps], reps)
+        print('{:38} {:8.3f} sec'.format('read: read_as_json ({})'.format(backend), t))
+    set_json_backend(default_backend)
+    blobs = [read_as_json(fp) for fp in fps]
+    out_fp = os.path.join(tempfile.mkdtemp(), 'out.json')
+    try:
+        t = _time(_codecs_write, [(b, out_fp) for b in blobs], reps)
+        print('{:38} {:8.3f} sec'.format('write: codecs + json.dump', t))
+        t = _time(write_as_json, [(b, out_fp) for b in blobs], reps)
+        print('{:38} {:8.3f} sec'.format('write: write_as_json', t))
+        t = _time(write_as_json, [(b, out_fp, 0, False) for b in blobs], reps)
+        print('{:38} {:8.3f} sec'.format('write: write_as_json (sort_keys=False)', t))
+    finally:
+        os.remove(out_fp)
+        os.rmdir(os.path.dirname(out_fp))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('dirs', nargs='*', help='directories searched for .json files')
+    parser.add_argument('--reps', type=int, default=5, help='number of runs timed (default 5)')
+    args = parser.parse_args()
+    dirs = args.dirs
+    if not dirs:
+        dirs = [pathmap.TEST_PHYLESYSTEM_PAR]
+        if not os.path.isdir(dirs[0]):
+            dirs = [pathmap.nexson_source_path()]
+    main(dirs, args.reps)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Times reading one tree (and the meta-only view) of a synthetic by-ID (1.2) study with
+`num_trees` random trees of `num_tips` tips, serialized as peyotl writes it, with json.loads
+followed by extract_tree_nexson (or strip_to_meta_only) and with a LazyNexson.
+The best of `reps` runs is reported.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.nexson_syntax import (BY_ID_HONEY_BADGERFISH,
+                                  extract_tree_nexson,
+                                  LazyNexson,
+                                  strip_to_meta_only)
+from nexson_conversion import synthetic_study
+import json
+import time
+
+
+def _time(func, reps):
+    best, out = None, None
+    for _ in range(reps):
+        start = time.time()
+        out = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, json.dumps(out)
+
+
+def _meta_only(content):
+    blob = json.loads(content.decode('utf-8'))
+    strip_to_meta_only(blob, BY_ID_HONEY_BADGERFISH)
+    return blob
+
+
+def main(num_tips, num_trees, reps, seed):
+    content = json.dumps(synthetic_study(num_tips, num_trees, seed), indent=0, sort_keys=True).encode('utf-8')
+    tree_id = 'tree{}'.format(num_trees // 2)
+    for name, full, lazy in [('one tree ', lambda: extract_tree_nexson(json.loads(content.decode('utf-8')), tree_id),
+                              lambda: LazyNexson(content=content).extract_tree_nexson(tree_id)),
+                             ('meta only', lambda: _meta_only(content),
+                              lambda: LazyNexson(content=content).get_meta_only_nexson())]:
+        full_t, full_out = _time(full, reps)
+        lazy_t, lazy_out = _time(lazy, reps)
+        print('{n}  json.loads {t:7.3f} sec   LazyNexson {z:7.3f} sec   same output: {s}'.format(
+            n=name, t=full_t, z=lazy_t, s=(full_out == lazy_out)))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-tips', type=int, default=20000, help='number of tips per tree (default 20000)')
+    parser.add_argument('--num-trees', type=int, default=10, help='number of trees (default 10)')
+    parser.add_argument('--reps', type=int, default=3, help='number of reads timed (default 3)')
+    parser.add_argument('--seed', type=int, default=1, help='random number seed')
+    args = parser.parse_args()
+    main(args.num_tips, args.num_trees, args.reps, args.seed)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""Times convert_tree (NexSON to newick and to NEXUS) on a "wide" tree (one polytomy, as in
+taxonomy-only studies) and a "deep" tree (a caterpillar), both with `num_tips` tips.
+Half of the otus are mapped to OTT, and some of the labels need quoting.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.nexson_syntax import convert_tree, PhyloSchema
+import time
+
+
+def wide_tree(num_tips):
+    """Returns (tree, otus) in the by-ID HoneyBadgerFish form for a star tree."""
+    edges = {}
+    nodes = {'root': {}}
+    otus = {}
+    for i in range(num_tips):
+        _add_tip(i, 'root', edges, nodes, otus)
+    return {'edgeBySourceId': edges, 'nodeById': nodes, '^ot:rootNodeId': 'root'}, otus
+
+
+def deep_tree(num_tips):
+    """Returns (tree, otus) in the by-ID HoneyBadgerFish form for a caterpillar tree."""
+    edges = {}
+    nodes = {}
+    otus = {}
+    par = None
+    for i in range(num_tips - 1):
+        node_id = 'in{}'.format(i)
+        nodes[node_id] = {}
+        if par is not None:
+            edges.setdefault(par, {})['ei{}'.format(i)] = {'@source': par, '@target': node_id, '@length': 0.5}
+        _add_tip(i, node_id, edges, nodes, otus)
+        par = node_id
+    _add_tip(num_tips - 1, par, edges, nodes, otus)
+    return {'edgeBySourceId': edges, 'nodeById': nodes, '^ot:rootNodeId': 'in0'}, otus
+
+
+def _add_tip(i, par, edges, nodes, otus):
+    node_id, otu_id = 'tip{}'.format(i), 'otu{}'.format(i)
+    nodes[node_id] = {'@otu': otu_id}
+    edges.setdefault(par, {})['e{}'.format(i)] = {'@source': par, '@target': node_id, '@length': 1.25}
+    otu = {'^ot:originalLabel': "Taxon {}'s label".format(i)}
+    if i % 2:
+        otu['^ot:ottTaxonName'] = 'Genus species_{}'.format(i) if i % 3 else 'Genus_species{}'.format(i)
+        otu['^ot:ottId'] = i
+    otus[otu_id] = otu
+
+
+def main(num_tips, reps, shapes):
+    for name, fn in (('wide', wide_tree), ('deep', deep_tree)):
+        if name not in shapes:
+            continue
+        tree, otus = fn(num_tips)
+        for schema in (PhyloSchema('newick', tip_label='ot:ottTaxonName'),
+                       PhyloSchema('nexus', tip_label='ot:originallabel'),
+                       PhyloSchema('newick', tip_label='nodeid_ottid')):
+            start = time.time()
+            for _ in range(reps):
+                s = convert_tree('tree1', tree, otus, schema)
+            elapsed = (time.time() - start) / reps
+            print('{n} {f:6} {l:16} {t:8.3f} sec ({c} chars)'.format(n=name, f=schema.format_str,
+                                                                    l=schema.otu_label_prop
+                                                                    if isinstance(schema.otu_label_prop, str)
+                                                                    else 'callable',
+                                                                    t=elapsed, c=len(s)))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-tips', type=int, default=100000, help='number of tips (default 100000)')
+    parser.add_argument('--reps', type=int, default=3, help='number of conversions timed (default 3)')
+    parser.add_argument('--shape', choices=['wide', 'deep'], default=None, help='only time one shape of tree')
+    args = parser.parse_args()
+    main(args.num_tips, args.reps, ['wide', 'deep'] if args.shape is None else [args.shape])
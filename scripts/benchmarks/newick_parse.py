@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+"""Times parse_newick with and without `fast=True` on a random tree, and checks that
+both build the same tree. Also reports the time and (with tracemalloc) the memory needed
+for a TreeWithPathsInEdges and for a CompactTree.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.phylo.tree import parse_newick, CompactTree, TreeWithPathsInEdges
+import tempfile
+import random
+import time
+import os
+
+
+def random_newick(num_tips, seed=1):
+    """Returns a newick string for a random tree with `num_tips` labelled tips, about half
+    of the internal nodes labelled, and branch lengths on every edge."""
+    rng = random.Random(seed)
+    subtrees = ["'tip {i}':{b:.4f}".format(i=i, b=rng.random()) for i in range(num_tips)]
+    n = 0
+    while len(subtrees) > 1:
+        k = min(len(subtrees), rng.randint(2, 4))
+        children = [subtrees.pop(rng.randrange(len(subtrees))) for _ in range(k)]
+        label = 'node_{}'.format(n) if rng.random() < 0.5 else ''
+        subtrees.append('({c}){l}:{b:.4f}'.format(c=','.join(children), l=label, b=rng.random()))
+        n += 1
+    return subtrees[0].rsplit(':', 1)[0] + ';\n'
+
+
+def tree_signature(tree):
+    return [(nd._id, nd._parent._id if nd._parent is not None else None, len(nd._children),
+             nd._edge.length if nd._edge is not None else None) for nd in tree.root.preorder_iter()]
+
+
+def _time_parse(fp, fast, _class=TreeWithPathsInEdges):
+    start = time.time()
+    tree = parse_newick(filepath=fp, fast=fast, _class=_class)
+    return tree, time.time() - start
+
+
+def _tree_mb(fp, _class):
+    """Returns the MB allocated while parsing the tree (or None without tracemalloc)."""
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        tree = parse_newick(filepath=fp, fast=True, _class=_class)
+        mb = tracemalloc.get_traced_memory()[0] / 1e6
+    finally:
+        tracemalloc.stop()
+    del tree
+    return mb
+
+
+def main(num_tips, seed):
+    newick = random_newick(num_tips, seed=seed)
+    fd, fp = tempfile.mkstemp(suffix='.tre')
+    try:
+        with os.fdopen(fd, 'w') as fo:
+            fo.write(newick)
+        print('{n} tips, {m:.1f} MB of newick'.format(n=num_tips, m=len(newick) / 1e6))
+        tree, slow = _time_parse(fp, False)
+        print('parse_newick             {:8.2f} sec'.format(slow))
+        fast_tree, fast = _time_parse(fp, True)
+        print('parse_newick(fast=True)  {:8.2f} sec ({:.1f}x)'.format(fast, slow / fast))
+        assert tree_signature(tree) == tree_signature(fast_tree)
+        assert set(tree.leaf_ids) == set(fast_tree.leaf_ids)
+        del tree
+        compact_tree, compact = _time_parse(fp, True, _class=CompactTree)
+        print('CompactTree (fast=True)  {:8.2f} sec ({:.1f}x)'.format(compact, slow / compact))
+        assert tree_signature(compact_tree) == tree_signature(fast_tree)
+        del compact_tree, fast_tree
+        for _class in (TreeWithPathsInEdges, CompactTree):
+            mb = _tree_mb(fp, _class)
+            if mb is not None:
+                print('{c:24} {m:8.1f} MB'.format(c=_class.__name__, m=mb))
+    finally:
+        os.remove(fp)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-tips', type=int, default=1000000, help='number of tips (default 1000000)')
+    parser.add_argument('--seed', type=int, default=1, help='random number seed')
+    args = parser.parse_args()
+    main(args.num_tips, args.seed)
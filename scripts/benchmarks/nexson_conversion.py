@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+"""Times the badgerfish (0.0) <-> by-ID (1.2) NexSON conversions of a synthetic study with
+`num_trees` random trees of `num_tips` tips, done in one step (Badgerfish2OptimalNexson and
+Optimal2BadgerfishNexson) and through the direct (1.0) form, and checks that both give the same
+JSON. Each conversion is run on a fresh copy of the input; the best of `reps` runs is reported.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.nexson_syntax.helper import ConversionConfig
+from peyotl.nexson_syntax.badgerfish2direct_nexson import Badgerfish2DirectNexson
+from peyotl.nexson_syntax.badgerfish2optimal_nexson import Badgerfish2OptimalNexson
+from peyotl.nexson_syntax.direct2badgerfish_nexson import Direct2BadgerfishNexson
+from peyotl.nexson_syntax.direct2optimal_nexson import Direct2OptimalNexson
+from peyotl.nexson_syntax.optimal2badgerfish_nexson import Optimal2BadgerfishNexson
+from peyotl.nexson_syntax.optimal2direct_nexson import Optimal2DirectNexson
+import random
+import json
+import time
+
+
+def synthetic_study(num_tips, num_trees, seed):
+    """Returns a by-ID (1.2) NexSON study."""
+    rng = random.Random(seed)
+    otu_by_id = {}
+    for i in range(num_tips):
+        otu = {'^ot:originalLabel': 'Taxon {}'.format(i)}
+        if i % 3:
+            otu['^ot:ottId'] = 1000 + i
+            otu['^ot:ottTaxonName'] = 'Genus species{}'.format(i)
+        otu_by_id['otu{}'.format(i)] = otu
+    tree_by_id = {}
+    for t in range(num_trees):
+        node_by_id = {'node0': {'@root': True}}
+        edge_by_source = {}
+        tips = ['node0']
+        for i in range(1, 2 * num_tips - 1, 2):
+            par = tips.pop(rng.randrange(len(tips)))
+            for nid in ('node{}'.format(i), 'node{}'.format(i + 1)):
+                node_by_id[nid] = {}
+                edge = {'@source': par, '@target': nid, '@length': rng.random()}
+                edge_by_source.setdefault(par, {})['edge' + nid[4:]] = edge
+                tips.append(nid)
+        for n, nid in enumerate(tips):
+            node_by_id[nid]['@otu'] = 'otu{}'.format(n)
+        tree_by_id['tree{}'.format(t)] = {'@label': 'tree {}'.format(t),
+                                          '^ot:branchLengthMode': 'ot:substitutionCount',
+                                          '^ot:inGroupClade': 'node0',
+                                          'nodeById': node_by_id,
+                                          'edgeBySourceId': edge_by_source,
+                                          '^ot:rootNodeId': 'node0'}
+    return {'nexml': {'@nexml2json': '1.2.1',
+                      '^ot:studyId': 'synthetic',
+                      '^ot:studyPublication': {'@href': 'http://example.org/synthetic'},
+                      'otusById': {'otus1': {'otuById': otu_by_id}},
+                      '^ot:otusElementOrder': ['otus1'],
+                      'treesById': {'trees1': {'@otus': 'otus1',
+                                               'treeById': tree_by_id,
+                                               '^ot:treeElementOrder': sorted(tree_by_id.keys())}},
+                      '^ot:treesElementOrder': ['trees1']}}
+
+
+def _time(converter_classes, serialized, reps):
+    cfg = ConversionConfig(None)
+    best, out = None, None
+    for _ in range(reps):
+        blob = json.loads(serialized)
+        start = time.time()
+        for cls in converter_classes:
+            blob = cls(cfg).convert(blob)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+        out = blob
+    return best, json.dumps(out)
+
+
+def main(num_tips, num_trees, reps, seed):
+    by_id = json.dumps(synthetic_study(num_tips, num_trees, seed))
+    badgerfish = _time([Optimal2DirectNexson, Direct2BadgerfishNexson], by_id, 1)[1]
+    for name, src, one_step, two_step in [('0.0 -> 1.2', badgerfish, [Badgerfish2OptimalNexson],
+                                           [Badgerfish2DirectNexson, Direct2OptimalNexson]),
+                                          ('1.2 -> 0.0', by_id, [Optimal2BadgerfishNexson],
+                                           [Optimal2DirectNexson, Direct2BadgerfishNexson])]:
+        two_t, two_out = _time(two_step, src, reps)
+        one_t, one_out = _time(one_step, src, reps)
+        print('{n}  via 1.0 {t:7.3f} sec   one step {o:7.3f} sec   same output: {s}'.format(
+            n=name, t=two_t, o=one_t, s=(one_out == two_out)))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-tips', type=int, default=20000, help='number of tips per tree (default 20000)')
+    parser.add_argument('--num-trees', type=int, default=5, help='number of trees (default 5)')
+    parser.add_argument('--reps', type=int, default=5, help='number of conversions timed (default 5)')
+    parser.add_argument('--seed', type=int, default=1, help='random number seed')
+    args = parser.parse_args()
+    main(args.num_tips, args.num_trees, args.reps, args.seed)
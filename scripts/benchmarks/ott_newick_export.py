@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""Times OTT.write_newick (with the treemachine pruning flags and a log dict) on a synthetic
+taxonomy of `num_taxa` taxa, written to a temporary OTT directory. Some of the names need
+quoting and about 2% of the taxa carry a flag that prunes them.
+The caches (and the label cache of the first export) are built before the timing starts.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.phylo.entities import OTULabelStyleEnum
+from peyotl.ott import OTT
+import tempfile
+import random
+import shutil
+import codecs
+import time
+import os
+
+_PRUNING_FLAGS = ['hidden', 'incertae_sedis', 'extinct_inherited', 'unclassified']
+
+
+class _NullWriter(object):
+    def __init__(self):
+        self.num_chars = 0
+
+    def write(self, s):
+        self.num_chars += len(s)
+
+
+def write_synthetic_ott(ott_dir, num_taxa, seed):
+    """Writes taxonomy.tsv, synonyms.tsv and version.txt for a random taxonomy to `ott_dir`."""
+    rng = random.Random(seed)
+    with codecs.open(os.path.join(ott_dir, 'taxonomy.tsv'), 'w', encoding='utf-8') as fo:
+        fo.write(u'uid\t|\tparent_uid\t|\tname\t|\trank\t|\tsourceinfo\t|\tuniqname\t|\tflags\t|\t\n')
+        fo.write(u'1\t|\t\t|\tlife\t|\tno rank\t|\t\t|\t\t|\t\t|\t\n')
+        for i in range(2, num_taxa + 1):
+            par = rng.randint(max(1, i // 2), i - 1)
+            if i % 7 == 0:
+                name = u"Taxon {}'s sp.".format(i)
+            elif i % 3 == 0:
+                name = u'Genus species{}'.format(i)
+            else:
+                name = u'Taxon_{}'.format(i)
+            r = rng.random()
+            if r < 0.005:
+                flag = _PRUNING_FLAGS[rng.randrange(len(_PRUNING_FLAGS))]
+            else:
+                flag = 'sibling_higher' if r < 0.1 else ''
+            fo.write(u'{}\t|\t{}\t|\t{}\t|\tspecies\t|\t\t|\t\t|\t{}\t|\t\n'.format(i, par, name, flag))
+    with codecs.open(os.path.join(ott_dir, 'synonyms.tsv'), 'w', encoding='utf-8') as fo:
+        fo.write(u'name\t|\tuid\t|\ttype\t|\tuniqname\t|\tsourceinfo\t|\t\n')
+    with codecs.open(os.path.join(ott_dir, 'version.txt'), 'w', encoding='utf-8') as fo:
+        fo.write(u'synthetic\n')
+
+
+def main(num_taxa, reps, seed):
+    ott_dir = tempfile.mkdtemp()
+    try:
+        write_synthetic_ott(ott_dir, num_taxa, seed)
+        ott = OTT(ott_dir=ott_dir)
+        start = time.time()
+        ott.array_cache
+        ott.make('ottid2names')
+        print('caches built in {:.1f} sec'.format(time.time() - start))
+        for style in (OTULabelStyleEnum.OTT_ID, OTULabelStyleEnum.CURRENT_LABEL_OTT_ID):
+            start = time.time()
+            ott.write_newick(_NullWriter(), label_style=style, prune_flags=OTT.TREEMACHINE_SUPPRESS_FLAGS)
+            print('{:22} first export {:8.2f} sec'.format(style.name, time.time() - start))
+            start = time.time()
+            for _ in range(reps):
+                out = _NullWriter()
+                log = OTT(ott_dir=ott_dir).write_newick(out, label_style=style,
+                                                        prune_flags=OTT.TREEMACHINE_SUPPRESS_FLAGS,
+                                                        create_log_dict=True)
+            print('{:22} fresh OTT    {:8.2f} sec ({} chars, {} nodes, {} pruned)'.format(
+                style.name, (time.time() - start) / reps, out.num_chars, log['num_nodes'],
+                log['num_pruned_anc_nodes']))
+    finally:
+        shutil.rmtree(ott_dir)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-taxa', type=int, default=1000000, help='number of taxa (default 1000000)')
+    parser.add_argument('--reps', type=int, default=2, help='number of exports timed (default 2)')
+    parser.add_argument('--seed', type=int, default=1, help='random number seed')
+    args = parser.parse_args()
+    main(args.num_taxa, args.reps, args.seed)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""Times classify_splits (with numpy, and with the pure-python fallback) against calling
+compare_bits_as_splits for every (phylo split, taxo split) pair, for the splits of a random
+binary "phylogeny" and a random "taxonomy" (with polytomies) of the same tips.
+The pairwise calls are timed on a sample of the phylo splits and extrapolated.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.phylo.compat import classify_splits, compare_bits_as_splits
+from peyotl.phylo import compat
+import random
+import time
+
+
+def random_clades(rng, num_tips, max_children):
+    """Returns the bitsets of the non-trivial clades of a random tree with `num_tips` tips."""
+    subtrees = [1 << i for i in range(num_tips)]
+    clades = []
+    while len(subtrees) > 1:
+        k = min(len(subtrees), rng.randint(2, max_children))
+        b = 0
+        for _ in range(k):
+            b |= subtrees.pop(rng.randrange(len(subtrees)))
+        subtrees.append(b)
+        if len(subtrees) > 1:
+            clades.append(b)
+    return clades
+
+
+def main(num_tips, sample_size, seed):
+    rng = random.Random(seed)
+    universe = (1 << num_tips) - 1
+    phylo = random_clades(rng, num_tips, 2)
+    taxo = random_clades(rng, num_tips, 12)
+    print('{t} tips, {p} phylo splits x {x} taxo splits'.format(t=num_tips, p=len(phylo), x=len(taxo)))
+    sample = rng.sample(range(len(phylo)), min(sample_size, len(phylo)))
+    start = time.time()
+    expected = [[compare_bits_as_splits(phylo[i], t, universe).value for t in taxo] for i in sample]
+    pairwise = (time.time() - start) * len(phylo) / len(sample)
+    print('compare_bits_as_splits    {:8.2f} sec (extrapolated from {} rows)'.format(pairwise, len(sample)))
+    saved = compat.numpy
+    compat.numpy = None
+    try:
+        start = time.time()
+        codes = classify_splits(phylo, taxo, universe)
+        elapsed = time.time() - start
+    finally:
+        compat.numpy = saved
+    print('classify_splits (python)  {:8.2f} sec ({:.1f}x)'.format(elapsed, pairwise / elapsed))
+    assert [codes[i] for i in sample] == expected
+    if compat.numpy is not None:
+        start = time.time()
+        codes = classify_splits(phylo, taxo, universe)
+        elapsed = time.time() - start
+        print('classify_splits (numpy)   {:8.2f} sec ({:.1f}x)'.format(elapsed, pairwise / elapsed))
+        assert [[int(c) for c in codes[i]] for i in sample] == expected
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-tips', type=int, default=10000, help='number of tips (default 10000)')
+    parser.add_argument('--sample-size', type=int, default=200,
+                        help='number of phylo splits compared pairwise (default 200)')
+    parser.add_argument('--seed', type=int, default=1, help='random number seed')
+    args = parser.parse_args()
+    main(args.num_tips, args.sample_size, args.seed)
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""Measures the throughput of taxomachine `taxon` calls against a local stub server.
+
+Compares calls made one at a time over a fresh connection each (the behavior before
+_WSWrapper owned a pooled session), sequential calls over the pooled session, and
+`taxon_many` with a few levels of concurrency.
+"""
+from __future__ import absolute_import, print_function, division
+from peyotl.api.taxomachine import _TaxomachineAPIWrapper
+from peyotl.utility.get_config import ConfigWrapper
+import threading
+import requests
+import json
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+
+class _StubTaxonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        ott_id = json.loads(body.decode('utf-8'))['ott_id']
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        out = json.dumps({'ott_id': ott_id,
+                          'name': 'taxon {}'.format(ott_id),
+                          'rank': 'species',
+                          'flags': []}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    def log_message(self, *args):  # pylint: disable=W0221
+        pass
+
+
+class _StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _time_it(label, num_calls, func):
+    start = time.time()
+    func()
+    elapsed = time.time() - start
+    print('{l:<40} {n:>6} calls {e:8.2f} sec {r:10.1f} calls/sec'.format(l=label,
+                                                                          n=num_calls,
+                                                                          e=elapsed,
+                                                                          r=num_calls / elapsed))
+
+
+def main(num_calls, latency, concurrency_levels):
+    server = _StubServer(('127.0.0.1', 0), _StubTaxonHandler)
+    server.latency = latency
+    threading.Thread(target=server.serve_forever).start()
+    try:
+        domain = 'http://127.0.0.1:{}'.format(server.server_address[1])
+        config = ConfigWrapper(overrides={'apis': {'api_version': '2'}})
+        taxo = _TaxomachineAPIWrapper(domain, config=config)
+        ott_ids = list(range(1, num_calls + 1))
+        uri = '{p}/taxon'.format(p=taxo.taxonomy_prefix)
+
+        def unpooled():
+            for ott_id in ott_ids:
+                requests.post(uri, data=json.dumps({'ott_id': ott_id})).json()
+
+        def pooled():
+            for ott_id in ott_ids:
+                taxo.taxon(ott_id)
+
+        _time_it('unpooled requests.post', num_calls, unpooled)
+        _time_it('pooled taxon()', num_calls, pooled)
+        for c in concurrency_levels:
+            r = []
+            _time_it('taxon_many(max_concurrency={})'.format(c),
+                     num_calls,
+                     lambda: r.extend(taxo.taxon_many(ott_ids, max_concurrency=c)))
+            assert [i['ott_id'] for i in r] == ott_ids
+        taxo.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--num-calls', type=int, default=10000, help='number of taxon calls (default 10000)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds that the stub server sleeps before each response (default 0)')
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[4, 10],
+                        help='levels of concurrency for taxon_many (default 4 10)')
+    args = parser.parse_args()
+    main(args.num_calls, args.latency, args.concurrency)
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""Evaluates the rootings of every tree in the phylesystem against OTT, using a pool of
+worker processes. One JSON object per tree is appended to the output file (which is also
+the checkpoint: rerunning with the same output file skips the trees that are already there).
+"""
+from peyotl.evaluate_tree import evaluate_rootings_batch
+from peyotl.phylesystem.phylesystem_umbrella import Phylesystem
+from peyotl import get_logger
+import argparse
+import time
+import sys
+import os
+
+if __name__ == '__main__':
+    SCRIPT_NAME = os.path.split(os.path.abspath(sys.argv[0]))[-1]
+    _LOG = get_logger(SCRIPT_NAME)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-o", "--output",
+                        metavar="FILE",
+                        required=True,
+                        help="output filepath (JSON lines). Results are appended.")
+    parser.add_argument("--ott-dir",
+                        default=None,
+                        required=False,
+                        help="OTT directory (the [ott] parent setting of your config is used if omitted)")
+    parser.add_argument("-j", "--workers",
+                        type=int,
+                        default=None,
+                        required=False,
+                        help="number of worker processes (default is the number of CPUs)")
+    parser.add_argument('--phylesystem-parent',
+                        default=None,
+                        required=False,
+                        help='directory holding the phylesystem shards (default from your config)')
+    args = parser.parse_args()
+    if args.phylesystem_parent is None:
+        phylesystem = Phylesystem()
+    else:
+        phylesystem = Phylesystem(repos_par=args.phylesystem_parent)
+    start = time.time()
+    n = evaluate_rootings_batch(phylesystem.iter_study_objs(), args.ott_dir, args.output, num_workers=args.workers)
+    sys.stderr.write('{n} trees evaluated in {x:.1f} sec\n'.format(n=n, x=time.time() - start))
@@ -108,6 +108,8 @@ setup(
                       'enum34==1.1.10; python_version < "3.4"',
                       'argcomplete',
                       'python-dateutil', ],
+    extras_require={'numpy': ['numpy>=1.17'],  # for the vectorized peyotl.phylo.compat.classify_splits
+                    'orjson': ['orjson']},  # for the faster JSON parsing of peyotl.utility.json_backend
     packages=PACKAGES,
     entry_points=ENTRY_POINTS,
     classifiers=[